@@ -0,0 +1,106 @@
+"""Add glucose rollup tables.
+
+Revision ID: d7f1a5b9c3e4
+Revises: c6e0f4a8b2d3
+Create Date: 2026-10-18 10:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+revision: str = "d7f1a5b9c3e4"
+down_revision: Union[str, Sequence[str], None] = "c6e0f4a8b2d3"
+branch_labels = None
+depends_on = None
+
+
+def _aggregate_columns() -> list[sa.Column]:
+    return [
+        sa.Column("user_id", sa.String(length=128), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("samples", sa.Integer(), nullable=False),
+        sa.Column("sum_mgdl", sa.Float(), nullable=False),
+        sa.Column("sum_sq_mgdl", sa.Float(), nullable=False),
+        sa.Column("min_mgdl", sa.Integer(), nullable=False),
+        sa.Column("max_mgdl", sa.Integer(), nullable=False),
+        sa.Column("below_54", sa.Integer(), nullable=False),
+        sa.Column("below_70", sa.Integer(), nullable=False),
+        sa.Column("in_range", sa.Integer(), nullable=False),
+        sa.Column("above_180", sa.Integer(), nullable=False),
+        sa.Column("above_250", sa.Integer(), nullable=False),
+        sa.Column("p10", sa.Float(), nullable=False),
+        sa.Column("p25", sa.Float(), nullable=False),
+        sa.Column("p50", sa.Float(), nullable=False),
+        sa.Column("p75", sa.Float(), nullable=False),
+        sa.Column("p90", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("user_id", "bucket_start"),
+    ]
+
+
+def upgrade() -> None:
+    existing: set[str] = set()
+    postgres = context.get_context().dialect.name == "postgresql"
+    if not context.is_offline_mode():
+        existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "glucose_rollup_5m" not in existing:
+        if postgres:
+            # Monthly range partitions; the rollup job creates upcoming months
+            # and the default partition catches anything it has not reached.
+            op.execute(
+                """
+                CREATE TABLE glucose_rollup_5m (
+                    user_id VARCHAR(128) NOT NULL,
+                    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+                    glucose_mgdl INTEGER NOT NULL,
+                    source VARCHAR(40) NOT NULL,
+                    trend_arrow VARCHAR(64),
+                    PRIMARY KEY (user_id, bucket_start)
+                ) PARTITION BY RANGE (bucket_start)
+                """
+            )
+            op.execute(
+                "CREATE TABLE glucose_rollup_5m_default PARTITION OF glucose_rollup_5m DEFAULT"
+            )
+        else:
+            op.create_table(
+                "glucose_rollup_5m",
+                sa.Column("user_id", sa.String(length=128), nullable=False),
+                sa.Column("bucket_start", sa.DateTime(timezone=True), nullable=False),
+                sa.Column("glucose_mgdl", sa.Integer(), nullable=False),
+                sa.Column("source", sa.String(length=40), nullable=False),
+                sa.Column("trend_arrow", sa.String(length=64), nullable=True),
+                sa.PrimaryKeyConstraint("user_id", "bucket_start"),
+            )
+
+    if "glucose_rollup_hourly" not in existing:
+        op.create_table("glucose_rollup_hourly", *_aggregate_columns())
+    if "glucose_rollup_daily" not in existing:
+        op.create_table("glucose_rollup_daily", *_aggregate_columns())
+    if "glucose_rollup_state" not in existing:
+        op.create_table(
+            "glucose_rollup_state",
+            sa.Column("name", sa.String(length=64), nullable=False),
+            sa.Column("cursor", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+            sa.PrimaryKeyConstraint("name"),
+        )
+    if "glucose_readings" in existing or context.is_offline_mode():
+        # Drives the rollup job's "what changed since the watermark" scan.
+        op.create_index(
+            "ix_glucose_readings_updated_at",
+            "glucose_readings",
+            ["updated_at"],
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_glucose_readings_updated_at", table_name="glucose_readings", if_exists=True)
+    op.drop_table("glucose_rollup_state")
+    op.drop_table("glucose_rollup_daily")
+    op.drop_table("glucose_rollup_hourly")
+    op.drop_table("glucose_rollup_5m")
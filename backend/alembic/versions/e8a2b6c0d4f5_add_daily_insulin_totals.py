@@ -0,0 +1,41 @@
+"""Add daily insulin totals table.
+
+Revision ID: e8a2b6c0d4f5
+Revises: d7f1a5b9c3e4
+Create Date: 2026-10-18 12:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+revision: str = "e8a2b6c0d4f5"
+down_revision: Union[str, Sequence[str], None] = "d7f1a5b9c3e4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    existing: set[str] = set()
+    if not context.is_offline_mode():
+        existing = set(sa.inspect(op.get_bind()).get_table_names())
+    # Rows are filled by the nightly rebuild; until then readers fall back
+    # to the raw treatments for the days they need.
+    if "daily_insulin_totals" not in existing:
+        op.create_table(
+            "daily_insulin_totals",
+            sa.Column("user_id", sa.String(length=128), nullable=False),
+            sa.Column("day", sa.Date(), nullable=False),
+            sa.Column("bolus_u", sa.Float(), nullable=False),
+            sa.Column("basal_u", sa.Float(), nullable=True),
+            sa.Column("carbs_g", sa.Float(), nullable=False),
+            sa.Column("treatments", sa.Integer(), nullable=False),
+            sa.Column("rebuilt_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+            sa.PrimaryKeyConstraint("user_id", "day"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("daily_insulin_totals")
@@ -0,0 +1,81 @@
+"""Own the ML training snapshot table and add its late fields.
+
+Revision ID: f9b3c7d1e5a6
+Revises: e8a2b6c0d4f5
+Create Date: 2026-10-18 13:00:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+revision: str = "f9b3c7d1e5a6"
+down_revision: Union[str, Sequence[str], None] = "e8a2b6c0d4f5"
+branch_labels = None
+depends_on = None
+
+HORIZONS = (30, 60, 120, 240, 360)
+LATE_COLUMNS = [f"actual_bg_{h}m" for h in HORIZONS]
+
+
+def upgrade() -> None:
+    existing: set[str] = set()
+    columns: set[str] = set()
+    if not context.is_offline_mode():
+        inspector = sa.inspect(op.get_bind())
+        existing = set(inspector.get_table_names())
+        if "ml_training_data_v2" in existing:
+            columns = {column["name"] for column in inspector.get_columns("ml_training_data_v2")}
+
+    # Previously created by the snapshot writer before every insert.
+    if "ml_training_data_v2" not in existing:
+        op.create_table(
+            "ml_training_data_v2",
+            sa.Column("feature_time", sa.DateTime(), nullable=False),
+            sa.Column("user_id", sa.String(), nullable=False),
+            sa.Column("bg_mgdl", sa.Float(), nullable=True),
+            sa.Column("trend", sa.String(), nullable=True),
+            sa.Column("bg_age_min", sa.Float(), nullable=True),
+            sa.Column("iob_u", sa.Float(), nullable=True),
+            sa.Column("cob_g", sa.Float(), nullable=True),
+            sa.Column("iob_status", sa.String(), nullable=True),
+            sa.Column("cob_status", sa.String(), nullable=True),
+            sa.Column("basal_active_u", sa.Float(), nullable=True),
+            sa.Column("basal_latest_u", sa.Float(), nullable=True),
+            sa.Column("basal_latest_age_min", sa.Float(), nullable=True),
+            sa.Column("basal_total_24h", sa.Float(), nullable=True),
+            sa.Column("basal_total_48h", sa.Float(), nullable=True),
+            sa.Column("bolus_total_3h", sa.Float(), nullable=True),
+            sa.Column("bolus_total_6h", sa.Float(), nullable=True),
+            sa.Column("carbs_total_3h", sa.Float(), nullable=True),
+            sa.Column("carbs_total_6h", sa.Float(), nullable=True),
+            sa.Column("exercise_minutes_6h", sa.Float(), nullable=True),
+            sa.Column("exercise_minutes_24h", sa.Float(), nullable=True),
+            *[sa.Column(f"baseline_bg_{h}m", sa.Float(), nullable=True) for h in HORIZONS],
+            sa.Column("active_params", sa.Text(), nullable=True),
+            sa.Column("event_counts", sa.Text(), nullable=True),
+            sa.Column("source_ns_enabled", sa.Boolean(), nullable=True),
+            sa.Column("source_ns_treatments_count", sa.Integer(), nullable=True),
+            sa.Column("source_db_treatments_count", sa.Integer(), nullable=True),
+            sa.Column("source_overlap_count", sa.Integer(), nullable=True),
+            sa.Column("source_conflict_count", sa.Integer(), nullable=True),
+            sa.Column("source_consistency_status", sa.String(), nullable=True),
+            sa.Column("flag_bg_missing", sa.Boolean(), nullable=True),
+            sa.Column("flag_bg_stale", sa.Boolean(), nullable=True),
+            sa.Column("flag_iob_unavailable", sa.Boolean(), nullable=True),
+            sa.Column("flag_cob_unavailable", sa.Boolean(), nullable=True),
+            sa.Column("flag_source_conflict", sa.Boolean(), nullable=True),
+            *[sa.Column(name, sa.Float(), nullable=True) for name in LATE_COLUMNS],
+            sa.PrimaryKeyConstraint("feature_time", "user_id"),
+        )
+        return
+
+    for name in LATE_COLUMNS:
+        if name not in columns:
+            op.add_column("ml_training_data_v2", sa.Column(name, sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    for name in reversed(LATE_COLUMNS):
+        op.drop_column("ml_training_data_v2", name)
@@ -1,6 +1,10 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app.core.db import get_engine
 from app.core.security import get_current_user, CurrentUser
-from app.services.export_service import export_all_user_data
+from app.services.export_service import export_all_user_data, gzip_stream, stream_user_export
 
 router = APIRouter(prefix="/data", tags=["data"])
 
@@ -11,6 +15,28 @@ async def export_user_history(current_user: CurrentUser = Depends(get_current_us
     """
     return await export_all_user_data(current_user.id)
 
+@router.get("/export/stream")
+async def export_user_history_stream(
+    gzip: bool = Query(False),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Stream every user table (glucose, treatments, ML data, ...) as NDJSON, optionally gzipped.
+    The file can be loaded on another install with POST /data/import/stream.
+    """
+    if not get_engine():
+        raise HTTPException(status_code=503, detail="Streaming export requires a database")
+    body = stream_user_export(current_user.id)
+    filename = f"bolusai-{current_user.id}-{datetime.utcnow():%Y%m%d}.ndjson"
+    if gzip:
+        body = gzip_stream(body)
+        filename += ".gz"
+    return StreamingResponse(
+        body,
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 @router.post("/import")
 async def import_user_history(data: dict, current_user: CurrentUser = Depends(get_current_user)):
     """
@@ -18,3 +44,14 @@ async def import_user_history(data: dict, current_user: CurrentUser = Depends(ge
     """
     from app.services.import_service import import_user_data
     return await import_user_data(current_user.id, data)
+
+@router.post("/import/stream")
+async def import_user_history_stream(request: Request, current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Bulk-load an NDJSON export (plain or gzipped) read straight from the request body.
+    """
+    from app.services.import_service import import_user_stream
+    try:
+        return await import_user_stream(current_user.id, request.stream())
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
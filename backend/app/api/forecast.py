@@ -17,7 +17,7 @@ from app.models.forecast import (
 )
 from app.services.forecast_engine import ForecastEngine
 from app.core.security import get_current_user, get_current_user_optional, CurrentUser
-from app.core.db import get_db_session
+from app.core.db import SessionLocal, get_db_session
 from app.core.settings import Settings, get_settings
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.settings_service import get_user_settings_service
@@ -27,7 +27,9 @@ from app.services.nightscout_client import NightscoutClient
 from app.services.autosens_service import AutosensService
 from app.services.smart_filter import FilterConfig
 from app.models.basal import BasalEntry
+from app.services.cgm_series import CGMSeriesRepository
 from app.services.dexcom_client import DexcomClient
+from app.services.glucose_backfill_service import backfill_dexcom, dexcom_configured
 from app.services.glucose_source_service import resolve_current_glucose
 from app.services.store import DataStore
 from pathlib import Path
@@ -216,7 +218,7 @@ async def get_current_forecast(
             pass
 
     # 2.2 Dexcom Fallback (if Start BG still missing)
-    if start_bg is None and user_settings and user_settings.dexcom and user_settings.dexcom.username:
+    if start_bg is None and user_settings and dexcom_configured(user_settings):
         try:
              # Use cached/shared client if possible, or new one
              dex = DexcomClient(
@@ -1000,7 +1002,7 @@ async def get_current_forecast(
     # [ML Inference Real]
     try:
         ml_svc = MLInferenceService.get_instance()
-        ml_svc.load_models()
+        await ml_svc.load_models_async()
         
         if ml_svc.models_loaded:
              # Prepare Inputs
@@ -1108,7 +1110,7 @@ async def get_current_forecast(
         if not cgm_source:
             if ns_config and ns_config.enabled and ns_config.url:
                 cgm_source = "nightscout"
-            elif user_settings and user_settings.dexcom and user_settings.dexcom.username:
+            elif user_settings and dexcom_configured(user_settings):
                 cgm_source = "dexcom"
 
         cgm_entries = []
@@ -1123,16 +1125,19 @@ async def get_current_forecast(
                 ]
             finally:
                 await client.aclose()
-        elif cgm_source == "dexcom" and user_settings and user_settings.dexcom and user_settings.dexcom.username:
-            dex = DexcomClient(
-                username=user_settings.dexcom.username,
-                password=user_settings.dexcom.password,
-                region=user_settings.dexcom.region or "ous",
-            )
+        elif cgm_source == "dexcom" and user_settings and dexcom_configured(user_settings):
+            # Share only keeps 24h: merge the newest readings into the local
+            # table and read the pattern window from there. The pull gets its
+            # own session so a failed one cannot roll back this request's.
             start_range = now_utc - timedelta(days=settings.night_pattern.days)
+            try:
+                async with SessionLocal() as backfill_session:
+                    await backfill_dexcom(backfill_session, username)
+            except Exception as exc:
+                logger.warning("Dexcom backfill before night pattern failed: %s", type(exc).__name__)
             cgm_entries = [
-                (reading.date, float(reading.sgv))
-                for reading in await dex.get_sgv_range(start_range, now_utc)
+                (point.measured_at, float(point.sgv))
+                for point in await CGMSeriesRepository(session, username).get_range(start_range, now_utc)
             ]
 
         pattern = None
@@ -1671,7 +1676,7 @@ async def simulate_forecast(
             
             ml_svc = MLInferenceService.get_instance()
             # Ensure models are loaded (idempotent)
-            ml_svc.load_models() 
+            await ml_svc.load_models_async()
             
             if ml_svc.models_loaded:
                 # 1. Prepare Simulated Treatments (History + Proposed)
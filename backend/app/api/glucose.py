@@ -1,29 +1,59 @@
 from __future__ import annotations
 
+import asyncio
+import json
+from dataclasses import asdict
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from pathlib import Path
+from typing import Any, Optional, Union
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.db import get_db_session
 from app.core.security import CurrentUser, get_current_user
+from app.core.settings import get_settings
 from app.models.glucose_reading import GlucoseReadingDB
-from app.services.glucose_ingest_service import GlucoseIngestData, as_utc, ingest_glucose_reading
+from app.services.circuit_breaker import peek_breaker
+from app.services.dexcom_client import DEXCOM_TIMEOUT_SECONDS, dexcom_breaker_name
+from app.services.glucose_agp_service import MAX_AGP_DAYS, get_agp_report
+from app.services.glucose_backfill_service import (
+    get_backfill_state,
+    history_freshness,
+    schedule_backfill,
+)
+from app.services.glucose_events import hub
+from app.services.glucose_history_service import (
+    canonical_rows,
+    current_cursor,
+    decode_cursor,
+    etag_matches,
+    history_etag,
+    load_history_delta,
+)
+from app.services.glucose_ingest_service import as_utc
+from app.services.glucose_rollup_service import (
+    GlucoseAggregate,
+    load_rollups,
+    summarize_range,
+)
 from app.services.glucose_source_service import (
-    SOURCE_PRIORITY,
     TREND_ARROWS,
     load_glucose_user_settings,
     resolve_current_glucose,
 )
-from app.services.nightscout_client import NightscoutClient
 from app.services.nightscout_secrets_service import get_ns_config
 
 
 router = APIRouter()
 
+HISTORY_GAP_TOLERANCE = timedelta(minutes=30)
+STREAM_KEEPALIVE_SECONDS = 25.0
+NIGHTSCOUT_DEFAULT_TIMEOUT_SECONDS = 10.0
+
 
 class CurrentGlucoseResponse(BaseModel):
     ok: bool
@@ -49,6 +79,7 @@ class CurrentGlucoseResponse(BaseModel):
 
 
 class GlucoseHistoryItem(BaseModel):
+    id: Optional[str] = None
     sgv: int
     date: int
     direction: Optional[str] = None
@@ -57,6 +88,23 @@ class GlucoseHistoryItem(BaseModel):
     historical: bool = False
 
 
+class GlucoseHistoryDelta(BaseModel):
+    cursor: str
+    full: bool = False
+    items: list[GlucoseHistoryItem] = Field(default_factory=list)
+    tombstones: list[str] = Field(default_factory=list)
+
+
+class UpstreamCircuitState(BaseModel):
+    state: str = "closed"
+    samples: int = 0
+    failure_rate: float = 0.0
+    consecutive_failures: int = 0
+    p95_latency_ms: Optional[float] = None
+    deadline_seconds: Optional[float] = None
+    retry_at: Optional[str] = None
+
+
 class GlucoseSourceState(BaseModel):
     source: str
     enabled: bool
@@ -66,6 +114,77 @@ class GlucoseSourceState(BaseModel):
     age_minutes: Optional[float] = None
     status: str
     pending_sync: int = 0
+    # Remote sources only: breaker guarding the upstream API.
+    circuit: Optional[UpstreamCircuitState] = None
+
+
+class GlucoseRangeStats(BaseModel):
+    samples: int = 0
+    mean_mgdl: Optional[float] = None
+    sd_mgdl: Optional[float] = None
+    cv_pct: Optional[float] = None
+    min_mgdl: Optional[int] = None
+    max_mgdl: Optional[int] = None
+    below_54_pct: Optional[float] = None
+    below_70_pct: Optional[float] = None
+    in_range_pct: Optional[float] = None
+    above_180_pct: Optional[float] = None
+    above_250_pct: Optional[float] = None
+    p10: Optional[float] = None
+    p25: Optional[float] = None
+    p50: Optional[float] = None
+    p75: Optional[float] = None
+    p90: Optional[float] = None
+
+
+class GlucoseRollupPoint(GlucoseRangeStats):
+    start: int
+    # 5-minute points carry the canonical reading instead of aggregates.
+    sgv: Optional[int] = None
+    source: Optional[str] = None
+
+
+class GlucoseRollupsResponse(BaseModel):
+    resolution: str
+    start: int
+    end: int
+    points: list[GlucoseRollupPoint] = Field(default_factory=list)
+
+
+class GlucoseStatsResponse(GlucoseRangeStats):
+    start: int
+    end: int
+    days: int
+
+
+class AGPBandItem(BaseModel):
+    minute: int
+    samples: int
+    p5: Optional[float] = None
+    p25: Optional[float] = None
+    p50: Optional[float] = None
+    p75: Optional[float] = None
+    p95: Optional[float] = None
+
+
+class AGPResponse(BaseModel):
+    start: int
+    end: int
+    days: int
+    bin_minutes: int
+    timezone: str
+    samples: int = 0
+    coverage_pct: float = 0.0
+    mean_mgdl: Optional[float] = None
+    sd_mgdl: Optional[float] = None
+    cv_pct: Optional[float] = None
+    gmi_pct: Optional[float] = None
+    very_low_pct: Optional[float] = None
+    low_pct: Optional[float] = None
+    in_range_pct: Optional[float] = None
+    high_pct: Optional[float] = None
+    very_high_pct: Optional[float] = None
+    bands: list[AGPBandItem] = Field(default_factory=list)
 
 
 class GlucoseSourcesResponse(BaseModel):
@@ -113,96 +232,268 @@ async def get_current_glucose(
     )
 
 
-async def _backfill_nightscout_history(
-    session: AsyncSession,
+def _history_item(row: GlucoseReadingDB) -> GlucoseHistoryItem:
+    return GlucoseHistoryItem(
+        id=row.id,
+        sgv=row.glucose_mgdl,
+        date=int(as_utc(row.measured_at).timestamp() * 1000),
+        direction=row.trend_arrow,
+        trendArrow=TREND_ARROWS.get(row.trend_arrow or "NONE", row.trend_arrow),
+        source=row.source,
+        historical=row.historical,
+    )
+
+
+def _report_freshness(
+    response: Response,
     user_id: str,
     *,
-    start: datetime,
-    end: datetime,
-    count: int,
+    latest: Optional[datetime],
+    now: datetime,
+    refresh: bool,
+    backfill_since: Optional[datetime],
 ) -> None:
-    ns = await get_ns_config(session, user_id)
-    if not ns or not ns.enabled or not ns.url:
-        return
-    client = NightscoutClient(ns.url, ns.api_secret, timeout_seconds=10)
-    try:
-        entries = await client.get_sgv_range(start, end, count=count)
-        for entry in entries:
-            await ingest_glucose_reading(
-                session,
-                user_id,
-                GlucoseIngestData(
-                    glucose_mgdl=int(entry.sgv),
-                    measured_at=datetime.fromtimestamp(entry.date / 1000, tz=timezone.utc),
-                    source="nightscout",
-                    trend_arrow=entry.direction,
-                    # Old points are marked historical by age validation. The
-                    # newest point can still be recognized as a live reading.
-                    historical=False,
-                ),
-                sync_to_nightscout=False,
-            )
-        await session.commit()
-    finally:
-        await client.aclose()
+    freshness = history_freshness(latest, now)
+    backfill = "idle"
+    if refresh and (freshness != "fresh" or backfill_since is not None):
+        if schedule_backfill(user_id, since=backfill_since):
+            backfill = "scheduled"
+    state = get_backfill_state(user_id)
+    if state.running:
+        backfill = "running"
+    response.headers["X-Glucose-Freshness"] = freshness
+    response.headers["X-Glucose-Backfill"] = backfill
+    if latest is not None:
+        response.headers["X-Glucose-Latest-At"] = latest.isoformat()
+    if state.last_success_at is not None:
+        response.headers["X-Glucose-Backfill-At"] = state.last_success_at.isoformat()
 
 
-@router.get("/history", response_model=list[GlucoseHistoryItem])
+@router.get("/history", response_model=Union[list[GlucoseHistoryItem], GlucoseHistoryDelta])
 async def get_glucose_history(
+    response: Response,
     count: int = Query(288, ge=1, le=5000),
     hours: Optional[int] = Query(None, ge=1, le=168),
     refresh: bool = Query(True),
+    since: Optional[str] = Query(None, max_length=64),
+    if_none_match: Optional[str] = Header(None),
     user: CurrentUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_db_session),
 ):
+    """Serve history from the local table; remote sources are backfilled in the background.
+
+    ``refresh`` no longer blocks on a Nightscout round trip. When the local
+    window looks incomplete a backfill is scheduled and the response carries
+    ``X-Glucose-*`` headers so clients can re-poll once it has landed.
+
+    Every response carries ``ETag`` and ``X-Glucose-Cursor``. Passing the
+    cursor back as ``since`` returns a ``GlucoseHistoryDelta`` holding only
+    readings changed since then plus ids superseded by a higher-priority
+    source; ``If-None-Match`` short-circuits to 304 when nothing changed.
+    """
     end = datetime.now(timezone.utc)
     effective_hours = hours or max(1, min(168, int((count * 5 + 59) / 60)))
     start = end - timedelta(hours=effective_hours)
-    if refresh:
-        try:
-            await _backfill_nightscout_history(
-                session, user.username, start=start, end=end, count=count
+
+    cursor = await current_cursor(session, user.username)
+    first, latest = (
+        await session.execute(
+            select(func.min(GlucoseReadingDB.measured_at), func.max(GlucoseReadingDB.measured_at)).where(
+                GlucoseReadingDB.user_id == user.username,
+                GlucoseReadingDB.validation_status == "accepted",
+                GlucoseReadingDB.measured_at >= start,
             )
-        except Exception:
-            # Local direct/watch history remains available when Nightscout fails.
-            pass
+        )
+    ).one()
+    latest = as_utc(latest) if latest else None
+    # The moving window drops old readings without touching the cursor; its
+    # start, at reading granularity, is the oldest reading still inside it.
+    window_start = int(as_utc(first).timestamp()) if first else None
+    etag = history_etag(cursor, count, effective_hours, since is not None, window_start)
+    response.headers["ETag"] = etag
+    response.headers["X-Glucose-Cursor"] = cursor
 
-    rows = list(
-        (
-            await session.execute(
-                select(GlucoseReadingDB)
-                .where(
-                    GlucoseReadingDB.user_id == user.username,
-                    GlucoseReadingDB.validation_status == "accepted",
-                    GlucoseReadingDB.measured_at >= start,
-                )
-                .order_by(GlucoseReadingDB.measured_at.desc())
-                .limit(count * 4)
+    if etag_matches(if_none_match, etag):
+        _report_freshness(
+            response, user.username, latest=latest, now=end, refresh=refresh, backfill_since=None
+        )
+        return Response(status_code=304, headers=dict(response.headers))
+
+    since_at = decode_cursor(since)
+    if since_at is not None:
+        delta = await load_history_delta(
+            session, user.username, since=since_at, start=start, max_changes=count
+        )
+        if delta is not None:
+            _report_freshness(
+                response, user.username, latest=latest, now=end, refresh=refresh, backfill_since=None
+            )
+            return GlucoseHistoryDelta(
+                cursor=cursor,
+                items=[_history_item(row) for row in delta.items],
+                tombstones=delta.tombstones,
             )
-        ).scalars().all()
-    )
 
-    # The same sensor sample can arrive through Android, watch and Nightscout.
-    # Keep one canonical point for graphing, preferring the most direct source.
-    canonical: dict[tuple[int, int], GlucoseReadingDB] = {}
-    for row in rows:
-        key = (int(as_utc(row.measured_at).timestamp()), row.glucose_mgdl)
-        previous = canonical.get(key)
-        if previous is None or SOURCE_PRIORITY.get(row.source, 0) > SOURCE_PRIORITY.get(previous.source, 0):
-            canonical[key] = row
-
-    selected = sorted(canonical.values(), key=lambda row: as_utc(row.measured_at), reverse=True)[:count]
-    return [
-        GlucoseHistoryItem(
-            sgv=row.glucose_mgdl,
-            date=int(as_utc(row.measured_at).timestamp() * 1000),
-            direction=row.trend_arrow,
-            trendArrow=TREND_ARROWS.get(row.trend_arrow or "NONE", row.trend_arrow),
-            source=row.source,
-            historical=row.historical,
+    rows = (
+        await session.execute(
+            select(GlucoseReadingDB)
+            .where(
+                GlucoseReadingDB.user_id == user.username,
+                GlucoseReadingDB.validation_status == "accepted",
+                GlucoseReadingDB.measured_at >= start,
+            )
+            .order_by(GlucoseReadingDB.measured_at.desc())
+            .limit(count * 4)
         )
-        for row in selected
-    ]
+    ).scalars().all()
+    selected = sorted(
+        canonical_rows(rows).values(), key=lambda row: as_utc(row.measured_at), reverse=True
+    )[:count]
+
+    oldest = as_utc(selected[-1].measured_at) if selected else None
+    # A short window that starts well after the requested start means the
+    # local table has not been backfilled that far yet.
+    partial = oldest is not None and len(selected) < count and oldest - start > HISTORY_GAP_TOLERANCE
+    _report_freshness(
+        response,
+        user.username,
+        latest=latest,
+        now=end,
+        refresh=refresh,
+        backfill_since=start if partial or latest is None else None,
+    )
+
+    items = [_history_item(row) for row in selected]
+    if since is not None:
+        # Unreadable or too-old cursor: the client replaces its copy.
+        return GlucoseHistoryDelta(cursor=cursor, full=True, items=items)
+    return items
+
+
+def _circuit_state(name: str, default_deadline: float) -> UpstreamCircuitState:
+    breaker = peek_breaker(name)
+    if breaker is None:
+        return UpstreamCircuitState(deadline_seconds=default_deadline)
+    snapshot = breaker.snapshot(default_deadline)
+    return UpstreamCircuitState(
+        state=snapshot.state,
+        samples=snapshot.samples,
+        failure_rate=snapshot.failure_rate,
+        consecutive_failures=snapshot.consecutive_failures,
+        p95_latency_ms=snapshot.p95_latency_ms,
+        deadline_seconds=snapshot.deadline_seconds,
+        retry_at=snapshot.retry_at,
+    )
+
+
+def _range_stats(aggregate: GlucoseAggregate) -> dict[str, Any]:
+    mean = aggregate.mean
+    sd = aggregate.sd
+    return {
+        "samples": aggregate.samples,
+        "mean_mgdl": round(mean, 1) if mean is not None else None,
+        "sd_mgdl": round(sd, 1) if sd is not None else None,
+        "cv_pct": round(sd / mean * 100, 1) if sd is not None and mean else None,
+        "min_mgdl": aggregate.min_mgdl,
+        "max_mgdl": aggregate.max_mgdl,
+        "below_54_pct": aggregate.pct(aggregate.below_54),
+        "below_70_pct": aggregate.pct(aggregate.below_70),
+        "in_range_pct": aggregate.pct(aggregate.in_range),
+        "above_180_pct": aggregate.pct(aggregate.above_180),
+        "above_250_pct": aggregate.pct(aggregate.above_250),
+        "p10": aggregate.p10,
+        "p25": aggregate.p25,
+        "p50": aggregate.p50,
+        "p75": aggregate.p75,
+        "p90": aggregate.p90,
+    }
+
+
+def _epoch_ms(value: datetime) -> int:
+    return int(as_utc(value).timestamp() * 1000)
+
+
+@router.get("/rollups", response_model=GlucoseRollupsResponse)
+async def get_glucose_rollups(
+    days: int = Query(14, ge=1, le=730),
+    resolution: str = Query("auto", pattern="^(auto|5m|hourly|daily)$"),
+    user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session),
+):
+    """Chart series from the rollup tables; ``auto`` picks the coarsest useful step."""
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    chosen, rows = await load_rollups(session, user.username, start, end, resolution=resolution)
+    if chosen == "5m":
+        points = [
+            GlucoseRollupPoint(
+                start=_epoch_ms(row.bucket_start),
+                samples=1,
+                sgv=row.glucose_mgdl,
+                source=row.source,
+            )
+            for row in rows
+        ]
+    else:
+        points = []
+        for row in rows:
+            aggregate = GlucoseAggregate.combine([row])
+            # A single bucket's stored percentiles are exact for that bucket.
+            aggregate.p10, aggregate.p25, aggregate.p50 = row.p10, row.p25, row.p50
+            aggregate.p75, aggregate.p90 = row.p75, row.p90
+            points.append(
+                GlucoseRollupPoint(start=_epoch_ms(row.bucket_start), **_range_stats(aggregate))
+            )
+    return GlucoseRollupsResponse(
+        resolution=chosen, start=_epoch_ms(start), end=_epoch_ms(end), points=points
+    )
+
+
+@router.get("/stats", response_model=GlucoseStatsResponse)
+async def get_glucose_stats(
+    days: int = Query(14, ge=1, le=730),
+    user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session),
+):
+    """Range statistics (mean, SD, CV, time in ranges, percentiles) from rollups."""
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    summary = await summarize_range(session, user.username, start, end)
+    return GlucoseStatsResponse(
+        start=_epoch_ms(start), end=_epoch_ms(end), days=days, **_range_stats(summary)
+    )
+
+
+@router.get("/agp", response_model=AGPResponse)
+async def get_glucose_agp(
+    days: int = Query(14, ge=1, le=MAX_AGP_DAYS),
+    bin_minutes: int = Query(15, ge=5, le=60),
+    user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db_session),
+):
+    """Ambulatory glucose profile: percentile bands by local time of day plus TIR/GMI/CV."""
+    if 1440 % bin_minutes:
+        raise HTTPException(status_code=422, detail="bin_minutes must divide a day")
+    report = await get_agp_report(session, user.username, days=days, bin_minutes=bin_minutes)
+    return AGPResponse(
+        start=_epoch_ms(report.start),
+        end=_epoch_ms(report.end),
+        days=report.days,
+        bin_minutes=report.bin_minutes,
+        timezone=report.timezone,
+        samples=report.samples,
+        coverage_pct=report.coverage_pct,
+        mean_mgdl=report.mean_mgdl,
+        sd_mgdl=report.sd_mgdl,
+        cv_pct=report.cv_pct,
+        gmi_pct=report.gmi_pct,
+        very_low_pct=report.very_low_pct,
+        low_pct=report.low_pct,
+        in_range_pct=report.in_range_pct,
+        high_pct=report.high_pct,
+        very_high_pct=report.very_high_pct,
+        bands=[AGPBandItem(**asdict(band)) for band in report.bands],
+    )
 
 
 @router.get("/sources/status", response_model=GlucoseSourcesResponse)
@@ -234,6 +525,18 @@ async def get_glucose_sources_status(
         "nightscout": settings.glucose_sources.nightscout_enabled,
         "dexcom_share": settings.glucose_sources.dexcom_share_enabled,
     }
+    circuits: dict[str, UpstreamCircuitState] = {}
+    ns = await get_ns_config(session, user.username)
+    if ns and ns.url:
+        circuits["nightscout"] = _circuit_state(
+            f"nightscout:{ns.url.rstrip('/')}", NIGHTSCOUT_DEFAULT_TIMEOUT_SECONDS
+        )
+    if settings.dexcom.username:
+        circuits["dexcom_share"] = _circuit_state(
+            dexcom_breaker_name(settings.dexcom.username, settings.dexcom.region or "ous"),
+            DEXCOM_TIMEOUT_SECONDS,
+        )
+
     for source in ("dexcom_android", "g7_direct_watch", "nightscout", "dexcom_share"):
         row = (
             await session.execute(
@@ -262,6 +565,7 @@ async def get_glucose_sources_status(
                 age_minutes=age,
                 status=status,
                 pending_sync=pending_sync if source in {"dexcom_android", "g7_direct_watch"} else 0,
+                circuit=circuits.get(source),
             )
         )
 
@@ -273,3 +577,79 @@ async def get_glucose_sources_status(
         pending_sync=pending_sync,
         sources=states,
     )
+
+
+async def _forecast_tick(user_id: str, user: Optional[CurrentUser]) -> Optional[dict[str, Any]]:
+    """Recompute the ambient forecast once per CGM tick for all stream subscribers."""
+    from app.api.forecast import get_current_forecast
+    from app.core.db import SessionLocal
+    from app.services.store import DataStore
+
+    settings = get_settings()
+    async with SessionLocal() as session:
+        forecast = await get_current_forecast(
+            user=user,
+            session=session,
+            store=DataStore(Path(settings.data.data_dir)),
+            settings=settings,
+            start_bg_param=None,
+            future_insulin_u=None,
+            future_insulin_delay_min=0,
+            future_insulin_duration_min=0,
+        )
+    return {
+        "type": "forecast",
+        "at": datetime.now(timezone.utc).isoformat(),
+        "summary": forecast.summary.model_dump(),
+        "quality": forecast.quality,
+        "warnings": forecast.warnings,
+        "slow_absorption_active": forecast.slow_absorption_active,
+        "ml_ready": forecast.ml_ready,
+    }
+
+
+hub.set_tick_handler(_forecast_tick)
+
+
+def _sse(message: dict[str, Any]) -> str:
+    data = json.dumps(message, separators=(",", ":"), default=str)
+    return f"id: {message['seq']}\nevent: {message['type']}\ndata: {data}\n\n"
+
+
+@router.get("/stream")
+async def stream_glucose_events(
+    request: Request,
+    user: CurrentUser = Depends(get_current_user),
+):
+    """Server-Sent Events replacing timer polls of current/history/forecast.
+
+    Events: ``readings`` (newly accepted readings, one message per commit),
+    ``forecast`` (summary recomputed once per new reading batch and shared by
+    every subscriber), ``sync`` (Nightscout upload status) and ``treatments``
+    (treatment rows written). The latest event of each type is replayed on
+    connect.
+    """
+
+    async def events():
+        async with hub.subscribe(user.username, context=user) as queue:
+            yield "retry: 5000\n\n"
+            replay = hub.latest(user.username)
+            for message in replay:
+                yield _sse(message)
+            if not any(message["type"] == "forecast" for message in replay):
+                hub.request_tick(user.username)
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(message)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
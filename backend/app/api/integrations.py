@@ -32,6 +32,7 @@ from app.services.glucose_ingest_service import (
     GlucoseIngestData,
     epoch_to_utc,
     ingest_glucose_reading,
+    ingest_glucose_readings_bulk,
 )
 from app.services.nutrition_shadow_matcher import (
     NutritionShadowEvent,
@@ -999,6 +1000,34 @@ def _v2_response(result) -> MobileGlucoseEntryV2Response:
     )
 
 
+def _v2_ingest_data(payload: MobileGlucoseEntryV2Request) -> GlucoseIngestData:
+    if payload.source == "dexcom_android" and payload.source_package not in {None, "com.dexcom.g7"}:
+        raise HTTPException(status_code=422, detail="Unsupported Android glucose source")
+    if payload.sensor_type.upper() != "G7":
+        raise HTTPException(status_code=422, detail="Unsupported glucose sensor")
+
+    is_watch_continuity = payload.source == "g7_direct_watch"
+    return GlucoseIngestData(
+        schema_version=payload.schema_version,
+        reading_uid=payload.reading_uid,
+        glucose_mgdl=payload.glucose_mgdl,
+        measured_at=epoch_to_utc(payload.timestamp),
+        received_at=epoch_to_utc(payload.received_at) if payload.received_at else None,
+        source=payload.source,
+        trend_arrow=_nightscout_direction(payload.trend_arrow),
+        trend_rate=payload.trend_rate,
+        sensor_state=payload.sensor_state,
+        display_only=payload.display_only,
+        historical=payload.historical,
+        timestamp_uncertain=payload.timestamp_uncertain,
+        sensor_session_id=payload.sensor_session_id,
+        sequence=payload.sequence,
+        sensor_type=payload.sensor_type,
+        source_package=payload.source_package,
+        decision_eligible=not is_watch_continuity,
+    )
+
+
 async def _ingest_v2_payload(
     payload: MobileGlucoseEntryV2Request,
     session: AsyncSession,
@@ -1007,35 +1036,12 @@ async def _ingest_v2_payload(
     flush: bool = True,
     sync_to_nightscout: bool = True,
 ):
-    if payload.source == "dexcom_android" and payload.source_package not in {None, "com.dexcom.g7"}:
-        raise HTTPException(status_code=422, detail="Unsupported Android glucose source")
-    if payload.sensor_type.upper() != "G7":
-        raise HTTPException(status_code=422, detail="Unsupported glucose sensor")
-
-    is_watch_continuity = payload.source == "g7_direct_watch"
+    data = _v2_ingest_data(payload)
     return await ingest_glucose_reading(
         session,
         user_id,
-        GlucoseIngestData(
-            schema_version=payload.schema_version,
-            reading_uid=payload.reading_uid,
-            glucose_mgdl=payload.glucose_mgdl,
-            measured_at=epoch_to_utc(payload.timestamp),
-            received_at=epoch_to_utc(payload.received_at) if payload.received_at else None,
-            source=payload.source,
-            trend_arrow=_nightscout_direction(payload.trend_arrow),
-            trend_rate=payload.trend_rate,
-            sensor_state=payload.sensor_state,
-            display_only=payload.display_only,
-            historical=payload.historical,
-            timestamp_uncertain=payload.timestamp_uncertain,
-            sensor_session_id=payload.sensor_session_id,
-            sequence=payload.sequence,
-            sensor_type=payload.sensor_type,
-            source_package=payload.source_package,
-            decision_eligible=not is_watch_continuity,
-        ),
-        sync_to_nightscout=sync_to_nightscout and not is_watch_continuity,
+        data,
+        sync_to_nightscout=sync_to_nightscout and payload.source != "g7_direct_watch",
         flush=flush,
     )
 
@@ -1070,18 +1076,19 @@ async def mobile_glucose_entries_batch(
     """Persist ordered mobile/watch backfill without creating retrospective actions."""
     _authorize_cgm_ingest_key(request, ingest_key_header)
     user_settings, user_id, _ = await _load_mobile_bolus_settings(session)
-    results = []
-    for item in sorted(payload.readings, key=lambda reading: reading.timestamp):
-        # Batch delivery is always historical unless the newest item is still
-        # genuinely fresh; validation in the ingest service remains decisive.
-        results.append(
-            await _ingest_v2_payload(
-                item,
-                session,
-                user_id,
-                sync_to_nightscout=user_settings.glucose_sources.sync_direct_to_nightscout,
-            )
-        )
+    # Batch delivery is always historical unless the newest item is still
+    # genuinely fresh; validation in the ingest service remains decisive.
+    # Nightscout sync only ever applies to dexcom_android rows, so one flag
+    # covers watch continuity items as well.
+    results = await ingest_glucose_readings_bulk(
+        session,
+        user_id,
+        [
+            _v2_ingest_data(item)
+            for item in sorted(payload.readings, key=lambda reading: reading.timestamp)
+        ],
+        sync_to_nightscout=user_settings.glucose_sources.sync_direct_to_nightscout,
+    )
     await session.commit()
 
     responses = [_v2_response(result) for result in results]
@@ -1,9 +1,10 @@
 from pathlib import Path
+import json
 import math
 from typing import Optional, Literal
 from datetime import datetime, timezone, timedelta
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from pydantic import BaseModel
 
 from app.core.security import get_current_user
@@ -15,6 +16,7 @@ from app.services.store import DataStore
 from app.core.db import get_db_session
 from app.services.nightscout_secrets_service import get_ns_config, upsert_ns_config
 from app.services.smart_filter import CompressionDetector, FilterConfig
+from app.services.glucose_history_service import etag_matches, history_etag
 from app.services.settings_service import get_user_settings_service
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.security import CurrentUser
@@ -670,10 +672,21 @@ async def get_treatments_server(
     return unique_treatments[:count] 
 
 
+# Compression detection compares each point with its neighbours, so a delta
+# request still fetches some context before the client's cursor.
+ENTRIES_SINCE_CONTEXT = timedelta(minutes=30)
+# The newest point's compression flag can change once its successor arrives;
+# deltas re-send this much behind the cursor and clients upsert by ``date``.
+ENTRIES_SINCE_OVERLAP = timedelta(minutes=10)
+
+
 @router.get("/entries", summary="Get SGV entries with optional filtering")
 async def get_entries(
+    response: Response,
     count: int = 288,
     full_history: bool = False, # If true, might fetch more?
+    since: Optional[int] = Query(None, ge=0, description="Epoch ms of the newest entry the client holds"),
+    if_none_match: Optional[str] = Header(None),
     user: CurrentUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_db_session),
 ):
@@ -711,13 +724,18 @@ async def get_entries(
             # Default 24h
             end_dt = datetime.now(timezone.utc)
             start_dt = end_dt - timedelta(hours=24)
+            since_dt = None
+            if since is not None:
+                since_dt = datetime.fromtimestamp(since / 1000, tz=timezone.utc)
+                start_dt = max(start_dt, since_dt - ENTRIES_SINCE_CONTEXT)
             
             # Fetch Entries
             entries = await client.get_sgv_range(start_dt, end_dt, count=count)
             
             # Fetch Treatments (for context)
             if f_config.enabled:
-                treatments = await client.get_recent_treatments(hours=24, limit=100)
+                lookback_hours = max(1, math.ceil((end_dt - start_dt).total_seconds() / 3600))
+                treatments = await client.get_recent_treatments(hours=lookback_hours, limit=100)
                 
         finally:
             await client.aclose()
@@ -730,7 +748,18 @@ async def get_entries(
         treatments_dicts = [t.model_dump() for t in treatments]
         
         processed_entries = detector.detect(entries_dicts, treatments_dicts)
-        
+        if since_dt is not None:
+            floor_ms = int((since_dt - ENTRIES_SINCE_OVERLAP).timestamp() * 1000)
+            processed_entries = [e for e in processed_entries if e["date"] > floor_ms]
+
+        etag = history_etag(json.dumps(processed_entries, sort_keys=True, default=str))
+        newest = max((e["date"] for e in processed_entries), default=since)
+        headers = {"ETag": etag}
+        if newest is not None:
+            headers["X-Nightscout-Cursor"] = str(newest)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
         return processed_entries
         
     except Exception as e:
@@ -3307,9 +3307,12 @@ async def _handle_snapshot_callback(query, data: str) -> None:
              if origin_id:
                   try:
                       async with SessionLocal() as session:
-                           from sqlalchemy import text
-                           await session.execute(text("DELETE FROM treatments WHERE id = :oid"), {"oid": origin_id})
-                           await session.commit()
+                           from app.models.treatment import Treatment
+                           # Through the ORM so the day's insulin totals follow.
+                           treatment = await session.get(Treatment, origin_id)
+                           if treatment is not None:
+                               await session.delete(treatment)
+                               await session.commit()
                       await edit_message_text_safe(query, f"{base_text}\n\n🗑️ Descartado y borrado.")
                   except Exception as e:
                       logger.error(f"Failed to delete ignored treatment: {e}")
@@ -673,20 +673,36 @@ async def get_nightscout_stats(range_hours: int = 24) -> NightscoutStats | ToolE
     except Exception as exc:
         return ToolError(type="config_error", message=f"Config no disponible: {exc}")
 
-    client = _build_ns_client(user_settings)
-    if not client:
-        return ToolError(type="missing_ns", message="Nightscout no configurado.")
-
     now = datetime.now(timezone.utc)
     start = now - timedelta(hours=range_hours)
+    quality = "live"
+    values: list[int] = []
+    # The local series (rollups + recent readings) answers without a Nightscout
+    # round trip; Nightscout is only asked when nothing is stored locally.
     try:
-        entries = await client.get_sgv_range(start, now, count=range_hours * 12 + 60)
-    except NightscoutError as exc:
-        return ToolError(type="ns_error", message=str(exc))
-    finally:
-        await client.aclose()
+        from app.services.glucose_agp_service import load_series
+
+        async with SessionLocal() as session:
+            user_id = await _resolve_user_id(session)
+            _, local_values = await load_series(session, user_id, start, now)
+        values = [int(value) for value in local_values]
+        quality = "local"
+    except Exception as exc:
+        logger.warning(f"Local glucose stats unavailable: {exc}")
+
+    if not values:
+        client = _build_ns_client(user_settings)
+        if not client:
+            return ToolError(type="missing_ns", message="Nightscout no configurado.")
+        try:
+            entries = await client.get_sgv_range(start, now, count=range_hours * 12 + 60)
+        except NightscoutError as exc:
+            return ToolError(type="ns_error", message=str(exc))
+        finally:
+            await client.aclose()
+        values = [e.sgv for e in entries if e.sgv is not None]
+        quality = "live"
 
-    values = [e.sgv for e in entries if e.sgv is not None]
     if not values:
         return NightscoutStats(range_hours=range_hours, quality="empty")
     
@@ -707,7 +723,7 @@ async def get_nightscout_stats(range_hours: int = 24) -> NightscoutStats | ToolE
         min_bg_val=min_bg, 
         max_bg_val=max_bg,
         sample_size=len(values), 
-        quality="live"
+        quality=quality
     )
 
 
@@ -41,6 +41,9 @@ BACKEND_ROOT = Path(__file__).resolve().parent.parent.parent
 class DataConfig(BaseModel):
     data_dir: Path = Field(default_factory=lambda: BACKEND_ROOT / "data")
     static_dir: Path = Field(default_factory=lambda: BACKEND_ROOT / "app" / "static")
+    # Opt-in: delete raw glucose readings older than this once rolled up.
+    # Off by default so the full history is kept.
+    glucose_raw_retention_days: Optional[int] = Field(default=None, ge=1)
 
     @field_validator("data_dir", mode="before")
     def _expand_path(cls, v: str | Path) -> Path:
@@ -81,6 +84,21 @@ class MLConfig(BaseModel):
     # Environment Gating (Can be overridden to allow Render training)
     allow_training_on_ephemeral: bool = Field(default=False)
 
+    # Columnar training-data mirror (defaults to <data_dir>/ml_parquet)
+    parquet_dir: Optional[str] = Field(default=None)
+    # Only the most recent N days feed a training run (None = all history)
+    training_window_days: Optional[int] = Field(default=None)
+    # Parallel training: worker processes (None = one per core) and the
+    # total memory budget the workers are sized against
+    training_workers: Optional[int] = Field(default=None, ge=1)
+    training_memory_mb: int = Field(default=2048, ge=256)
+    # Warm-start nightly runs from the live models on the rows added since
+    # they were trained; retrain from scratch every full_retrain_days
+    incremental_training: bool = Field(default=True)
+    full_retrain_days: int = Field(default=7, ge=1)
+    # Most recent slice held out to compare a candidate with the live models
+    validation_holdout_hours: int = Field(default=24, ge=1)
+
     model_config = ConfigDict(protected_namespaces=())
 
 class DatabaseConfig(BaseModel):
@@ -223,6 +241,10 @@ def _load_env() -> dict[str, Any]:
     if data_dir:
         env_config.setdefault("data", {})["data_dir"] = data_dir
 
+    raw_retention_days = os.environ.get("GLUCOSE_RAW_RETENTION_DAYS")
+    if raw_retention_days:
+        env_config.setdefault("data", {})["glucose_raw_retention_days"] = int(raw_retention_days)
+
     # Vision env vars
     vision_provider = os.environ.get("VISION_PROVIDER")
     if vision_provider:
@@ -249,6 +271,18 @@ def _load_env() -> dict[str, Any]:
     if ml_model_dir:
         env_config.setdefault("ml", {})["model_dir"] = ml_model_dir
         
+    ml_parquet_dir = os.environ.get("ML_PARQUET_DIR")
+    if ml_parquet_dir:
+        env_config.setdefault("ml", {})["parquet_dir"] = ml_parquet_dir
+
+    ml_train_workers = os.environ.get("ML_TRAINING_WORKERS")
+    if ml_train_workers:
+        env_config.setdefault("ml", {})["training_workers"] = int(ml_train_workers)
+
+    ml_train_memory = os.environ.get("ML_TRAINING_MEMORY_MB")
+    if ml_train_memory:
+        env_config.setdefault("ml", {})["training_memory_mb"] = int(ml_train_memory)
+
     ml_train_enabled = os.environ.get("ML_TRAINING_ENABLED")
     if ml_train_enabled is not None:
          env_config.setdefault("ml", {})["training_enabled"] = ml_train_enabled.lower() == "true"
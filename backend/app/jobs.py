@@ -115,9 +115,15 @@ async def _run_data_cleanup_task():
     """
     Background Task: Cleans up old data retention > 90 days.
     """
+    from app.core.db import SessionLocal
     from app.services.basal_repo import delete_old_data
+    from app.services.glucose_rollup_service import prune_raw_readings
     logger.info("Running Data Cleanup Job...")
     res = await delete_old_data(retention_days=90)
+    # Raw glucose rows are kept unless data.glucose_raw_retention_days opts in
+    # to pruning; pruned days are kept in the rollup tables.
+    async with SessionLocal() as session:
+        res["glucose_readings"] = await prune_raw_readings(session)
     logger.info(f"Cleanup finished. Stats: {res}")
 
 async def run_data_cleanup():
@@ -245,7 +251,7 @@ async def _run_ml_training_snapshot_task() -> None:
     """
     from app.core.db import get_engine
     from sqlalchemy.ext.asyncio import AsyncSession
-    from app.services.ml_training_pipeline import collect_and_persist_training_snapshot
+    from app.services.ml_training_pipeline import SnapshotRun, collect_and_persist_training_snapshot
     from sqlalchemy import text
 
     logger.info("Running ML Training Snapshot Job...")
@@ -267,14 +273,17 @@ async def _run_ml_training_snapshot_task() -> None:
         logger.error("Failed to load users for ML snapshot: %s", exc)
         users = user_store.get_all_users()
 
+    # One slot, data store and local events read for every user in this run.
+    run = SnapshotRun.start()
     async with AsyncSession(engine) as session:
         for user in users:
             username = user.get("username")
             if not username:
                 continue
             try:
-                await collect_and_persist_training_snapshot(username, session)
+                await collect_and_persist_training_snapshot(username, session, run=run)
             except Exception as exc:
+                await session.rollback()
                 logger.error("ML snapshot failed for user %s: %s", username, exc)
 
     logger.info("ML Training Snapshot Job Completed.")
@@ -284,6 +293,44 @@ async def run_ml_training_snapshot() -> None:
     await jobs_state.run_job("ml_training_snapshot", _run_ml_training_snapshot_task)
 
 
+async def _run_ml_parquet_export_task() -> None:
+    """
+    Background Task: Appends new ML training snapshots to the Parquet mirror.
+    Runs hourly.
+    """
+    from app.core.db import get_engine
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from app.services.ml_parquet_store import HAS_PYARROW, TABLE_NAME, MLParquetStore
+    from sqlalchemy import inspect, text
+
+    if not HAS_PYARROW:
+        logger.info("pyarrow not installed; skipping ML Parquet export.")
+        return
+    engine = get_engine()
+    if not engine:
+        logger.warning("No DB engine for ML Parquet export.")
+        return
+
+    async with engine.connect() as conn:
+        if not await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table(TABLE_NAME)):
+            return
+        res = await conn.execute(text(f"SELECT DISTINCT user_id FROM {TABLE_NAME}"))
+        users = [r[0] for r in res.fetchall()]
+
+    store = MLParquetStore()
+    async with AsyncSession(engine) as session:
+        for user_id in users:
+            try:
+                result = await store.export_incremental(session, user_id)
+                logger.info("ML Parquet export for %s: %s", user_id, result)
+            except Exception as exc:
+                logger.error("ML Parquet export failed for user %s: %s", user_id, exc)
+
+
+async def run_ml_parquet_export() -> None:
+    await jobs_state.run_job("ml_parquet_export", _run_ml_parquet_export_task)
+
+
 async def _run_ml_training_task() -> None:
     """
     Background Task: Trains ML models if conditions met (Anti-Humo Compliant).
@@ -365,7 +412,7 @@ async def _run_glucose_sync_task() -> None:
     from app.services.glucose_sync_service import sync_pending_glucose_readings
 
     async with SessionLocal() as session:
-        stats = await sync_pending_glucose_readings(session, limit=250)
+        stats = await sync_pending_glucose_readings(session, limit=2000)
     if stats["processed"]:
         logger.info("Glucose Nightscout sync completed: %s", stats)
 
@@ -374,6 +421,48 @@ async def run_glucose_sync() -> None:
     await jobs_state.run_job("glucose_sync", _run_glucose_sync_task)
 
 
+async def _run_glucose_backfill_task() -> None:
+    from app.core.db import SessionLocal
+    from app.services.glucose_backfill_service import backfill_all_users
+
+    async with SessionLocal() as session:
+        stats = await backfill_all_users(session)
+    if stats["inserted"] or stats["failed"]:
+        logger.info("Glucose backfill completed: %s", stats)
+
+
+async def run_glucose_backfill() -> None:
+    await jobs_state.run_job("glucose_backfill", _run_glucose_backfill_task)
+
+
+async def _run_glucose_rollup_task() -> None:
+    from app.core.db import SessionLocal
+    from app.services.glucose_rollup_service import ensure_rollup_partitions, refresh_changed_rollups
+
+    async with SessionLocal() as session:
+        await ensure_rollup_partitions(session)
+        stats = await refresh_changed_rollups(session)
+    if stats["users"]:
+        logger.info("Glucose rollups refreshed: %s", stats)
+
+
+async def run_glucose_rollup() -> None:
+    await jobs_state.run_job("glucose_rollup", _run_glucose_rollup_task)
+
+
+async def _run_daily_totals_rebuild_task() -> None:
+    from app.core.db import SessionLocal
+    from app.services.daily_totals_service import rebuild_recent_daily_totals
+
+    async with SessionLocal() as session:
+        stats = await rebuild_recent_daily_totals(session)
+    logger.info("Daily insulin totals rebuilt: %s", stats)
+
+
+async def run_daily_totals_rebuild() -> None:
+    await jobs_state.run_job("daily_totals_rebuild", _run_daily_totals_rebuild_task)
+
+
 async def _run_nutrition_notification_outbox_task() -> None:
     from app.bot.service import deliver_nutrition_notification
     from app.core.db import get_session_factory
@@ -416,6 +505,21 @@ def setup_periodic_tasks():
     schedule_task(run_glucose_sync, glucose_sync_trigger, "glucose_sync")
     jobs_state.refresh_next_run("glucose_sync")
 
+    # Keeps /glucose/history servable from the local table without waiting on Nightscout.
+    glucose_backfill_trigger = CronTrigger(minute="1-59/2")
+    schedule_task(run_glucose_backfill, glucose_backfill_trigger, "glucose_backfill")
+    jobs_state.refresh_next_run("glucose_backfill")
+
+    # Long-range stats and charts read these instead of raw readings.
+    glucose_rollup_trigger = CronTrigger(minute="3-59/10")
+    schedule_task(run_glucose_rollup, glucose_rollup_trigger, "glucose_rollup")
+    jobs_state.refresh_next_run("glucose_rollup")
+
+    # Reconciles the incrementally maintained daily TDD rows.
+    daily_totals_trigger = CronTrigger(hour=3, minute=40)
+    schedule_task(run_daily_totals_rebuild, daily_totals_trigger, "daily_totals_rebuild")
+    jobs_state.refresh_next_run("daily_totals_rebuild")
+
     # Run at 07:00 AM every day
     trigger = CronTrigger(hour=7, minute=0)
     schedule_task(run_auto_night_scan, trigger, "auto_night_scan")
@@ -440,6 +544,10 @@ def setup_periodic_tasks():
     schedule_task(run_ml_training_snapshot, ml_training_trigger, "ml_training_snapshot")
     jobs_state.refresh_next_run("ml_training_snapshot")
 
+    # Mirror new ML snapshots to Parquet once an hour
+    schedule_task(run_ml_parquet_export, CronTrigger(minute=17), "ml_parquet_export")
+    jobs_state.refresh_next_run("ml_parquet_export")
+
     # Run Guardian Mode (Glucose Alert) every 5 mins
     from app.bot.service import run_glucose_monitor_job
     guardian_trigger = CronTrigger(minute='*/5')
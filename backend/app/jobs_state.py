@@ -17,7 +17,11 @@ JOB_KEYS_TO_SCHEDULER_IDS: dict[str, str] = {
     "data_cleanup": "data_cleanup",
     "combo_followup": "combo_followup",
     "ml_training_snapshot": "ml_training_snapshot",
+    "ml_parquet_export": "ml_parquet_export",
     "glucose_sync": "glucose_sync",
+    "glucose_backfill": "glucose_backfill",
+    "glucose_rollup": "glucose_rollup",
+    "daily_totals_rebuild": "daily_totals_rebuild",
 }
 
 
@@ -13,6 +13,13 @@ from .temp_mode import TempModeDB
 from .bot_leader_lock import BotLeaderLock
 from .companion import CompanionEpisode, CompanionPreference
 from .glucose_reading import GlucoseReadingDB
+from .glucose_rollup import (
+    GlucoseRollup5mDB,
+    GlucoseRollupDailyDB,
+    GlucoseRollupHourlyDB,
+    GlucoseRollupStateDB,
+)
+from .daily_totals import DailyInsulinTotalDB
 from .meal_session import MealSession, MealSessionEvent
 from .nutrition_notification_outbox import NutritionNotificationOutbox
 from .meal_coverage import MealCoverageState
@@ -21,3 +28,4 @@ from .imported_meal import ImportedMeal, ImportedMealSnapshot
 from .autosens import AutosensRun
 from .isf_run import IsfRun
 from .ml_store import MLModelStore
+from .ml_training import MLTrainingSnapshotDB
@@ -1,4 +1,4 @@
-from typing import Literal, Optional
+from typing import Annotated, Literal, Optional
 
 from pydantic import BaseModel, Field, ConfigDict, model_validator
 
@@ -45,6 +45,36 @@ class CalcSettings(BaseModel):
     model_config = ConfigDict(allow_inf_nan=False)
 
 
+class SweepExercise(BaseModel):
+    minutes: int = Field(default=0, ge=0, le=600)
+    intensity: Literal["low", "moderate", "high"] = "moderate"
+
+    model_config = ConfigDict(allow_inf_nan=False)
+
+
+# Upper bound on carbs x exercise x target cells evaluated in one request.
+MAX_SWEEP_CELLS = 10000
+
+
+class BolusSweepGrid(BaseModel):
+    """Variations evaluated against the same context as the main calculation.
+
+    An empty axis keeps the request's own value (carbs, exercise or target).
+    """
+    carbs_g: list[Annotated[float, Field(ge=0, le=500)]] = Field(default_factory=list, max_length=501)
+    exercise: list[SweepExercise] = Field(default_factory=list, max_length=12)
+    targets_mgdl: list[Annotated[float, Field(ge=60, le=250)]] = Field(default_factory=list, max_length=12)
+
+    @model_validator(mode="after")
+    def limit_cells(self):
+        cells = max(len(self.carbs_g), 1) * max(len(self.exercise), 1) * max(len(self.targets_mgdl), 1)
+        if cells > MAX_SWEEP_CELLS:
+            raise ValueError(f"sweep grid has {cells} cells; the limit is {MAX_SWEEP_CELLS}")
+        return self
+
+    model_config = ConfigDict(allow_inf_nan=False)
+
+
 class NightscoutConfigSimple(BaseModel):
     url: str
     token: Optional[str] = None
@@ -105,6 +135,9 @@ class BolusRequestV2(BaseModel):
     # Strategy Override
     strategy: Literal["auto", "normal"] = "auto"
 
+    # Optional dose-response table (e.g. a carb slider) computed in the same call
+    sweep: Optional[BolusSweepGrid] = None
+
     @model_validator(mode="before")
     @classmethod
     def reject_removed_iob_bypass(cls, value):
@@ -162,6 +195,24 @@ class BolusSuggestions(BaseModel):
 from app.models.iob import IOBInfo, COBInfo
 
 
+class BolusSweepTable(BaseModel):
+    """Doses over a sweep grid. Cell arrays are indexed ``[exercise][target][carbs]``."""
+    carbs_g: list[float]
+    exercise: list[SweepExercise]
+    targets_mgdl: list[float]
+    # Components that depend on a single axis: per carbs value / per target.
+    meal_u: list[float]
+    correction_u: list[float]
+    total_u: list[list[list[float]]]
+    upfront_u: list[list[list[float]]]
+    later_u: list[list[list[float]]]
+    duration_min: list[list[list[int]]]
+    # Reduced by the max IOB ceiling or the max bolus limit.
+    capped: list[list[list[bool]]]
+
+    model_config = ConfigDict(allow_inf_nan=False)
+
+
 class BolusResponseV2(BaseModel):
     ok: bool = True
     total_u: float = 0.0
@@ -191,5 +242,10 @@ class BolusResponseV2(BaseModel):
 
     clamped: bool = False
     assumptions: list[str] = Field(default_factory=list)
+    # Debug: wall time per context stage, in milliseconds.
+    timings_ms: dict[str, float] = Field(default_factory=dict)
+    # Debug: context parts served from the precomputed dosing context.
+    context_cached: list[str] = Field(default_factory=list)
+    sweep: Optional[BolusSweepTable] = None
 
     model_config = ConfigDict(allow_inf_nan=False)
@@ -0,0 +1,34 @@
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from sqlalchemy import Date, DateTime, Float, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.db import Base
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class DailyInsulinTotalDB(Base):
+    """Insulin and carbs per user and local calendar day.
+
+    Treatment writes update the row incrementally; the nightly job rebuilds
+    recent days from the raw tables and stamps ``rebuilt_at``. Rows without
+    it have never been reconciled and readers recompute those days.
+    """
+
+    __tablename__ = "daily_insulin_totals"
+
+    user_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    bolus_u: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    # Latest basal_dose entry effective that day; None when none was logged.
+    basal_u: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    carbs_g: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    treatments: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rebuilt_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, default=_utc_now, onupdate=_utc_now
+    )
@@ -28,6 +28,7 @@ class GlucoseReadingDB(Base):
         Index("ix_glucose_readings_user_measured", "user_id", "measured_at"),
         Index("ix_glucose_readings_user_source_measured", "user_id", "source", "measured_at"),
         Index("ix_glucose_readings_sync_status", "sync_status", "received_at"),
+        Index("ix_glucose_readings_updated_at", "updated_at"),
     )
 
     id: Mapped[str] = mapped_column(
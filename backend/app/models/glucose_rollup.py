@@ -0,0 +1,82 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import DateTime, Float, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.db import Base
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class GlucoseRollup5mDB(Base):
+    """One canonical sample per user and 5-minute slot, kept after raw rows expire.
+
+    On Postgres the table is range-partitioned by month on ``bucket_start``
+    (see the migration); the composite primary key carries the partition key.
+    """
+
+    __tablename__ = "glucose_rollup_5m"
+
+    user_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    glucose_mgdl: Mapped[int] = mapped_column(Integer, nullable=False)
+    source: Mapped[str] = mapped_column(String(40), nullable=False)
+    trend_arrow: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+
+class _GlucoseAggregateColumns:
+    """Additive aggregates: rows of any span can be combined without raw data.
+
+    Percentiles are the exception; they are exact for the row's own bucket.
+    """
+
+    samples: Mapped[int] = mapped_column(Integer, nullable=False)
+    sum_mgdl: Mapped[float] = mapped_column(Float, nullable=False)
+    sum_sq_mgdl: Mapped[float] = mapped_column(Float, nullable=False)
+    min_mgdl: Mapped[int] = mapped_column(Integer, nullable=False)
+    max_mgdl: Mapped[int] = mapped_column(Integer, nullable=False)
+    below_54: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    below_70: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    in_range: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    above_180: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    above_250: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    p10: Mapped[float] = mapped_column(Float, nullable=False)
+    p25: Mapped[float] = mapped_column(Float, nullable=False)
+    p50: Mapped[float] = mapped_column(Float, nullable=False)
+    p75: Mapped[float] = mapped_column(Float, nullable=False)
+    p90: Mapped[float] = mapped_column(Float, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, default=_utc_now, onupdate=_utc_now
+    )
+
+
+class GlucoseRollupHourlyDB(_GlucoseAggregateColumns, Base):
+    """Aggregates of the 5-minute series per UTC hour."""
+
+    __tablename__ = "glucose_rollup_hourly"
+
+    user_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+
+
+class GlucoseRollupDailyDB(_GlucoseAggregateColumns, Base):
+    """Aggregates of the 5-minute series per UTC day."""
+
+    __tablename__ = "glucose_rollup_daily"
+
+    user_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+
+
+class GlucoseRollupStateDB(Base):
+    """Raw-row ``updated_at`` watermark up to which rollups are current."""
+
+    __tablename__ = "glucose_rollup_state"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    cursor: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, default=_utc_now, onupdate=_utc_now
+    )
@@ -0,0 +1,63 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.db import Base
+
+
+class MLTrainingSnapshotDB(Base):
+    """One ML feature snapshot per user and 5-minute slot (naive UTC).
+
+    Rows are written once by the snapshot job. The ``actual_bg_{h}m`` late
+    fields are empty on insert and filled by a batched backfill once the
+    horizon has passed and the reading has been ingested.
+    """
+
+    __tablename__ = "ml_training_data_v2"
+
+    feature_time: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    bg_mgdl: Mapped[Optional[float]] = mapped_column(Float)
+    trend: Mapped[Optional[str]] = mapped_column(String)
+    bg_age_min: Mapped[Optional[float]] = mapped_column(Float)
+    iob_u: Mapped[Optional[float]] = mapped_column(Float)
+    cob_g: Mapped[Optional[float]] = mapped_column(Float)
+    iob_status: Mapped[Optional[str]] = mapped_column(String)
+    cob_status: Mapped[Optional[str]] = mapped_column(String)
+    basal_active_u: Mapped[Optional[float]] = mapped_column(Float)
+    basal_latest_u: Mapped[Optional[float]] = mapped_column(Float)
+    basal_latest_age_min: Mapped[Optional[float]] = mapped_column(Float)
+    basal_total_24h: Mapped[Optional[float]] = mapped_column(Float)
+    basal_total_48h: Mapped[Optional[float]] = mapped_column(Float)
+    bolus_total_3h: Mapped[Optional[float]] = mapped_column(Float)
+    bolus_total_6h: Mapped[Optional[float]] = mapped_column(Float)
+    carbs_total_3h: Mapped[Optional[float]] = mapped_column(Float)
+    carbs_total_6h: Mapped[Optional[float]] = mapped_column(Float)
+    exercise_minutes_6h: Mapped[Optional[float]] = mapped_column(Float)
+    exercise_minutes_24h: Mapped[Optional[float]] = mapped_column(Float)
+    baseline_bg_30m: Mapped[Optional[float]] = mapped_column(Float)
+    baseline_bg_60m: Mapped[Optional[float]] = mapped_column(Float)
+    baseline_bg_120m: Mapped[Optional[float]] = mapped_column(Float)
+    baseline_bg_240m: Mapped[Optional[float]] = mapped_column(Float)
+    baseline_bg_360m: Mapped[Optional[float]] = mapped_column(Float)
+    active_params: Mapped[Optional[str]] = mapped_column(Text)
+    event_counts: Mapped[Optional[str]] = mapped_column(Text)
+    source_ns_enabled: Mapped[Optional[bool]] = mapped_column(Boolean)
+    source_ns_treatments_count: Mapped[Optional[int]] = mapped_column(Integer)
+    source_db_treatments_count: Mapped[Optional[int]] = mapped_column(Integer)
+    source_overlap_count: Mapped[Optional[int]] = mapped_column(Integer)
+    source_conflict_count: Mapped[Optional[int]] = mapped_column(Integer)
+    source_consistency_status: Mapped[Optional[str]] = mapped_column(String)
+    flag_bg_missing: Mapped[Optional[bool]] = mapped_column(Boolean)
+    flag_bg_stale: Mapped[Optional[bool]] = mapped_column(Boolean)
+    flag_iob_unavailable: Mapped[Optional[bool]] = mapped_column(Boolean)
+    flag_cob_unavailable: Mapped[Optional[bool]] = mapped_column(Boolean)
+    flag_source_conflict: Mapped[Optional[bool]] = mapped_column(Boolean)
+    # Late fields: measured BG at feature_time + h
+    actual_bg_30m: Mapped[Optional[float]] = mapped_column(Float)
+    actual_bg_60m: Mapped[Optional[float]] = mapped_column(Float)
+    actual_bg_120m: Mapped[Optional[float]] = mapped_column(Float)
+    actual_bg_240m: Mapped[Optional[float]] = mapped_column(Float)
+    actual_bg_360m: Mapped[Optional[float]] = mapped_column(Float)
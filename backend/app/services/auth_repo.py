@@ -6,6 +6,7 @@ from typing import Optional, Dict, Any
 from sqlalchemy import text
 from app.core.db import get_engine
 from app.core.security import hash_password
+from app.services.daily_totals_service import mark_user_unreconciled
 
 logger = logging.getLogger(__name__)
 
@@ -188,7 +189,8 @@ async def rename_user(old_username: str, new_username: str) -> bool:
                 "basal_checkin", 
                 "basal_night_summary", 
                 "basal_advice_daily", 
-                "basal_change_evaluation"
+                "basal_change_evaluation",
+                "daily_insulin_totals",
             ]
             
             for t in tables:
@@ -197,7 +199,11 @@ async def rename_user(old_username: str, new_username: str) -> bool:
                 except Exception:
                     # Table might not exist yet? Ignore.
                     pass
-                    
+
+            # The moved totals were built for the old account (timezone
+            # included); recompute them from the moved treatments.
+            await conn.run_sync(mark_user_unreconciled, new_username)
+
             return True
         except Exception as e:
             logger.error(f"Rename user failed: {e}")
@@ -7,6 +7,7 @@ from sqlalchemy import select, and_, desc, func
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from app.models.basal import BasalEntry, BasalCheckin, BasalNightSummary, BasalAdviceDaily, BasalChangeEvaluation
+from app.services.cgm_series import CGMSeriesRepository
 from app.services.nightscout_client import NightscoutClient
 
 logger = logging.getLogger(__name__)
@@ -37,7 +38,7 @@ async def upsert_checkin_service(user_id: str, checkin_date: date, bg: float, tr
     await db.commit()
     return {"status": "ok"}
 
-async def scan_night_service(user_id: str, target_date: date, client: NightscoutClient, db: AsyncSession, write_enabled: bool = False):
+async def scan_night_service(user_id: str, target_date: date, client: Optional[NightscoutClient], db: AsyncSession, write_enabled: bool = False):
     # Window: 00:00 - 06:00 of target_date local time? 
     # Night of X usually means X evening to X+1 morning.
     # User said: "00:00–06:00 local".
@@ -55,8 +56,10 @@ async def scan_night_service(user_id: str, target_date: date, client: Nightscout
     start_dt = datetime.combine(target_date, time(0, 0))
     end_dt = datetime.combine(target_date, time(6, 0))
     
-    # Fetch entries from NS
-    entries = await client.get_sgv_range(start_dt, end_dt, count=288)
+    # Local CGM series first; Nightscout only when the night was never ingested.
+    entries = (await CGMSeriesRepository(db, user_id).load(start_dt, end_dt)).points
+    if not entries and client:
+        entries = await client.get_sgv_range(start_dt, end_dt, count=288)
     
     if not entries:
         # Maybe store empty summary?
@@ -3,6 +3,7 @@ from datetime import datetime, date, timedelta
 from typing import List, Optional, Dict, Any
 from sqlalchemy import text
 from app.core.db import get_engine
+from app.services.daily_totals_service import refresh_basal_days
 import logging
 
 logger = logging.getLogger(__name__)
@@ -103,6 +104,7 @@ async def upsert_basal_dose(user_id: str, dose_u: float, effective_from: date =
         async with get_engine().begin() as conn:
             result = await conn.execute(query, params)
             row = result.fetchone()
+            await conn.run_sync(refresh_basal_days, [(user_id, effective_from)])
             if row:
                 return dict(row._mapping)
     else:
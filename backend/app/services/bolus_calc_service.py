@@ -1,26 +1,33 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
-from typing import Optional
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Optional
 
 from fastapi import HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
 from app.core.security import CurrentUser
 from app.models.bolus_v2 import BolusRequestV2, BolusResponseV2, GlucoseUsed
-from app.models.iob import SourceStatus
+from app.models.iob import COBInfo, IOBInfo, SourceStatus
 from app.models.settings import UserSettings
 from app.services.autosens_service import AutosensService
 from app.services.autosens_hybrid import (
     build_compression_config,
     combine_hybrid_autosens,
 )
-from app.services.bolus_engine import calculate_bolus_v2
+from app.services.bolus_engine import calculate_bolus_v2, sweep_bolus_v2
+from app.services.dosing_context import contexts, settings_fingerprint
+from app.services.dynamic_isf_service import DynamicISFService
 from app.services import iob as iob_service
 from app.services.nightscout_client import NightscoutClient
 from app.services.nightscout_secrets_service import get_ns_config
-from app.services.glucose_source_service import resolve_current_glucose
+from app.services.glucose_source_service import ResolvedGlucose, resolve_current_glucose
 from app.services.store import DataStore
 
 logger = logging.getLogger(__name__)
@@ -34,6 +41,388 @@ async def compute_cob_from_sources(*args, **kwargs):
     return await iob_service.compute_cob_from_sources(*args, **kwargs)
 
 
+# Overall budget for gathering the dosing context (glucose, autosens, IOB,
+# COB). A stage still running at the deadline is cancelled and treated as
+# unavailable, which routes the request through the usual safety paths.
+BOLUS_CONTEXT_DEADLINE_SECONDS = 8.0
+
+
+def _elapsed_ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 1)
+
+
+@dataclass
+class _GlucoseContext:
+    resolved_bg: Optional[float]
+    bg_source: str
+    status: SourceStatus
+    bg_trend: Optional[str] = None
+    bg_age_minutes: Optional[float] = None
+    bg_is_stale: bool = False
+    compression_flag: bool = False
+    compression_reason: Optional[str] = None
+
+    @classmethod
+    def initial(cls, bg_mgdl: Optional[float]) -> "_GlucoseContext":
+        source = "manual" if bg_mgdl is not None else "none"
+        return cls(
+            resolved_bg=bg_mgdl,
+            bg_source=source,
+            status=SourceStatus(
+                source=source,
+                status="ok" if bg_mgdl is not None else "unavailable",
+                fetched_at=datetime.now(timezone.utc),
+            ),
+        )
+
+
+def _context_fingerprints(
+    user_settings: UserSettings, ns_config, store: DataStore
+) -> dict[str, str]:
+    sources = (str(store.data_dir), ns_config.url if ns_config.enabled else None)
+    return {
+        "glucose": settings_fingerprint(user_settings.glucose_sources.model_dump(), *sources),
+        "autosens": settings_fingerprint(user_settings.model_dump(mode="json")),
+        "iob": settings_fingerprint(user_settings.iob.dia_hours, *sources),
+        "cob": settings_fingerprint(*sources),
+    }
+
+
+def _cacheable(name: str, value: Any) -> bool:
+    """Only clean results are kept; failures are always retried live."""
+    if name == "glucose":
+        return value.status == "ok" and value.usable_for_dosing and value.measured_at is not None
+    if name == "iob":
+        return not (value.db_error or value.local_error or value.ns_error)
+    if name == "autosens":
+        return not (value[1] or "").startswith(("Error", "Timeout"))
+    return True
+
+
+class _ContextCache:
+    """The parts of a user's warm dosing context one calculation may use.
+
+    Disabled for requests that bring their own settings or Nightscout
+    credentials: their inputs differ from the user's stored configuration.
+    """
+
+    def __init__(
+        self,
+        username: str,
+        user_settings: UserSettings,
+        ns_config,
+        store: DataStore,
+        *,
+        enabled: bool,
+        now: datetime,
+    ):
+        self.username = username
+        self.now = now
+        self.max_age_minutes = user_settings.glucose_sources.max_age_minutes
+        self.fingerprints = (
+            _context_fingerprints(user_settings, ns_config, store) if enabled else {}
+        )
+        # Captured before anything is loaded, see ``DosingContext.epochs``.
+        self.epochs = {name: contexts.epoch(username, name) for name in self.fingerprints}
+        self.hits: list[str] = []
+
+    def get(self, name: str) -> Any:
+        fingerprint = self.fingerprints.get(name)
+        part = contexts.fresh(self.username, name, fingerprint, now=self.now) if fingerprint else None
+        if part is None:
+            return None
+        value = part.value
+        if name == "glucose":
+            # Re-age the reading; past the freshness limit it is resolved live.
+            measured_at = value.measured_at
+            if measured_at.tzinfo is None:
+                measured_at = measured_at.replace(tzinfo=timezone.utc)
+            age = max(0.0, (self.now - measured_at).total_seconds() / 60.0)
+            if age > self.max_age_minutes:
+                return None
+            value = replace(value, age_minutes=age)
+        self.hits.append(name)
+        return value
+
+    def remember(self, name: str, value: Any) -> None:
+        fingerprint = self.fingerprints.get(name)
+        if fingerprint is None or value is None or not _cacheable(name, value):
+            return
+        contexts.put(
+            self.username,
+            name,
+            value,
+            fingerprint,
+            epoch=self.epochs[name],
+            computed_at=self.now,
+        )
+
+
+@asynccontextmanager
+async def _stage_session(session, db_lock: asyncio.Lock) -> AsyncIterator:
+    """Session for a context stage running alongside the others.
+
+    A session bound to an engine gets a sibling session of its own; anything
+    else is shared, with ``db_lock`` serializing the stages that use it.
+    """
+    bind = getattr(session, "bind", None)
+    if isinstance(bind, AsyncEngine):
+        async with AsyncSession(bind, expire_on_commit=False) as own:
+            yield own
+    else:
+        async with db_lock:
+            yield session
+
+
+async def _resolve_glucose(
+    payload: BolusRequestV2,
+    session,
+    user: CurrentUser,
+    user_settings: UserSettings,
+    ns_client: Optional[NightscoutClient],
+    db_lock: asyncio.Lock,
+    cache: _ContextCache,
+) -> _GlucoseContext:
+    """Manual override vs unified source resolver."""
+    ctx = _GlucoseContext.initial(payload.bg_mgdl)
+    glucose_status = ctx.status
+
+    if ctx.resolved_bg is None and session:
+        try:
+            selected: Optional[ResolvedGlucose] = cache.get("glucose")
+            if selected is None:
+                async with db_lock:
+                    selected = await resolve_current_glucose(
+                        session,
+                        user.username,
+                        user_settings=user_settings,
+                        refresh_remote=True,
+                    )
+                cache.remember("glucose", selected)
+            ctx.bg_source = selected.source
+            ctx.bg_trend = selected.trend
+            ctx.bg_age_minutes = selected.age_minutes
+            ctx.bg_is_stale = selected.status == "stale"
+            ctx.compression_flag = selected.is_compression
+            ctx.compression_reason = selected.compression_reason
+            glucose_status.source = selected.source
+            glucose_status.status = selected.status
+            if selected.is_compression:
+                glucose_status.reason = "compression_suspected"
+            elif selected.status == "conflict":
+                glucose_status.reason = "source_conflict"
+            elif not selected.usable_for_dosing and selected.bg_mgdl is not None:
+                glucose_status.reason = "reading_not_usable_for_dosing"
+
+            # Never feed stale, historical, uncertain or conflicting automatic
+            # glucose into the correction component.
+            ctx.resolved_bg = selected.bg_mgdl if selected.usable_for_dosing else None
+        except Exception as e:
+            logger.error("Unified glucose resolution failed in calc: %s", e)
+            ctx = _GlucoseContext.initial(None)
+            glucose_status = ctx.status
+    if ctx.resolved_bg is None and ctx.bg_source == "none" and ns_client is not None:
+        # Compatibility for request-scoped Nightscout credentials that are not
+        # stored in the encrypted user table. Apply the same freshness gate.
+        try:
+            sgv = await ns_client.get_latest_sgv()
+            measured_at = datetime.fromtimestamp(sgv.date / 1000, tz=timezone.utc)
+            ctx.bg_age_minutes = max(
+                0.0,
+                (datetime.now(timezone.utc) - measured_at).total_seconds() / 60.0,
+            )
+            ctx.bg_source = "nightscout"
+            ctx.bg_trend = sgv.direction
+            ctx.bg_is_stale = ctx.bg_age_minutes > user_settings.glucose_sources.max_age_minutes
+            glucose_status.source = ctx.bg_source
+            glucose_status.status = "stale" if ctx.bg_is_stale else "ok"
+            ctx.resolved_bg = None if ctx.bg_is_stale else float(sgv.sgv)
+        except Exception as exc:
+            logger.error("Stateless Nightscout glucose fallback failed: %s", exc)
+            glucose_status.status = "unavailable"
+    return ctx
+
+
+async def _resolve_autosens(
+    session,
+    username: str,
+    user_settings: UserSettings,
+    db_lock: asyncio.Lock,
+    persist_autosens_run: bool,
+    timings: dict[str, float],
+) -> tuple[float, Optional[str]]:
+    """Hybrid autosens ratio: TDD-based dynamic ISF combined with local autosens."""
+    try:
+        async def tdd_stage():
+            started = time.perf_counter()
+            try:
+                async with _stage_session(session, db_lock) as tdd_session:
+                    # Get TDD ratio with debug info
+                    return await DynamicISFService.calculate_dynamic_ratio(
+                        username=username,
+                        session=tdd_session,
+                        settings=user_settings,
+                        return_debug=True,
+                    )
+            finally:
+                timings["dynamic_isf"] = _elapsed_ms(started)
+
+        compression_config = build_compression_config(user_settings)
+
+        async def local_stage():
+            started = time.perf_counter()
+            try:
+                async with _stage_session(session, db_lock) as local_session:
+                    return await AutosensService.calculate_autosens(
+                        username=username,
+                        session=local_session,
+                        settings=user_settings,
+                        record_run=persist_autosens_run,
+                        compression_config=compression_config,
+                    )
+            finally:
+                timings["autosens_local"] = _elapsed_ms(started)
+
+        tdd_result, res = await asyncio.gather(
+            tdd_stage(), local_stage(), return_exceptions=True
+        )
+        if isinstance(tdd_result, BaseException):
+            raise tdd_result
+
+        # Handle both return types (with or without debug)
+        if isinstance(tdd_result, tuple):
+            tdd_ratio, tdd_debug = tdd_result
+        else:
+            tdd_ratio = tdd_result
+            tdd_debug = None
+
+        local_ratio = 1.0
+        local_reason_flags = []
+        local_error = None
+        if isinstance(res, BaseException):
+            local_error = f"{type(res).__name__}: {res}"
+            logger.error(
+                "Local Autosens failed; neutralizing hybrid dynamic dosing",
+                exc_info=res,
+            )
+        else:
+            local_ratio = res.ratio
+            local_reason_flags = list(res.reason_flags or [])
+
+        decision = combine_hybrid_autosens(
+            tdd_ratio=tdd_ratio,
+            local_ratio=local_ratio,
+            min_ratio=user_settings.autosens.min_ratio,
+            max_ratio=user_settings.autosens.max_ratio,
+            local_reason_flags=local_reason_flags,
+            local_error=local_error,
+        )
+        raw_hybrid = decision.raw_ratio
+        autosens_ratio = decision.ratio
+        autosens_reason = decision.reason
+
+        # Add debug info if available
+        if tdd_debug:
+            autosens_reason += (
+                f" [TDD: Recent={tdd_debug.recent_tdd:.1f}U, "
+                f"Base={tdd_debug.baseline_tdd:.1f}U, "
+                f"Basal src={tdd_debug.basal_source}]"
+            )
+
+        logger.info(
+            "Hybrid Autosens: ratio=%.2f (raw=%.3f), TDD=%.2f, Local=%.2f",
+            autosens_ratio, raw_hybrid, tdd_ratio, local_ratio
+        )
+        return autosens_ratio, autosens_reason
+    except Exception as e:
+        logger.error(f"Hybrid Autosens failed: {e}")
+        return 1.0, "Error (usando 1.0)"
+
+
+async def _timed(name: str, stage: Awaitable, timings: dict[str, float]) -> Any:
+    started = time.perf_counter()
+    try:
+        return await stage
+    finally:
+        timings[name] = _elapsed_ms(started)
+
+
+async def _gather_with_deadline(
+    stages: dict[str, Awaitable], timeout: float, timings: dict[str, float]
+) -> tuple[dict[str, Any], list[str]]:
+    """Run ``stages`` concurrently; returns their results and the names that
+    missed the deadline. Errors raised by a stage propagate to the caller."""
+    started = time.perf_counter()
+    tasks = {
+        name: asyncio.ensure_future(_timed(name, stage, timings))
+        for name, stage in stages.items()
+    }
+    try:
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=max(timeout, 0.0))
+    finally:
+        pending = [task for task in tasks.values() if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        timings["context"] = _elapsed_ms(started)
+
+    results: dict[str, Any] = {}
+    timed_out: list[str] = []
+    for name, task in tasks.items():
+        if task in pending:
+            timed_out.append(name)
+        else:
+            results[name] = task.result()
+    return results, timed_out
+
+
+async def _load_stored_settings(
+    username: str, session: Optional[AsyncSession], store: DataStore
+) -> UserSettings:
+    from app.services.settings_service import get_user_settings_service
+
+    user_settings = None
+    if session:
+        try:
+            data = await get_user_settings_service(username, session)
+            if data and data.get("settings"):
+                user_settings = UserSettings.migrate(data["settings"])
+        except Exception as e:
+            logger.warning(f"Failed to load settings from DB for bolus: {e}")
+
+    if user_settings:
+        invalid_limits = (
+            user_settings.max_bolus_u <= 0
+            or user_settings.max_correction_u < 0
+            or user_settings.round_step_u < 0
+        )
+        invalid_ratios = any(
+            getattr(user_settings.cr, slot, 0) <= 0
+            for slot in ("breakfast", "lunch", "dinner", "snack")
+        )
+        if invalid_limits or invalid_ratios:
+            logger.warning("Invalid settings from DB for bolus; using stored defaults.")
+            user_settings = None
+
+    if not user_settings:
+        user_settings = store.load_settings()
+    return user_settings
+
+
+async def _inject_stored_ns_config(ns_config, session: AsyncSession, username: str) -> None:
+    try:
+        db_ns_config = await get_ns_config(session, username)
+        if db_ns_config and db_ns_config.enabled and db_ns_config.url:
+            ns_config.enabled = True
+            ns_config.url = db_ns_config.url
+            ns_config.token = db_ns_config.api_secret
+            logger.debug("Injected Nightscout config from DB for calculation.")
+    except Exception as e:
+        logger.warning(f"Failed to fetch NS config from DB: {e}")
+
+
 async def calculate_bolus_stateless_service(
     payload: BolusRequestV2,
     *,
@@ -43,7 +432,11 @@ async def calculate_bolus_stateless_service(
     persist_autosens_run: bool = True,
     persist_iob_cache: bool = True,
 ) -> BolusResponseV2:
+    started = time.perf_counter()
+    timings: dict[str, float] = {}
+
     # 1. Resolve Settings
+    stored_settings = not payload.settings and not payload.cr_g_per_u
     if payload.settings:
         from app.models.settings import (
             AutosensConfig,
@@ -168,40 +561,17 @@ async def calculate_bolus_stateless_service(
         )
 
     else:
-        from app.services.settings_service import get_user_settings_service
-
-        user_settings = None
-        if session:
-            try:
-                data = await get_user_settings_service(user.username, session)
-                if data and data.get("settings"):
-                    user_settings = UserSettings.migrate(data["settings"])
-            except Exception as e:
-                logger.warning(f"Failed to load settings from DB for bolus: {e}")
-
-        if user_settings:
-            invalid_limits = (
-                user_settings.max_bolus_u <= 0
-                or user_settings.max_correction_u < 0
-                or user_settings.round_step_u < 0
-            )
-            invalid_ratios = any(
-                getattr(user_settings.cr, slot, 0) <= 0
-                for slot in ("breakfast", "lunch", "dinner", "snack")
-            )
-            if invalid_limits or invalid_ratios:
-                logger.warning("Invalid settings from DB for bolus; using stored defaults.")
-                user_settings = None
-
-        if not user_settings:
-            user_settings = store.load_settings()
+        user_settings = await _load_stored_settings(user.username, session, store)
 
     # A per-request Autosens flag is an explicit override only. If omitted,
     # preserve the user's authoritative saved backend configuration.
     if payload.enable_autosens is not None:
         user_settings.autosens.enabled = payload.enable_autosens
 
+    timings["settings"] = _elapsed_ms(started)
+
     # 2. Resolve Nightscout Client
+    stage_started = time.perf_counter()
     ns_client: Optional[NightscoutClient] = None
     ns_config = user_settings.nightscout
 
@@ -210,191 +580,125 @@ async def calculate_bolus_stateless_service(
         ns_config.url = payload.nightscout.url
         ns_config.token = payload.nightscout.token
     elif session:
-        try:
-            db_ns_config = await get_ns_config(session, user.username)
-            if db_ns_config and db_ns_config.enabled and db_ns_config.url:
-                ns_config.enabled = True
-                ns_config.url = db_ns_config.url
-                ns_config.token = db_ns_config.api_secret
-                logger.debug("Injected Nightscout config from DB for calculation.")
-        except Exception as e:
-            logger.warning(f"Failed to fetch NS config from DB: {e}")
+        await _inject_stored_ns_config(ns_config, session, user.username)
 
-    # 3. Resolve Glucose (manual override vs unified source resolver)
-    resolved_bg: Optional[float] = payload.bg_mgdl
-    reported_bg: Optional[float] = resolved_bg
-    bg_source = "manual" if resolved_bg is not None else "none"
-    bg_trend: Optional[str] = None
-    bg_age_minutes: Optional[float] = None
-    bg_is_stale: bool = False
-    compression_flag = False
-    compression_reason = None
-    glucose_status = SourceStatus(
-        source=bg_source,
-        status="ok" if resolved_bg is not None else "unavailable",
-        fetched_at=datetime.now(timezone.utc),
-    )
-
-    if resolved_bg is None and session:
-        try:
-            selected = await resolve_current_glucose(
-                session,
-                user.username,
-                user_settings=user_settings,
-                refresh_remote=True,
-            )
-            bg_source = selected.source
-            bg_trend = selected.trend
-            bg_age_minutes = selected.age_minutes
-            bg_is_stale = selected.status == "stale"
-            compression_flag = selected.is_compression
-            compression_reason = selected.compression_reason
-            glucose_status.source = selected.source
-            glucose_status.status = selected.status
-            if selected.is_compression:
-                glucose_status.reason = "compression_suspected"
-            elif selected.status == "conflict":
-                glucose_status.reason = "source_conflict"
-            elif not selected.usable_for_dosing and selected.bg_mgdl is not None:
-                glucose_status.reason = "reading_not_usable_for_dosing"
+    timings["nightscout_config"] = _elapsed_ms(stage_started)
 
-            # Never feed stale, historical, uncertain or conflicting automatic
-            # glucose into the correction component.
-            reported_bg = selected.bg_mgdl
-            resolved_bg = selected.bg_mgdl if selected.usable_for_dosing else None
-        except Exception as e:
-            logger.error("Unified glucose resolution failed in calc: %s", e)
-            resolved_bg = None
-            bg_source = "none"
-            bg_trend = None
-            bg_age_minutes = None
-            bg_is_stale = False
-            glucose_status.source = "none"
-            glucose_status.status = "unavailable"
-    if resolved_bg is None and bg_source == "none" and ns_config.enabled and ns_config.url:
-        # Compatibility for request-scoped Nightscout credentials that are not
-        # stored in the encrypted user table. Apply the same freshness gate.
-        try:
-            ns_client = NightscoutClient(
-                base_url=ns_config.url,
-                token=ns_config.token,
-                timeout_seconds=5,
-            )
-            sgv = await ns_client.get_latest_sgv()
-            reported_bg = float(sgv.sgv)
-            measured_at = datetime.fromtimestamp(sgv.date / 1000, tz=timezone.utc)
-            bg_age_minutes = max(
-                0.0,
-                (datetime.now(timezone.utc) - measured_at).total_seconds() / 60.0,
-            )
-            bg_source = "nightscout"
-            bg_trend = sgv.direction
-            bg_is_stale = bg_age_minutes > user_settings.glucose_sources.max_age_minutes
-            glucose_status.source = bg_source
-            glucose_status.status = "stale" if bg_is_stale else "ok"
-            resolved_bg = None if bg_is_stale else float(sgv.sgv)
-        except Exception as exc:
-            logger.error("Stateless Nightscout glucose fallback failed: %s", exc)
-            glucose_status.status = "unavailable"
-
-    if ns_client is None and ns_config.enabled and ns_config.url:
+    # 3. Gather the dosing context. Glucose, autosens, IOB and COB do not
+    # depend on each other, so they run concurrently under one deadline.
+    if ns_config.enabled and ns_config.url:
         ns_client = NightscoutClient(
             base_url=ns_config.url,
             token=ns_config.token,
             timeout_seconds=5,
         )
 
-    autosens_ratio = 1.0
-    autosens_reason = None
-
-    should_run_autosens = user_settings.autosens.enabled
-
-    if should_run_autosens and session:
-        try:
-            from app.services.dynamic_isf_service import DynamicISFService, TDDDebugInfo
-
-            # Get TDD ratio with debug info
-            tdd_result = await DynamicISFService.calculate_dynamic_ratio(
-                username=user.username,
-                session=session,
-                settings=user_settings,
-                return_debug=True,
-            )
-
-            # Handle both return types (with or without debug)
-            if isinstance(tdd_result, tuple):
-                tdd_ratio, tdd_debug = tdd_result
-            else:
-                tdd_ratio = tdd_result
-                tdd_debug = None
+    try:
+        now = datetime.now(timezone.utc)
+        db_lock = asyncio.Lock()
+        # Parts of the user's warm dosing context that are still fresh are
+        # reused; only the rest is loaded (and stored for the next request).
+        use_context = stored_settings and session is not None and not payload.nightscout
+        if use_context:
+            contexts.touch(user.username)
+        cache = _ContextCache(
+            user.username, user_settings, ns_config, store, enabled=use_context, now=now
+        )
 
-            compression_config = build_compression_config(user_settings)
-            local_ratio = 1.0
-            local_reason_flags = []
-            local_error = None
-            try:
-                res = await AutosensService.calculate_autosens(
-                    username=user.username,
-                    session=session,
-                    settings=user_settings,
-                    record_run=persist_autosens_run,
-                    compression_config=compression_config,
-                )
-                local_ratio = res.ratio
-                local_reason_flags = list(res.reason_flags or [])
-            except Exception as exc:
-                local_error = f"{type(exc).__name__}: {exc}"
-                logger.exception(
-                    "Local Autosens failed; neutralizing hybrid dynamic dosing"
+        async def iob_stage():
+            sources = None
+            if use_context:
+                # Only the local part is kept warm; Nightscout is read each time.
+                sources = cache.get("iob")
+                if sources is None:
+                    sources = await iob_service.load_iob_sources(
+                        now=now,
+                        settings=user_settings,
+                        nightscout_client=None,
+                        data_store=store,
+                        user_id=user.username,
+                    )
+                    cache.remember("iob", sources)
+                sources = await iob_service.with_nightscout_boluses(
+                    sources, user_settings, ns_client
                 )
-
-            decision = combine_hybrid_autosens(
-                tdd_ratio=tdd_ratio,
-                local_ratio=local_ratio,
-                min_ratio=user_settings.autosens.min_ratio,
-                max_ratio=user_settings.autosens.max_ratio,
-                local_reason_flags=local_reason_flags,
-                local_error=local_error,
+            return await compute_iob_from_sources(
+                now,
+                user_settings,
+                ns_client,
+                store,
+                user_id=user.username,
+                persist_cache=persist_iob_cache,
+                sources=sources,
             )
-            raw_hybrid = decision.raw_ratio
-            autosens_ratio = decision.ratio
-            autosens_reason = decision.reason
-
-            # Add debug info if available
-            if tdd_debug:
-                autosens_reason += (
-                    f" [TDD: Recent={tdd_debug.recent_tdd:.1f}U, "
-                    f"Base={tdd_debug.baseline_tdd:.1f}U, "
-                    f"Basal src={tdd_debug.basal_source}]"
-                )
 
-            logger.info(
-                "Hybrid Autosens: ratio=%.2f (raw=%.3f), TDD=%.2f, Local=%.2f",
-                autosens_ratio, raw_hybrid, tdd_ratio, local_ratio
+        async def cob_stage():
+            sources = cache.get("cob") if use_context else None
+            if use_context and sources is None:
+                sources = await iob_service.load_cob_sources(now, store, user.username)
+                cache.remember("cob", sources)
+            return await compute_cob_from_sources(
+                now,
+                ns_client,
+                store,
+                extra_entries=None,
+                user_id=user.username,
+                sources=sources,
             )
-        except Exception as e:
-            logger.error(f"Hybrid Autosens failed: {e}")
-            autosens_reason = "Error (usando 1.0)"
 
-    try:
-        now = datetime.now(timezone.utc)
-        iob_u, breakdown, iob_info, iob_warning = await compute_iob_from_sources(
-            now,
-            user_settings,
-            ns_client,
-            store,
-            user_id=user.username,
-            persist_cache=persist_iob_cache,
-        )
-        cob_total, cob_info, cob_source_status = await compute_cob_from_sources(
-            now,
-            ns_client,
-            store,
-            extra_entries=None,
-            user_id=user.username,
+        stages: dict[str, Awaitable] = {"iob": iob_stage(), "cob": cob_stage()}
+        if payload.bg_mgdl is None:
+            stages["glucose"] = _resolve_glucose(
+                payload, session, user, user_settings, ns_client, db_lock, cache
+            )
+        cached_autosens = None
+        if user_settings.autosens.enabled and session:
+            cached_autosens = cache.get("autosens")
+            if cached_autosens is None:
+                stages["autosens"] = _resolve_autosens(
+                    session, user.username, user_settings, db_lock, persist_autosens_run, timings
+                )
+        context, timed_out = await _gather_with_deadline(
+            stages, BOLUS_CONTEXT_DEADLINE_SECONDS - (time.perf_counter() - started), timings
         )
+        if "autosens" in context:
+            cache.remember("autosens", context["autosens"])
+        if timed_out:
+            logger.warning("Bolus context stages missed the deadline: %s", ", ".join(timed_out))
+
+        glucose = context.get("glucose") or _GlucoseContext.initial(payload.bg_mgdl)
+        if "glucose" in timed_out:
+            glucose.status.reason = "timeout"
+        resolved_bg = glucose.resolved_bg
+        bg_source = glucose.bg_source
+        bg_trend = glucose.bg_trend
+        bg_age_minutes = glucose.bg_age_minutes
+        bg_is_stale = glucose.bg_is_stale
+        compression_flag = glucose.compression_flag
+        compression_reason = glucose.compression_reason
+        glucose_status = glucose.status
+
+        autosens_ratio, autosens_reason = context.get("autosens") or cached_autosens or (1.0, None)
+        if "autosens" in timed_out:
+            autosens_reason = "Timeout (usando 1.0)"
+
+        if "iob" in timed_out:
+            context["iob"] = (
+                None,
+                [],
+                IOBInfo(status="unavailable", reason="timeout", fetched_at=now),
+                None,
+            )
+        iob_u, breakdown, iob_info, iob_warning = context["iob"]
+        if "cob" in timed_out:
+            context["cob"] = (
+                None,
+                COBInfo(status="unavailable", reason="timeout", fetched_at=now),
+                SourceStatus(status="unavailable", reason="timeout", fetched_at=now),
+            )
+        cob_total, cob_info, cob_source_status = context["cob"]
         iob_info.glucose_source_status = glucose_status
-        assumptions: list[str] = []
+        assumptions: list[str] = [f"{name.upper()}_CONTEXT_TIMEOUT" for name in timed_out]
 
         if iob_info.status == "unavailable" and not payload.confirm_iob_unknown:
             raise HTTPException(
@@ -499,6 +803,7 @@ async def calculate_bolus_stateless_service(
             is_stale=bg_is_stale,
         )
 
+        stage_started = time.perf_counter()
         response = calculate_bolus_v2(
             request=payload,
             settings=user_settings,
@@ -507,6 +812,19 @@ async def calculate_bolus_stateless_service(
             autosens_ratio=autosens_ratio,
             autosens_reason=autosens_reason,
         )
+        timings["engine"] = _elapsed_ms(stage_started)
+        if payload.sweep is not None:
+            stage_started = time.perf_counter()
+            response.sweep = sweep_bolus_v2(
+                request=payload,
+                settings=user_settings,
+                iob_u=iob_for_calc,
+                glucose_info=glucose_info,
+                grid=payload.sweep,
+                autosens_ratio=autosens_ratio,
+                autosens_reason=autosens_reason,
+            )
+            timings["sweep"] = _elapsed_ms(stage_started)
 
         response.iob = iob_info
         response.cob = cob_info
@@ -555,8 +873,69 @@ async def calculate_bolus_stateless_service(
                     f"    - {time_label}: {b['units']} U -> quedan {b['iob']:.2f} U"
                 )
 
+        timings["total"] = _elapsed_ms(started)
+        response.timings_ms = timings
+        response.context_cached = list(cache.hits)
         return response
 
     finally:
         if ns_client:
             await ns_client.aclose()
+
+
+async def refresh_dosing_context(user_id: str) -> None:
+    """Recompute the stale parts of ``user_id``'s dosing context.
+
+    Runs in the background after new readings or treatments are committed,
+    with the user's stored settings, so the next calculation finds them warm.
+    """
+    from app.core.db import SessionLocal
+    from app.core.settings import get_settings
+
+    store = DataStore(Path(get_settings().data.data_dir))
+    async with SessionLocal() as session:
+        user_settings = await _load_stored_settings(user_id, session, store)
+        ns_config = user_settings.nightscout
+        await _inject_stored_ns_config(ns_config, session, user_id)
+        now = datetime.now(timezone.utc)
+        cache = _ContextCache(user_id, user_settings, ns_config, store, enabled=True, now=now)
+        stale = [name for name in cache.fingerprints if cache.get(name) is None]
+        if not user_settings.autosens.enabled and "autosens" in stale:
+            stale.remove("autosens")
+        if not stale:
+            return
+
+        db_lock = asyncio.Lock()
+
+        async def glucose_part():
+            # New readings were just committed locally; no remote poll.
+            async with db_lock:
+                return await resolve_current_glucose(
+                    session, user_id, user_settings=user_settings, refresh_remote=False
+                )
+
+        loaders = {
+            "glucose": glucose_part,
+            "autosens": lambda: _resolve_autosens(
+                session, user_id, user_settings, db_lock, False, {}
+            ),
+            "iob": lambda: iob_service.load_iob_sources(
+                now=now,
+                settings=user_settings,
+                nightscout_client=None,
+                data_store=store,
+                user_id=user_id,
+            ),
+            "cob": lambda: iob_service.load_cob_sources(now, store, user_id),
+        }
+        results = await asyncio.gather(
+            *(loaders[name]() for name in stale), return_exceptions=True
+        )
+        for name, result in zip(stale, results):
+            if isinstance(result, BaseException):
+                logger.warning("Dosing context part %s failed for %s: %s", name, user_id, result)
+                continue
+            cache.remember(name, result)
+
+
+contexts.set_refresher(refresh_dosing_context)
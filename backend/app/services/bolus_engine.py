@@ -2,11 +2,16 @@ import logging
 import math
 from typing import Optional
 
+import numpy as np
+
 from app.models.bolus_v2 import (
     BolusRequestV2,
     BolusResponseV2,
     BolusSuggestions,
+    BolusSweepGrid,
+    BolusSweepTable,
     GlucoseUsed,
+    SweepExercise,
     UsedParams,
 )
 from app.models.settings import UserSettings
@@ -71,6 +76,26 @@ def calculate_exercise_reduction(minutes: int, intensity: str) -> float:
 
 
 
+def _trend_mode(trend) -> str:
+    """Map a CGM trend arrow to the Techne rounding direction."""
+    from app.models.enums import Trend
+
+    # Handle Enum objects vs Strings
+    if hasattr(trend, 'value'):
+        t_str = trend.value
+    else:
+        t_str = str(trend)
+
+    up_trends = [Trend.DOUBLE_UP, Trend.SINGLE_UP, Trend.FORTY_FIVE_UP]
+    down_trends = [Trend.DOUBLE_DOWN, Trend.SINGLE_DOWN, Trend.FORTY_FIVE_DOWN]
+
+    if any(ut.value.lower() == t_str.lower() for ut in up_trends):
+        return "up"
+    if any(dt.value.lower() == t_str.lower() for dt in down_trends):
+        return "down"
+    return "neutral"
+
+
 def _smart_round(
     value: float,
     step: float,
@@ -89,26 +114,7 @@ def _smart_round(
     - If BG < 100, DISABLE 'Ceil' behavior. Enforce 'Floor' or 'Nearest'.
     """
     standard = round(value / step) * step
-    
-    # Map Trend
-    from app.models.enums import Trend
-    
-    t = trend 
-    # Handle Enum objects vs Strings
-    if hasattr(t, 'value'):
-        t_str = t.value
-    else:
-        t_str = str(t)
-        
-    mode = "neutral"
-    
-    up_trends = [Trend.DOUBLE_UP, Trend.SINGLE_UP, Trend.FORTY_FIVE_UP]
-    down_trends = [Trend.DOUBLE_DOWN, Trend.SINGLE_DOWN, Trend.FORTY_FIVE_DOWN]
-    
-    if any(ut.value.lower() == t_str.lower() for ut in up_trends):
-        mode = "up"
-    elif any(dt.value.lower() == t_str.lower() for dt in down_trends):
-        mode = "down"
+    mode = _trend_mode(trend)
     
     # Safety Override: Low BG prevents aggressive rounding up
     if bg is not None and bg < 100 and mode == "up":
@@ -411,16 +417,15 @@ def _calculate_core(inp: CalculationInput) -> CalculationResult:
         duration_min=duration_min
     )
 
-def calculate_bolus_v2(
+def _build_input(
     request: BolusRequestV2,
     settings: UserSettings,
     iob_u: float,
     glucose_info: GlucoseUsed,
     autosens_ratio: float = 1.0,
     autosens_reason: Optional[str] = None
-) -> BolusResponseV2:
-    
-    # 1. Adapt Input to Pure DTO (The Bridge)
+) -> CalculationInput:
+    """Adapt the request and settings to the pure DTO (The Bridge)."""
     meal_slot = request.meal_slot
     cr_base = request.cr_g_per_u or getattr(settings.cr, meal_slot, 10.0)
     isf_base = request.isf_mgdl_per_u or getattr(settings.cf, meal_slot, 30.0)
@@ -430,7 +435,7 @@ def calculate_bolus_v2(
     else:
         target = resolve_target(settings, meal_slot)
     
-    inp = CalculationInput(
+    return CalculationInput(
         carbs_g=request.carbs_g,
         fiber_g=request.fiber_g,
         fat_g=request.fat_g,
@@ -470,6 +475,21 @@ def calculate_bolus_v2(
         min_bolus_interval_min=getattr(settings, 'min_bolus_interval_min', 0),
         last_bolus_minutes=getattr(request, 'last_bolus_minutes', None),
     )
+
+
+def calculate_bolus_v2(
+    request: BolusRequestV2,
+    settings: UserSettings,
+    iob_u: float,
+    glucose_info: GlucoseUsed,
+    autosens_ratio: float = 1.0,
+    autosens_reason: Optional[str] = None
+) -> BolusResponseV2:
+    
+    # 1. Adapt Input to Pure DTO (The Bridge)
+    inp = _build_input(request, settings, iob_u, glucose_info, autosens_ratio, autosens_reason)
+    target = inp.target_mgdl
+    isf_base = inp.isf
     
     # 2. Call Core (Pure Math)
     res = _calculate_core(inp)
@@ -517,3 +537,161 @@ def calculate_bolus_v2(
         explain=res.breakdown,
         warnings=res.warnings
     )
+
+
+def _round_step_array(values: np.ndarray, step: float) -> np.ndarray:
+    if step <= 0:
+        return values
+    return np.round(values / step) * step
+
+
+def _smart_round_array(
+    values: np.ndarray, step: float, trend: str, max_change: float, bg: Optional[float]
+) -> np.ndarray:
+    """Elementwise ``_smart_round`` (same rules, without the explain lines)."""
+    if step <= 0:
+        return values
+    standard = np.round(values / step) * step
+    mode = _trend_mode(trend)
+    if mode == "neutral" or (bg is not None and bg < 100 and mode == "up"):
+        return standard
+    rounder = np.ceil if mode == "up" else np.floor
+    proposed = rounder(values / step) * step
+    too_far = np.abs(proposed - values) > max_change + 0.001
+    moved = np.abs(proposed - standard) > 0.001
+    return np.where(~too_far & moved, proposed, standard)
+
+
+def sweep_bolus_v2(
+    request: BolusRequestV2,
+    settings: UserSettings,
+    iob_u: float,
+    glucose_info: GlucoseUsed,
+    grid: BolusSweepGrid,
+    autosens_ratio: float = 1.0,
+    autosens_reason: Optional[str] = None
+) -> BolusSweepTable:
+    """
+    Evaluate ``_calculate_core`` over a carbs x exercise x target grid at once.
+
+    Every cell shares the request's context (glucose, IOB, autosens, fat,
+    protein, fiber and settings). The stages follow ``_calculate_core`` step
+    by step as array operations, so each cell equals the single calculation
+    for that combination; keep both in sync when changing the dosing math.
+    """
+    inp = _build_input(request, settings, iob_u, glucose_info, autosens_ratio, autosens_reason)
+    carbs_axis = list(grid.carbs_g) or [inp.carbs_g]
+    exercise_axis = list(grid.exercise) or [
+        SweepExercise(minutes=inp.exercise_minutes, intensity=inp.exercise_intensity)
+    ]
+    target_axis = list(grid.targets_mgdl) or [inp.target_mgdl]
+
+    # Axes broadcast as (exercise, target, carbs).
+    carbs = np.asarray(carbs_axis, dtype=float)
+    targets = np.asarray(target_axis, dtype=float)[:, None]
+    exercise_factor = np.array(
+        [
+            1.0 - min(calculate_exercise_reduction(item.minutes, item.intensity), 0.9)
+            for item in exercise_axis
+        ]
+    )[:, None, None]
+
+    # --- 1. Autosens ---
+    cr = inp.cr / inp.autosens_ratio
+    isf = inp.isf / inp.autosens_ratio
+    if cr <= 0.1:
+        cr = 10.0
+    if isf <= 5:
+        isf = 30.0
+
+    # --- 2. Meal Bolus (per carbs value) ---
+    eff_carbs = carbs
+    if inp.use_fiber_deduction and inp.fiber_g > inp.fiber_threshold:
+        # High fiber (fiber >= carbs) keeps the full carbs.
+        deduct = (carbs > 0) & ~(inp.fiber_g >= carbs)
+        eff_carbs = np.where(
+            deduct, np.maximum(0.0, carbs - inp.fiber_g * inp.fiber_factor), carbs
+        )
+    meal_u = np.where(eff_carbs > 0, eff_carbs / cr, 0.0)
+
+    warsaw_later_u = 0.0
+    if inp.warsaw_enabled and (inp.fat_g > 0 or inp.protein_g > 0):
+        total_kcal = inp.fat_g * 9 + inp.protein_g * 4
+        if total_kcal > 50:
+            fpu_count = total_kcal / 100.0
+            if total_kcal >= inp.warsaw_trigger and inp.strategy != "normal":
+                warsaw_later_u = fpu_count * 10.0 * inp.warsaw_factor_dual / cr
+            else:
+                meal_u = meal_u + fpu_count * 10.0 * inp.warsaw_factor_simple / cr
+
+    # --- 3. Correction (per target) ---
+    corr_u = np.zeros_like(targets)
+    if inp.bg_mgdl is not None and not inp.bg_is_stale:
+        corr_u = np.minimum((inp.bg_mgdl - targets) / isf, inp.max_correction_u)
+
+    # --- 4. IOB ---
+    positive_correction = np.maximum(corr_u, 0.0)
+    low_bg_adjustment = np.minimum(corr_u, 0.0)
+    correction_after_iob = np.maximum(positive_correction - inp.iob_u, 0.0)
+    upfront = np.maximum(0.0, meal_u + low_bg_adjustment + correction_after_iob)
+    later = np.full_like(upfront, warsaw_later_u)
+
+    # --- 4c. Max IOB Ceiling ---
+    capped = np.zeros(upfront.shape, dtype=bool)
+    if inp.max_iob_u is not None and inp.max_iob_u > 0:
+        over = inp.iob_u + upfront + later > inp.max_iob_u
+        allowed = max(0.0, inp.max_iob_u - inp.iob_u)
+        cut_upfront = over & (upfront > allowed)
+        later = np.where(
+            cut_upfront, 0.0, np.where(over, np.maximum(0.0, allowed - upfront), later)
+        )
+        upfront = np.where(cut_upfront, allowed, upfront)
+        capped |= over
+
+    # --- 5. Exercise ---
+    upfront = upfront * exercise_factor
+    later = later * exercise_factor
+    capped = np.broadcast_to(capped, upfront.shape)
+
+    # --- 6. Rounding & Limits ---
+    if inp.techne_enabled and not inp.alcohol_mode and inp.bg_trend:
+        upfront = _smart_round_array(
+            upfront, inp.round_step, inp.bg_trend, inp.techne_max_step, inp.bg_mgdl
+        )
+    else:
+        upfront = _round_step_array(upfront, inp.round_step)
+    later = _round_step_array(later, inp.round_step)
+    total = upfront + later
+
+    over = total > inp.max_bolus_u
+    excess = total - inp.max_bolus_u
+    covered = upfront >= excess
+    later = np.where(over & ~covered, np.maximum(0.0, later - excess), later)
+    upfront = np.where(over, np.where(covered, upfront - excess, 0.0), upfront)
+    total = np.where(over, inp.max_bolus_u, total)
+    capped = capped | over
+
+    if inp.bg_mgdl and inp.bg_mgdl < 70:
+        upfront = np.zeros_like(total)
+        later = np.zeros_like(total)
+        total = np.zeros_like(total)
+
+    if not inp.dual_bolus_enabled:
+        upfront = np.where(later > 0, total, upfront)
+        later = np.where(later > 0, 0.0, later)
+
+    dual_duration = 240 if warsaw_later_u > 0 and inp.dual_bolus_enabled else 0
+    duration = np.where(later <= 0, 0, dual_duration)
+
+    return BolusSweepTable(
+        carbs_g=carbs_axis,
+        exercise=exercise_axis,
+        targets_mgdl=target_axis,
+        meal_u=[round(value, 2) for value in meal_u.tolist()],
+        correction_u=[round(value, 2) for value in corr_u[:, 0].tolist()],
+        total_u=total.tolist(),
+        upfront_u=upfront.tolist(),
+        later_u=later.tolist(),
+        duration_min=duration.tolist(),
+        capped=capped.tolist(),
+    )
@@ -42,6 +42,8 @@ def build_bolus_trace(
         "warnings": list(rec.warnings or []),
         "assumptions": list(rec.assumptions or []),
         "explain": list(rec.explain or []),
+        "timings_ms": dict(rec.timings_ms or {}),
+        "context_cached": list(rec.context_cached or []),
     }
 
     applied_ratios = used.model_dump(mode="json") if used else {}
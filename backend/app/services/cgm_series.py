@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import bisect
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.glucose_reading import GlucoseReadingDB
+from app.services.glucose_ingest_service import as_utc
+from app.services.glucose_source_service import SOURCE_PRIORITY
+
+
+logger = logging.getLogger(__name__)
+
+GRID_STEP = timedelta(minutes=5)
+# Dexcom sensors tick every 5 minutes, so two copies of one sample (phone,
+# watch, Nightscout echo) always land within half a period of each other.
+DEDUPE_WINDOW = timedelta(seconds=150)
+# Below this share of the expected 5-minute samples the local table is treated
+# as not yet backfilled and the caller's remote client is queried once.
+MIN_LOCAL_COVERAGE = 0.5
+
+
+@dataclass(slots=True)
+class CGMPoint:
+    """One canonical glucose sample.
+
+    ``sgv``/``date``/``direction`` mirror ``NightscoutSGV`` so analytics code
+    written against Nightscout entries can consume local points unchanged.
+    """
+
+    measured_at: datetime
+    sgv: int
+    source: str
+    direction: Optional[str] = None
+
+    @property
+    def date(self) -> int:
+        return int(self.measured_at.timestamp() * 1000)
+
+
+def dedupe_points(
+    points: Iterable[CGMPoint], *, window: timedelta = DEDUPE_WINDOW
+) -> list[CGMPoint]:
+    """Collapse copies of one sensor sample, keeping the highest-priority source."""
+    ordered = sorted(points, key=lambda point: point.measured_at)
+    result: list[CGMPoint] = []
+    for point in ordered:
+        if result and point.measured_at - result[-1].measured_at <= window:
+            previous = result[-1]
+            if SOURCE_PRIORITY.get(point.source, 0) > SOURCE_PRIORITY.get(previous.source, 0):
+                result[-1] = point
+            continue
+        result.append(point)
+    return result
+
+
+@dataclass(slots=True)
+class CGMSeries:
+    """Sorted, deduplicated in-memory glucose series for a time span."""
+
+    start: datetime
+    end: datetime
+    points: list[CGMPoint] = field(default_factory=list)
+    remote_fallback_used: bool = False
+    _times: list[datetime] = field(default_factory=list, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.points = sorted(self.points, key=lambda point: point.measured_at)
+        self._times = [point.measured_at for point in self.points]
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def coverage(self, step: timedelta = GRID_STEP) -> float:
+        expected = max(1, int((self.end - self.start) / step))
+        return min(1.0, len(self.points) / expected)
+
+    def window(self, start: datetime, end: datetime) -> list[CGMPoint]:
+        lo = bisect.bisect_left(self._times, as_utc(start))
+        hi = bisect.bisect_right(self._times, as_utc(end))
+        return self.points[lo:hi]
+
+    def value_at(
+        self, at: datetime, *, tolerance: timedelta = timedelta(minutes=15)
+    ) -> Optional[CGMPoint]:
+        """Nearest point to ``at`` within ``tolerance`` (ties favour the earlier point)."""
+        if not self.points:
+            return None
+        at = as_utc(at)
+        index = bisect.bisect_left(self._times, at)
+        best: Optional[CGMPoint] = None
+        for candidate in (index - 1, index):
+            if 0 <= candidate < len(self.points):
+                point = self.points[candidate]
+                if best is None or abs(point.measured_at - at) < abs(best.measured_at - at):
+                    best = point
+        if best is None or abs(best.measured_at - at) > tolerance:
+            return None
+        return best
+
+    def resample(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        *,
+        step: timedelta = GRID_STEP,
+        tolerance: Optional[timedelta] = None,
+    ) -> list[tuple[datetime, Optional[int]]]:
+        """Snap the series onto a fixed grid; slots without a nearby sample are ``None``."""
+        start = as_utc(start or self.start)
+        end = as_utc(end or self.end)
+        tolerance = tolerance if tolerance is not None else step / 2
+        grid: list[tuple[datetime, Optional[int]]] = []
+        slot = start
+        while slot <= end:
+            point = self.value_at(slot, tolerance=tolerance)
+            grid.append((slot, point.sgv if point else None))
+            slot += step
+        return grid
+
+
+class CGMSeriesRepository:
+    """Read access to a user's ``glucose_readings`` as a canonical CGM series.
+
+    Analytics should load one series per run and answer every lookup from it,
+    rather than issuing a Nightscout range read per event.
+    """
+
+    def __init__(self, session: AsyncSession, user_id: str):
+        self.session = session
+        self.user_id = user_id
+
+    async def get_range(self, start: datetime, end: datetime) -> list[CGMPoint]:
+        start = as_utc(start)
+        end = as_utc(end)
+        result = await self.session.execute(
+            select(
+                GlucoseReadingDB.measured_at,
+                GlucoseReadingDB.glucose_mgdl,
+                GlucoseReadingDB.source,
+                GlucoseReadingDB.trend_arrow,
+            )
+            .where(
+                GlucoseReadingDB.user_id == self.user_id,
+                GlucoseReadingDB.validation_status == "accepted",
+                GlucoseReadingDB.measured_at >= start,
+                GlucoseReadingDB.measured_at <= end,
+            )
+            .order_by(GlucoseReadingDB.measured_at.asc())
+        )
+        return dedupe_points(
+            CGMPoint(
+                measured_at=as_utc(measured_at),
+                sgv=int(glucose_mgdl),
+                source=source,
+                direction=trend_arrow,
+            )
+            for measured_at, glucose_mgdl, source, trend_arrow in result.all()
+        )
+
+    async def load(
+        self,
+        start: datetime,
+        end: datetime,
+        *,
+        fallback_client=None,
+        min_coverage: float = MIN_LOCAL_COVERAGE,
+    ) -> CGMSeries:
+        """Load ``[start, end]`` from the local table.
+
+        When ``fallback_client`` (anything exposing Nightscout's
+        ``get_sgv_range``) is given and the local table covers less than
+        ``min_coverage`` of the span, a single remote range read fills the gaps
+        in memory. Remote errors propagate so callers keep their own failure
+        policy.
+        """
+        start = as_utc(start)
+        end = as_utc(end)
+        series = CGMSeries(start=start, end=end, points=await self.get_range(start, end))
+        if fallback_client is None or series.coverage() >= min_coverage:
+            return series
+
+        expected = int((end - start) / GRID_STEP) + 1
+        entries = await fallback_client.get_sgv_range(start, end, count=expected + 50)
+        remote = [
+            CGMPoint(
+                measured_at=datetime.fromtimestamp(entry.date / 1000, tz=timezone.utc),
+                sgv=int(entry.sgv),
+                source="nightscout",
+                direction=getattr(entry, "direction", None),
+            )
+            for entry in entries or []
+            if getattr(entry, "sgv", None)
+        ]
+        logger.info(
+            "CGM series for %s: local coverage %.0f%%, merged %d remote points",
+            self.user_id,
+            series.coverage() * 100,
+            len(remote),
+        )
+        return CGMSeries(
+            start=start,
+            end=end,
+            points=dedupe_points([*series.points, *remote]),
+            remote_fallback_used=True,
+        )
+
+    async def value_at(
+        self, at: datetime, *, tolerance: timedelta = timedelta(minutes=15)
+    ) -> Optional[CGMPoint]:
+        at = as_utc(at)
+        series = CGMSeries(
+            start=at - tolerance,
+            end=at + tolerance,
+            points=await self.get_range(at - tolerance, at + tolerance),
+        )
+        return series.value_at(at, tolerance=tolerance)
+
+    async def resample(
+        self,
+        start: datetime,
+        end: datetime,
+        *,
+        step: timedelta = GRID_STEP,
+        tolerance: Optional[timedelta] = None,
+    ) -> list[tuple[datetime, Optional[int]]]:
+        series = await self.load(start, end)
+        return series.resample(step=step, tolerance=tolerance)
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+WINDOW_SIZE = 20
+MIN_SAMPLES = 5
+FAILURE_RATE_TO_OPEN = 0.5
+CONSECUTIVE_FAILURES_TO_OPEN = 3
+OPEN_BASE_SECONDS = 30.0
+OPEN_MAX_SECONDS = 300.0
+# Adaptive deadline = p95 of recent successful calls of the same endpoint
+# class times this factor, clamped between MIN_DEADLINE_SECONDS and the
+# caller's configured timeout.
+DEADLINE_P95_FACTOR = 3.0
+MIN_DEADLINE_SECONDS = 2.0
+# Returned by ``allow`` for ordinary calls while the breaker is closed.
+PASS = object()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+
+@dataclass(slots=True)
+class BreakerSnapshot:
+    name: str
+    state: str
+    samples: int
+    failure_rate: float
+    consecutive_failures: int
+    p95_latency_ms: Optional[float]
+    deadline_seconds: Optional[float]
+    retry_at: Optional[str] = None
+
+
+class CircuitBreaker:
+    """Rolling-window breaker for one upstream (a Nightscout site, a Dexcom account).
+
+    Closed: calls pass, outcomes are recorded. Open: calls are refused until
+    the cool-down elapses. Half-open: a single probe call is let through; its
+    outcome closes the breaker or re-opens it with a doubled cool-down.
+
+    Failures are judged per upstream, but latency is learned per endpoint
+    class: a bulk range read and a one-entry poll never share a deadline.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.state = STATE_CLOSED
+        self._outcomes: deque[tuple[bool, float]] = deque(maxlen=WINDOW_SIZE)
+        self._consecutive_failures = 0
+        self._open_seconds = OPEN_BASE_SECONDS
+        self._retry_at = 0.0
+        self._latencies: dict[str, deque[float]] = {}
+        self._probe: Optional[object] = None
+        self._probe_expires_at: Optional[float] = None
+
+    def allow(self, probe_deadline: float = OPEN_MAX_SECONDS) -> Optional[object]:
+        """A token if a call may go out now, else ``None``.
+
+        ``probe_deadline`` is the timeout of the call about to be made; a
+        half-open probe that has not reported back within it is treated as
+        lost and the slot is handed to the next caller. The token of the
+        probe call is the only one :meth:`release_probe` accepts.
+        """
+        now = time.monotonic()
+        if self.state == STATE_CLOSED:
+            return PASS
+        if self.state == STATE_OPEN:
+            if now < self._retry_at:
+                return None
+            self.state = STATE_HALF_OPEN
+            self._clear_probe()
+        # Half-open: one probe at a time.
+        if self._probe_expires_at is not None and now < self._probe_expires_at:
+            return None
+        self._probe = object()
+        self._probe_expires_at = now + probe_deadline
+        return self._probe
+
+    def release_probe(self, token: Optional[object]) -> None:
+        """Free the probe slot without an outcome if ``token`` holds it (caller cancelled or failed locally)."""
+        if token is not None and token is self._probe:
+            self._clear_probe()
+
+    def _clear_probe(self) -> None:
+        self._probe = None
+        self._probe_expires_at = None
+
+    def record_success(self, latency_seconds: float, endpoint: Optional[str] = None) -> None:
+        self._outcomes.append((True, latency_seconds))
+        if endpoint is not None:
+            self._latencies.setdefault(endpoint, deque(maxlen=WINDOW_SIZE)).append(latency_seconds)
+        self._consecutive_failures = 0
+        if self.state != STATE_CLOSED:
+            logger.info("Circuit %s closed after successful probe", self.name)
+            self.state = STATE_CLOSED
+            self._open_seconds = OPEN_BASE_SECONDS
+            self._clear_probe()
+            # Forget the failures that opened the breaker.
+            self._outcomes = deque([(True, latency_seconds)], maxlen=WINDOW_SIZE)
+
+    def record_failure(self, latency_seconds: float) -> None:
+        self._outcomes.append((False, latency_seconds))
+        self._consecutive_failures += 1
+        if self.state == STATE_HALF_OPEN:
+            self._open_seconds = min(OPEN_MAX_SECONDS, self._open_seconds * 2)
+            self._open()
+            return
+        if self.state == STATE_CLOSED and (
+            self._consecutive_failures >= CONSECUTIVE_FAILURES_TO_OPEN
+            or (len(self._outcomes) >= MIN_SAMPLES and self.failure_rate() >= FAILURE_RATE_TO_OPEN)
+        ):
+            self._open()
+
+    def _open(self) -> None:
+        self.state = STATE_OPEN
+        self._clear_probe()
+        self._retry_at = time.monotonic() + self._open_seconds
+        logger.warning(
+            "Circuit %s opened for %.0fs (failure rate %.0f%%, %d consecutive failures)",
+            self.name,
+            self._open_seconds,
+            self.failure_rate() * 100,
+            self._consecutive_failures,
+        )
+
+    def failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for ok, _ in self._outcomes if not ok) / len(self._outcomes)
+
+    def p95_latency(self, endpoint: Optional[str] = None) -> Optional[float]:
+        """p95 of recent successful calls to ``endpoint``, or of all calls when ``None``."""
+        if endpoint is None:
+            latencies = sorted(latency for ok, latency in self._outcomes if ok)
+        else:
+            latencies = sorted(self._latencies.get(endpoint, ()))
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, math.ceil(0.95 * len(latencies)) - 1)]
+
+    def deadline(self, default_seconds: float, endpoint: Optional[str] = None) -> float:
+        """Per-call timeout: tight when the endpoint has been fast, never above ``default_seconds``."""
+        p95 = self.p95_latency(endpoint)
+        if p95 is None:
+            return default_seconds
+        return max(min(MIN_DEADLINE_SECONDS, default_seconds), min(default_seconds, p95 * DEADLINE_P95_FACTOR))
+
+    def snapshot(self, default_deadline: Optional[float] = None) -> BreakerSnapshot:
+        # Report a due half-open transition without consuming the probe slot.
+        state = self.state
+        if state == STATE_OPEN and time.monotonic() >= self._retry_at:
+            state = STATE_HALF_OPEN
+        retry_at = None
+        if state == STATE_OPEN:
+            remaining = max(0.0, self._retry_at - time.monotonic())
+            retry_at = (datetime.now(timezone.utc) + timedelta(seconds=remaining)).isoformat()
+        p95 = self.p95_latency()
+        return BreakerSnapshot(
+            name=self.name,
+            state=state,
+            samples=len(self._outcomes),
+            failure_rate=round(self.failure_rate(), 3),
+            consecutive_failures=self._consecutive_failures,
+            p95_latency_ms=round(p95 * 1000, 1) if p95 is not None else None,
+            deadline_seconds=(
+                round(self.deadline(default_deadline), 2) if default_deadline is not None else None
+            ),
+            retry_at=retry_at,
+        )
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def peek_breaker(name: str) -> Optional[CircuitBreaker]:
+    """Existing breaker for ``name`` without creating one."""
+    return _breakers.get(name)
+
+
+def reset_breakers() -> None:
+    _breakers.clear()
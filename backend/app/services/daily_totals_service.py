@@ -0,0 +1,393 @@
+"""Materialized per-day insulin totals (``daily_insulin_totals``).
+
+Every flushed treatment adds (or subtracts) its insulin and carbs to the
+row of its local day in the same transaction, and basal entries refresh
+the day's basal dose. Bulk writes that bypass the ORM (imports, renames,
+raw deletes) mark the days they touch unreconciled instead, and a nightly
+job rebuilds the last ``REBUILD_DAYS`` days from the raw tables. Readers get one
+small row per day; days without a reconciled row are computed from the raw
+tables on the fly (read-only).
+"""
+from __future__ import annotations
+
+import logging
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Iterable, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import event, inspect, select, union, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.basal import BasalEntry
+from app.models.daily_totals import DailyInsulinTotalDB
+from app.models.treatment import Treatment
+from app.services.glucose_ingest_service import as_utc
+from app.utils.timezone import get_user_timezone
+
+logger = logging.getLogger(__name__)
+
+REBUILD_DAYS = 14
+TABLE = DailyInsulinTotalDB.__table__
+# Treatment columns that move a row's contribution between days or totals.
+_TRACKED = ("user_id", "created_at", "insulin", "carbs")
+_engines_with_table: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+
+@dataclass(slots=True)
+class DailyTotals:
+    day: date
+    bolus_u: float = 0.0
+    basal_u: Optional[float] = None
+    carbs_g: float = 0.0
+    treatments: int = 0
+
+
+def local_day(at: datetime, tz: ZoneInfo) -> date:
+    """Calendar day of ``at`` (naive means UTC) in ``tz``."""
+    return as_utc(at).astimezone(tz).date()
+
+
+def local_today(user_id: str) -> date:
+    return datetime.now(get_user_timezone(user_id)).date()
+
+
+def _day_start(day: date, tz: ZoneInfo) -> datetime:
+    """Naive UTC start of ``day`` in ``tz``, comparable with ``Treatment.created_at``."""
+    start = datetime.combine(day, time.min, tzinfo=tz)
+    return start.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _days(start: date, end: date) -> list[date]:
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def _dialect_insert(dialect: str):
+    if dialect == "postgresql":
+        return postgresql.insert(TABLE)
+    if dialect == "sqlite":
+        return sqlite.insert(TABLE)
+    return None
+
+
+async def compute_daily_totals(
+    session: AsyncSession, user_id: str, start: date, end: date
+) -> dict[date, DailyTotals]:
+    """Totals for each local day in ``[start, end]`` straight from the raw tables."""
+    tz = get_user_timezone(user_id)
+    totals = {day: DailyTotals(day) for day in _days(start, end)}
+
+    result = await session.execute(
+        select(Treatment)
+        .where(Treatment.user_id == user_id)
+        .where(Treatment.created_at >= _day_start(start, tz))
+        .where(Treatment.created_at < _day_start(end + timedelta(days=1), tz))
+    )
+    for row in result.scalars().all():
+        item = totals.get(local_day(row.created_at, tz))
+        if item is not None:
+            item.bolus_u += row.insulin or 0.0
+            item.carbs_g += row.carbs or 0.0
+            item.treatments += 1
+
+    result = await session.execute(
+        select(BasalEntry.effective_from, BasalEntry.dose_u)
+        .where(BasalEntry.user_id == user_id)
+        .where(BasalEntry.effective_from >= start)
+        .where(BasalEntry.effective_from <= end)
+        .order_by(BasalEntry.effective_from.asc(), BasalEntry.created_at.asc())
+    )
+    for effective_from, dose_u in result.all():
+        item = totals.get(effective_from)
+        if item is not None and dose_u is not None:
+            item.basal_u = float(dose_u)  # latest entry of the day wins
+    return totals
+
+
+async def read_daily_totals(
+    session: AsyncSession, user_id: str, start: date, end: date
+) -> dict[date, DailyTotals]:
+    """Totals for each local day in ``[start, end]``, from the materialized rows."""
+    result = await session.execute(
+        select(DailyInsulinTotalDB)
+        .where(DailyInsulinTotalDB.user_id == user_id)
+        .where(DailyInsulinTotalDB.day >= start)
+        .where(DailyInsulinTotalDB.day <= end)
+    )
+    totals: dict[date, DailyTotals] = {}
+    for row in result.scalars().all():
+        if row.rebuilt_at is not None:
+            totals[row.day] = DailyTotals(
+                day=row.day,
+                bolus_u=row.bolus_u,
+                basal_u=row.basal_u,
+                carbs_g=row.carbs_g,
+                treatments=row.treatments,
+            )
+
+    missing = [day for day in _days(start, end) if day not in totals]
+    if missing:
+        computed = await compute_daily_totals(session, user_id, missing[0], missing[-1])
+        for day in missing:
+            totals[day] = computed[day]
+    return dict(sorted(totals.items()))
+
+
+async def rebuild_daily_totals(
+    session: AsyncSession, user_id: str, start: date, end: date
+) -> int:
+    """Recompute and store ``[start, end]`` for ``user_id``; the caller commits."""
+    connection = await session.connection()
+    stmt = _dialect_insert(connection.dialect.name)
+    if stmt is None:
+        return 0
+    computed = await compute_daily_totals(session, user_id, start, end)
+    now = datetime.now(timezone.utc)
+    values = [
+        {
+            "user_id": user_id,
+            "day": item.day,
+            "bolus_u": item.bolus_u,
+            "basal_u": item.basal_u,
+            "carbs_g": item.carbs_g,
+            "treatments": item.treatments,
+            "rebuilt_at": now,
+            "updated_at": now,
+        }
+        for item in computed.values()
+    ]
+    keys = ("user_id", "day")
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: stmt.excluded[name] for name in values[0] if name not in keys},
+    )
+    await session.execute(stmt, values)
+    return len(values)
+
+
+async def rebuild_recent_daily_totals(session: AsyncSession, days: int = REBUILD_DAYS) -> dict[str, Any]:
+    """Nightly consistency pass over every user with recent doses or rows."""
+    since = datetime.now(timezone.utc) - timedelta(days=days + 1)
+    users_query = union(
+        select(Treatment.user_id).where(Treatment.created_at >= since.replace(tzinfo=None)),
+        select(BasalEntry.user_id).where(BasalEntry.effective_from >= since.date()),
+        select(DailyInsulinTotalDB.user_id).where(DailyInsulinTotalDB.day >= since.date()),
+    )
+    users = [user_id for user_id in (await session.execute(users_query)).scalars().all() if user_id]
+    rows = 0
+    for user_id in users:
+        end = local_today(user_id)
+        rows += await rebuild_daily_totals(session, user_id, end - timedelta(days=days - 1), end)
+        await session.commit()
+    return {"users": len(users), "rows": rows}
+
+
+def _upsert_deltas(connection: Connection, deltas: dict[tuple[str, date], list]) -> None:
+    stmt = _dialect_insert(connection.dialect.name)
+    if stmt is None:
+        return
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "day"],
+        set_={
+            "bolus_u": TABLE.c.bolus_u + stmt.excluded.bolus_u,
+            "carbs_g": TABLE.c.carbs_g + stmt.excluded.carbs_g,
+            "treatments": TABLE.c.treatments + stmt.excluded.treatments,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    now = datetime.now(timezone.utc)
+    connection.execute(
+        stmt,
+        [
+            {
+                "user_id": user_id,
+                "day": day,
+                "bolus_u": bolus_u,
+                "basal_u": None,
+                "carbs_g": carbs_g,
+                "treatments": count,
+                # A day first seen through a delta stays unreconciled until rebuilt.
+                "rebuilt_at": None,
+                "updated_at": now,
+            }
+            for (user_id, day), (bolus_u, carbs_g, count) in deltas.items()
+        ],
+    )
+
+
+def _mark_unreconciled(connection: Connection, keys: Iterable[tuple[str, date]]) -> None:
+    stmt = _dialect_insert(connection.dialect.name)
+    if stmt is None:
+        return
+    now = datetime.now(timezone.utc)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "day"],
+        set_={"rebuilt_at": None, "updated_at": stmt.excluded.updated_at},
+    )
+    connection.execute(
+        stmt,
+        [
+            {"user_id": user_id, "day": day, "bolus_u": 0.0, "carbs_g": 0.0, "treatments": 0, "updated_at": now}
+            for user_id, day in keys
+        ],
+    )
+
+
+def _refresh_basal_days(connection: Connection, keys: Iterable[tuple[str, date]]) -> None:
+    stmt = _dialect_insert(connection.dialect.name)
+    if stmt is None:
+        return
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "day"],
+        set_={"basal_u": stmt.excluded.basal_u, "updated_at": stmt.excluded.updated_at},
+    )
+    now = datetime.now(timezone.utc)
+    for user_id, day in keys:
+        dose = connection.execute(
+            select(BasalEntry.dose_u)
+            .where(BasalEntry.user_id == user_id, BasalEntry.effective_from == day)
+            .order_by(BasalEntry.created_at.desc())
+            .limit(1)
+        ).scalar()
+        connection.execute(
+            stmt,
+            {
+                "user_id": user_id,
+                "day": day,
+                "bolus_u": 0.0,
+                "basal_u": float(dose) if dose is not None else None,
+                "carbs_g": 0.0,
+                "treatments": 0,
+                "rebuilt_at": None,
+                "updated_at": now,
+            },
+        )
+
+
+def refresh_basal_days(connection: Connection, keys: Iterable[tuple[str, date]]) -> None:
+    """Store the latest basal dose of each ``(user_id, effective_from)`` day."""
+    _apply_guarded(connection, lambda conn: _refresh_basal_days(conn, keys))
+
+
+def mark_days_unreconciled(connection: Connection, keys: Iterable[tuple[str, date]]) -> None:
+    """Make readers recompute each ``(user_id, local day)`` until it is rebuilt."""
+    keys = set(keys)
+    if keys:
+        _apply_guarded(connection, lambda conn: _mark_unreconciled(conn, keys))
+
+
+def mark_user_unreconciled(connection: Connection, user_id: str) -> None:
+    """Make readers recompute every stored day of ``user_id`` until it is rebuilt."""
+    _apply_guarded(
+        connection,
+        lambda conn: conn.execute(
+            update(TABLE).where(TABLE.c.user_id == user_id).values(rebuilt_at=None)
+        ),
+    )
+
+
+def _apply_guarded(connection: Connection, apply) -> None:
+    if not _has_table(connection):
+        return
+    # The totals are derived data: a failure here must never fail the dose
+    # write itself. The nightly rebuild repairs the rows.
+    try:
+        with connection.begin_nested():
+            apply(connection)
+    except Exception as exc:
+        logger.warning("Daily insulin totals not updated: %s", exc)
+
+
+def _has_table(connection: Connection) -> bool:
+    """Whether the bound database has the totals table (cached once found)."""
+    engine = connection.engine
+    if engine in _engines_with_table:
+        return True
+    if inspect(connection).has_table(TABLE.name):
+        _engines_with_table.add(engine)
+        return True
+    return False
+
+
+def _treatment_values(obj: Treatment, *, previous: bool) -> Optional[dict[str, Any]]:
+    """Tracked column values before (``previous``) or after the flush, if known."""
+    state = inspect(obj)
+    values: dict[str, Any] = {}
+    for name in _TRACKED:
+        if not previous:
+            if name in state.dict:
+                values[name] = state.dict[name]
+            elif name in ("insulin", "carbs") and state.key is None:
+                values[name] = 0.0  # column default of a new row
+            else:
+                return None
+            continue
+        history = state.attrs[name].history
+        known = history.deleted or history.unchanged
+        if not known:
+            return None  # not loaded; the old value is unknown
+        values[name] = known[0]
+    return values
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_flushed_doses(session: Session, _flush_context) -> None:
+    deltas: dict[tuple[str, date], list] = defaultdict(lambda: [0.0, 0.0, 0])
+    unreconciled: set[tuple[str, date]] = set()
+    basal_days: set[tuple[str, date]] = set()
+
+    def add(values: Optional[dict[str, Any]], sign: int) -> None:
+        if values and values["user_id"] and values["created_at"] is not None:
+            day = local_day(values["created_at"], get_user_timezone(values["user_id"]))
+            delta = deltas[(values["user_id"], day)]
+            delta[0] += sign * (values["insulin"] or 0.0)
+            delta[1] += sign * (values["carbs"] or 0.0)
+            delta[2] += sign
+
+    for obj in session.new:
+        if isinstance(obj, Treatment):
+            add(_treatment_values(obj, previous=False), 1)
+        elif isinstance(obj, BasalEntry) and obj.user_id:
+            basal_days.add((obj.user_id, obj.effective_from))
+    for obj in session.deleted:
+        if isinstance(obj, Treatment):
+            add(_treatment_values(obj, previous=True), -1)
+        elif isinstance(obj, BasalEntry) and obj.user_id:
+            basal_days.add((obj.user_id, obj.effective_from))
+    for obj in session.dirty:
+        state = inspect(obj)
+        if isinstance(obj, Treatment):
+            if not any(state.attrs[name].history.has_changes() for name in _TRACKED):
+                continue
+            before = _treatment_values(obj, previous=True)
+            after = _treatment_values(obj, previous=False)
+            if before is None or after is None:
+                if obj.user_id and state.dict.get("created_at") is not None:
+                    day = local_day(state.dict["created_at"], get_user_timezone(obj.user_id))
+                    unreconciled.add((obj.user_id, day))
+                continue
+            add(before, -1)
+            add(after, 1)
+        elif isinstance(obj, BasalEntry) and obj.user_id:
+            history = state.attrs.effective_from.history
+            for day in (*history.deleted, obj.effective_from):
+                basal_days.add((obj.user_id, day))
+
+    deltas = {key: value for key, value in deltas.items() if any(value)}
+    if not (deltas or unreconciled or basal_days):
+        return
+
+    def apply(connection: Connection) -> None:
+        if deltas:
+            _upsert_deltas(connection, deltas)
+        if unreconciled:
+            _mark_unreconciled(connection, unreconciled)
+        if basal_days:
+            _refresh_basal_days(connection, basal_days)
+
+    _apply_guarded(session.connection(), apply)
@@ -1,14 +1,80 @@
-import logging
 import asyncio
-from typing import Optional, Dict
-from pydexcom import Dexcom
-from dataclasses import dataclass
+import logging
+import re
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
+from typing import Any, Optional
+
+import httpx
+
+from app.services.circuit_breaker import CircuitOpenError, get_breaker
 
 logger = logging.getLogger(__name__)
 
-# Cache instances to avoid repeated logins (Dexcom is sensitive to this)
-_CLIENT_CACHE: Dict[str, Dexcom] = {}
+# Dexcom Share endpoints, as used by pydexcom and the Dexcom follow apps.
+DEXCOM_BASE_URLS = {
+    "us": "https://share2.dexcom.com/ShareWebServices/Services/",
+    "ous": "https://shareous1.dexcom.com/ShareWebServices/Services/",
+    "jp": "https://share.dexcom.jp/ShareWebServices/Services/",
+}
+DEXCOM_APPLICATION_IDS = {
+    "us": "d89443d2-327c-4a6f-89e5-496bbb0317db",
+    "ous": "d89443d2-327c-4a6f-89e5-496bbb0317db",
+    "jp": "d8665ade-9673-4e27-9ff6-92db4ce13d13",
+}
+AUTHENTICATE_ENDPOINT = "General/AuthenticatePublisherAccount"
+LOGIN_ENDPOINT = "General/LoginPublisherAccountById"
+READINGS_ENDPOINT = "Publisher/ReadPublisherLatestGlucoseValues"
+DEFAULT_UUID = "00000000-0000-0000-0000-000000000000"
+# Share only serves the last 24 hours, at most one reading per 5 minutes.
+MAX_MINUTES = 1440
+MAX_COUNT = 288
+
+# Upper bound for one Share call; the breaker tightens it once it has seen
+# enough fast responses.
+DEXCOM_TIMEOUT_SECONDS = 15.0
+# Logged-in sessions are reused (Dexcom locks accounts that log in too
+# often) but refreshed before Share expires them server-side.
+SESSION_MAX_AGE_SECONDS = 6 * 3600
+MAX_CACHED_SESSIONS = 256
+# Share calls in flight at once across all accounts.
+DEXCOM_MAX_CONCURRENCY = 4
+
+_SESSION_ERROR_CODES = {"SessionIdNotFound", "SessionNotValid"}
+_ACCOUNT_ERROR_CODES = {"AccountPasswordInvalid", "SSO_AuthenticateMaxAttemptsExceeded"}
+
+TREND_ARROWS = {
+    "None": "",
+    "DoubleUp": "↑↑",
+    "SingleUp": "↑",
+    "FortyFiveUp": "↗",
+    "Flat": "→",
+    "FortyFiveDown": "↘",
+    "SingleDown": "↓",
+    "DoubleDown": "↓↓",
+    "NotComputable": "?",
+    "RateOutOfRange": "-",
+}
+# Older Share deployments send the trend as an index into this order.
+_TREND_BY_INDEX = list(TREND_ARROWS)
+_SHARE_DATE = re.compile(r"Date\((?P<ms>-?\d+)(?:[+-]\d{4})?\)")
+
+
+def dexcom_breaker_name(username: str, region: str = "ous") -> str:
+    return f"dexcom_share:{username}_{region}"
+
+
+class DexcomShareError(Exception):
+    """Error payload returned by the Share API (``Code``/``Message``)."""
+
+    def __init__(self, code: Optional[str], message: Optional[str] = None, status_code: int = 0):
+        super().__init__(f"{code}: {message}" if message else str(code))
+        self.code = code
+        self.status_code = status_code
+
 
 @dataclass
 class GlucoseReading:
@@ -16,116 +82,258 @@ class GlucoseReading:
     trend: str
     date: datetime
     delta: Optional[float] = None
+    direction: Optional[str] = None
+
+
+@dataclass
+class _ShareSession:
+    account_id: Optional[str] = None
+    session_id: Optional[str] = None
+    logged_in_at: float = 0.0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def valid(self) -> bool:
+        return bool(self.session_id) and time.monotonic() - self.logged_in_at < SESSION_MAX_AGE_SECONDS
+
+
+# LRU of logged-in Share sessions keyed by account.
+_SESSIONS: "OrderedDict[str, _ShareSession]" = OrderedDict()
+# One pooled HTTP client and concurrency limit per event loop.
+_HTTP_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+_LIMITERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _shared_http() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _HTTP_CLIENTS.get(loop)
+    if client is None or client.is_closed:
+        client = _HTTP_CLIENTS[loop] = httpx.AsyncClient(
+            headers={"Accept": "application/json", "Content-Type": "application/json"},
+            timeout=DEXCOM_TIMEOUT_SECONDS,
+        )
+    return client
+
+
+def _limiter() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    limiter = _LIMITERS.get(loop)
+    if limiter is None:
+        limiter = _LIMITERS[loop] = asyncio.Semaphore(DEXCOM_MAX_CONCURRENCY)
+    return limiter
+
+
+def clear_sessions() -> None:
+    _SESSIONS.clear()
+
+
+def parse_share_reading(item: dict[str, Any]) -> Optional[GlucoseReading]:
+    """Share JSON -> reading. ``DT``/``WT`` carry UTC epoch milliseconds."""
+    try:
+        value = int(item["Value"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    match = _SHARE_DATE.match(str(item.get("DT") or item.get("WT") or ""))
+    if not match or value <= 0:
+        return None
+    trend = item.get("Trend")
+    if isinstance(trend, int) and 0 <= trend < len(_TREND_BY_INDEX):
+        trend = _TREND_BY_INDEX[trend]
+    direction = trend if isinstance(trend, str) else None
+    return GlucoseReading(
+        sgv=value,
+        trend=TREND_ARROWS.get(direction or "", ""),
+        date=datetime.fromtimestamp(int(match.group("ms")) / 1000, tz=timezone.utc),
+        delta=None,
+        direction=direction,
+    )
+
 
 class DexcomClient:
-    def __init__(self, username: str, password: str, region: str = "ous"):
+    """Async Dexcom Share follower client.
+
+    Sessions are shared between instances for the same account and refreshed
+    on expiry; HTTP connections are pooled per event loop. Every call goes
+    through the account's circuit breaker.
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        region: str = "ous",
+        client: Optional[httpx.AsyncClient] = None,
+    ):
         self.username = username
         self.password = password
-        self.region = region.lower()
+        self.region = (region or "ous").lower()
+        if self.region not in DEXCOM_BASE_URLS:
+            self.region = "ous"
+        self.base_url = DEXCOM_BASE_URLS[self.region]
         self.cache_key = f"{username}_{region}"
+        self.breaker = get_breaker(dexcom_breaker_name(username, region))
+        self._client = client
 
-    async def _get_client(self):
-        """
-        Retrieves a cached Dexcom client or creates a new one (login).
+    async def _post(
+        self, endpoint: str, *, json: Optional[dict] = None, params: Optional[dict] = None
+    ) -> Any:
+        """One Share call, guarded by the account's breaker and the global limit.
+
+        Transport errors, 5xx and rejected credentials count as failures, so a
+        wrong password stops being retried before Dexcom locks the account.
         """
-        global _CLIENT_CACHE
-        
-        if self.cache_key not in _CLIENT_CACHE:
-            def _init_dexcom():
-                logger.info(f"Dexcom: Performing fresh login for {self.username}")
-                return Dexcom(username=self.username, password=self.password, region=self.region)
-            
-            try:
-                _CLIENT_CACHE[self.cache_key] = await asyncio.to_thread(_init_dexcom)
-            except Exception as e:
-                logger.error(f"Dexcom Login Failed for {self.username}: {e}")
-                raise e
-                
-        return _CLIENT_CACHE[self.cache_key]
+        timeout = self.breaker.deadline(DEXCOM_TIMEOUT_SECONDS, endpoint)
+        token = self.breaker.allow(timeout)
+        if token is None:
+            raise CircuitOpenError(f"Dexcom circuit open for {self.username}")
+        http = self._client or _shared_http()
+        try:
+            async with _limiter():
+                started = time.monotonic()
+                try:
+                    response = await http.post(
+                        f"{self.base_url}{endpoint}",
+                        json=json or {},
+                        params=params,
+                        timeout=timeout,
+                    )
+                except httpx.HTTPError:
+                    self.breaker.record_failure(time.monotonic() - started)
+                    raise
+                elapsed = time.monotonic() - started
+        except httpx.HTTPError:
+            raise
+        except BaseException:
+            # Cancelled while queued or in flight: no outcome, free a probe slot.
+            self.breaker.release_probe(token)
+            raise
 
-    async def get_latest_sgv(self) -> Optional[GlucoseReading]:
         try:
-            client = await self._get_client()
-            
-            # Run blocking call in executor
-            bg = await asyncio.to_thread(client.get_current_glucose_reading)
-            
-            if not bg:
-                return None
-            
-            # Pydexcom typical bg.datetime is aware or we need to ensure it
-            bg_dt = bg.datetime
-            
-            # Timezone Fix: Pydexcom returns naive times. We need to be careful.
-            if bg_dt:
-                now_utc = datetime.now(timezone.utc)
-                
-                if bg_dt.tzinfo is None:
-                    try:
-                        local_tz = datetime.now().astimezone().tzinfo or timezone.utc
-                        candidate = bg_dt.replace(tzinfo=local_tz).astimezone(timezone.utc)
-                    except Exception as exc:
-                        logger.warning(f"Dexcom naive timestamp; defaulting to UTC: {exc}")
-                        candidate = bg_dt.replace(tzinfo=timezone.utc)
-                else:
-                    candidate = bg_dt.astimezone(timezone.utc)
-                
-                diff_sec = abs((now_utc - candidate).total_seconds())
-                
-                if diff_sec > 3600: # 1 hour tolerance
-                    logger.warning(f"Dexcom time drift detected (TS={bg_dt} vs Now={now_utc}). Snapping to NOW.")
-                    bg_dt = now_utc
-                else:
-                    bg_dt = candidate
+            payload = response.json()
+        except ValueError:
+            payload = None
+        if response.status_code >= 400:
+            error = payload if isinstance(payload, dict) else {}
+            code = error.get("Code")
+            if code in _ACCOUNT_ERROR_CODES or (
+                response.status_code >= 500 and code not in _SESSION_ERROR_CODES
+            ):
+                self.breaker.record_failure(elapsed)
             else:
-                 bg_dt = datetime.now(timezone.utc)
-            
-            return GlucoseReading(
-                sgv=bg.value,
-                trend=bg.trend_arrow or "",
-                date=bg_dt or datetime.now(timezone.utc),
-                delta=None
+                self.breaker.record_success(elapsed, endpoint)
+            raise DexcomShareError(code or f"HTTP {response.status_code}", error.get("Message"), response.status_code)
+        self.breaker.record_success(elapsed, endpoint)
+        return payload
+
+    def _session(self) -> _ShareSession:
+        session = _SESSIONS.get(self.cache_key)
+        if session is None:
+            session = _SESSIONS[self.cache_key] = _ShareSession()
+            while len(_SESSIONS) > MAX_CACHED_SESSIONS:
+                _SESSIONS.popitem(last=False)
+        else:
+            _SESSIONS.move_to_end(self.cache_key)
+        return session
+
+    async def _session_id(self, *, stale: Optional[str] = None) -> str:
+        """Logged-in session id, re-using the account's cached one unless it is ``stale``."""
+        session = self._session()
+        if session.valid() and session.session_id != stale:
+            return session.session_id
+        async with session.lock:
+            # Another caller may have logged in while we waited.
+            if session.valid() and session.session_id != stale:
+                return session.session_id
+            logger.info("Dexcom: Performing fresh login for %s", self.username)
+            application_id = DEXCOM_APPLICATION_IDS[self.region]
+            if not session.account_id:
+                session.account_id = await self._post(
+                    AUTHENTICATE_ENDPOINT,
+                    json={
+                        "accountName": self.username,
+                        "password": self.password,
+                        "applicationId": application_id,
+                    },
+                )
+            session_id = await self._post(
+                LOGIN_ENDPOINT,
+                json={
+                    "accountId": session.account_id,
+                    "password": self.password,
+                    "applicationId": application_id,
+                },
             )
+            if not isinstance(session_id, str) or not session_id or session_id == DEFAULT_UUID:
+                session.account_id = None
+                raise DexcomShareError("SessionIdInvalid", "Share login returned no session")
+            session.session_id = session_id
+            session.logged_in_at = time.monotonic()
+            return session_id
+
+    def _forget_session(self) -> None:
+        _SESSIONS.pop(self.cache_key, None)
+
+    async def _read(self, minutes: int, max_count: int) -> list[GlucoseReading]:
+        params = {
+            "minutes": max(1, min(MAX_MINUTES, int(minutes))),
+            "maxCount": max(1, min(MAX_COUNT, int(max_count))),
+        }
+        stale: Optional[str] = None
+        for attempt in range(2):
+            params["sessionId"] = await self._session_id(stale=stale)
+            try:
+                items = await self._post(READINGS_ENDPOINT, params=params)
+            except DexcomShareError as exc:
+                # Share expires sessions on its own schedule; log in again once.
+                if exc.code in _SESSION_ERROR_CODES and attempt == 0:
+                    stale = params["sessionId"]
+                    continue
+                raise
+            readings = [parse_share_reading(item) for item in items or [] if isinstance(item, dict)]
+            return [reading for reading in readings if reading is not None]
+        return []
+
+    async def get_latest_sgv(self) -> Optional[GlucoseReading]:
+        try:
+            readings = await self._read(minutes=10, max_count=1)
+            return readings[0] if readings else None
+        except CircuitOpenError:
+            logger.debug("Dexcom Share skipped: circuit open for %s", self.username)
+            return None
         except Exception as e:
             logger.error(f"Dexcom Share Fetch Error: {e}")
-            # If fetch fails, maybe session expired? Clear cache to force re-login next time
-            if self.cache_key in _CLIENT_CACHE:
-                del _CLIENT_CACHE[self.cache_key]
+            # If fetch fails, maybe session expired? Clear it to force re-login next time
+            self._forget_session()
             return None
 
+    async def fetch_sgv_range(self, start_dt: datetime, end_dt: datetime) -> list[GlucoseReading]:
+        """Readings in ``[start_dt, end_dt]``, newest first; raises when Share cannot be read.
+
+        Share keeps only the last 24 hours.
+        """
+        now = datetime.now(timezone.utc)
+        start = start_dt if start_dt.tzinfo else start_dt.replace(tzinfo=timezone.utc)
+        end = end_dt if end_dt.tzinfo else end_dt.replace(tzinfo=timezone.utc)
+        minutes = int((now - start).total_seconds() // 60) + 1
+        try:
+            readings = await self._read(minutes=minutes, max_count=minutes // 5 + 2)
+        except CircuitOpenError:
+            raise
+        except Exception:
+            self._forget_session()
+            raise
+        return [reading for reading in readings if start <= reading.date <= end]
+
     async def get_sgv_range(self, start_dt: datetime, end_dt: datetime) -> list[GlucoseReading]:
+        """Like :meth:`fetch_sgv_range`, but an unreachable Share yields an empty list."""
         try:
-            client = await self._get_client()
-
-            def _fetch():
-                return client.get_glucose_readings(start_dt=start_dt, end_dt=end_dt)
-
-            readings = await asyncio.to_thread(_fetch)
-            results: list[GlucoseReading] = []
-            if not readings:
-                return results
-            for bg in readings:
-                bg_dt = getattr(bg, "datetime", None) or getattr(bg, "timestamp", None)
-                if not bg_dt:
-                    continue
-                if isinstance(bg_dt, datetime):
-                    if bg_dt.tzinfo is None:
-                        bg_dt = bg_dt.replace(tzinfo=timezone.utc)
-                    else:
-                        bg_dt = bg_dt.astimezone(timezone.utc)
-                else:
-                    bg_dt = datetime.fromtimestamp(bg_dt, tz=timezone.utc)
-                results.append(
-                    GlucoseReading(
-                        sgv=getattr(bg, "value", None) or getattr(bg, "sgv", 0),
-                        trend=getattr(bg, "trend_arrow", None) or "",
-                        date=bg_dt,
-                        delta=None,
-                    )
-                )
-            return results
+            return await self.fetch_sgv_range(start_dt, end_dt)
+        except CircuitOpenError:
+            logger.debug("Dexcom Share range skipped: circuit open for %s", self.username)
+            return []
         except Exception as exc:
             logger.error(f"Dexcom Share Range Fetch Error: {exc}")
-            if self.cache_key in _CLIENT_CACHE:
-                del _CLIENT_CACHE[self.cache_key]
             return []
@@ -0,0 +1,195 @@
+"""Per-user dosing context kept warm between bolus calculations.
+
+Each part (current glucose, autosens ratio, IOB and COB source data) is
+stored with the time it was computed and a fingerprint of the settings that
+produced it. A calculation reuses the parts that are still fresh and only
+recomputes the rest. Committed readings and treatments arrive through the
+glucose event hub, invalidate the affected parts and schedule a background
+refresh, so the next calculation normally finds everything ready.
+
+IOB and COB parts cache the *loaded treatments*, not the totals: the decay is
+always projected to the moment of the calculation. Only locally stored
+treatments are cached; Nightscout treatments uploaded by other devices raise
+no local event, so they are read again on every calculation.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models.treatment import Treatment
+from app.services.glucose_events import hub, queue_event
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds on reuse; events normally invalidate parts much sooner.
+PART_TTL: dict[str, timedelta] = {
+    "glucose": timedelta(minutes=5),
+    "iob": timedelta(minutes=2),
+    "cob": timedelta(minutes=2),
+    "autosens": timedelta(minutes=15),
+}
+# Contexts are only kept warm for users who calculated a bolus recently.
+ACTIVE_WINDOW = timedelta(hours=12)
+# Parts invalidated by each glucose hub event type.
+EVENT_PARTS: dict[str, tuple[str, ...]] = {
+    "readings": ("glucose",),
+    "treatments": ("iob", "cob"),
+}
+
+Refresher = Callable[[str], Awaitable[None]]
+
+
+def settings_fingerprint(*values: Any) -> str:
+    digest = hashlib.blake2b(digest_size=12)
+    for value in values:
+        digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+@dataclass(slots=True)
+class ContextPart:
+    value: Any
+    computed_at: datetime
+    fingerprint: str
+
+
+@dataclass
+class DosingContext:
+    parts: dict[str, ContextPart] = field(default_factory=dict)
+    # Bumped on every invalidation; a load that started before a bump is
+    # discarded instead of being stored as fresh.
+    epochs: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    last_used: Optional[datetime] = None
+
+
+class DosingContextStore:
+    def __init__(self) -> None:
+        self._contexts: dict[str, DosingContext] = defaultdict(DosingContext)
+        self._refresher: Optional[Refresher] = None
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._dirty: set[str] = set()
+
+    def set_refresher(self, refresher: Optional[Refresher]) -> None:
+        self._refresher = refresher
+
+    def touch(self, user_id: str) -> None:
+        self._contexts[user_id].last_used = datetime.now(timezone.utc)
+
+    def is_active(self, user_id: str) -> bool:
+        context = self._contexts.get(user_id)
+        if context is None or context.last_used is None:
+            return False
+        return datetime.now(timezone.utc) - context.last_used <= ACTIVE_WINDOW
+
+    def epoch(self, user_id: str, name: str) -> int:
+        return self._contexts[user_id].epochs[name]
+
+    def fresh(
+        self, user_id: str, name: str, fingerprint: str, *, now: Optional[datetime] = None
+    ) -> Optional[ContextPart]:
+        context = self._contexts.get(user_id)
+        part = context.parts.get(name) if context else None
+        if part is None or part.fingerprint != fingerprint:
+            return None
+        now = now or datetime.now(timezone.utc)
+        if now - part.computed_at > PART_TTL[name]:
+            return None
+        return part
+
+    def put(
+        self,
+        user_id: str,
+        name: str,
+        value: Any,
+        fingerprint: str,
+        *,
+        epoch: int,
+        computed_at: Optional[datetime] = None,
+    ) -> bool:
+        context = self._contexts[user_id]
+        if context.epochs[name] != epoch:
+            return False
+        context.parts[name] = ContextPart(
+            value=value,
+            computed_at=computed_at or datetime.now(timezone.utc),
+            fingerprint=fingerprint,
+        )
+        return True
+
+    def invalidate(self, user_id: str, *names: str) -> None:
+        context = self._contexts.get(user_id)
+        if context is None:
+            return
+        for name in names or tuple(PART_TTL):
+            context.epochs[name] += 1
+            context.parts.pop(name, None)
+
+    def request_refresh(self, user_id: str) -> None:
+        """Recompute the user's context in the background, coalescing bursts."""
+        if self._refresher is None or not self.is_active(user_id):
+            return
+        running = self._tasks.get(user_id)
+        if running is not None and not running.done():
+            self._dirty.add(user_id)
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._tasks[user_id] = loop.create_task(self._run_refresh(user_id))
+
+    async def _run_refresh(self, user_id: str) -> None:
+        try:
+            while True:
+                self._dirty.discard(user_id)
+                refresher = self._refresher
+                if refresher is None:
+                    return
+                try:
+                    await refresher(user_id)
+                except Exception as exc:
+                    logger.warning("Dosing context refresh failed for %s: %s", user_id, exc)
+                if user_id not in self._dirty:
+                    return
+        finally:
+            self._tasks.pop(user_id, None)
+
+    def clear(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self._dirty.clear()
+        self._contexts.clear()
+
+
+contexts = DosingContextStore()
+
+
+def clear_dosing_contexts() -> None:
+    contexts.clear()
+
+
+def _on_glucose_event(user_id: str, message: dict[str, Any]) -> None:
+    names = EVENT_PARTS.get(message.get("type"))
+    if names:
+        contexts.invalidate(user_id, *names)
+        contexts.request_refresh(user_id)
+
+
+hub.add_listener(_on_glucose_event)
+
+
+@event.listens_for(Session, "after_flush")
+def _stage_treatment_events(session: Session, _flush_context) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Treatment) and obj.user_id:
+            queue_event(session, obj.user_id, "treatments", {"id": obj.id})
@@ -1,12 +1,13 @@
 
 import logging
 from datetime import datetime, date, timedelta, timezone
-from sqlalchemy import select, text
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Optional
 
 from app.models.treatment import Treatment
 from app.models.settings import UserSettings
+from app.services.daily_totals_service import DailyTotals, local_today, read_daily_totals
 from app.services.math.basal import BasalModels
 
 logger = logging.getLogger(__name__)
@@ -38,31 +39,29 @@ class DynamicISFService:
     """
 
     @staticmethod
-    async def _get_real_basal_doses(username: str, session: AsyncSession, days: int = 7) -> Dict[date, float]:
+    async def _get_daily_totals(username: str, session: AsyncSession, days: int = 7) -> Dict[date, DailyTotals]:
         """
-        Fetch actual basal doses from basal_dose table.
+        Read the materialized per-day totals from ``days`` local days ago up to today.
+        Returns dict mapping date -> DailyTotals (``days`` complete days plus today).
+        """
+        today = local_today(username)
+        return await read_daily_totals(session, username, today - timedelta(days=days), today)
+
+    @staticmethod
+    async def _get_real_basal_doses(
+        username: str,
+        session: AsyncSession,
+        days: int = 7,
+        totals: Optional[Dict[date, DailyTotals]] = None,
+    ) -> Dict[date, float]:
+        """
+        Actual basal doses logged in the basal_dose table, per day.
         Returns dict mapping date -> dose_u
         """
         try:
-            start_date = date.today() - timedelta(days=days)
-            query = text("""
-                SELECT effective_from, dose_u
-                FROM basal_dose
-                WHERE user_id = :user_id
-                AND effective_from >= :start_date
-                ORDER BY effective_from DESC, created_at DESC
-            """)
-            result = await session.execute(query, {"user_id": username, "start_date": start_date})
-            rows = result.fetchall()
-
-            # Build dict of date -> dose (latest entry per date wins)
-            doses: Dict[date, float] = {}
-            for row in rows:
-                d = row.effective_from
-                if d not in doses:  # Keep first (most recent) entry per date
-                    doses[d] = float(row.dose_u)
-
-            return doses
+            if totals is None:
+                totals = await DynamicISFService._get_daily_totals(username, session, days=days)
+            return {day: item.basal_u for day, item in totals.items() if item.basal_u is not None}
         except Exception as e:
             logger.warning(f"Failed to fetch real basal doses: {e}")
             return {}
@@ -86,33 +85,22 @@ class DynamicISFService:
         debug = TDDDebugInfo()
 
         try:
-            # 1. Calculate Historical TDD (Looking back 7 days)
+            # 1. Historical TDD from the daily totals (7 complete local days plus today)
             now_utc = datetime.now(timezone.utc)
-            today = now_utc.date()
-            start_7d = now_utc - timedelta(days=7)
-
-            stmt = (
-                select(Treatment)
-                .where(Treatment.user_id == username)
-                .where(Treatment.created_at >= start_7d.replace(tzinfo=None))
-            )
-            res = await session.execute(stmt)
-            rows = res.scalars().all()
+            today = local_today(username)
+            totals = await DynamicISFService._get_daily_totals(username, session, days=7)
 
-            # Bucket boluses by day
             daily_bolus: Dict[int, float] = {}
-            for r in rows:
-                dt = r.created_at
-                days_ago = (now_utc - dt.replace(tzinfo=timezone.utc)).days
-                if days_ago < 0: days_ago = 0
-                if days_ago > 6: days_ago = 6
-
-                daily_bolus[days_ago] = daily_bolus.get(days_ago, 0.0) + (r.insulin or 0.0)
+            for day, item in totals.items():
+                if item.bolus_u:
+                    daily_bolus[(today - day).days] = item.bolus_u
 
             debug.bolus_by_day = daily_bolus.copy()
 
             # 2. Get REAL basal doses from basal_dose table (PRIMARY SOURCE)
-            real_basal_doses = await DynamicISFService._get_real_basal_doses(username, session, days=7)
+            real_basal_doses = await DynamicISFService._get_real_basal_doses(
+                username, session, days=7, totals=totals
+            )
 
             # 3. Determine daily basal for each day
             # Priority: Real dose > Schedule > settings.tdd_u heuristic
@@ -122,7 +110,7 @@ class DynamicISFService:
             if settings.bot.proactive.basal.schedule:
                 schedule_basal = sum(item.units for item in settings.bot.proactive.basal.schedule)
 
-            for days_ago in range(7):
+            for days_ago in range(8):
                 target_date = today - timedelta(days=days_ago)
                 if target_date in real_basal_doses:
                     daily_basal[days_ago] = real_basal_doses[target_date]
@@ -149,10 +137,11 @@ class DynamicISFService:
             )
             
             # 4. Calculate Weighted TDD
+            # Today is still in progress; the week average uses complete days only.
             tdd_sum_7d = 0.0
             day_count = 0
 
-            for d in range(7):
+            for d in range(1, 8):
                 bolus = daily_bolus.get(d, 0.0)
                 basal = daily_basal.get(d, 0.0)
                 total = bolus + basal
@@ -171,11 +160,13 @@ class DynamicISFService:
             week_tdd_avg = tdd_sum_7d / day_count
             debug.week_avg_tdd = week_tdd_avg
 
-            # Calculate exact last 24h sum
-            recent_bolus_sum = sum(
-                r.insulin or 0.0 for r in rows
-                if (now_utc - r.created_at.replace(tzinfo=timezone.utc)).total_seconds() <= 86400
+            # Calculate exact last 24h sum (only the last day's treatments are read)
+            res = await session.execute(
+                select(Treatment)
+                .where(Treatment.user_id == username)
+                .where(Treatment.created_at >= (now_utc - timedelta(hours=24)).replace(tzinfo=None))
             )
+            recent_bolus_sum = sum(r.insulin or 0.0 for r in res.scalars().all())
             # Use today's basal (day 0) for recent TDD
             recent_basal = daily_basal.get(0, schedule_basal if schedule_basal > 0 else 0.0)
             recent_tdd = recent_bolus_sum + recent_basal
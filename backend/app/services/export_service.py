@@ -1,8 +1,26 @@
-from datetime import date, datetime
+from datetime import date, datetime, time
+import base64
+import json
 import uuid
-from sqlalchemy import text
+import zlib
+from decimal import Decimal
+from typing import Any, AsyncIterable, AsyncIterator, Mapping
+
+from sqlalchemy import MetaData, Table, select, text
 from app.core.db import get_engine, _in_memory_store
 
+EXPORT_FORMAT = "bolusai-ndjson"
+EXPORT_VERSION = 1
+EXPORT_BATCH_SIZE = 1000
+# Rows bound to this install (stored credentials, browser push endpoints,
+# process locks) or holding no user data are not carried to another host.
+EXCLUDED_TABLES = {
+    "nightscout_secrets",
+    "push_subscriptions",
+    "bot_leader_locks",
+    "alembic_version",
+}
+
 async def export_all_user_data(user_id: str):
     # In-Memory Fallback
     engine = get_engine()
@@ -10,7 +28,7 @@ async def export_all_user_data(user_id: str):
         # Naive export from memory dicts if structured, but our _in_memory_store is simple
         # For this refactor, we focus on DB.
         return {
-            "source": "memory", 
+            "source": "memory",
             "basal_checkins": [c for c in _in_memory_store.get("checkins", []) if getattr(c, "user_id", "") == user_id],
             "entries": [e for e in _in_memory_store.get("entries", []) if getattr(e, "user_id", "") == user_id]
         }
@@ -37,7 +55,7 @@ async def export_all_user_data(user_id: str):
                 # Better: try/except the query
                 query = text(f"SELECT * FROM {table} WHERE user_id = :uid ORDER BY {sort_col} DESC")
                 result = await conn.execute(query, {"uid": user_id})
-                
+
                 rows = []
                 for row in result:
                     item = dict(row._mapping)
@@ -48,9 +66,133 @@ async def export_all_user_data(user_id: str):
                         elif isinstance(v, uuid.UUID):
                             item[k] = str(v)
                     rows.append(item)
-                
+
                 data[table] = rows
             except Exception as e:
                 data[table] = {"error": str(e), "note": "Table might not exist or empty"}
-    
+
     return data
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    return value
+
+
+def _line(payload: Mapping[str, Any]) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+# Tables without a ``user_id`` column whose rows belong to a user through a
+# parent row: child table -> (column, parent table, parent key).
+CHILD_TABLES = {
+    "suggestion_evaluation": ("suggestion_id", "parameter_suggestion", "id"),
+    "meal_outcomes": ("meal_entry_id", "meal_entries", "id"),
+    "imported_meal_snapshots": ("meal_id", "imported_meals", "id"),
+}
+
+
+async def user_tables(conn) -> list[Table]:
+    """Every table in the live database holding user rows, parents before children.
+
+    Reflected rather than taken from the ORM metadata so tables created
+    outside it (``ml_training_data_v2``) and future tables are included.
+    Tables with a ``user_id`` column come in foreign-key dependency order,
+    followed by the ``CHILD_TABLES`` whose parent is present, so an import
+    replaying them in this order never inserts a child before its parent.
+    """
+
+    def reflect(sync_conn) -> list[Table]:
+        metadata = MetaData()
+        metadata.reflect(bind=sync_conn)
+        owned = [
+            table
+            for table in metadata.sorted_tables
+            if "user_id" in table.c and table.name not in EXCLUDED_TABLES
+        ]
+        names = {table.name for table in owned}
+        children = [
+            table
+            for table in metadata.sorted_tables
+            if table.name in CHILD_TABLES and CHILD_TABLES[table.name][1] in names
+        ]
+        return owned + children
+
+    return await conn.run_sync(reflect)
+
+
+def owned_rows(table: Table, tables: Mapping[str, Table], user_id: str):
+    """``SELECT`` of the user's rows in ``table``, joining child tables to their parent."""
+    if table.name not in CHILD_TABLES:
+        return select(table).where(table.c.user_id == user_id)
+    column, parent_name, key = CHILD_TABLES[table.name]
+    parent = tables[parent_name]
+    return (
+        select(table)
+        .select_from(table.join(parent, table.c[column] == parent.c[key]))
+        .where(parent.c.user_id == user_id)
+    )
+
+
+async def stream_user_export(user_id: str, *, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """All of a user's rows as NDJSON: a header line, one line per row, a footer.
+
+    Rows are read table by table through server-side cursors and emitted in
+    batches, so memory stays flat regardless of history size.
+    """
+    engine = get_engine()
+    if not engine:
+        raise RuntimeError("Streaming export requires a database")
+
+    async with engine.connect() as conn:
+        tables = await user_tables(conn)
+        by_name = {table.name: table for table in tables}
+        yield _line(
+            {
+                "type": "header",
+                "format": EXPORT_FORMAT,
+                "version": EXPORT_VERSION,
+                "user_id": user_id,
+                "export_date": datetime.utcnow().isoformat(),
+                "tables": [table.name for table in tables],
+            }
+        ).encode()
+
+        counts: dict[str, int] = {}
+        for table in tables:
+            query = owned_rows(table, by_name, user_id)
+            if table.primary_key.columns:
+                query = query.order_by(*table.primary_key.columns)
+            result = await conn.stream(query.execution_options(yield_per=batch_size))
+            count = 0
+            async for rows in result.partitions(batch_size):
+                count += len(rows)
+                yield "".join(
+                    _line(
+                        {
+                            "type": "row",
+                            "table": table.name,
+                            "data": {key: _json_value(value) for key, value in row._mapping.items()},
+                        }
+                    )
+                    for row in rows
+                ).encode()
+            counts[table.name] = count
+
+        yield _line({"type": "end", "counts": counts, "total": sum(counts.values())}).encode()
+
+
+async def gzip_stream(chunks: AsyncIterable[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.glucose_rollup import GlucoseRollup5mDB
+from app.services.cgm_series import CGMSeriesRepository
+from app.services.glucose_history_service import current_cursor
+from app.services.glucose_ingest_service import as_utc
+from app.services.glucose_rollup_service import ROLLUP_STEP, canonical_slots
+from app.utils.timezone import get_user_timezone
+
+
+AGP_PERCENTILES = (5, 25, 50, 75, 95)
+DEFAULT_BIN_MINUTES = 15
+MAX_AGP_DAYS = 90
+# Reports are keyed on the user's reading cursor, so a new or changed reading
+# invalidates them; the TTL only bounds how far the window end may drift.
+AGP_CACHE_TTL_SECONDS = 300.0
+MAX_CACHED_REPORTS = 256
+# Thresholds follow the international consensus on time in ranges.
+RANGE_EDGES = (54, 70, 180, 250)
+
+
+@dataclass(slots=True)
+class AGPBand:
+    minute: int
+    samples: int
+    p5: Optional[float] = None
+    p25: Optional[float] = None
+    p50: Optional[float] = None
+    p75: Optional[float] = None
+    p95: Optional[float] = None
+
+
+@dataclass(slots=True)
+class AGPReport:
+    start: datetime
+    end: datetime
+    days: int
+    bin_minutes: int
+    timezone: str
+    samples: int = 0
+    coverage_pct: float = 0.0
+    mean_mgdl: Optional[float] = None
+    sd_mgdl: Optional[float] = None
+    cv_pct: Optional[float] = None
+    gmi_pct: Optional[float] = None
+    very_low_pct: Optional[float] = None
+    low_pct: Optional[float] = None
+    in_range_pct: Optional[float] = None
+    high_pct: Optional[float] = None
+    very_high_pct: Optional[float] = None
+    bands: list[AGPBand] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class _CachedReport:
+    version: str
+    expires_at: float
+    report: AGPReport
+
+
+_REPORTS: "OrderedDict[tuple, _CachedReport]" = OrderedDict()
+
+
+def clear_agp_cache() -> None:
+    _REPORTS.clear()
+
+
+def glucose_management_indicator(mean_mgdl: float) -> float:
+    """GMI (%) from mean glucose in mg/dL (Bergenstal et al., 2018)."""
+    return 3.31 + 0.02392 * mean_mgdl
+
+
+async def load_series(
+    session: AsyncSession, user_id: str, start: datetime, end: datetime
+) -> tuple[np.ndarray, np.ndarray]:
+    """Canonical 5-minute series as ``(epoch_seconds, mg/dL)`` arrays.
+
+    Reads the 5-minute rollups and only the not-yet-rolled-up tail from raw
+    readings, so a 90-day window is one narrow query of ~26k rows.
+    """
+    start = as_utc(start)
+    end = as_utc(end)
+    rows = (
+        await session.execute(
+            select(GlucoseRollup5mDB.bucket_start, GlucoseRollup5mDB.glucose_mgdl)
+            .where(
+                GlucoseRollup5mDB.user_id == user_id,
+                GlucoseRollup5mDB.bucket_start >= start,
+                GlucoseRollup5mDB.bucket_start <= end,
+            )
+            .order_by(GlucoseRollup5mDB.bucket_start.asc())
+        )
+    ).all()
+    tail_start = as_utc(rows[-1][0]) + ROLLUP_STEP if rows else start
+    tail = [
+        (slot.measured_at, slot.sgv)
+        for slot in canonical_slots(
+            await CGMSeriesRepository(session, user_id).get_range(tail_start, end)
+        )
+        if slot.measured_at >= tail_start
+    ]
+    pairs = [(as_utc(at).timestamp(), value) for at, value in rows] + [
+        (at.timestamp(), value) for at, value in tail
+    ]
+    if not pairs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    data = np.asarray(pairs, dtype=np.float64)
+    return data[:, 0].astype(np.int64), data[:, 1]
+
+
+def local_minute_of_day(epoch_seconds: np.ndarray, tz: ZoneInfo) -> np.ndarray:
+    """Local minute of day for each timestamp, DST aware.
+
+    UTC offsets only change on hour boundaries, so they are resolved once per
+    distinct hour and broadcast back.
+    """
+    if epoch_seconds.size == 0:
+        return np.empty(0, dtype=np.int64)
+    hours, inverse = np.unique(epoch_seconds // 3600, return_inverse=True)
+    offsets = np.fromiter(
+        (
+            datetime.fromtimestamp(int(hour) * 3600, tz=timezone.utc).astimezone(tz).utcoffset().total_seconds()
+            for hour in hours
+        ),
+        dtype=np.int64,
+        count=hours.size,
+    )
+    local = epoch_seconds + offsets[inverse.reshape(-1)]
+    return (local % 86400) // 60
+
+
+def binned_percentiles(
+    bins: np.ndarray, values: np.ndarray, bin_count: int, qs: tuple[int, ...] = AGP_PERCENTILES
+) -> tuple[np.ndarray, np.ndarray]:
+    """Per-bin linear-interpolated percentiles in one sort.
+
+    Returns ``(counts, table)`` with ``table[q_index, bin]`` (NaN for empty bins).
+    """
+    order = np.lexsort((values, bins))
+    sorted_values = values[order]
+    counts = np.bincount(bins, minlength=bin_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    table = np.full((len(qs), bin_count), np.nan)
+    filled = counts > 0
+    if not filled.any():
+        return counts, table
+    for index, q in enumerate(qs):
+        position = starts[filled] + (counts[filled] - 1) * (q / 100.0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        weight = position - lower
+        table[index, filled] = sorted_values[lower] * (1 - weight) + sorted_values[upper] * weight
+    return counts, table
+
+
+def build_report(
+    epoch_seconds: np.ndarray,
+    values: np.ndarray,
+    *,
+    start: datetime,
+    end: datetime,
+    days: int,
+    tz: ZoneInfo,
+    bin_minutes: int = DEFAULT_BIN_MINUTES,
+) -> AGPReport:
+    report = AGPReport(start=start, end=end, days=days, bin_minutes=bin_minutes, timezone=str(tz))
+    samples = int(values.size)
+    if not samples:
+        return report
+
+    mean = float(values.mean())
+    sd = float(values.std(ddof=1)) if samples > 1 else None
+    below_54, below_70, upto_180, upto_250 = (
+        int(np.count_nonzero(values < RANGE_EDGES[0])),
+        int(np.count_nonzero(values < RANGE_EDGES[1])),
+        int(np.count_nonzero(values <= RANGE_EDGES[2])),
+        int(np.count_nonzero(values <= RANGE_EDGES[3])),
+    )
+
+    def pct(count: int) -> float:
+        return round(count / samples * 100, 1)
+
+    expected = max(1, int((end - start) / ROLLUP_STEP))
+    report.samples = samples
+    report.coverage_pct = round(min(1.0, samples / expected) * 100, 1)
+    report.mean_mgdl = round(mean, 1)
+    report.sd_mgdl = round(sd, 1) if sd is not None else None
+    report.cv_pct = round(sd / mean * 100, 1) if sd is not None and mean else None
+    report.gmi_pct = round(glucose_management_indicator(mean), 1)
+    report.very_low_pct = pct(below_54)
+    report.low_pct = pct(below_70 - below_54)
+    report.in_range_pct = pct(upto_180 - below_70)
+    report.high_pct = pct(upto_250 - upto_180)
+    report.very_high_pct = pct(samples - upto_250)
+
+    bin_count = 1440 // bin_minutes
+    bins = local_minute_of_day(epoch_seconds, tz) // bin_minutes
+    counts, table = binned_percentiles(bins, values, bin_count)
+    for index in range(bin_count):
+        band = AGPBand(minute=index * bin_minutes, samples=int(counts[index]))
+        if counts[index]:
+            band.p5, band.p25, band.p50, band.p75, band.p95 = (
+                round(float(value), 1) for value in table[:, index]
+            )
+        report.bands.append(band)
+    return report
+
+
+async def get_agp_report(
+    session: AsyncSession,
+    user_id: str,
+    *,
+    days: int = 14,
+    bin_minutes: int = DEFAULT_BIN_MINUTES,
+    now: Optional[datetime] = None,
+) -> AGPReport:
+    """AGP bands and range statistics for the last ``days`` days, cached per user and window."""
+    days = max(1, min(MAX_AGP_DAYS, int(days)))
+    if bin_minutes <= 0 or 1440 % bin_minutes:
+        raise ValueError("bin_minutes must divide a day")
+    version = await current_cursor(session, user_id)
+    key = (user_id, days, bin_minutes)
+    cached = _REPORTS.get(key)
+    if cached is not None and cached.version == version and cached.expires_at > time.monotonic():
+        _REPORTS.move_to_end(key)
+        return cached.report
+
+    end = as_utc(now or datetime.now(timezone.utc))
+    start = end - timedelta(days=days)
+    tz = get_user_timezone(user_id)
+    epoch_seconds, values = await load_series(session, user_id, start, end)
+    report = build_report(
+        epoch_seconds, values, start=start, end=end, days=days, tz=tz, bin_minutes=bin_minutes
+    )
+
+    _REPORTS[key] = _CachedReport(version, time.monotonic() + AGP_CACHE_TTL_SECONDS, report)
+    _REPORTS.move_to_end(key)
+    while len(_REPORTS) > MAX_CACHED_REPORTS:
+        _REPORTS.popitem(last=False)
+    return report
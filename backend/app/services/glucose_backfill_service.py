@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.glucose_reading import GlucoseReadingDB
+from app.models.nightscout_secrets import NightscoutSecrets
+from app.models.settings import UserSettings, UserSettingsDB
+from app.services.dexcom_client import DexcomClient
+from app.services.glucose_ingest_service import (
+    GlucoseIngestData,
+    as_utc,
+    ingest_glucose_readings_bulk,
+)
+from app.services.glucose_source_service import load_glucose_user_settings
+from app.services.nightscout_client import NightscoutClient
+from app.services.nightscout_secrets_service import get_ns_config
+
+
+logger = logging.getLogger(__name__)
+
+# Re-read a little before the high-water mark so late Nightscout uploads
+# (uploader catching up after a phone outage) are still picked up.
+BACKFILL_OVERLAP = timedelta(minutes=15)
+INITIAL_LOOKBACK = timedelta(hours=24)
+# Ingest validation rejects anything older than 7 days.
+MAX_LOOKBACK = timedelta(days=7)
+MAX_ENTRIES_PER_PULL = 5000
+# Dexcom Share cannot serve anything older than this.
+DEXCOM_LOOKBACK = timedelta(minutes=1440)
+# Local history is "fresh" while its newest point is younger than this.
+FRESH_AFTER = timedelta(minutes=10)
+# Minimum spacing between on-demand (cache-miss) backfills for one user.
+ON_DEMAND_MIN_INTERVAL = timedelta(seconds=60)
+
+
+@dataclass(slots=True)
+class BackfillState:
+    high_water_mark: Optional[datetime] = None
+    last_attempt_at: Optional[datetime] = None
+    last_success_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    running: bool = False
+
+
+_states: dict[str, BackfillState] = {}
+_locks: dict[str, asyncio.Lock] = {}
+_tasks: dict[str, asyncio.Task] = {}
+
+
+def get_backfill_state(user_id: str) -> BackfillState:
+    return _states.setdefault(user_id, BackfillState())
+
+
+async def _high_water_mark(session: AsyncSession, user_id: str, source: str) -> Optional[datetime]:
+    value = (
+        await session.execute(
+            select(func.max(GlucoseReadingDB.measured_at)).where(
+                GlucoseReadingDB.user_id == user_id,
+                GlucoseReadingDB.source == source,
+            )
+        )
+    ).scalar_one_or_none()
+    return as_utc(value) if value else None
+
+
+async def nightscout_high_water_mark(session: AsyncSession, user_id: str) -> Optional[datetime]:
+    return await _high_water_mark(session, user_id, "nightscout")
+
+
+async def dexcom_high_water_mark(session: AsyncSession, user_id: str) -> Optional[datetime]:
+    return await _high_water_mark(session, user_id, "dexcom_share")
+
+
+async def _serialized(
+    session: AsyncSession,
+    user_id: str,
+    now: datetime,
+    pull: Callable[[], Awaitable[dict[str, object]]],
+) -> dict[str, object]:
+    """Run one pull for ``user_id`` under its lock, keeping ``BackfillState`` current.
+
+    Runs are serialized per user so the scheduler and on-demand triggers never
+    ingest the same span twice concurrently.
+    """
+    state = get_backfill_state(user_id)
+    lock = _locks.setdefault(user_id, asyncio.Lock())
+    async with lock:
+        state.running = True
+        state.last_attempt_at = now
+        try:
+            result = await pull()
+        except Exception as exc:
+            state.last_error = type(exc).__name__
+            await session.rollback()
+            raise
+        finally:
+            state.running = False
+        if result["status"] == "ok":
+            state.last_success_at = datetime.now(timezone.utc)
+            state.last_error = None
+        return result
+
+
+async def _ingest_pulled(
+    session: AsyncSession, user_id: str, source: str, items: list[GlucoseIngestData], start: datetime
+) -> int:
+    results = await ingest_glucose_readings_bulk(session, user_id, items, sync_to_nightscout=False)
+    await session.commit()
+    inserted = sum(1 for result in results if not result.duplicate)
+    if inserted:
+        logger.info(
+            "Glucose backfill source=%s user=%s fetched=%d inserted=%d since=%s",
+            source,
+            user_id,
+            len(items),
+            inserted,
+            start.isoformat(),
+        )
+    return inserted
+
+
+async def backfill_nightscout(
+    session: AsyncSession,
+    user_id: str,
+    *,
+    since: Optional[datetime] = None,
+    now: Optional[datetime] = None,
+) -> dict[str, object]:
+    """Pull Nightscout entries newer than the user's high-water mark into the local table.
+
+    ``since`` widens the pull further back (cache miss for an older window).
+    """
+    now = as_utc(now or datetime.now(timezone.utc))
+
+    async def pull() -> dict[str, object]:
+        ns = await get_ns_config(session, user_id)
+        if not ns or not ns.enabled or not ns.url:
+            return {"status": "not_configured", "fetched": 0, "inserted": 0}
+
+        high_water_mark = await nightscout_high_water_mark(session, user_id)
+        start = (
+            high_water_mark - BACKFILL_OVERLAP
+            if high_water_mark
+            else now - INITIAL_LOOKBACK
+        )
+        if since is not None:
+            start = min(start, as_utc(since))
+        start = max(start, now - MAX_LOOKBACK)
+        count = min(
+            MAX_ENTRIES_PER_PULL,
+            int((now - start).total_seconds() // 300) + 50,
+        )
+
+        client = NightscoutClient(ns.url, ns.api_secret, timeout_seconds=10)
+        try:
+            entries = await client.get_sgv_range(start, now, count=count)
+        finally:
+            await client.aclose()
+
+        inserted = await _ingest_pulled(
+            session,
+            user_id,
+            "nightscout",
+            [
+                GlucoseIngestData(
+                    glucose_mgdl=int(entry.sgv),
+                    measured_at=datetime.fromtimestamp(entry.date / 1000, tz=timezone.utc),
+                    source="nightscout",
+                    trend_arrow=entry.direction,
+                    # Old points are marked historical by age validation. The
+                    # newest point can still be recognized as a live reading.
+                    historical=False,
+                )
+                for entry in entries
+            ],
+            start,
+        )
+        get_backfill_state(user_id).high_water_mark = await nightscout_high_water_mark(session, user_id)
+        return {"status": "ok", "fetched": len(entries), "inserted": inserted}
+
+    return await _serialized(session, user_id, now, pull)
+
+
+def dexcom_configured(settings: UserSettings) -> bool:
+    """Whether Dexcom Share is enabled with credentials and as a glucose source."""
+    config = settings.dexcom
+    return bool(
+        config.enabled
+        and config.username
+        and config.password
+        and settings.glucose_sources.dexcom_share_enabled
+    )
+
+
+async def backfill_dexcom(
+    session: AsyncSession,
+    user_id: str,
+    *,
+    now: Optional[datetime] = None,
+) -> dict[str, object]:
+    """Merge Dexcom Share readings newer than the local high-water mark.
+
+    Share only keeps 24 hours, so the local table is what makes longer
+    windows (night pattern, history) available for Dexcom-only users. After
+    the first pull each run asks Share for just the last few minutes.
+    """
+    now = as_utc(now or datetime.now(timezone.utc))
+
+    async def pull() -> dict[str, object]:
+        settings = await load_glucose_user_settings(session, user_id)
+        if not dexcom_configured(settings):
+            return {"status": "not_configured", "fetched": 0, "inserted": 0}
+
+        high_water_mark = await dexcom_high_water_mark(session, user_id)
+        start = high_water_mark - BACKFILL_OVERLAP if high_water_mark else now - DEXCOM_LOOKBACK
+        start = max(start, now - DEXCOM_LOOKBACK)
+
+        readings = await DexcomClient(
+            username=settings.dexcom.username,
+            password=settings.dexcom.password,
+            region=settings.dexcom.region or "ous",
+        ).fetch_sgv_range(start, now)
+
+        inserted = await _ingest_pulled(
+            session,
+            user_id,
+            "dexcom_share",
+            [
+                GlucoseIngestData(
+                    glucose_mgdl=int(reading.sgv),
+                    measured_at=as_utc(reading.date),
+                    source="dexcom_share",
+                    trend_arrow=reading.trend,
+                    historical=False,
+                )
+                for reading in readings
+            ],
+            start,
+        )
+        get_backfill_state(user_id).high_water_mark = await dexcom_high_water_mark(session, user_id)
+        return {"status": "ok", "fetched": len(readings), "inserted": inserted}
+
+    return await _serialized(session, user_id, now, pull)
+
+
+async def backfill_user(
+    session: AsyncSession,
+    user_id: str,
+    *,
+    since: Optional[datetime] = None,
+    now: Optional[datetime] = None,
+) -> dict[str, object]:
+    """Backfill from Nightscout when it is configured, otherwise from Dexcom Share."""
+    result = await backfill_nightscout(session, user_id, since=since, now=now)
+    if result["status"] != "not_configured":
+        return result
+    return await backfill_dexcom(session, user_id, now=now)
+
+
+async def _backfill_in_own_session(user_id: str, since: Optional[datetime]) -> None:
+    from app.core.db import SessionLocal
+
+    try:
+        async with SessionLocal() as session:
+            await backfill_user(session, user_id, since=since)
+    except Exception as exc:
+        logger.warning(
+            "Background glucose backfill failed for %s: %s", user_id, type(exc).__name__
+        )
+    finally:
+        _tasks.pop(user_id, None)
+
+
+def schedule_backfill(user_id: str, *, since: Optional[datetime] = None) -> bool:
+    """Start a background backfill for ``user_id`` unless one ran or is running recently.
+
+    Returns True when a backfill is (now) in flight.
+    """
+    existing = _tasks.get(user_id)
+    if existing is not None and not existing.done():
+        return True
+    state = get_backfill_state(user_id)
+    now = datetime.now(timezone.utc)
+    if state.last_attempt_at and now - state.last_attempt_at < ON_DEMAND_MIN_INTERVAL:
+        return False
+    state.last_attempt_at = now
+    _tasks[user_id] = asyncio.create_task(
+        _backfill_in_own_session(user_id, since),
+        name=f"glucose_backfill:{user_id}",
+    )
+    return True
+
+
+def history_freshness(latest_measured_at: Optional[datetime], now: Optional[datetime] = None) -> str:
+    if latest_measured_at is None:
+        return "empty"
+    now = as_utc(now or datetime.now(timezone.utc))
+    return "fresh" if now - as_utc(latest_measured_at) <= FRESH_AFTER else "stale"
+
+
+async def backfill_all_users(session: AsyncSession) -> dict[str, int]:
+    """Scheduler entry point: advance every Nightscout or Dexcom Share user's high-water mark."""
+    nightscout_users = set(
+        (
+            await session.execute(
+                select(NightscoutSecrets.user_id).where(NightscoutSecrets.enabled.is_(True))
+            )
+        ).scalars().all()
+    )
+    dexcom_users = []
+    for user_id, payload in (
+        await session.execute(select(UserSettingsDB.user_id, UserSettingsDB.settings))
+    ).all():
+        if user_id in nightscout_users or not (payload or {}).get("dexcom", {}).get("enabled"):
+            continue
+        if dexcom_configured(UserSettings.migrate(payload)):
+            dexcom_users.append(user_id)
+
+    stats = {"users": 0, "fetched": 0, "inserted": 0, "failed": 0}
+    jobs = [(user_id, backfill_nightscout) for user_id in sorted(nightscout_users)]
+    jobs += [(user_id, backfill_dexcom) for user_id in dexcom_users]
+    for user_id, backfill in jobs:
+        try:
+            result = await backfill(session, user_id)
+        except Exception as exc:
+            stats["failed"] += 1
+            logger.warning("Glucose backfill failed for %s: %s", user_id, type(exc).__name__)
+            continue
+        if result["status"] != "ok":
+            continue
+        stats["users"] += 1
+        stats["fetched"] += int(result["fetched"])
+        stats["inserted"] += int(result["inserted"])
+    return stats
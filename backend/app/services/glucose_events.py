@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models.glucose_reading import GlucoseReadingDB
+
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 32
+_PENDING_KEY = "glucose_events_pending"
+
+TickHandler = Callable[[str, Any], Awaitable[Optional[dict[str, Any]]]]
+Listener = Callable[[str, dict[str, Any]], None]
+
+
+class GlucoseEventHub:
+    """In-process fan-out of glucose events to streaming subscribers.
+
+    Events are computed once and copied to every subscriber queue. A slow
+    subscriber loses its oldest events rather than blocking the publisher.
+    After each batch of new readings the optional tick handler (forecast
+    summary) runs once per user, coalescing readings that land while it is
+    still computing.
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+        self._contexts: dict[str, Any] = {}
+        self._latest: dict[str, dict[str, dict[str, Any]]] = defaultdict(dict)
+        self._tick_handler: Optional[TickHandler] = None
+        self._tick_tasks: dict[str, asyncio.Task] = {}
+        self._tick_dirty: set[str] = set()
+        self._listeners: list[Listener] = []
+        self._sequence = 0
+
+    def set_tick_handler(self, handler: Optional[TickHandler]) -> None:
+        self._tick_handler = handler
+
+    def add_listener(self, listener: Listener) -> None:
+        """Call ``listener(user_id, message)`` on every publish, subscribers or not.
+
+        Listeners run inline in the publisher and must not block.
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def subscriber_count(self, user_id: str) -> int:
+        return len(self._subscribers.get(user_id, ()))
+
+    def latest(self, user_id: str) -> list[dict[str, Any]]:
+        """Last event of each type, replayed to new subscribers."""
+        return sorted(self._latest.get(user_id, {}).values(), key=lambda item: item["seq"])
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, user_id: str, *, context: Any = None) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[user_id].add(queue)
+        if context is not None:
+            self._contexts[user_id] = context
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    self._subscribers.pop(user_id, None)
+                    self._contexts.pop(user_id, None)
+
+    def publish(self, user_id: str, payload: dict[str, Any]) -> dict[str, Any]:
+        self._sequence += 1
+        message = {"seq": self._sequence, **payload}
+        self._latest[user_id][payload["type"]] = message
+        for queue in list(self._subscribers.get(user_id, ())):
+            if queue.full():
+                with contextlib.suppress(asyncio.QueueEmpty):
+                    queue.get_nowait()
+            queue.put_nowait(message)
+        for listener in self._listeners:
+            try:
+                listener(user_id, message)
+            except Exception as exc:
+                logger.warning("Glucose event listener failed for %s: %s", user_id, type(exc).__name__)
+        if payload["type"] == "readings":
+            self.request_tick(user_id)
+        return message
+
+    def request_tick(self, user_id: str) -> None:
+        if self._tick_handler is None or not self.subscriber_count(user_id):
+            return
+        running = self._tick_tasks.get(user_id)
+        if running is not None and not running.done():
+            self._tick_dirty.add(user_id)
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._tick_tasks[user_id] = loop.create_task(self._run_tick(user_id))
+
+    async def _run_tick(self, user_id: str) -> None:
+        try:
+            while True:
+                self._tick_dirty.discard(user_id)
+                handler = self._tick_handler
+                if handler is None or not self.subscriber_count(user_id):
+                    return
+                try:
+                    payload = await handler(user_id, self._contexts.get(user_id))
+                except Exception as exc:
+                    logger.warning("Glucose push tick failed for %s: %s", user_id, type(exc).__name__)
+                    payload = None
+                if payload is not None:
+                    self.publish(user_id, payload)
+                if user_id not in self._tick_dirty:
+                    return
+        finally:
+            self._tick_tasks.pop(user_id, None)
+
+
+hub = GlucoseEventHub()
+
+
+def reading_event_item(row: GlucoseReadingDB) -> dict[str, Any]:
+    measured_at = row.measured_at
+    if measured_at.tzinfo is None:
+        measured_at = measured_at.replace(tzinfo=timezone.utc)
+    return {
+        "id": row.id,
+        "sgv": row.glucose_mgdl,
+        "date": int(measured_at.timestamp() * 1000),
+        "direction": row.trend_arrow,
+        "source": row.source,
+        "historical": bool(row.historical),
+        "usable_for_dosing": bool(row.usable_for_dosing),
+    }
+
+
+def queue_event(session: Any, user_id: str, kind: str, item: Any) -> None:
+    """Stage an event on ``session``; it is published only if the transaction commits.
+
+    ``item`` may be a ``GlucoseReadingDB`` row; it is serialized at commit
+    time, once its primary key has been assigned by the flush.
+    """
+    sync_session = getattr(session, "sync_session", session)
+    info = getattr(sync_session, "info", None)
+    if not isinstance(info, dict):
+        return
+    info.setdefault(_PENDING_KEY, []).append((user_id, kind, item))
+
+
+def queue_reading(session: Any, row: GlucoseReadingDB) -> None:
+    if row.validation_status == "accepted":
+        queue_event(session, row.user_id, "readings", row)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    grouped: dict[tuple[str, str], list[dict[str, Any]]] = defaultdict(list)
+    for user_id, kind, item in pending:
+        if isinstance(item, GlucoseReadingDB):
+            item = reading_event_item(item)
+        grouped[(user_id, kind)].append(item)
+    now = datetime.now(timezone.utc).isoformat()
+    for (user_id, kind), items in grouped.items():
+        # One message per user and commit: a 288-point backfill is one event
+        # and triggers one forecast tick, not 288.
+        hub.publish(user_id, {"type": kind, "at": now, "items": items})
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
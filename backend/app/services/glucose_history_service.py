@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.glucose_reading import GlucoseReadingDB
+from app.services.glucose_ingest_service import as_utc
+from app.services.glucose_source_service import SOURCE_PRIORITY
+
+
+CURSOR_VERSION = "v1"
+# Rows are stamped with ``updated_at`` at flush time, slightly before their
+# transaction commits. Re-reading a short overlap behind the cursor keeps a
+# concurrent ingest from slipping past a poll; clients upsert items by id.
+CURSOR_OVERLAP = timedelta(seconds=30)
+
+
+def encode_cursor(updated_at: Optional[datetime]) -> str:
+    if updated_at is None:
+        return f"{CURSOR_VERSION}:0"
+    return f"{CURSOR_VERSION}:{int(as_utc(updated_at).timestamp() * 1_000_000)}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[datetime]:
+    """Cursor -> high-water ``updated_at``; ``None`` for missing or unreadable cursors."""
+    if not cursor:
+        return None
+    version, _, value = cursor.partition(":")
+    if version != CURSOR_VERSION or not value.isdigit():
+        return None
+    return datetime.fromtimestamp(int(value) / 1_000_000, tz=timezone.utc)
+
+
+def history_etag(cursor: str, *parts: object) -> str:
+    digest = hashlib.sha1("|".join([cursor, *map(str, parts)]).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {value.strip() for value in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def canonical_key(row: GlucoseReadingDB) -> tuple[int, int]:
+    return int(as_utc(row.measured_at).timestamp()), row.glucose_mgdl
+
+
+def canonical_rows(rows: Iterable[GlucoseReadingDB]) -> dict[tuple[int, int], GlucoseReadingDB]:
+    """One row per sensor sample, preferring the most direct source.
+
+    The same sample can arrive through Android, watch and Nightscout; the
+    history endpoint and its deltas must agree on which copy is served.
+    """
+    canonical: dict[tuple[int, int], GlucoseReadingDB] = {}
+    for row in rows:
+        key = canonical_key(row)
+        previous = canonical.get(key)
+        if previous is None or SOURCE_PRIORITY.get(row.source, 0) > SOURCE_PRIORITY.get(previous.source, 0):
+            canonical[key] = row
+    return canonical
+
+
+async def current_cursor(session: AsyncSession, user_id: str) -> str:
+    value = (
+        await session.execute(
+            select(func.max(GlucoseReadingDB.updated_at)).where(GlucoseReadingDB.user_id == user_id)
+        )
+    ).scalar_one_or_none()
+    return encode_cursor(value)
+
+
+@dataclass(slots=True)
+class HistoryDelta:
+    items: list[GlucoseReadingDB] = field(default_factory=list)
+    tombstones: list[str] = field(default_factory=list)
+    # True when the cursor could not be honoured and ``items`` is the full window.
+    full: bool = False
+
+
+async def load_history_delta(
+    session: AsyncSession,
+    user_id: str,
+    *,
+    since: datetime,
+    start: datetime,
+    max_changes: int,
+) -> Optional[HistoryDelta]:
+    """Canonical readings changed after ``since`` plus ids they superseded.
+
+    Returns ``None`` when more than ``max_changes`` rows changed; the caller
+    should then send a full window instead.
+    """
+    changed = list(
+        (
+            await session.execute(
+                select(GlucoseReadingDB)
+                .where(
+                    GlucoseReadingDB.user_id == user_id,
+                    GlucoseReadingDB.updated_at > since - CURSOR_OVERLAP,
+                    GlucoseReadingDB.measured_at >= start,
+                )
+                .order_by(GlucoseReadingDB.updated_at.asc())
+                .limit(max_changes + 1)
+            )
+        ).scalars().all()
+    )
+    if len(changed) > max_changes:
+        return None
+    if not changed:
+        return HistoryDelta()
+
+    # Re-run the canonical choice only over the samples the changed rows touch.
+    times = [as_utc(row.measured_at) for row in changed]
+    neighbourhood = (
+        await session.execute(
+            select(GlucoseReadingDB).where(
+                GlucoseReadingDB.user_id == user_id,
+                GlucoseReadingDB.validation_status == "accepted",
+                GlucoseReadingDB.measured_at >= min(times) - timedelta(seconds=1),
+                GlucoseReadingDB.measured_at <= max(times) + timedelta(seconds=1),
+            )
+        )
+    ).scalars().all()
+    canonical = canonical_rows(neighbourhood)
+    canonical_ids = {row.id for row in canonical.values()}
+    touched = {canonical_key(row) for row in changed}
+
+    items = [row for row in changed if row.id in canonical_ids]
+    tombstones = {row.id for row in changed if row.id not in canonical_ids}
+    tombstones.update(
+        row.id
+        for row in neighbourhood
+        if row.id not in canonical_ids and canonical_key(row) in touched
+    )
+    items.sort(key=lambda row: as_utc(row.measured_at), reverse=True)
+    return HistoryDelta(items=items, tombstones=sorted(tombstones))
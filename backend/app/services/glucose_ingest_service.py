@@ -3,18 +3,22 @@ from __future__ import annotations
 import hashlib
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Iterable, Optional, Sequence
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.glucose_reading import GlucoseReadingDB
+from app.services.glucose_events import queue_reading
 
 
 DIRECT_SOURCES = {"dexcom_android", "g7_direct_watch"}
 REMOTE_SOURCES = {"nightscout", "dexcom_share"}
 ALLOWED_SOURCES = DIRECT_SOURCES | REMOTE_SOURCES | {"manual"}
 
+# Keeps IN lists well under SQLite's bound-parameter limit.
+BULK_LOOKUP_CHUNK = 500
+
 BLOCKED_SENSOR_STATES = {
     "WARMUP",
     "STARTUP",
@@ -137,72 +141,86 @@ def validate_ingest(data: GlucoseIngestData, now: Optional[datetime] = None) ->
     return ("accepted" if reason is None else "rejected", reason, usable, historical)
 
 
-async def ingest_glucose_reading(
-    session: AsyncSession,
-    user_id: str,
-    data: GlucoseIngestData,
-    *,
-    sync_to_nightscout: bool = True,
-    flush: bool = True,
-) -> GlucoseIngestResult:
+@dataclass(slots=True)
+class _PreparedReading:
+    data: GlucoseIngestData
+    source: str
+    measured_at: datetime
+    received_at: datetime
+    session_id: Optional[str]
+    origin_installation_id: Optional[str]
+    uid: str
+
+    @property
+    def sequence_key(self) -> Optional[tuple[str, str, str, int]]:
+        if self.origin_installation_id and self.session_id and self.data.sequence is not None:
+            return (self.source, self.origin_installation_id, self.session_id, self.data.sequence)
+        return None
+
+
+def _prepare_reading(user_id: str, data: GlucoseIngestData) -> _PreparedReading:
     source = data.source.strip().lower()
     measured_at = as_utc(data.measured_at)
-    received_at = as_utc(data.received_at or datetime.now(timezone.utc))
     session_id = _bounded_identifier(data.sensor_session_id)
-    uid = build_reading_uid(
-        user_id=user_id,
+    return _PreparedReading(
+        data=data,
         source=source,
         measured_at=measured_at,
-        glucose_mgdl=int(data.glucose_mgdl),
-        reading_uid=data.reading_uid,
-        sensor_session_id=session_id,
-        sequence=data.sequence,
+        received_at=as_utc(data.received_at or datetime.now(timezone.utc)),
+        session_id=session_id,
+        origin_installation_id=_bounded_identifier(data.origin_installation_id),
+        uid=build_reading_uid(
+            user_id=user_id,
+            source=source,
+            measured_at=measured_at,
+            glucose_mgdl=int(data.glucose_mgdl),
+            reading_uid=data.reading_uid,
+            sensor_session_id=session_id,
+            sequence=data.sequence,
+        ),
     )
 
-    existing = (
-        await session.execute(
-            select(GlucoseReadingDB).where(
-                GlucoseReadingDB.user_id == user_id,
-                GlucoseReadingDB.reading_uid == uid,
-            )
-        )
-    ).scalars().first()
-    origin_installation_id = _bounded_identifier(data.origin_installation_id)
-    if (
-        existing is None
-        and origin_installation_id
-        and session_id
-        and data.sequence is not None
-    ):
-        existing = (
-            await session.execute(
-                select(GlucoseReadingDB).where(
-                    GlucoseReadingDB.user_id == user_id,
-                    GlucoseReadingDB.source == source,
-                    GlucoseReadingDB.origin_installation_id == origin_installation_id,
-                    GlucoseReadingDB.sensor_session_id == session_id,
-                    GlucoseReadingDB.sequence == data.sequence,
-                )
-            )
-        ).scalars().first()
-    if existing:
-        # A point may first arrive as backfill and later as a live reading. Keep
-        # the stable UID, but allow the live copy to restore dosing metadata.
-        validation_status, validation_reason, usable, historical = validate_ingest(data)
-        if existing.validation_status == "accepted" and validation_status == "accepted":
-            existing.historical = historical
-            existing.timestamp_uncertain = bool(data.timestamp_uncertain)
-            existing.usable_for_dosing = usable
-            existing.validation_reason = validation_reason
-            existing.received_at = max(as_utc(existing.received_at), received_at)
-            existing.trend_arrow = _bounded_identifier(data.trend_arrow, 64) or existing.trend_arrow
-            existing.trend_rate = data.trend_rate if data.trend_rate is not None else existing.trend_rate
-            if source == "dexcom_android" and sync_to_nightscout and existing.sync_status == "not_required":
-                existing.sync_status = "pending"
-            if flush:
-                await session.flush()
-        return GlucoseIngestResult(status="duplicate", reading=existing, duplicate=True)
 
+def _row_sequence_key(row: GlucoseReadingDB) -> Optional[tuple[str, str, str, int]]:
+    if row.origin_installation_id and row.sensor_session_id and row.sequence is not None:
+        return (row.source, row.origin_installation_id, row.sensor_session_id, row.sequence)
+    return None
+
+
+def _apply_duplicate(
+    existing: GlucoseReadingDB,
+    prepared: _PreparedReading,
+    *,
+    sync_to_nightscout: bool,
+) -> None:
+    # A point may first arrive as backfill and later as a live reading. Keep
+    # the stable UID, but allow the live copy to restore dosing metadata.
+    data = prepared.data
+    validation_status, validation_reason, usable, historical = validate_ingest(data)
+    if existing.validation_status == "accepted" and validation_status == "accepted":
+        existing.historical = historical
+        existing.timestamp_uncertain = bool(data.timestamp_uncertain)
+        existing.usable_for_dosing = usable
+        existing.validation_reason = validation_reason
+        existing.received_at = max(as_utc(existing.received_at), prepared.received_at)
+        existing.trend_arrow = _bounded_identifier(data.trend_arrow, 64) or existing.trend_arrow
+        existing.trend_rate = data.trend_rate if data.trend_rate is not None else existing.trend_rate
+        if (
+            prepared.source == "dexcom_android"
+            and sync_to_nightscout
+            and existing.sync_status == "not_required"
+        ):
+            existing.sync_status = "pending"
+
+
+def _new_row(
+    user_id: str,
+    prepared: _PreparedReading,
+    *,
+    sync_to_nightscout: bool,
+) -> GlucoseReadingDB:
+    data = prepared.data
+    source = prepared.source
     validation_status, validation_reason, usable, historical = validate_ingest(data)
     decision_eligible = bool(data.decision_eligible and source != "g7_direct_watch")
     if source == "dexcom_android" and sync_to_nightscout and validation_status == "accepted":
@@ -212,20 +230,20 @@ async def ingest_glucose_reading(
     else:
         sync_status = "not_required"
 
-    row = GlucoseReadingDB(
+    return GlucoseReadingDB(
         user_id=user_id,
-        reading_uid=uid,
+        reading_uid=prepared.uid,
         schema_version=max(1, int(data.schema_version or 1)),
         glucose_mgdl=int(data.glucose_mgdl),
-        measured_at=measured_at,
-        received_at=received_at,
+        measured_at=prepared.measured_at,
+        received_at=prepared.received_at,
         received_at_watch=as_utc(data.received_at_watch) if data.received_at_watch else None,
         received_at_phone=as_utc(data.received_at_phone) if data.received_at_phone else None,
         source=source,
         source_package=_bounded_identifier(data.source_package),
-        origin_installation_id=origin_installation_id,
+        origin_installation_id=prepared.origin_installation_id,
         sensor_type=_bounded_identifier(data.sensor_type, 40),
-        sensor_session_id=session_id,
+        sensor_session_id=prepared.session_id,
         sequence=data.sequence,
         outbox_sequence=data.outbox_sequence,
         trend_arrow=_bounded_identifier(data.trend_arrow, 64),
@@ -240,10 +258,135 @@ async def ingest_glucose_reading(
         decision_eligible=decision_eligible,
         sync_status=sync_status,
     )
+
+
+async def ingest_glucose_reading(
+    session: AsyncSession,
+    user_id: str,
+    data: GlucoseIngestData,
+    *,
+    sync_to_nightscout: bool = True,
+    flush: bool = True,
+) -> GlucoseIngestResult:
+    prepared = _prepare_reading(user_id, data)
+
+    existing = (
+        await session.execute(
+            select(GlucoseReadingDB).where(
+                GlucoseReadingDB.user_id == user_id,
+                GlucoseReadingDB.reading_uid == prepared.uid,
+            )
+        )
+    ).scalars().first()
+    if existing is None and prepared.sequence_key is not None:
+        existing = (
+            await session.execute(
+                select(GlucoseReadingDB).where(
+                    GlucoseReadingDB.user_id == user_id,
+                    GlucoseReadingDB.source == prepared.source,
+                    GlucoseReadingDB.origin_installation_id == prepared.origin_installation_id,
+                    GlucoseReadingDB.sensor_session_id == prepared.session_id,
+                    GlucoseReadingDB.sequence == data.sequence,
+                )
+            )
+        ).scalars().first()
+    if existing:
+        _apply_duplicate(existing, prepared, sync_to_nightscout=sync_to_nightscout)
+        if flush:
+            await session.flush()
+        return GlucoseIngestResult(status="duplicate", reading=existing, duplicate=True)
+
+    row = _new_row(user_id, prepared, sync_to_nightscout=sync_to_nightscout)
     session.add(row)
+    queue_reading(session, row)
+    if flush:
+        await session.flush()
+    return GlucoseIngestResult(status=row.validation_status, reading=row)
+
+
+def _chunks(values: list, size: int) -> Iterable[list]:
+    for index in range(0, len(values), size):
+        yield values[index:index + size]
+
+
+async def ingest_glucose_readings_bulk(
+    session: AsyncSession,
+    user_id: str,
+    items: Sequence[GlucoseIngestData],
+    *,
+    sync_to_nightscout: bool = True,
+    flush: bool = True,
+) -> list[GlucoseIngestResult]:
+    """Set-based equivalent of calling ``ingest_glucose_reading`` per item in order.
+
+    Existing rows are resolved with one ``IN`` query per dedupe key (reading
+    UID and sensor sequence tuple) instead of two SELECTs per reading. Items
+    repeated inside the batch dedupe against each other exactly as sequential
+    calls would, and new rows plus duplicate upgrades go out in one flush.
+    """
+    prepared = [_prepare_reading(user_id, item) for item in items]
+    if not prepared:
+        return []
+
+    by_uid: dict[str, GlucoseReadingDB] = {}
+    for chunk in _chunks(sorted({item.uid for item in prepared}), BULK_LOOKUP_CHUNK):
+        rows = (
+            await session.execute(
+                select(GlucoseReadingDB).where(
+                    GlucoseReadingDB.user_id == user_id,
+                    GlucoseReadingDB.reading_uid.in_(chunk),
+                )
+            )
+        ).scalars().all()
+        by_uid.update({row.reading_uid: row for row in rows})
+
+    by_sequence: dict[tuple[str, str, str, int], GlucoseReadingDB] = {}
+    wanted_sequences = {
+        item.sequence_key
+        for item in prepared
+        if item.uid not in by_uid and item.sequence_key is not None
+    }
+    if wanted_sequences:
+        session_ids = sorted({key[2] for key in wanted_sequences})
+        for chunk in _chunks(session_ids, BULK_LOOKUP_CHUNK):
+            rows = (
+                await session.execute(
+                    select(GlucoseReadingDB).where(
+                        GlucoseReadingDB.user_id == user_id,
+                        GlucoseReadingDB.sensor_session_id.in_(chunk),
+                        GlucoseReadingDB.sequence.in_(sorted({key[3] for key in wanted_sequences})),
+                    )
+                )
+            ).scalars().all()
+            for row in rows:
+                key = _row_sequence_key(row)
+                if key in wanted_sequences:
+                    by_sequence.setdefault(key, row)
+
+    results: list[GlucoseIngestResult] = []
+    new_rows: list[GlucoseReadingDB] = []
+    for item in prepared:
+        existing = by_uid.get(item.uid)
+        if existing is None and item.sequence_key is not None:
+            existing = by_sequence.get(item.sequence_key)
+        if existing is not None:
+            _apply_duplicate(existing, item, sync_to_nightscout=sync_to_nightscout)
+            results.append(GlucoseIngestResult(status="duplicate", reading=existing, duplicate=True))
+            continue
+
+        row = _new_row(user_id, item, sync_to_nightscout=sync_to_nightscout)
+        new_rows.append(row)
+        by_uid[row.reading_uid] = row
+        if item.sequence_key is not None:
+            by_sequence[item.sequence_key] = row
+        results.append(GlucoseIngestResult(status=row.validation_status, reading=row))
+
+    session.add_all(new_rows)
+    for row in new_rows:
+        queue_reading(session, row)
     if flush:
         await session.flush()
-    return GlucoseIngestResult(status=validation_status, reading=row)
+    return results
 
 
 async def latest_local_readings(
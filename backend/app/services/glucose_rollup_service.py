@@ -0,0 +1,447 @@
+from __future__ import annotations
+
+import logging
+import math
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.settings import get_settings
+from app.models.glucose_reading import GlucoseReadingDB
+from app.models.glucose_rollup import (
+    GlucoseRollup5mDB,
+    GlucoseRollupDailyDB,
+    GlucoseRollupHourlyDB,
+    GlucoseRollupStateDB,
+)
+from app.services.cgm_series import CGMPoint, CGMSeriesRepository
+from app.services.glucose_ingest_service import as_utc
+from app.services.glucose_source_service import SOURCE_PRIORITY
+
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_STEP = timedelta(minutes=5)
+STATE_NAME = "glucose_rollups"
+# Rows are stamped at flush, slightly before commit; re-scan a little behind
+# the watermark so a concurrent ingest is never skipped.
+CURSOR_OVERLAP = timedelta(minutes=2)
+PARTITION_MONTHS_AHEAD = 2
+# Read resolution by requested span: charts never load more than ~700 points.
+FIVE_MINUTE_MAX_SPAN = timedelta(days=2)
+HOURLY_MAX_SPAN = timedelta(days=30)
+# Exact percentiles are computed from the 5-minute series up to this span.
+EXACT_PERCENTILE_MAX_SPAN = timedelta(days=90)
+
+ROLLUP_TABLES = {
+    "5m": GlucoseRollup5mDB,
+    "hourly": GlucoseRollupHourlyDB,
+    "daily": GlucoseRollupDailyDB,
+}
+
+
+def floor_time(at: datetime, step: timedelta) -> datetime:
+    at = as_utc(at)
+    seconds = int(step.total_seconds())
+    return datetime.fromtimestamp(int(at.timestamp()) // seconds * seconds, tz=timezone.utc)
+
+
+def _day(at: datetime) -> datetime:
+    return as_utc(at).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Linear-interpolated percentile (``q`` in 0..100) of pre-sorted values."""
+    if not sorted_values:
+        raise ValueError("percentile of empty sequence")
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return float(sorted_values[lower])
+    weight = position - lower
+    return sorted_values[lower] * (1 - weight) + sorted_values[upper] * weight
+
+
+@dataclass(slots=True)
+class GlucoseAggregate:
+    samples: int = 0
+    sum_mgdl: float = 0.0
+    sum_sq_mgdl: float = 0.0
+    min_mgdl: Optional[int] = None
+    max_mgdl: Optional[int] = None
+    below_54: int = 0
+    below_70: int = 0
+    in_range: int = 0
+    above_180: int = 0
+    above_250: int = 0
+    p10: Optional[float] = None
+    p25: Optional[float] = None
+    p50: Optional[float] = None
+    p75: Optional[float] = None
+    p90: Optional[float] = None
+
+    @classmethod
+    def from_values(cls, values: Iterable[int]) -> "GlucoseAggregate":
+        ordered = sorted(values)
+        if not ordered:
+            return cls()
+        return cls(
+            samples=len(ordered),
+            sum_mgdl=float(sum(ordered)),
+            sum_sq_mgdl=float(sum(value * value for value in ordered)),
+            min_mgdl=ordered[0],
+            max_mgdl=ordered[-1],
+            below_54=sum(1 for value in ordered if value < 54),
+            below_70=sum(1 for value in ordered if value < 70),
+            in_range=sum(1 for value in ordered if 70 <= value <= 180),
+            above_180=sum(1 for value in ordered if value > 180),
+            above_250=sum(1 for value in ordered if value > 250),
+            p10=percentile(ordered, 10),
+            p25=percentile(ordered, 25),
+            p50=percentile(ordered, 50),
+            p75=percentile(ordered, 75),
+            p90=percentile(ordered, 90),
+        )
+
+    @classmethod
+    def combine(cls, rows: Iterable[object]) -> "GlucoseAggregate":
+        """Merge rollup rows. Counts and moments add up; percentiles are left unset."""
+        total = cls()
+        for row in rows:
+            if not row.samples:
+                continue
+            total.samples += row.samples
+            total.sum_mgdl += row.sum_mgdl
+            total.sum_sq_mgdl += row.sum_sq_mgdl
+            total.min_mgdl = row.min_mgdl if total.min_mgdl is None else min(total.min_mgdl, row.min_mgdl)
+            total.max_mgdl = row.max_mgdl if total.max_mgdl is None else max(total.max_mgdl, row.max_mgdl)
+            total.below_54 += row.below_54
+            total.below_70 += row.below_70
+            total.in_range += row.in_range
+            total.above_180 += row.above_180
+            total.above_250 += row.above_250
+        return total
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum_mgdl / self.samples if self.samples else None
+
+    @property
+    def sd(self) -> Optional[float]:
+        if self.samples < 2:
+            return None
+        variance = (self.sum_sq_mgdl - self.sum_mgdl * self.sum_mgdl / self.samples) / (self.samples - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def pct(self, count: int) -> Optional[float]:
+        return round(count / self.samples * 100, 1) if self.samples else None
+
+    def row_values(self) -> dict[str, object]:
+        return asdict(self)
+
+
+def canonical_slots(points: Iterable[CGMPoint]) -> list[CGMPoint]:
+    """One sample per 5-minute slot, preferring the most direct source."""
+    slots: dict[datetime, CGMPoint] = {}
+    for point in points:
+        slot = floor_time(point.measured_at, ROLLUP_STEP)
+        previous = slots.get(slot)
+        if previous is None or SOURCE_PRIORITY.get(point.source, 0) > SOURCE_PRIORITY.get(previous.source, 0):
+            slots[slot] = point
+    return [
+        CGMPoint(measured_at=slot, sgv=point.sgv, source=point.source, direction=point.direction)
+        for slot, point in sorted(slots.items())
+    ]
+
+
+async def refresh_rollups(
+    session: AsyncSession, user_id: str, start: datetime, end: datetime
+) -> dict[str, int]:
+    """Rebuild every rollup for the whole UTC days touching ``[start, end]``.
+
+    Day-granular rebuilds keep the daily rows exact; a day is at most 288
+    slots, so re-deriving it is cheap. The caller commits.
+    """
+    first_day = _day(start)
+    end_day = _day(end) + timedelta(days=1)
+    points = await CGMSeriesRepository(session, user_id).get_range(
+        first_day, end_day - timedelta(microseconds=1)
+    )
+    slots = canonical_slots(points)
+
+    for model in ROLLUP_TABLES.values():
+        await session.execute(
+            delete(model).where(
+                model.user_id == user_id,
+                model.bucket_start >= first_day,
+                model.bucket_start < end_day,
+            )
+        )
+
+    hourly: dict[datetime, list[int]] = defaultdict(list)
+    daily: dict[datetime, list[int]] = defaultdict(list)
+    for point in slots:
+        hourly[floor_time(point.measured_at, timedelta(hours=1))].append(point.sgv)
+        daily[_day(point.measured_at)].append(point.sgv)
+
+    if slots:
+        await session.execute(
+            insert(GlucoseRollup5mDB),
+            [
+                {
+                    "user_id": user_id,
+                    "bucket_start": point.measured_at,
+                    "glucose_mgdl": point.sgv,
+                    "source": point.source,
+                    "trend_arrow": point.direction,
+                }
+                for point in slots
+            ],
+        )
+    for model, buckets in ((GlucoseRollupHourlyDB, hourly), (GlucoseRollupDailyDB, daily)):
+        if buckets:
+            await session.execute(
+                insert(model),
+                [
+                    {
+                        "user_id": user_id,
+                        "bucket_start": bucket_start,
+                        **GlucoseAggregate.from_values(values).row_values(),
+                    }
+                    for bucket_start, values in buckets.items()
+                ],
+            )
+    return {"slots": len(slots), "hours": len(hourly), "days": len(daily)}
+
+
+async def _load_cursor(session: AsyncSession) -> Optional[datetime]:
+    state = await session.get(GlucoseRollupStateDB, STATE_NAME)
+    return as_utc(state.cursor) if state else None
+
+
+def raw_retention() -> Optional[timedelta]:
+    """How long raw readings are kept, or ``None`` (the default) to keep them all."""
+    days = get_settings().data.glucose_raw_retention_days
+    return timedelta(days=days) if days else None
+
+
+def retention_floor(now: Optional[datetime] = None, retention: Optional[timedelta] = None) -> Optional[datetime]:
+    """First UTC day whose raw rows are still complete; older days live only in rollups.
+
+    ``None`` while raw readings are never pruned.
+    """
+    retention = retention or raw_retention()
+    if retention is None:
+        return None
+    return _day(as_utc(now or datetime.now(timezone.utc)) - retention)
+
+
+async def refresh_changed_rollups(
+    session: AsyncSession, *, now: Optional[datetime] = None
+) -> dict[str, int]:
+    """Roll up the days touched by raw rows written since the last run, then commit.
+
+    When raw pruning is enabled, days before the retention floor are never
+    rebuilt: their raw rows are (partly) pruned and the existing rollups are
+    the only complete copy.
+    """
+    floor = retention_floor(now)
+    cursor = await _load_cursor(session)
+    query = select(
+        GlucoseReadingDB.user_id,
+        func.min(GlucoseReadingDB.measured_at),
+        func.max(GlucoseReadingDB.measured_at),
+        func.max(GlucoseReadingDB.updated_at),
+    ).group_by(GlucoseReadingDB.user_id)
+    if cursor is not None:
+        query = query.where(GlucoseReadingDB.updated_at > cursor - CURSOR_OVERLAP)
+    changed = (await session.execute(query)).all()
+
+    stats = {"users": 0, "days": 0, "slots": 0}
+    high_water = cursor
+    for user_id, first_measured, last_measured, last_updated in changed:
+        last_updated = as_utc(last_updated)
+        high_water = last_updated if high_water is None else max(high_water, last_updated)
+        first_measured, last_measured = as_utc(first_measured), as_utc(last_measured)
+        if floor is not None:
+            if last_measured < floor:
+                continue
+            first_measured = max(first_measured, floor)
+        result = await refresh_rollups(session, user_id, first_measured, last_measured)
+        stats["users"] += 1
+        stats["days"] += result["days"]
+        stats["slots"] += result["slots"]
+
+    if high_water is not None and high_water != cursor:
+        state = await session.get(GlucoseRollupStateDB, STATE_NAME)
+        if state is None:
+            session.add(GlucoseRollupStateDB(name=STATE_NAME, cursor=high_water))
+        else:
+            state.cursor = high_water
+    await session.commit()
+    return stats
+
+
+async def ensure_rollup_partitions(
+    session: AsyncSession, *, now: Optional[datetime] = None, months_ahead: int = PARTITION_MONTHS_AHEAD
+) -> list[str]:
+    """Create monthly partitions of ``glucose_rollup_5m`` on Postgres; no-op elsewhere."""
+    if session.bind.dialect.name != "postgresql":
+        return []
+    partitioned = (
+        await session.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table "
+                "WHERE partrelid = to_regclass('glucose_rollup_5m')"
+            )
+        )
+    ).first()
+    if not partitioned:
+        return []
+
+    month = _day(now or datetime.now(timezone.utc)).replace(day=1)
+    created = []
+    for _ in range(months_ahead + 1):
+        following = (month + timedelta(days=32)).replace(day=1)
+        name = f"glucose_rollup_5m_y{month:%Y}m{month:%m}"
+        try:
+            async with session.begin_nested():
+                await session.execute(
+                    text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF glucose_rollup_5m "
+                        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+                    )
+                )
+            created.append(name)
+        except Exception as exc:
+            # Rows for this month already sit in the default partition.
+            logger.warning("Could not create rollup partition %s: %s", name, type(exc).__name__)
+        month = following
+    await session.commit()
+    return created
+
+
+async def prune_raw_readings(
+    session: AsyncSession,
+    *,
+    now: Optional[datetime] = None,
+) -> int:
+    """Delete raw readings past ``data.glucose_raw_retention_days``; their days survive in the rollups.
+
+    Does nothing unless that setting is configured. Rollups are brought up
+    to date first so nothing is pruned un-rolled.
+    """
+    # Whole days only, so every day at or after the floor keeps all its rows.
+    cutoff = retention_floor(now)
+    if cutoff is None:
+        return 0
+    await refresh_changed_rollups(session, now=now)
+    result = await session.execute(
+        delete(GlucoseReadingDB).where(
+            GlucoseReadingDB.measured_at < cutoff,
+            GlucoseReadingDB.sync_status.notin_(("pending", "failed")),
+        )
+    )
+    await session.commit()
+    return int(result.rowcount or 0)
+
+
+def choose_resolution(span: timedelta) -> str:
+    if span <= FIVE_MINUTE_MAX_SPAN:
+        return "5m"
+    if span <= HOURLY_MAX_SPAN:
+        return "hourly"
+    return "daily"
+
+
+async def load_rollups(
+    session: AsyncSession,
+    user_id: str,
+    start: datetime,
+    end: datetime,
+    *,
+    resolution: str = "auto",
+) -> tuple[str, list]:
+    if resolution == "auto":
+        resolution = choose_resolution(as_utc(end) - as_utc(start))
+    model = ROLLUP_TABLES[resolution]
+    rows = (
+        await session.execute(
+            select(model)
+            .where(
+                model.user_id == user_id,
+                model.bucket_start >= floor_time(start, ROLLUP_STEP),
+                model.bucket_start <= as_utc(end),
+            )
+            .order_by(model.bucket_start.asc())
+        )
+    ).scalars().all()
+    return resolution, list(rows)
+
+
+async def summarize_range(
+    session: AsyncSession, user_id: str, start: datetime, end: datetime
+) -> GlucoseAggregate:
+    """Range statistics from rollups; never touches raw readings.
+
+    Whole UTC days come from daily rows and the partial edges from hourly
+    rows. Percentiles are exact from the 5-minute series for spans up to
+    ``EXACT_PERCENTILE_MAX_SPAN`` and omitted beyond it.
+    """
+    start = as_utc(start)
+    end = as_utc(end)
+    first_full_day = _day(start) if _day(start) == start else _day(start) + timedelta(days=1)
+    end_full_day = _day(end)
+
+    rows: list = []
+    if first_full_day < end_full_day:
+        rows += (
+            await session.execute(
+                select(GlucoseRollupDailyDB).where(
+                    GlucoseRollupDailyDB.user_id == user_id,
+                    GlucoseRollupDailyDB.bucket_start >= first_full_day,
+                    GlucoseRollupDailyDB.bucket_start < end_full_day,
+                )
+            )
+        ).scalars().all()
+        edges = [(start, first_full_day), (end_full_day, end)]
+    else:
+        edges = [(start, end)]
+    for edge_start, edge_end in edges:
+        if edge_end <= edge_start:
+            continue
+        rows += (
+            await session.execute(
+                select(GlucoseRollupHourlyDB).where(
+                    GlucoseRollupHourlyDB.user_id == user_id,
+                    GlucoseRollupHourlyDB.bucket_start >= floor_time(edge_start, timedelta(hours=1)),
+                    GlucoseRollupHourlyDB.bucket_start < edge_end,
+                )
+            )
+        ).scalars().all()
+    summary = GlucoseAggregate.combine(rows)
+
+    if summary.samples and end - start <= EXACT_PERCENTILE_MAX_SPAN:
+        values = sorted(
+            (
+                await session.execute(
+                    select(GlucoseRollup5mDB.glucose_mgdl).where(
+                        GlucoseRollup5mDB.user_id == user_id,
+                        GlucoseRollup5mDB.bucket_start >= floor_time(start, timedelta(hours=1)),
+                        GlucoseRollup5mDB.bucket_start < end,
+                    )
+                )
+            ).scalars().all()
+        )
+        if values:
+            summary.p10 = percentile(values, 10)
+            summary.p25 = percentile(values, 25)
+            summary.p50 = percentile(values, 50)
+            summary.p75 = percentile(values, 75)
+            summary.p90 = percentile(values, 90)
+    return summary
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from typing import Optional
 
-from sqlalchemy import select
+from sqlalchemy import case, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.settings import get_settings
 from app.models.glucose_reading import GlucoseReadingDB
+from app.services.glucose_events import queue_event
 from app.services.glucose_ingest_service import as_utc
 from app.services.nightscout_client import NightscoutClient
 from app.services.nightscout_secrets_service import get_ns_config
@@ -16,6 +19,11 @@ from app.services.nightscout_secrets_service import get_ns_config
 
 logger = logging.getLogger(__name__)
 
+# Nightscout accepts arrays on /api/v1/entries; one POST per chunk.
+SYNC_CHUNK_SIZE = 100
+# Users (Nightscout sites) uploaded at the same time by one sync run.
+SYNC_USER_CONCURRENCY = 4
+
 
 async def _nightscout_client_for_user(
     session: AsyncSession, user_id: str
@@ -85,36 +93,165 @@ async def sync_glucose_reading(
     return reading.sync_status
 
 
+@dataclass(slots=True)
+class _PendingReading:
+    id: str
+    user_id: str
+    glucose_mgdl: int
+    timestamp_ms: int
+    direction: str
+    accepted: bool
+
+
+@dataclass(slots=True)
+class _ChunkOutcome:
+    readings: list[_PendingReading]
+    statuses: dict[str, str] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def _chunked(items: list[_PendingReading], size: int) -> list[list[_PendingReading]]:
+    return [items[index:index + size] for index in range(0, len(items), size)]
+
+
+async def _upload_user_backlog(
+    client: NightscoutClient,
+    readings: list[_PendingReading],
+    semaphore: asyncio.Semaphore,
+) -> list[_ChunkOutcome]:
+    outcomes: list[_ChunkOutcome] = []
+    async with semaphore:
+        for chunk in _chunked(readings, SYNC_CHUNK_SIZE):
+            outcome = _ChunkOutcome(readings=chunk)
+            try:
+                result = await client.upload_sgv_batch(
+                    [(item.glucose_mgdl, item.timestamp_ms, item.direction) for item in chunk]
+                )
+            except Exception as exc:
+                outcome.error = type(exc).__name__
+                logger.warning(
+                    "Glucose Nightscout batch sync failed user=%s readings=%d error=%s",
+                    chunk[0].user_id,
+                    len(chunk),
+                    outcome.error,
+                )
+            else:
+                for item in chunk:
+                    key = (item.timestamp_ms, item.glucose_mgdl)
+                    outcome.statuses[item.id] = "duplicate" if key in result["duplicate"] else "synced"
+            outcomes.append(outcome)
+    return outcomes
+
+
 async def sync_pending_glucose_readings(
     session: AsyncSession,
     *,
     user_id: Optional[str] = None,
     limit: int = 100,
 ) -> dict[str, int]:
+    """Drain the Nightscout upload backlog.
+
+    Readings are posted as arrays of up to ``SYNC_CHUNK_SIZE`` per request,
+    users are uploaded concurrently (bounded by ``SYNC_USER_CONCURRENCY``),
+    and each chunk's outcome is written back with a single UPDATE.
+    """
     query = (
-        select(GlucoseReadingDB)
+        select(
+            GlucoseReadingDB.id,
+            GlucoseReadingDB.user_id,
+            GlucoseReadingDB.glucose_mgdl,
+            GlucoseReadingDB.measured_at,
+            GlucoseReadingDB.trend_arrow,
+            GlucoseReadingDB.validation_status,
+        )
         .where(GlucoseReadingDB.sync_status.in_(("pending", "failed")))
-        .order_by(GlucoseReadingDB.received_at.asc())
+        .order_by(GlucoseReadingDB.received_at.asc(), GlucoseReadingDB.measured_at.asc())
         .limit(limit)
     )
     if user_id:
         query = query.where(GlucoseReadingDB.user_id == user_id)
-    rows = list((await session.execute(query)).scalars().all())
+    readings = [
+        _PendingReading(
+            id=row.id,
+            user_id=row.user_id,
+            glucose_mgdl=row.glucose_mgdl,
+            timestamp_ms=int(as_utc(row.measured_at).timestamp() * 1000),
+            direction=row.trend_arrow or "NONE",
+            accepted=row.validation_status == "accepted",
+        )
+        for row in (await session.execute(query)).all()
+    ]
 
     stats = {"processed": 0, "synced": 0, "duplicate": 0, "failed": 0, "pending": 0}
-    clients: dict[str, Optional[NightscoutClient]] = {}
+    by_user: dict[str, list[_PendingReading]] = {}
+    not_required: list[str] = []
+    for item in readings:
+        if item.accepted:
+            by_user.setdefault(item.user_id, []).append(item)
+        else:
+            not_required.append(item.id)
+            queue_event(session, item.user_id, "sync", {"id": item.id, "sync_status": "not_required"})
+    stats["processed"] += len(not_required)
+    if not_required:
+        await session.execute(
+            update(GlucoseReadingDB)
+            .where(GlucoseReadingDB.id.in_(not_required))
+            .values(sync_status="not_required")
+        )
+
+    clients: dict[str, NightscoutClient] = {}
     try:
-        for row in rows:
-            if row.user_id not in clients:
-                clients[row.user_id] = await _nightscout_client_for_user(session, row.user_id)
-            status = await sync_glucose_reading(
-                session, row, client=clients[row.user_id]
+        unconfigured: list[_PendingReading] = []
+        for uid, items in by_user.items():
+            client = await _nightscout_client_for_user(session, uid)
+            if client is None:
+                unconfigured.extend(items)
+            else:
+                clients[uid] = client
+        if unconfigured:
+            await session.execute(
+                update(GlucoseReadingDB)
+                .where(GlucoseReadingDB.id.in_([item.id for item in unconfigured]))
+                .values(sync_status="pending", sync_error="nightscout_not_configured")
+            )
+            stats["processed"] += len(unconfigured)
+            stats["pending"] += len(unconfigured)
+
+        # HTTP only inside the gather; the session is touched again afterwards.
+        semaphore = asyncio.Semaphore(SYNC_USER_CONCURRENCY)
+        per_user = await asyncio.gather(
+            *(
+                _upload_user_backlog(client, by_user[uid], semaphore)
+                for uid, client in clients.items()
             )
-            stats["processed"] += 1
-            stats[status if status in stats else "failed"] += 1
+        )
+
+        synced_at = datetime.now(timezone.utc)
+        for outcome in (outcome for outcomes in per_user for outcome in outcomes):
+            ids = [item.id for item in outcome.readings]
+            if outcome.error is not None:
+                values = {
+                    "sync_status": "failed",
+                    "sync_error": outcome.error,
+                    "sync_attempts": GlucoseReadingDB.sync_attempts + 1,
+                }
+            else:
+                values = {
+                    "sync_status": case(outcome.statuses, value=GlucoseReadingDB.id, else_="synced"),
+                    "synced_at": synced_at,
+                    "sync_error": None,
+                    "sync_attempts": GlucoseReadingDB.sync_attempts + 1,
+                }
+            await session.execute(
+                update(GlucoseReadingDB).where(GlucoseReadingDB.id.in_(ids)).values(**values)
+            )
+            for item in outcome.readings:
+                status = outcome.statuses.get(item.id, "failed")
+                stats["processed"] += 1
+                stats[status] += 1
+                queue_event(session, item.user_id, "sync", {"id": item.id, "sync_status": status})
         await session.commit()
     finally:
         for client in clients.values():
-            if client:
-                await client.aclose()
+            await client.aclose()
     return stats
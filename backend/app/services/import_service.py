@@ -1,91 +1,331 @@
+import base64
 import json
-from sqlalchemy import text
+import logging
+import uuid
+import zlib
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Optional
+
+from sqlalchemy import Table, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
 from app.core.db import get_engine
+from app.services.daily_totals_service import local_day, mark_days_unreconciled, refresh_basal_days
+from app.services.export_service import CHILD_TABLES, EXPORT_FORMAT, user_tables
+from app.utils.timezone import get_user_timezone
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 500
+# Never overwritten from an import: identity and creation stamps stay local.
+_PROTECTED_COLUMNS = {"id", "user_id", "created_at"}
+# Tables the legacy ``/data/import`` JSON document may write; anything else in
+# it is ignored. The NDJSON stream carries its own table list.
+LEGACY_IMPORT_TABLES = (
+    "user_settings",
+    "basal_checkin",
+    "basal_entries",
+    "basal_night_summary",
+    "basal_advice_daily",
+    "basal_change_evaluation",
+    "parameter_suggestion",
+    "suggestion_evaluation",
+    "user_notification_state",
+)
+
+
+def _coerce(table: Table, column: str, value: Any) -> Any:
+    """JSON value -> the Python type the column's driver expects."""
+    if value is None or isinstance(value, (dict, list)):
+        return value
+    try:
+        python_type = table.c[column].type.python_type
+    except NotImplementedError:
+        return value
+    if not isinstance(value, str) or python_type is str:
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    if python_type is time:
+        return time.fromisoformat(value)
+    if python_type is uuid.UUID:
+        return uuid.UUID(value)
+    if python_type is Decimal:
+        return Decimal(value)
+    if python_type is bytes:
+        return base64.b64decode(value)
+    return value
 
-async def import_user_data(user_id: str, data: dict):
+
+def _upsert(conn, table: Table, columns: Iterable[str]):
+    """Insert statement that updates the existing row on a primary-key clash."""
+    dialect = conn.dialect.name
+    keys = [column.name for column in table.primary_key.columns]
+    if dialect not in ("postgresql", "sqlite") or not keys:
+        return insert(table)
+    stmt = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(table)
+    updates = {
+        column: stmt.excluded[column]
+        for column in columns
+        if column not in keys and column not in _PROTECTED_COLUMNS
+    }
+    if not updates:
+        return stmt.on_conflict_do_nothing(index_elements=keys)
+    # A clashing id that belongs to another account is left untouched; for
+    # child tables the owner is the parent row, checked before writing.
+    if table.name in CHILD_TABLES:
+        column = CHILD_TABLES[table.name][0]
+        owner = table.c[column] == stmt.excluded[column]
+    else:
+        owner = table.c.user_id == stmt.excluded.user_id
+    return stmt.on_conflict_do_update(index_elements=keys, set_=updates, where=owner)
+
+
+class _BulkLoader:
+    """Buffers rows per table and writes each batch as one executemany upsert.
+
+    Every batch commits on its own, so a multi-gigabyte import never holds a
+    single huge transaction. A batch that fails (typically a clash on a
+    unique constraint other than the primary key) is retried row by row, so
+    only the offending rows are lost. Tables are written in the order of
+    ``tables`` (parents first), so child rows always find their parent.
+    """
+
+    def __init__(self, conn, user_id: str, tables: dict[str, Table], batch_size: int):
+        self.conn = conn
+        self.user_id = user_id
+        self.tables = tables
+        self.order = list(tables)
+        self.batch_size = batch_size
+        self.pending: dict[str, list[dict]] = {}
+        self.stats: dict[str, Any] = {"total_imported": 0, "skipped": 0, "errors": 0, "tables": {}}
+
+    async def add(self, table_name: str, row: Any) -> None:
+        table = self.tables.get(table_name)
+        if table is None or not isinstance(row, dict):
+            self.stats["skipped"] += 1
+            return
+        try:
+            values = {
+                key: _coerce(table, key, value) for key, value in row.items() if key in table.c
+            }
+        except (TypeError, ValueError):
+            self.stats["errors"] += 1
+            return
+        if "user_id" in table.c:
+            # Rows always land under the importing account.
+            values["user_id"] = self.user_id
+        batch = self.pending.setdefault(table_name, [])
+        batch.append(values)
+        if len(batch) >= self.batch_size:
+            await self.flush(table_name)
+
+    async def flush(self, table_name: Optional[str] = None) -> None:
+        if table_name is None:
+            names = [name for name in self.order if name in self.pending]
+        else:
+            # Parents buffered earlier go first, or their children would dangle.
+            position = self.order.index(table_name)
+            names = [name for name in self.order[:position] if name in self.pending] + [table_name]
+        for name in names:
+            rows = self.pending.pop(name, [])
+            if rows:
+                await self._write(self.tables[name], rows)
+
+    async def _owned(self, table: Table, rows: list[dict]) -> list[dict]:
+        """Child rows whose parent row belongs to the importing account."""
+        column, parent_name, key = CHILD_TABLES[table.name]
+        parent = self.tables[parent_name]
+        wanted = {row.get(column) for row in rows} - {None}
+        if not wanted:
+            owned = set()
+        else:
+            result = await self.conn.execute(
+                select(parent.c[key]).where(parent.c[key].in_(wanted), parent.c.user_id == self.user_id)
+            )
+            owned = set(result.scalars())
+            await self.conn.commit()
+        kept = [row for row in rows if row.get(column) in owned]
+        self.stats["skipped"] += len(rows) - len(kept)
+        return kept
+
+    async def _write(self, table: Table, rows: list[dict]) -> None:
+        if table.name in CHILD_TABLES:
+            rows = await self._owned(table, rows)
+        # executemany needs one key set per statement; exports are uniform
+        # per table, so this is normally a single group.
+        groups: dict[tuple[str, ...], list[dict]] = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        for columns, group in groups.items():
+            stmt = _upsert(self.conn, table, columns)
+            try:
+                async with self.conn.begin():
+                    written = await self._execute(stmt, table, group)
+                # Rows whose id clashed with another account's row were left alone.
+                self.stats["skipped"] += len(group) - written
+            except Exception as exc:
+                logger.warning(
+                    "Import batch into %s failed (%d rows), retrying row by row: %s",
+                    table.name,
+                    len(group),
+                    exc,
+                )
+                written = await self._write_rows(stmt, table, group)
+            if written:
+                self.stats["tables"][table.name] = self.stats["tables"].get(table.name, 0) + written
+                self.stats["total_imported"] += written
+                await self._touch_daily_totals(table, group)
+
+    async def _touch_daily_totals(self, table: Table, rows: list[dict]) -> None:
+        """Core inserts skip the ORM hook that keeps ``daily_insulin_totals`` current."""
+        if table.name == "treatments":
+            tz = get_user_timezone(self.user_id)
+            days = {
+                (self.user_id, local_day(row["created_at"], tz))
+                for row in rows
+                if isinstance(row.get("created_at"), datetime)
+            }
+            apply = mark_days_unreconciled
+        elif table.name == "basal_dose":
+            days = {
+                (self.user_id, row["effective_from"])
+                for row in rows
+                if isinstance(row.get("effective_from"), date)
+            }
+            apply = refresh_basal_days
+        else:
+            return
+        if days:
+            async with self.conn.begin():
+                await self.conn.run_sync(apply, days)
+
+    async def _execute(self, stmt, table: Table, rows: list[dict]) -> int:
+        """Run ``stmt`` for ``rows``; returns how many rows were inserted or updated."""
+        keys = list(table.primary_key.columns)
+        if not keys or not self.conn.dialect.insert_executemany_returning:
+            await self.conn.execute(stmt, rows)
+            return len(rows)
+        # A guarded upsert that skips a row returns nothing for it.
+        result = await self.conn.execute(stmt.returning(*keys), rows)
+        return len(result.all())
+
+    async def _write_rows(self, stmt, table: Table, rows: list[dict]) -> int:
+        written = 0
+        for row in rows:
+            try:
+                async with self.conn.begin():
+                    applied = await self._execute(stmt, table, [row])
+            except Exception as exc:
+                logger.debug("Import row into %s rejected: %s", table.name, exc)
+                self.stats["errors"] += 1
+                continue
+            if applied:
+                written += 1
+            else:
+                self.stats["skipped"] += 1
+        return written
+
+
+async def _load(
+    user_id: str,
+    rows: AsyncIterable[tuple[str, Any]],
+    batch_size: int,
+    allowed: Optional[Iterable[str]] = None,
+) -> dict:
+    engine = get_engine()
+    if not engine:
+        return {"error": "No database connection"}
+    async with engine.connect() as conn:
+        tables = {table.name: table for table in await user_tables(conn)}
+        if allowed is not None:
+            allowed = set(allowed)
+            tables = {name: table for name, table in tables.items() if name in allowed}
+        await conn.commit()
+        loader = _BulkLoader(conn, user_id, tables, batch_size)
+        async for table_name, row in rows:
+            await loader.add(table_name, row)
+        await loader.flush()
+    return loader.stats
+
+
+async def import_user_data(user_id: str, data: dict, *, batch_size: int = IMPORT_BATCH_SIZE):
     """
     Import data from JSON export.
     Upserts records based on Primary Key (usually ID).
     Forces user_id to match the authenticated user.
+    Only ``LEGACY_IMPORT_TABLES`` are written, parents before children.
     """
-    engine = get_engine()
-    if not engine:
-        return {"error": "No database connection"}
 
-    allowed_tables = [
-        "user_settings",
-        "basal_checkin",
-        "basal_entries", 
-        "basal_night_summary",
-        "basal_advice_daily",
-        "basal_change_evaluation",
-        "parameter_suggestion",
-        "suggestion_evaluation",
-        "user_notification_state"
-    ]
-
-    stats = {t: 0 for t in allowed_tables}
-    stats["total_imported"] = 0
-
-    async with engine.begin() as conn:
-        for table_name, rows in data.items():
-            if table_name not in allowed_tables or not isinstance(rows, list):
+    async def rows() -> AsyncIterator[tuple[str, Any]]:
+        for table_name in LEGACY_IMPORT_TABLES:
+            table_rows = data.get(table_name)
+            if isinstance(table_rows, list):
+                for row in table_rows:
+                    yield table_name, row
+
+    return await _load(user_id, rows(), batch_size, allowed=LEGACY_IMPORT_TABLES)
+
+
+async def _ndjson_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Split a (possibly gzip-compressed) byte stream into lines."""
+    decompressor = None
+    buffer = b""
+    first = True
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if first:
+            first = False
+            if chunk[:2] == b"\x1f\x8b":
+                decompressor = zlib.decompressobj(31)
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if decompressor is not None:
+        buffer += decompressor.flush()
+    for line in buffer.split(b"\n"):
+        yield line
+
+
+async def import_user_stream(
+    user_id: str, chunks: AsyncIterable[bytes], *, batch_size: int = IMPORT_BATCH_SIZE
+) -> dict:
+    """Bulk-load an NDJSON export (see ``stream_user_export``), plain or gzipped.
+
+    Malformed lines and rows for unknown tables are counted and skipped
+    rather than aborting the import.
+    """
+    header: dict[str, Any] = {}
+    malformed = 0
+
+    async def rows() -> AsyncIterator[tuple[str, Any]]:
+        nonlocal malformed
+        async for raw in _ndjson_lines(chunks):
+            if not raw.strip():
                 continue
-            
-            if not rows:
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                malformed += 1
                 continue
+            kind = record.get("type") if isinstance(record, dict) else None
+            if kind == "row":
+                yield record.get("table"), record.get("data")
+            elif kind == "header":
+                if record.get("format") != EXPORT_FORMAT:
+                    raise ValueError(f"Unsupported export format: {record.get('format')!r}")
+                header.update(record)
+            elif kind != "end":
+                malformed += 1
 
-            # We assume all rows in a list have mostly same columns. 
-            # We take columns from the first row to build the statement.
-            # This is a bit naive but standard for homogeneous exports.
-            first_row = rows[0]
-            columns = list(first_row.keys())
-            
-            # Filter columns to ensure safety? (Prevent SQL injection via column names? unlikely from JSON but good practice)
-            # We just quote them.
-            
-            col_list = ", ".join([f'"{c}"' for c in columns])
-            val_list = ", ".join([f':{c}' for c in columns])
-            
-            # Update clause for ON CONFLICT
-            # We skip 'id' and 'user_id' in update
-            update_assignments = [f'"{c}" = EXCLUDED."{c}"' for c in columns if c not in ('id', 'user_id', 'created_at')]
-            
-            if not update_assignments:
-                # If only IDs, do nothing on conflict
-                conflict_action = "DO NOTHING"
-            else:
-                conflict_action = f"DO UPDATE SET {', '.join(update_assignments)}"
-
-            # Prepare Statement
-            # Assuming 'id' is the unique constraint or PK.
-            # Most tables have 'id' UUID.
-            # Some like user_settings use user_id as PK?
-            # Let's check schemas next time if this fails.
-            # For user_settings, PK is user_id. For others, it's 'id'.
-            
-            constraint = "(id)"
-            if table_name == "user_settings":
-                constraint = "(user_id)"
-            
-            query = text(f"""
-                INSERT INTO {table_name} ({col_list}) 
-                VALUES ({val_list})
-                ON CONFLICT {constraint} {conflict_action}
-            """)
-
-            for row in rows:
-                # Override user_id for security
-                row["user_id"] = user_id
-                
-                # Execute
-                try:
-                    await conn.execute(query, row)
-                    stats[table_name] += 1
-                    stats["total_imported"] += 1
-                except Exception as e:
-                    print(f"Error importing row into {table_name}: {e}")
-                    # Continue best effort
-                    pass
-
+    stats = await _load(user_id, rows(), batch_size)
+    stats["errors"] = stats.get("errors", 0) + malformed
+    stats["source_user_id"] = header.get("user_id")
     return stats
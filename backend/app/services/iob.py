@@ -3,7 +3,7 @@ from __future__ import annotations
 import logging
 import math
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone, timedelta
 from typing import Literal, Sequence, Optional
 
@@ -183,6 +183,34 @@ def _merge_unique_boluses(*sources: Sequence[dict]) -> list[dict]:
     return unique
 
 
+def _db_bolus(row) -> dict | None:
+    """IOB bolus from a ``treatments`` row; basal injections are skipped."""
+    event_type = (getattr(row, "event_type", "") or "").lower()
+    notes = (getattr(row, "notes", "") or "").lower()
+    if "basal" in event_type or "basal" in notes or "lenta" in notes:
+        return None
+    created_at = row.created_at
+    if isinstance(created_at, str):
+        created_at = _parse_timestamp(created_at)
+    ts = (
+        created_at.replace(tzinfo=timezone.utc).isoformat()
+        if created_at.tzinfo is None
+        else created_at.astimezone(timezone.utc).isoformat()
+    )
+    local_id = str(row.id) if row.id else None
+    ns_id = str(row.nightscout_id) if row.nightscout_id else None
+    return {
+        "ts": ts,
+        "units": float(row.insulin),
+        "duration": float(getattr(row, "duration", 0) or 0),
+        "id": local_id,
+        "nightscout_id": ns_id,
+        "identity_aliases": [value for value in (local_id, ns_id) if value],
+        "source": "local_db",
+        "entered_by": getattr(row, "entered_by", None),
+    }
+
+
 async def _load_iob_sources(
     *,
     now: datetime,
@@ -220,30 +248,9 @@ async def _load_iob_sources(
             """)
             result = await session.execute(query, params)
             for row in result.fetchall():
-                event_type = (getattr(row, "event_type", "") or "").lower()
-                notes = (getattr(row, "notes", "") or "").lower()
-                if "basal" in event_type or "basal" in notes or "lenta" in notes:
-                    continue
-                created_at = row.created_at
-                if isinstance(created_at, str):
-                    created_at = _parse_timestamp(created_at)
-                ts = (
-                    created_at.replace(tzinfo=timezone.utc).isoformat()
-                    if created_at.tzinfo is None
-                    else created_at.astimezone(timezone.utc).isoformat()
-                )
-                local_id = str(row.id) if row.id else None
-                ns_id = str(row.nightscout_id) if row.nightscout_id else None
-                db_boluses.append({
-                    "ts": ts,
-                    "units": float(row.insulin),
-                    "duration": float(getattr(row, "duration", 0) or 0),
-                    "id": local_id,
-                    "nightscout_id": ns_id,
-                    "identity_aliases": [value for value in (local_id, ns_id) if value],
-                    "source": "local_db",
-                    "entered_by": getattr(row, "entered_by", None),
-                })
+                bolus = _db_bolus(row)
+                if bolus is not None:
+                    db_boluses.append(bolus)
     except Exception as exc:
         db_error = f"tratamientos locales no disponibles: {exc}"
         logger.error("Failed to fetch DB treatments for IOB: %s", exc)
@@ -258,30 +265,84 @@ async def _load_iob_sources(
         logger.error("Failed to load local events for IOB: %s", exc)
 
     if nightscout_client is not None:
-        try:
-            treatments = await nightscout_client.get_recent_treatments(
-                hours=math.ceil(settings.iob.dia_hours + 1),
-                limit=500,
-            )
-            # External records without a persistent identity are not safe to
-            # merge because they cannot be distinguished from local mirrors.
-            parsed_ns_boluses = _boluses_from_treatments(treatments)
-            ns_boluses = [
-                bolus for bolus in parsed_ns_boluses if _identity_values(bolus)
-            ]
-            if len(ns_boluses) != len(parsed_ns_boluses):
-                ns_error = (
-                    "Nightscout devolvió tratamientos de insulina sin identidad estable"
-                )
-        except Exception as exc:
-            ns_error = f"Nightscout no disponible: {exc}"
-            logger.error("Failed to fetch Nightscout treatments for IOB: %s", exc)
+        ns_boluses, ns_error = await _load_nightscout_boluses(settings, nightscout_client)
 
     return db_boluses, local_boluses, ns_boluses, db_error, local_error, ns_error
 
 
+async def _load_nightscout_boluses(
+    settings: UserSettings, nightscout_client
+) -> tuple[list[dict], Optional[str]]:
+    ns_boluses: list[dict] = []
+    ns_error: Optional[str] = None
+    try:
+        treatments = await nightscout_client.get_recent_treatments(
+            hours=math.ceil(settings.iob.dia_hours + 1),
+            limit=500,
+        )
+        # External records without a persistent identity are not safe to
+        # merge because they cannot be distinguished from local mirrors.
+        parsed_ns_boluses = _boluses_from_treatments(treatments)
+        ns_boluses = [
+            bolus for bolus in parsed_ns_boluses if _identity_values(bolus)
+        ]
+        if len(ns_boluses) != len(parsed_ns_boluses):
+            ns_error = (
+                "Nightscout devolvió tratamientos de insulina sin identidad estable"
+            )
+    except Exception as exc:
+        ns_error = f"Nightscout no disponible: {exc}"
+        logger.error("Failed to fetch Nightscout treatments for IOB: %s", exc)
+    return ns_boluses, ns_error
+
+
 from app.models.iob import IOBInfo, IOBStatus, SourceStatus, COBInfo, COBStatus
 
+
+@dataclass
+class IOBSources:
+    """Insulin treatments as loaded from each source, before decay."""
+
+    db_boluses: list[dict]
+    local_boluses: list[dict]
+    ns_boluses: list[dict]
+    db_error: Optional[str] = None
+    local_error: Optional[str] = None
+    ns_error: Optional[str] = None
+
+
+async def load_iob_sources(
+    *,
+    now: datetime,
+    settings: UserSettings,
+    nightscout_client,
+    data_store: DataStore,
+    user_id: Optional[str],
+) -> IOBSources:
+    return IOBSources(
+        *await _load_iob_sources(
+            now=now,
+            settings=settings,
+            nightscout_client=nightscout_client,
+            data_store=data_store,
+            user_id=user_id,
+        )
+    )
+
+async def with_nightscout_boluses(
+    sources: IOBSources, settings: UserSettings, nightscout_client
+) -> IOBSources:
+    """``sources`` (loaded without Nightscout) plus a fresh Nightscout read.
+
+    Treatments uploaded to Nightscout by other devices raise no local event,
+    so callers that keep local sources warm still read Nightscout every time.
+    """
+    if nightscout_client is None:
+        return sources
+    ns_boluses, ns_error = await _load_nightscout_boluses(settings, nightscout_client)
+    return replace(sources, ns_boluses=ns_boluses, ns_error=ns_error)
+
+
 async def compute_iob_from_sources(
     now: datetime,
     settings: UserSettings,
@@ -290,10 +351,14 @@ async def compute_iob_from_sources(
     extra_boluses: list[dict] | None = None,
     user_id: Optional[str] = None,
     persist_cache: bool = True,
+    sources: Optional[IOBSources] = None,
 ) -> tuple[Optional[float], list[dict], IOBInfo, Optional[str]]:
     """
     Computes IOB with detailed status reporting.
     Returns: (internal_iob, breakdown, iob_info, warning_msg)
+
+    ``sources`` are treatments loaded earlier by ``load_iob_sources``; the
+    decay is always projected to ``now``.
     """
     profile = InsulinActionProfile(
         dia_hours=settings.iob.dia_hours,
@@ -323,20 +388,20 @@ async def compute_iob_from_sources(
         cache_iob = None
         cache_ts = None
     
-    (
-        db_boluses,
-        local_boluses,
-        ns_boluses,
-        db_error,
-        local_error,
-        ns_error,
-    ) = await _load_iob_sources(
-        now=now,
-        settings=settings,
-        nightscout_client=nightscout_client,
-        data_store=data_store,
-        user_id=user_id,
-    )
+    if sources is None:
+        sources = await load_iob_sources(
+            now=now,
+            settings=settings,
+            nightscout_client=nightscout_client,
+            data_store=data_store,
+            user_id=user_id,
+        )
+    db_boluses = sources.db_boluses
+    local_boluses = sources.local_boluses
+    ns_boluses = sources.ns_boluses
+    db_error = sources.db_error
+    local_error = sources.local_error
+    ns_error = sources.ns_error
     
     boluses = _merge_unique_boluses(
         db_boluses,
@@ -582,19 +647,31 @@ def compute_cob(now: datetime, carb_entries: Sequence[dict[str, float]], duratio
         return max(total, 0.0)
     return compute_cob_linear(now, carb_entries, duration_hours=duration_hours)
 
-async def compute_cob_from_sources(
+@dataclass
+class COBSources:
+    """Carb entries as loaded from local events and the treatments table."""
+
+    local_entries: list[dict]
+    db_entries: list[dict]
+
+
+def _db_carb_entry(row) -> dict:
+    created_at = row.created_at
+    ts_iso = created_at.replace(tzinfo=timezone.utc).isoformat() if created_at.tzinfo is None else created_at.isoformat()
+    return {
+        "ts": ts_iso,
+        "carbs": float(row.carbs),
+        "fat": float(getattr(row, "fat", 0) or 0),
+        "protein": float(getattr(row, "protein", 0) or 0),
+        "fiber": float(getattr(row, "fiber", 0) or 0)
+    }
+
+
+async def load_cob_sources(
     now: datetime,
-    nightscout_client,
     data_store: DataStore,
-    extra_entries: list[dict[str, float]] | None = None,
     user_id: Optional[str] = None,
-) -> tuple[Optional[float], dict, SourceStatus]:
-    entries = []
-    assumptions: list[str] = []
-    cob_model = os.getenv("COB_MODEL", "linear").lower()
-    source_status = SourceStatus(source="nightscout", status="unknown")
-    ns_error = None
-    
+) -> COBSources:
     # 1. Fetch Local fallback (always load for merging)
     local_events = []
     try:
@@ -607,19 +684,6 @@ async def compute_cob_from_sources(
     except Exception as exc:
         logger.error(f"Failed to load local events for COB: {exc}")
 
-    entries.extend(local_events)
-
-    # 2. Skip Fetch Nightscout (Write-Only Mode)
-    ns_entries = []
-    source_status.status = "ok" 
-    source_status.fetched_at = now
-    source_status.source = "local_only"
-    
-    # 3. Merge DB (Extra + Query Treatments)
-    if extra_entries:
-        for e in extra_entries:
-            entries.append(e)
-
     db_entries = []
     try:
         engine = get_engine()
@@ -651,19 +715,83 @@ async def compute_cob_from_sources(
                  
                  for r in rows:
                      if r.created_at and r.carbs:
-                         ts_iso = r.created_at.replace(tzinfo=timezone.utc).isoformat() if r.created_at.tzinfo is None else r.created_at.isoformat()
-                         db_entries.append({
-                             "ts": ts_iso,
-                             "carbs": float(r.carbs),
-                             "fat": float(getattr(r, "fat", 0) or 0),
-                             "protein": float(getattr(r, "protein", 0) or 0),
-                             "fiber": float(getattr(r, "fiber", 0) or 0)
-                         })
+                         db_entries.append(_db_carb_entry(r))
     except Exception as e:
          logger.warning(f"Failed to fetch DB treatments for COB: {e}")
-            
-    if db_entries:
-        entries.extend(db_entries)
+
+    return COBSources(local_entries=local_events, db_entries=db_entries)
+
+
+def sources_from_treatments(
+    now: datetime,
+    settings: UserSettings,
+    treatments: Sequence,
+    local_events: Sequence[dict],
+    user_id: Optional[str] = None,
+) -> tuple[IOBSources, COBSources]:
+    """IOB and COB sources from ``treatments`` rows the caller already loaded.
+
+    Applies the windows and filters of ``load_iob_sources`` and
+    ``load_cob_sources`` (Nightscout excluded), so batch callers can answer
+    both from one treatment query and one read of the local events.
+    """
+    iob_cutoff = now - timedelta(hours=settings.iob.dia_hours + 1)
+    cob_cutoff = now - timedelta(hours=6)
+    db_boluses: list[dict] = []
+    db_entries: list[dict] = []
+    for row in treatments:
+        if not row.created_at:
+            continue
+        created_at = row.created_at
+        created_at = created_at.replace(tzinfo=timezone.utc) if created_at.tzinfo is None else created_at
+        if (row.insulin or 0) > 0 and created_at > iob_cutoff:
+            bolus = _db_bolus(row)
+            if bolus is not None:
+                db_boluses.append(bolus)
+        if (row.carbs or 0) > 0 and created_at > cob_cutoff:
+            db_entries.append(_db_carb_entry(row))
+
+    events = [event for event in local_events if not user_id or event.get("user_id") == user_id]
+    local_carbs = [
+        {"ts": event["ts"], "carbs": float(event["carbs"])} for event in events if event.get("carbs")
+    ]
+    return (
+        IOBSources(db_boluses=db_boluses, local_boluses=_boluses_from_events(events), ns_boluses=[]),
+        COBSources(local_entries=local_carbs, db_entries=db_entries),
+    )
+
+
+async def compute_cob_from_sources(
+    now: datetime,
+    nightscout_client,
+    data_store: DataStore,
+    extra_entries: list[dict[str, float]] | None = None,
+    user_id: Optional[str] = None,
+    sources: Optional[COBSources] = None,
+) -> tuple[Optional[float], dict, SourceStatus]:
+    entries = []
+    assumptions: list[str] = []
+    cob_model = os.getenv("COB_MODEL", "linear").lower()
+    source_status = SourceStatus(source="nightscout", status="unknown")
+    ns_error = None
+    
+    if sources is None:
+        sources = await load_cob_sources(now, data_store, user_id)
+    entries.extend(sources.local_entries)
+
+    # 2. Skip Fetch Nightscout (Write-Only Mode)
+    ns_entries = []
+    source_status.status = "ok" 
+    source_status.fetched_at = now
+    source_status.source = "local_only"
+    
+    # 3. Merge DB (Extra + Query Treatments)
+    if extra_entries:
+        for e in extra_entries:
+            entries.append(e)
+
+    if sources.db_entries:
+        entries.extend(sources.db_entries)
 
     if ns_entries:
         for e in ns_entries:
@@ -7,6 +7,7 @@ from sqlalchemy import select, and_
 from sqlalchemy.orm import joinedload
 
 from app.models.learning import MealEntry, MealOutcome
+from app.services.cgm_series import CGMSeries, CGMSeriesRepository
 from app.services.nightscout_client import NightscoutClient, NightscoutSGV
 
 logger = logging.getLogger(__name__)
@@ -166,7 +167,11 @@ class LearningService:
             return
             
         logger.info(f"Memory: Evaluating {len(pending_ids)} pending meal outcomes for user {user_id or 'ALL'}...")
-        
+
+        # All pending windows lie inside [old_limit, now]: one local series read
+        # per user replaces a Nightscout range read per entry.
+        series_by_user: dict[str, CGMSeries] = {}
+
         for entry_id in pending_ids:
             # Re-fetch the entry fresh from DB to attach to session for this iteration
             # Re-fetch with explicit join to avoid greenlet/lazy load issues during commit back-population
@@ -178,11 +183,26 @@ class LearningService:
                 continue
 
             try:
-                await self._compute_outcome(entry, ns_client)
+                if entry.user_id not in series_by_user:
+                    series_by_user[entry.user_id] = await CGMSeriesRepository(
+                        self.session, entry.user_id
+                    ).load(
+                        old_limit.replace(tzinfo=timezone.utc),
+                        now.replace(tzinfo=timezone.utc),
+                        fallback_client=ns_client,
+                    )
+                await self._compute_outcome(
+                    entry, ns_client, series=series_by_user[entry.user_id]
+                )
             except Exception as e:
                 logger.error(f"Failed to evaluate entry {entry.id}: {e}")
 
-    async def _compute_outcome(self, entry: MealEntry, ns_client: NightscoutClient):
+    async def _compute_outcome(
+        self,
+        entry: MealEntry,
+        ns_client: Optional[NightscoutClient],
+        series: Optional[CGMSeries] = None,
+    ):
         # 1. Fetch SGV data for [entry.created_at, entry.created_at + 4h]
         # entry.created_at is naive UTC. We need aware UTC for Nightscout Client, 
         # but naive for DB queries (Timestamp without time zone).
@@ -248,12 +268,14 @@ class LearningService:
             await self.session.commit()
             return
 
-        # 1. Fetch SGV data for [entry.created_at, entry.created_at + 4h]
-        sgvs = await ns_client.get_sgv_range(
-            start_dt_naive.replace(tzinfo=timezone.utc), 
-            end_dt_naive.replace(tzinfo=timezone.utc), 
-            count=100
-        )
+        # 1. SGV data for [entry.created_at, entry.created_at + 4h]
+        start_dt = start_dt_naive.replace(tzinfo=timezone.utc)
+        end_dt = end_dt_naive.replace(tzinfo=timezone.utc)
+        if series is None:
+            series = await CGMSeriesRepository(self.session, entry.user_id).load(
+                start_dt, end_dt, fallback_client=ns_client
+            )
+        sgvs = series.window(start_dt, end_dt)
         
         if not sgvs or len(sgvs) < 12: # Need at least ~1h of data to judge
             logger.warning(f"Insufficient data for {entry.id}")
@@ -10,6 +10,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.meal_learning import MealCluster, MealExperience
 from app.models.settings import UserSettings
 from app.models.treatment import Treatment
+from app.services.cgm_series import CGMSeriesRepository
 from app.services.nightscout_client import NightscoutClient, NightscoutSGV
 
 
@@ -157,6 +158,12 @@ class MealLearningService:
         )
         treatments = (await self.session.execute(stmt)).scalars().all()
 
+        # Every complete treatment window falls inside [cutoff, now], so one
+        # local series read (loaded on first need) answers all of them.
+        # Nightscout is only a one-shot fallback for periods the local table
+        # has not been backfilled for.
+        series = None
+
         created_count = 0
         for treatment in treatments:
             if await self._experience_exists(treatment.user_id, treatment.id):
@@ -174,8 +181,12 @@ class MealLearningService:
             sgv_points = []
             if sgv_provider:
                 sgv_points = sgv_provider(treatment, window_minutes)
-            elif ns_client:
-                sgv_points = await ns_client.get_sgv_range(
+            else:
+                if series is None:
+                    series = await CGMSeriesRepository(self.session, user_id).load(
+                        cutoff, now, fallback_client=ns_client
+                    )
+                sgv_points = series.window(
                     self._ensure_aware(treatment.created_at),
                     self._ensure_aware(treatment.created_at) + timedelta(minutes=window_minutes),
                 )
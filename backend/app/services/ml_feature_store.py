@@ -0,0 +1,199 @@
+"""Training matrices aligned to an exact 5-minute grid.
+
+The snapshot job writes at most one row per user and 5-minute slot, but
+slots go missing (restarts, downtime, failed runs), so shifting rows by
+``h / 5`` pairs a snapshot with the wrong future. Here every snapshot is
+placed on its integer slot and the BG at ``feature_time + h`` comes from the
+snapshot's own ``actual_bg_{h}m`` late field, filled by the snapshot job's
+backfill. Only where that is still NULL is it joined by timestamp: from
+``glucose_readings`` when a reading is within half a CGM period (the same
+lookup the backfill makes), else from the snapshot stored at exactly
+``slot + h / 5``. Each
+horizon gets a mask of the rows whose features and target are both known,
+so the trainer selects rows without any per-run reindexing.
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.cgm_series import CGMSeriesRepository
+
+logger = logging.getLogger(__name__)
+
+GRID_MINUTES = 5
+HORIZONS = (30, 60, 120, 240, 360)
+CAT_FEATURES = ("trend",)
+FEATURE_COLUMNS = (
+    "bg_mgdl", "trend", "iob_u", "cob_g", "basal_active_u",
+    "basal_total_24h", "bolus_total_3h", "carbs_total_3h",
+    "exercise_minutes_6h", "hour_of_day", "day_of_week",
+) + tuple(f"baseline_bg_{h}m" for h in HORIZONS)
+ACTUAL_BG_COLUMNS = tuple(f"actual_bg_{h}m" for h in HORIZONS)
+# Half a CGM period: the reading that belongs to a target time. Shared with
+# the snapshot backfill so stored and joined targets agree.
+TARGET_TOLERANCE = timedelta(seconds=150)
+
+_SLOT_NS = GRID_MINUTES * 60 * 1_000_000_000
+_MINUTE_NS = 60 * 1_000_000_000
+
+# Reading times (int64 ns since the epoch, ascending) and their values.
+Readings = Tuple[np.ndarray, np.ndarray]
+
+
+@dataclass
+class AlignedMatrix:
+    """One row per 5-minute slot that has a snapshot, in time order."""
+
+    feature_time: pd.DatetimeIndex  # naive UTC
+    slots: np.ndarray  # int64 slot numbers since the epoch
+    features: pd.DataFrame
+    actual_bg: Dict[int, np.ndarray]
+    targets: Dict[int, np.ndarray]  # actual BG minus the stored baseline; NaN if unknown
+    masks: Dict[int, np.ndarray]  # complete features and a known target
+    missing_slots: int
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def rows(self, horizon: int) -> np.ndarray:
+        return np.flatnonzero(self.masks[horizon])
+
+
+def _naive_utc_ns(times: pd.Series) -> np.ndarray:
+    times = pd.to_datetime(times)
+    if times.dt.tz is not None:
+        times = times.dt.tz_convert("UTC").dt.tz_localize(None)
+    return times.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+
+def _nearest(times_ns: np.ndarray, values: np.ndarray, at_ns: np.ndarray, tolerance_ns: int) -> np.ndarray:
+    """Value of the reading nearest to each of ``at_ns`` within the tolerance, else NaN."""
+    result = np.full(len(at_ns), np.nan)
+    if not len(times_ns):
+        return result
+    right = np.clip(np.searchsorted(times_ns, at_ns), 0, len(times_ns) - 1)
+    left = np.clip(right - 1, 0, len(times_ns) - 1)
+    # Ties favour the earlier reading, as in CGMSeries.value_at.
+    use_left = np.abs(times_ns[left] - at_ns) <= np.abs(times_ns[right] - at_ns)
+    best = np.where(use_left, left, right)
+    hit = np.abs(times_ns[best] - at_ns) <= tolerance_ns
+    result[hit] = values[best[hit]]
+    return result
+
+
+def align_snapshots(
+    snapshots: pd.DataFrame,
+    readings: Optional[Readings] = None,
+    horizons: Sequence[int] = HORIZONS,
+) -> AlignedMatrix:
+    """Place snapshots on the 5-minute grid and attach per-horizon targets."""
+    df = snapshots.copy()
+    ns = _naive_utc_ns(df["feature_time"])
+    df["_slot"] = ns // _SLOT_NS
+    # A slot is written once; keep the last copy if a source repeated it.
+    df = df.iloc[np.argsort(ns, kind="stable")].drop_duplicates("_slot", keep="last")
+    slots = df["_slot"].to_numpy(dtype=np.int64)
+    feature_time = pd.DatetimeIndex(slots * _SLOT_NS)
+
+    if "hour_of_day" not in df.columns:
+        df["hour_of_day"] = feature_time.hour
+    if "day_of_week" not in df.columns:
+        df["day_of_week"] = feature_time.dayofweek
+    features = df[[c for c in FEATURE_COLUMNS if c in df.columns]].reset_index(drop=True)
+    complete = features.notna().all(axis=1).to_numpy()
+
+    snapshot_bg = pd.to_numeric(df["bg_mgdl"], errors="coerce").to_numpy(dtype=float)
+    reading_times, reading_values = readings if readings is not None else (np.empty(0, np.int64), np.empty(0))
+    actual_bg: Dict[int, np.ndarray] = {}
+    targets: Dict[int, np.ndarray] = {}
+    masks: Dict[int, np.ndarray] = {}
+    for h in horizons:
+        baseline_col = f"baseline_bg_{h}m"
+        if baseline_col not in df.columns:
+            continue
+        # Same slot h minutes later, if a snapshot was written there.
+        later = slots + h // GRID_MINUTES
+        index = np.clip(np.searchsorted(slots, later), 0, max(len(slots) - 1, 0))
+        on_grid = np.where(slots[index] == later, snapshot_bg[index], np.nan) if len(slots) else snapshot_bg
+        measured = _nearest(
+            reading_times,
+            reading_values,
+            slots * _SLOT_NS + h * _MINUTE_NS,
+            int(TARGET_TOLERANCE.total_seconds() * 1e9),
+        )
+        actual = np.where(np.isnan(measured), on_grid, measured)
+        stored_col = f"actual_bg_{h}m"
+        if stored_col in df.columns:
+            stored = pd.to_numeric(df[stored_col], errors="coerce").to_numpy(dtype=float)
+            actual = np.where(np.isnan(stored), actual, stored)
+        baseline = pd.to_numeric(df[baseline_col], errors="coerce").to_numpy(dtype=float)
+        actual_bg[h] = actual
+        targets[h] = actual - baseline
+        masks[h] = complete & np.isfinite(targets[h])
+
+    missing = int(slots[-1] - slots[0] + 1 - len(slots)) if len(slots) else 0
+    return AlignedMatrix(
+        feature_time=feature_time,
+        slots=slots,
+        features=features,
+        actual_bg=actual_bg,
+        targets=targets,
+        masks=masks,
+        missing_slots=missing,
+    )
+
+
+async def load_readings(session: AsyncSession, user_id: str, start: datetime, end: datetime) -> Readings:
+    points = await CGMSeriesRepository(session, user_id).get_range(start, end)
+    times = np.array([int(p.measured_at.timestamp() * 1e9) for p in points], dtype=np.int64)
+    values = np.array([float(p.sgv) for p in points], dtype=float)
+    return times, values
+
+
+def _unfilled(snapshots: pd.DataFrame, horizons: Sequence[int]) -> np.ndarray:
+    """Rows missing a stored ``actual_bg_{h}m`` for at least one horizon."""
+    missing = np.zeros(len(snapshots), dtype=bool)
+    for h in horizons:
+        column = f"actual_bg_{h}m"
+        if column not in snapshots.columns:
+            return np.ones(len(snapshots), dtype=bool)
+        missing |= pd.to_numeric(snapshots[column], errors="coerce").isna().to_numpy()
+    return missing
+
+
+async def build_training_matrix(
+    session: AsyncSession,
+    user_id: str,
+    snapshots: pd.DataFrame,
+    horizons: Sequence[int] = HORIZONS,
+) -> AlignedMatrix:
+    """Aligned matrix for ``snapshots``; readings are loaded only for unfilled targets."""
+    unfilled = _unfilled(snapshots, horizons)
+    readings: Optional[Readings] = None
+    if unfilled.any():
+        ns = _naive_utc_ns(snapshots["feature_time"])[unfilled]
+        first = datetime.fromtimestamp(ns.min() / 1e9, tz=timezone.utc)
+        last = datetime.fromtimestamp(ns.max() / 1e9, tz=timezone.utc)
+        readings = await load_readings(
+            session,
+            user_id,
+            first + timedelta(minutes=min(horizons)) - TARGET_TOLERANCE,
+            last + timedelta(minutes=max(horizons)) + TARGET_TOLERANCE,
+        )
+    matrix = align_snapshots(snapshots, readings, horizons)
+    logger.info(
+        "ML: Aligned %d snapshots for %s (%d missing slots, %d without stored targets, %d readings)",
+        len(matrix),
+        user_id,
+        matrix.missing_slots,
+        int(unfilled.sum()),
+        len(readings[0]) if readings is not None else 0,
+    )
+    return matrix
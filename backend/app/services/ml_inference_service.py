@@ -1,23 +1,25 @@
 
+import asyncio
+import hashlib
 import logging
 import os # Added for env var
 import json
+import shutil
 import threading
 import numpy as np
-import pandas as pd
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Optional, Dict, List, Any
-from dataclasses import dataclass
+from typing import Optional, Dict, List, Any, Sequence, Tuple
+from dataclasses import dataclass, field, replace
 
 # Attempt to import CatBoost
 try:
-    from catboost import CatBoostRegressor
+    from catboost import CatBoostRegressor, Pool
     HAS_CATBOOST = True
 except ImportError:
     HAS_CATBOOST = False
 
-from sqlalchemy import select, text
+from sqlalchemy import func, inspect, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.ml_store import MLModelStore
 
@@ -26,6 +28,50 @@ from app.models.forecast import ForecastPoint
 
 logger = logging.getLogger(__name__)
 
+# Features the trainer uses, in training order (baseline_bg_Xm columns follow).
+# Only used when the loaded models do not report their own feature names.
+BASE_FEATURES = (
+    "bg_mgdl", "trend", "iob_u", "cob_g", "basal_active_u",
+    "basal_total_24h", "bolus_total_3h", "carbs_total_3h",
+    "exercise_minutes_6h", "hour_of_day", "day_of_week",
+)
+CAT_FEATURES = ("trend",)
+# Farthest baseline point accepted as a stand-in for a missing horizon.
+BASELINE_TOLERANCE_MIN = 15
+QUANTILE_KEYS = ("p50", "p10", "p90")
+METADATA_FILE = "metadata.json"
+# Model blobs are copied out of the DB in slices of this size.
+SYNC_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_model_artifact(name: str) -> bool:
+    return name == METADATA_FILE or name.endswith(".cbm")
+
+@dataclass(frozen=True)
+class FeatureLayout:
+    """Column order of the model input, compiled once per model version."""
+    version: Optional[str]
+    horizons: Tuple[int, ...]
+    names: Tuple[str, ...]
+    cat_indices: Tuple[int, ...]
+
+@dataclass(frozen=True)
+class ModelRegistry:
+    """One loaded model version. Replaced as a whole, never mutated in place."""
+    version: Optional[str] = None
+    metadata: Optional[Dict] = None
+    models: Dict[int, Dict[str, Any]] = field(default_factory=dict)  # {horizon: {'p10': model, 'p50': model, 'p90': model}}
+    layout: Optional[FeatureLayout] = None
+    file_hashes: Dict[str, str] = field(default_factory=dict)  # artifact name -> sha256 it was loaded from
+
 @dataclass
 class MLPredictionResult:
     predicted_series: List[ForecastPoint]
@@ -37,12 +83,25 @@ class MLPredictionResult:
     warnings: List[str] = None
     source: str = "physics" # "ml" or "physics"
 
+def _compile_layout(models: Dict[int, Dict[str, Any]], version: Optional[str]) -> FeatureLayout:
+    horizons = tuple(sorted(models.keys()))
+    names: Optional[Tuple[str, ...]] = None
+    for by_quantile in models.values():
+        for model in by_quantile.values():
+            trained = getattr(model, "feature_names_", None)
+            if isinstance(trained, (list, tuple)) and trained and all(isinstance(n, str) for n in trained):
+                names = tuple(trained)
+                break
+        if names:
+            break
+    if names is None:
+        names = BASE_FEATURES + tuple(f"baseline_bg_{h}m" for h in horizons)
+    cat_indices = tuple(i for i, name in enumerate(names) if name in CAT_FEATURES)
+    return FeatureLayout(version, horizons, names, cat_indices)
+
 class MLInferenceService:
     _instance = None
     _lock = threading.Lock()
-    _models: Dict[int, Dict[str, Any]] = {}  # {horizon: {'p10': model, 'p50': model, 'p90': model}}
-    _model_version: Optional[str] = None
-    _metadata: Optional[Dict] = None
 
     @classmethod
     def get_instance(cls):
@@ -56,8 +115,27 @@ class MLInferenceService:
     def __init__(self):
         self.settings = get_settings()
         self.models_loaded = False
+        # Readers take a single reference to the registry; reloads swap it.
+        self._registry = ModelRegistry()
+        self._sync_lock = asyncio.Lock()
         # Do strictly nothing heavy in init. Load on first use or explicit reload.
 
+    @property
+    def _models(self) -> Dict[int, Dict[str, Any]]:
+        return self._registry.models
+
+    @_models.setter
+    def _models(self, models: Dict[int, Dict[str, Any]]) -> None:
+        self._registry = replace(self._registry, models=models, layout=None, file_hashes={})
+
+    @property
+    def _metadata(self) -> Optional[Dict]:
+        return self._registry.metadata
+
+    @property
+    def _model_version(self) -> Optional[str]:
+        return self._registry.version
+
     def _locate_models(self) -> Optional[Path]:
         """
         Find the best available model directory.
@@ -98,109 +176,221 @@ class MLInferenceService:
         return None
 
 
+    def _sync_target_dir(self) -> Path:
+        # Force use of local writable dir
+        target_dir = Path("ml_training_output")
+        if self.settings.ml.model_dir:
+            target_dir = Path(self.settings.ml.model_dir)
+        if not target_dir.is_absolute():
+            base = Path(__file__).resolve().parent.parent.parent
+            target_dir = base / target_dir
+        return target_dir
+
     async def sync_models_from_db(self, session: AsyncSession):
         """
         Check DB for a newer model version and download it if found.
-        Use raw SQL check first to avoid errors if table doesn't exist yet.
+
+        Only artifacts whose sha256 (listed under "files" in metadata.json)
+        differs from the local copy are downloaded, in slices, into a staging
+        directory that then replaces the model directory. The new version is
+        loaded off the event loop and published with a single registry swap.
         """
-        try:
-            # Check table existence first
-            check = await session.execute(text(f"SELECT to_regclass('public.{MLModelStore.__tablename__}')"))
-            if not check.scalar():
-                logger.info("ML Sync: Table not found in DB. Skipping sync.")
-                return
-
-            # Get latest version from DB
-            stmt = select(MLModelStore).where(MLModelStore.model_name == 'metadata.json').order_by(MLModelStore.updated_at.desc()).limit(1)
-            res = await session.execute(stmt)
-            row = res.scalar_one_or_none()
-            
-            if not row:
-                logger.info("ML Sync: No trained models in DB yet.")
-                return
+        async with self._sync_lock:
+            try:
+                await self._sync_models(session)
+            except Exception as e:
+                logger.error(f"ML Sync Failed: {e}")
+
+    async def _sync_models(self, session: AsyncSession) -> None:
+        table = MLModelStore.__tablename__
+        if not await session.run_sync(lambda s: inspect(s.connection()).has_table(table)):
+            logger.info("ML Sync: Table not found in DB. Skipping sync.")
+            return
 
-            db_version = row.version
-            
-            # Compare with local
-            if self._metadata and self._metadata.get("version") == db_version:
-                logger.info(f"ML Sync: Local model {db_version} is up to date.")
-                return
+        # Get latest version from DB
+        stmt = (
+            select(MLModelStore.user_id, MLModelStore.version, MLModelStore.model_data)
+            .where(MLModelStore.model_name == METADATA_FILE)
+            .order_by(MLModelStore.updated_at.desc())
+            .limit(1)
+        )
+        row = (await session.execute(stmt)).first()
+        if not row:
+            logger.info("ML Sync: No trained models in DB yet.")
+            return
 
-            logger.info(f"ML Sync: Found newer model {db_version} in DB. Downloading...")
-            
-            # Download all files for this user/version
-            # Simple approach: Get all files for this user
-            user_id = row.user_id # Assume model fits user
-            files_stmt = select(MLModelStore).where(MLModelStore.user_id == user_id).where(MLModelStore.version == db_version)
-            files_res = await session.execute(files_stmt)
-            files = files_res.scalars().all()
-            
-            # Target Dir
-            # Force use of local writable dir
-            target_dir = Path("ml_training_output")
-            if self.settings.ml.model_dir:
-                target_dir = Path(self.settings.ml.model_dir)
-            
-            if not target_dir.is_absolute():
-                 base = Path(__file__).resolve().parent.parent.parent
-                 target_dir = base / target_dir
-            
-            target_dir.mkdir(parents=True, exist_ok=True)
-            
-            for file_row in files:
-                out_path = target_dir / file_row.model_name
-                # If metadata, parse json
-                if file_row.model_name == "metadata.json":
-                     # meta is bytes, decode
-                     try:
-                         data_str = file_row.model_data.decode('utf-8')
-                         # validate json
-                         json.loads(data_str)
-                         with open(out_path, "w") as f:
-                             f.write(data_str)
-                     except:
-                         with open(out_path, "wb") as f:
-                             f.write(file_row.model_data)
-                else:
-                    with open(out_path, "wb") as f:
-                        f.write(file_row.model_data)
-            
-            logger.info(f"ML Sync: Successfully downloaded model {db_version}.")
-            # Trigger reload
-            self.load_models(force_reload=True)
-            
-        except Exception as e:
-            logger.error(f"ML Sync Failed: {e}")
+        db_version = row.version
+        # Compare with local
+        if self._metadata and self._metadata.get("version") == db_version:
+            logger.info(f"ML Sync: Local model {db_version} is up to date.")
+            return
+
+        target_dir = self._sync_target_dir()
+        local_meta = await asyncio.to_thread(self._read_metadata, target_dir)
+        if local_meta and local_meta.get("version") == db_version:
+            logger.info(f"ML Sync: Model {db_version} already on disk. Loading...")
+            await self.load_models_async(force_reload=True)
+            return
+
+        try:
+            remote_meta = json.loads(row.model_data.decode("utf-8"))
+        except ValueError:
+            remote_meta = {}
+        expected: Dict[str, str] = remote_meta.get("files") or {}
+        if expected:
+            names = list(expected)
+        else:
+            # Models trained before hashes were recorded: fetch everything.
+            names_stmt = select(MLModelStore.model_name).where(
+                MLModelStore.user_id == row.user_id,
+                MLModelStore.version == db_version,
+                MLModelStore.model_name != METADATA_FILE,
+            )
+            names = list((await session.execute(names_stmt)).scalars().all())
+
+        staging = target_dir.with_name(f".{target_dir.name}.staging")
+        reused = await asyncio.to_thread(self._prepare_staging, target_dir, staging, expected)
+        changed = [name for name in names if name not in reused]
+        logger.info(
+            f"ML Sync: Found newer model {db_version} in DB. Downloading {len(changed)} of {len(names)} artifacts..."
+        )
+        try:
+            for name in changed:
+                await self._download_artifact(
+                    session, row.user_id, db_version, name, staging / name, expected.get(name)
+                )
+            (staging / METADATA_FILE).write_bytes(row.model_data)
+            await asyncio.to_thread(self._swap_dirs, staging, target_dir)
+        except BaseException:
+            await asyncio.to_thread(shutil.rmtree, staging, True)
+            raise
+
+        logger.info(f"ML Sync: Successfully downloaded model {db_version}.")
+        # Trigger reload
+        await self.load_models_async(force_reload=True)
+
+    @staticmethod
+    def _read_metadata(model_dir: Path) -> Optional[Dict]:
+        try:
+            with open(model_dir / METADATA_FILE, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _prepare_staging(target_dir: Path, staging: Path, expected: Dict[str, str]) -> set:
+        """Fresh staging dir seeded with the local artifacts whose hash still matches."""
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        reused = set()
+        for name, digest in expected.items():
+            src = target_dir / name
+            if src.is_file() and file_sha256(src) == digest:
+                shutil.copy2(src, staging / name)
+                reused.add(name)
+        return reused
+
+    async def _download_artifact(
+        self,
+        session: AsyncSession,
+        user_id: str,
+        version: Optional[str],
+        name: str,
+        dest: Path,
+        expected_sha: Optional[str],
+    ) -> None:
+        where = (
+            MLModelStore.user_id == user_id,
+            MLModelStore.model_name == name,
+            MLModelStore.version == version,
+        )
+        size = (await session.execute(select(func.length(MLModelStore.model_data)).where(*where))).scalar()
+        if size is None:
+            raise FileNotFoundError(f"{name} ({version}) missing from model store")
+
+        digest = hashlib.sha256()
+        part = dest.with_name(dest.name + ".part")
+        with open(part, "wb") as f:
+            for offset in range(0, size, SYNC_CHUNK_BYTES):
+                # substr() is 1-based and works on BYTEA and BLOB alike
+                chunk_stmt = select(func.substr(MLModelStore.model_data, offset + 1, SYNC_CHUNK_BYTES)).where(*where)
+                chunk = bytes((await session.execute(chunk_stmt)).scalar())
+                f.write(chunk)
+                digest.update(chunk)
+        if expected_sha and digest.hexdigest() != expected_sha:
+            part.unlink(missing_ok=True)
+            raise ValueError(f"{name}: sha256 mismatch after download")
+        os.replace(part, dest)
+
+    @staticmethod
+    def _swap_dirs(staging: Path, target_dir: Path) -> None:
+        """Replace target_dir with staging; non-model entries (README, subdirs) move along."""
+        if target_dir.exists():
+            for entry in target_dir.iterdir():
+                if not _is_model_artifact(entry.name) and not (staging / entry.name).exists():
+                    os.replace(entry, staging / entry.name)
+        previous = target_dir.with_name(f".{target_dir.name}.previous")
+        shutil.rmtree(previous, ignore_errors=True)
+        if target_dir.exists():
+            os.replace(target_dir, previous)
+        try:
+            os.replace(staging, target_dir)
+        except OSError:
+            if previous.exists():
+                os.replace(previous, target_dir)
+            raise
+        shutil.rmtree(previous, ignore_errors=True)
 
     def load_models(self, force_reload: bool = False):
         if self.models_loaded and not force_reload:
             return
+        registry = self._read_registry()
+        if registry is not None:
+            self._publish(registry)
+
+    async def load_models_async(self, force_reload: bool = False):
+        """Same as load_models, but reads and deserializes the models in a worker thread."""
+        if self.models_loaded and not force_reload:
+            return
+        registry = await asyncio.to_thread(self._read_registry)
+        if registry is not None:
+            self._publish(registry)
+
+    def _publish(self, registry: ModelRegistry) -> None:
+        self._registry = registry
+        self.models_loaded = True
+        loaded_count = sum(len(models) for models in registry.models.values())
+        logger.info(f"Successfully loaded {loaded_count} ML models (Version: {registry.version}). State: ACTIVE.")
 
+    def _read_registry(self) -> Optional[ModelRegistry]:
         if not HAS_CATBOOST:
             logger.warning("CatBoost not installed. ML inference disabled.")
-            return
+            return None
 
         model_dir = self._locate_models()
         if not model_dir:
             logger.info("ML: No model directory found (not trained yet). State: DATA_GATHERING.")
-            return
+            return None
 
         try:
             logger.info(f"ML: Found model directory at {model_dir}. Verifying artifacts...")
             
             # Load metadata
-            if not (model_dir / "metadata.json").exists():
+            if not (model_dir / METADATA_FILE).exists():
                  logger.warning("ML: metadata.json missing in model dir. Refusing to load partial models.")
-                 return
-            with open(model_dir / "metadata.json", "r") as f:
-                self._metadata = json.load(f)
-                self._model_version = self._metadata.get("version", "unknown")
+                 return None
+            with open(model_dir / METADATA_FILE, "r") as f:
+                metadata = json.load(f)
+            version = metadata.get("version", "unknown")
 
-            horizons = self._metadata.get("horizons", [30, 60, 120, 240, 360])
+            horizons = metadata.get("horizons", [30, 60, 120, 240, 360])
             quantiles = [0.1, 0.5, 0.9] # p10, p50, p90
-            
-            loaded_count = 0
+            hashes = metadata.get("files") or {}
+            # Artifacts with the same hash as the running version are not reloaded.
+            current = self._registry
+
             new_models = {}
+            file_hashes = {}
 
             for h in horizons:
                 new_models[h] = {}
@@ -208,26 +398,100 @@ class MLInferenceService:
                     fname = f"catboost_residual_{h}m_p{int(q*100)}.cbm"
                     fpath = model_dir / fname
                     if fpath.exists():
-                        model = CatBoostRegressor()
-                        model.load_model(str(fpath))
-                        
                         key = "p50"
                         if q == 0.1: key = "p10"
                         if q == 0.9: key = "p90"
-                        
+
+                        digest = hashes.get(fname)
+                        model = None
+                        if digest and current.file_hashes.get(fname) == digest:
+                            model = current.models.get(h, {}).get(key)
+                        if model is None:
+                            model = CatBoostRegressor()
+                            model.load_model(str(fpath))
+
                         new_models[h][key] = model
-                        loaded_count += 1
-            
-            self._models = new_models
-            self.models_loaded = True
-            logger.info(f"Successfully loaded {loaded_count} ML models (Version: {self._model_version}). State: ACTIVE.")
+                        if digest:
+                            file_hashes[fname] = digest
+
+            return ModelRegistry(
+                version=version,
+                metadata=metadata,
+                models=new_models,
+                layout=_compile_layout(new_models, version),
+                file_hashes=file_hashes,
+            )
 
         except Exception as e:
             logger.error(f"Failed to load ML models: {e}")
+            return None
+
+    def _layout_for(self, registry: ModelRegistry) -> FeatureLayout:
+        if registry.layout is None:
+            # Models injected without a load: compile once and keep it on the registry.
+            registry = replace(registry, layout=_compile_layout(registry.models, registry.version))
+            if self._registry.models is registry.models:
+                self._registry = registry
+        return registry.layout
+
+    @staticmethod
+    def _baseline_at(baseline_series: List[ForecastPoint], horizons: np.ndarray) -> np.ndarray:
+        """Baseline bg at each horizon: exact point, else nearest within tolerance, else NaN."""
+        if not baseline_series:
+            return np.full(len(horizons), np.nan)
+        t = np.fromiter((p.t_min for p in baseline_series), dtype=float, count=len(baseline_series))
+        bg = np.fromiter((p.bg for p in baseline_series), dtype=float, count=len(baseline_series))
+        distance = np.abs(t[:, None] - horizons[None, :])
+        nearest = distance.argmin(axis=0)
+        found = distance[nearest, np.arange(len(horizons))] <= BASELINE_TOLERANCE_MIN
+        return np.where(found, bg[nearest], np.nan)
+
+    @staticmethod
+    def _numeric(value: Any) -> float:
+        if value is None:
+            return np.nan
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    def _build_matrix(
+        self,
+        layout: FeatureLayout,
+        features_list: Sequence[Dict[str, Any]],
+        baselines: np.ndarray,
+    ) -> np.ndarray:
+        """One row per context in layout order; categorical columns hold strings."""
+        matrix = np.empty((len(features_list), len(layout.names)), dtype=object)
+        baseline_cols = {f"baseline_bg_{h}m": i for i, h in enumerate(layout.horizons)}
+        for col, name in enumerate(layout.names):
+            if name in baseline_cols:
+                matrix[:, col] = baselines[:, baseline_cols[name]]
+            elif col in layout.cat_indices:
+                matrix[:, col] = [
+                    "Flat" if f.get(name) is None else str(f.get(name)) for f in features_list
+                ]
+            else:
+                matrix[:, col] = [self._numeric(f.get(name)) for f in features_list]
+        return matrix
 
-    def _interpolate_series(self, 
-                          horizons: List[int], 
-                          predictions: Dict[int, float], 
+    def _model_input(self, layout: FeatureLayout, matrix: np.ndarray):
+        if not HAS_CATBOOST:
+            return matrix
+        return Pool(matrix, cat_features=list(layout.cat_indices), feature_names=list(layout.names))
+
+    @staticmethod
+    def _interp_grid(horizons: np.ndarray, values: np.ndarray, start_val: float, step_min: int = 5):
+        """Interpolate point predictions onto a 5-min grid from t=0 to the last horizon."""
+        order = np.argsort(horizons)
+        x_points = np.concatenate(([0.0], horizons[order]))
+        y_points = np.concatenate(([start_val], values[order]))
+        grid = np.arange(0, int(horizons.max()) + step_min, step_min)
+        return grid, np.interp(grid, x_points, y_points)
+
+    def _interpolate_series(self,
+                          horizons: List[int],
+                          predictions: Dict[int, float],
                           start_val: float,
                           steps_per_hour: int = 12) -> List[ForecastPoint]:
         """
@@ -236,23 +500,9 @@ class MLInferenceService:
         predictions: {30: val, 60: val...}
         start_val: value at t=0
         """
-        # Create X, Y points for interpolation
-        # X=0, Y=0 (Start residual is 0 by definition, deviation grows over time)
-        # Actually start_val passed here is likely the residual at t=0 which is 0.
-        
-        x_points = [0] + sorted(horizons)
-        y_points = [start_val] + [predictions[h] for h in sorted(horizons)]
-        
-        # Max horizon
-        max_h = max(horizons)
-        
-        # Linear Interp
-        series = []
-        for t in range(0, max_h + 5, 5):
-            val = np.interp(t, x_points, y_points)
-            series.append(ForecastPoint(t_min=t, bg=float(val)))
-            
-        return series
+        h = np.asarray(horizons, dtype=float)
+        grid, values = self._interp_grid(h, np.array([predictions[x] for x in horizons], dtype=float), start_val)
+        return [ForecastPoint(t_min=int(t), bg=float(v)) for t, v in zip(grid, values)]
 
     def predict(
         self, 
@@ -264,161 +514,106 @@ class MLInferenceService:
         features: Dict matching training features structure.
         baseline_series: The physics-based forecast series.
         """
-        if not self.models_loaded or not self._models:
-            return MLPredictionResult([], ml_ready=False, warnings=["Models not loaded"], source="physics")
+        return self.predict_many([(features, baseline_series)])[0]
 
-        # Validate Features
-        # CatBoost handles missing values (NaN) if configured, but cleaner to fill defaults
-        # We assume caller formatted features roughly correct.
-        
-        # Prepare Dataframe Row (Single prediction)
-        # We need to construct the baseline_bg_{h}m features from the provided baseline_series
-        
-        row = features.copy()
-        
-        # Extract baseline points
-        baseline_map = {p.t_min: p.bg for p in baseline_series}
-        
-        # Add baseline_bg_Xm features
-        horizons = sorted(list(self._models.keys()))
-        valid_horizons = []
-        
-        for h in horizons:
-            # Find closest point in baseline series
-            val = baseline_map.get(h)
-            if val is None:
-                # Interpolate/Nearest
-                # assuming baseline_series is sorted and 5min steps
-                # simple find
-                closest = min(baseline_map.keys(), key=lambda t: abs(t-h))
-                if abs(closest - h) <= 15:
-                    val = baseline_map[closest]
-                else:
-                    # Baseline missing for this horizon?
-                    val = None
-            
-            if val is not None:
-                row[f"baseline_bg_{h}m"] = val
-                valid_horizons.append(h)
-            else:
-                row[f"baseline_bg_{h}m"] = np.nan
-
-        # IMPORTANT: Only use features that the model was trained with
-        # Training uses: bg_mgdl, trend, iob_u, cob_g, basal_active_u,
-        # basal_total_24h, bolus_total_3h, carbs_total_3h,
-        # exercise_minutes_6h, hour_of_day, day_of_week + baseline_bg_Xm
-        allowed_features = {
-            "bg_mgdl", "trend", "iob_u", "cob_g", "basal_active_u",
-            "basal_total_24h", "bolus_total_3h", "carbs_total_3h",
-            "exercise_minutes_6h", "hour_of_day", "day_of_week"
-        }
-        # Add baseline columns dynamically
-        for h in horizons:
-            allowed_features.add(f"baseline_bg_{h}m")
-
-        # Filter row to only include allowed features
-        row = {k: v for k, v in row.items() if k in allowed_features}
-
-        # Convert to DataFrame (CatBoost expectation)
-        df_row = pd.DataFrame([row])
-
-        # Ensure categorical column is string (only 'trend' was used as categorical in training)
-        if "trend" in df_row.columns:
-            df_row["trend"] = df_row["trend"].fillna("Flat").astype(str)
-        
-        # Run Inference per horizon
-        residuals_p50 = {}
-        residuals_p10 = {}
-        residuals_p90 = {}
-        
-        for h in valid_horizons:
-            models = self._models.get(h)
-            if not models: continue
-            
-            # Predict P50
+    def predict_many(
+        self,
+        contexts: Sequence[Tuple[Dict[str, Any], List[ForecastPoint]]],
+    ) -> List[MLPredictionResult]:
+        """
+        Run inference for several (features, baseline_series) contexts at once.
+        The input matrix is built once and each horizon/quantile model is
+        called a single time for the whole batch.
+        """
+        registry = self._registry
+        if not self.models_loaded or not registry.models:
+            return [
+                MLPredictionResult([], ml_ready=False, warnings=["Models not loaded"], source="physics")
+                for _ in contexts
+            ]
+        if not contexts:
+            return []
+
+        layout = self._layout_for(registry)
+        horizons = np.array(layout.horizons, dtype=float)
+        # baseline_bg_{h}m features come from each context's physics forecast
+        baselines = np.vstack([self._baseline_at(series, horizons) for _, series in contexts])
+        valid = ~np.isnan(baselines)
+        model_input = self._model_input(layout, self._build_matrix(layout, [f for f, _ in contexts], baselines))
+
+        # residuals[key][:, j] holds horizon j for every context; NaN = no prediction
+        residuals = {key: np.full(baselines.shape, np.nan) for key in QUANTILE_KEYS}
+        for j, h in enumerate(layout.horizons):
+            models = registry.models.get(h)
+            if not models or not valid[:, j].any():
+                continue
             if "p50" in models:
                 try:
-                    pred_res = models["p50"].predict(df_row)[0]
-                    residuals_p50[h] = pred_res
+                    residuals["p50"][:, j] = np.asarray(models["p50"].predict(model_input), dtype=float)
                 except Exception as e:
                     logger.warning(f"Inference error H{h} p50: {e}")
-            
-            # Predict P10/P90
             if "p10" in models and "p90" in models:
-                 try:
-                    r10 = models["p10"].predict(df_row)[0]
-                    r90 = models["p90"].predict(df_row)[0]
-                    residuals_p10[h] = r10
-                    residuals_p90[h] = r90
-                 except: pass
-
-        if not residuals_p50:
+                try:
+                    r10 = np.asarray(models["p10"].predict(model_input), dtype=float)
+                    r90 = np.asarray(models["p90"].predict(model_input), dtype=float)
+                    residuals["p10"][:, j] = r10
+                    residuals["p90"][:, j] = r90
+                except Exception:
+                    pass
+        for key in QUANTILE_KEYS:
+            residuals[key][~valid] = np.nan
+
+        return [
+            self._assemble(registry, horizons, {key: residuals[key][i] for key in QUANTILE_KEYS}, series)
+            for i, (_, series) in enumerate(contexts)
+        ]
+
+    def _assemble(
+        self,
+        registry: ModelRegistry,
+        horizons: np.ndarray,
+        residuals: Dict[str, np.ndarray],
+        baseline_series: List[ForecastPoint],
+    ) -> MLPredictionResult:
+        """Pred = Baseline + interpolated residual, with safety and physiological clamps."""
+        has_p50 = ~np.isnan(residuals["p50"])
+        if not has_p50.any():
             return MLPredictionResult([], ml_ready=False, warnings=["Inference produced no results"], source="physics")
 
-        # Reconstruct Absolute Values
-        # Pred = Baseline + Residual
-        
-        series_p50 = []
-        series_p10 = []
-        series_p90 = []
-        
-        # We implement Safety Clamping here
-        # Max deviation allowed from baseline?
-        # e.g. If residual demands +200 mg/dL, maybe dampen it?
-        # Let's start raw, interpolate residuals, then add to baseline.
-        
-        interp_res_p50 = self._interpolate_series(list(residuals_p50.keys()), residuals_p50, start_val=0.0)
-        
+        has_q = ~np.isnan(residuals["p10"])
         # For band, if we have enough points, interpolate. Else skip band.
-        has_band = len(residuals_p10) == len(residuals_p50)
-        interp_res_p10 = self._interpolate_series(list(residuals_p10.keys()), residuals_p10, start_val=0.0) if has_band else []
-        interp_res_p90 = self._interpolate_series(list(residuals_p90.keys()), residuals_p90, start_val=0.0) if has_band else []
-        
+        has_band = int(has_q.sum()) == int(has_p50.sum())
+
+        grid, res_p50 = self._interp_grid(horizons[has_p50], residuals["p50"][has_p50], 0.0)
+        if has_band:
+            _, res_p10 = self._interp_grid(horizons[has_q], residuals["p10"][has_q], 0.0)
+            _, res_p90 = self._interp_grid(horizons[has_q], residuals["p90"][has_q], 0.0)
+
         baseline_lookup = {p.t_min: p.bg for p in baseline_series}
         max_t = baseline_series[-1].t_min if baseline_series else 0
-        
-        final_series_p50 = []
-        final_series_p10 = []
-        final_series_p90 = []
-        
-        for pt in interp_res_p50:
-            t = pt.t_min
-            if t > max_t: break
-            base = baseline_lookup.get(t)
-            if base is None: continue
-            
-            # Safety Clamp on Residual
-            # Example: Max surge +100, max drop -100
-            clamp_val = self.settings.ml.safety_clamp_mgdl
-            residual = max(-clamp_val, min(clamp_val, pt.bg))
-            
-            val_p50 = base + residual
-            # Physio Clamp
-            val_p50 = max(20, min(400, val_p50))
-            
-            final_series_p50.append(ForecastPoint(t_min=t, bg=round(val_p50, 1)))
-            
-            if has_band:
-                # Same logic for bands
-                # P10
-                pt10_res = next((p.bg for p in interp_res_p10 if p.t_min == t), 0)
-                val_p10 = max(20, min(400, base + pt10_res))
-                final_series_p10.append(ForecastPoint(t_min=t, bg=round(val_p10, 1)))
-                
-                # P90
-                pt90_res = next((p.bg for p in interp_res_p90 if p.t_min == t), 0)
-                val_p90 = max(20, min(400, base + pt90_res))
-                # Ensure p90 >= p10
-                if val_p90 < val_p10: val_p90 = val_p10
-                final_series_p90.append(ForecastPoint(t_min=t, bg=round(val_p90, 1)))
+        keep = np.array([i for i, t in enumerate(grid) if t <= max_t and int(t) in baseline_lookup], dtype=int)
+        t_keep = grid[keep]
+        base = np.array([baseline_lookup[int(t)] for t in t_keep], dtype=float)
+
+        # Safety Clamp on Residual, then Physio Clamp
+        clamp_val = self.settings.ml.safety_clamp_mgdl
+        val_p50 = np.clip(base + np.clip(res_p50[keep], -clamp_val, clamp_val), 20, 400)
+        final_series_p50 = [ForecastPoint(t_min=int(t), bg=round(float(v), 1)) for t, v in zip(t_keep, val_p50)]
+
+        final_series_p10 = final_series_p90 = None
+        if has_band:
+            val_p10 = np.clip(base + res_p10[keep], 20, 400)
+            # Ensure p90 >= p10
+            val_p90 = np.maximum(np.clip(base + res_p90[keep], 20, 400), val_p10)
+            final_series_p10 = [ForecastPoint(t_min=int(t), bg=round(float(v), 1)) for t, v in zip(t_keep, val_p10)]
+            final_series_p90 = [ForecastPoint(t_min=int(t), bg=round(float(v), 1)) for t, v in zip(t_keep, val_p90)]
 
         return MLPredictionResult(
             predicted_series=final_series_p50,
-            p10_series=final_series_p10 if has_band else None,
-            p90_series=final_series_p90 if has_band else None,
+            p10_series=final_series_p10,
+            p90_series=final_series_p90,
             ml_ready=True,
             confidence_score=0.8 if has_band else 0.5, # Placeholder Logic
-            used_model_version=self._model_version,
+            used_model_version=registry.version,
             source="ml"
         )
-
@@ -0,0 +1,359 @@
+"""Columnar (Parquet) mirror of ``ml_training_data_v2`` for offline training.
+
+Layout, one directory per user::
+
+    <root>/user=<quoted id>/month=YYYY-MM/part-<first>-<last>.parquet
+    <root>/user=<quoted id>/_manifest.json
+
+Each export appends the settled snapshots newer than the manifest's watermark
+as new part files; months that accumulate many parts are compacted into one. Rows
+inside a file are sorted by ``feature_time`` with row-group statistics, and
+the manifest records every file's time range, so readers skip whole files
+and row groups outside the window they ask for.
+
+Rows written behind the watermark (an import, a late run) are caught by
+comparing the table's row count up to the watermark with the manifest; on a
+mismatch, or after the column set changed, the user's mirror is rebuilt from
+the table. Late fields (``actual_bg_{h}m``) are filled for ``BACKFILL_WINDOW``
+after a snapshot is taken, so only snapshots older than that are mirrored:
+part files are immutable, and a row copied earlier would keep NULL targets.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterable, Optional, Sequence
+from urllib.parse import quote
+
+import pandas as pd
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.settings import get_settings
+from app.services.ml_training_pipeline import BACKFILL_WINDOW
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = "ml_training_data_v2"
+EXPORT_BATCH_SIZE = 5000
+# Parts per month before they are rewritten as a single file.
+COMPACT_AFTER_PARTS = 24
+ROW_GROUP_SIZE = 8640  # ~30 days of 5-minute snapshots
+# Bumped whenever TRAINING_COLUMNS or the rows selected for mirroring change;
+# older mirrors are rebuilt.
+SCHEMA_VERSION = 3
+
+# Column -> logical type. Mirrors the table created by the training pipeline.
+TRAINING_COLUMNS: dict[str, str] = {
+    "feature_time": "timestamp",
+    "user_id": "string",
+    "bg_mgdl": "float",
+    "trend": "category",
+    "bg_age_min": "float",
+    "iob_u": "float",
+    "cob_g": "float",
+    "iob_status": "category",
+    "cob_status": "category",
+    "basal_active_u": "float",
+    "basal_latest_u": "float",
+    "basal_latest_age_min": "float",
+    "basal_total_24h": "float",
+    "basal_total_48h": "float",
+    "bolus_total_3h": "float",
+    "bolus_total_6h": "float",
+    "carbs_total_3h": "float",
+    "carbs_total_6h": "float",
+    "exercise_minutes_6h": "float",
+    "exercise_minutes_24h": "float",
+    "baseline_bg_30m": "float",
+    "baseline_bg_60m": "float",
+    "baseline_bg_120m": "float",
+    "baseline_bg_240m": "float",
+    "baseline_bg_360m": "float",
+    "actual_bg_30m": "float",
+    "actual_bg_60m": "float",
+    "actual_bg_120m": "float",
+    "actual_bg_240m": "float",
+    "actual_bg_360m": "float",
+    "active_params": "string",
+    "event_counts": "string",
+    "source_ns_enabled": "bool",
+    "source_ns_treatments_count": "int",
+    "source_db_treatments_count": "int",
+    "source_overlap_count": "int",
+    "source_conflict_count": "int",
+    "source_consistency_status": "category",
+    "flag_bg_missing": "bool",
+    "flag_bg_stale": "bool",
+    "flag_iob_unavailable": "bool",
+    "flag_cob_unavailable": "bool",
+    "flag_source_conflict": "bool",
+}
+
+
+def arrow_schema() -> "pa.Schema":
+    types = {
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "string": pa.string(),
+        "category": pa.dictionary(pa.int16(), pa.string()),
+        "float": pa.float64(),
+        "int": pa.int32(),
+        "bool": pa.bool_(),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in TRAINING_COLUMNS.items()])
+
+
+def _as_utc(value: Any) -> Optional[datetime]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+@dataclass(slots=True)
+class ParquetPart:
+    path: str
+    start: str
+    end: str
+    rows: int
+
+
+@dataclass(slots=True)
+class ParquetManifest:
+    version: int = SCHEMA_VERSION
+    watermark: Optional[str] = None
+    files: list[ParquetPart] = field(default_factory=list)
+
+
+class MLParquetStore:
+    def __init__(self, root: Optional[Path | str] = None):
+        if root is None:
+            settings = get_settings()
+            root = settings.ml.parquet_dir or Path(settings.data.data_dir) / "ml_parquet"
+        self.root = Path(root) / TABLE_NAME
+
+    def user_dir(self, user_id: str) -> Path:
+        return self.root / f"user={quote(user_id, safe='')}"
+
+    def load_manifest(self, user_id: str) -> ParquetManifest:
+        path = self.user_dir(user_id) / "_manifest.json"
+        if not path.exists():
+            return ParquetManifest()
+        raw = json.loads(path.read_text())
+        return ParquetManifest(
+            version=raw.get("version", 1),
+            watermark=raw.get("watermark"),
+            files=[ParquetPart(**part) for part in raw.get("files", [])],
+        )
+
+    def _save_manifest(self, user_id: str, manifest: ParquetManifest) -> None:
+        path = self.user_dir(user_id) / "_manifest.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(asdict(manifest), indent=1))
+        os.replace(tmp, path)
+
+    def _write_part(self, user_id: str, table: "pa.Table") -> ParquetPart:
+        times = table.column("feature_time")
+        start = times[0].as_py()
+        end = times[-1].as_py()
+        relative = f"month={start:%Y-%m}/part-{start:%Y%m%dT%H%M%S}-{end:%Y%m%dT%H%M%S}.parquet"
+        path = self.user_dir(user_id) / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE, compression="zstd")
+        return ParquetPart(path=relative, start=start.isoformat(), end=end.isoformat(), rows=table.num_rows)
+
+    def _table_from_rows(self, rows: Sequence[Sequence[Any]], columns: Sequence[str]) -> "pa.Table":
+        schema = arrow_schema()
+        data: dict[str, list] = {name: [] for name in schema.names}
+        positions = {name: columns.index(name) for name in schema.names if name in columns}
+        # SQLite hands back timestamps as text and booleans as integers.
+        coerce = {"timestamp": _as_utc, "bool": bool, "int": int, "float": float}
+        for name, values in data.items():
+            index = positions.get(name)
+            convert = coerce.get(TRAINING_COLUMNS[name])
+            for row in rows:
+                value = row[index] if index is not None else None
+                if value is not None and convert is not None:
+                    value = convert(value)
+                values.append(value)
+        return pa.Table.from_pydict(data, schema=schema)
+
+    def _append(self, user_id: str, manifest: ParquetManifest, table: "pa.Table") -> None:
+        months = pc.strftime(table.column("feature_time"), format="%Y-%m").to_pylist()
+        by_month: dict[str, list[int]] = defaultdict(list)
+        for index, month in enumerate(months):
+            by_month[month].append(index)
+        for indices in by_month.values():
+            manifest.files.append(self._write_part(user_id, table.take(indices)))
+
+    def _compact(self, user_id: str, manifest: ParquetManifest) -> list[str]:
+        """Merge busy months into one file each; returns the replaced part paths.
+
+        The caller deletes them only after saving the manifest, so a crash
+        never leaves the manifest pointing at missing files.
+        """
+        by_month: dict[str, list[ParquetPart]] = defaultdict(list)
+        for part in manifest.files:
+            by_month[part.path.split("/", 1)[0]].append(part)
+        stale: list[str] = []
+        for parts in by_month.values():
+            if len(parts) <= COMPACT_AFTER_PARTS:
+                continue
+            base = self.user_dir(user_id)
+            merged = pa.concat_tables(
+                [pq.read_table(base / part.path, memory_map=True) for part in parts]
+            ).sort_by("feature_time")
+            replacement = self._write_part(user_id, merged)
+            stale += [part.path for part in parts if part.path != replacement.path]
+            manifest.files = [part for part in manifest.files if part not in parts] + [replacement]
+        manifest.files.sort(key=lambda part: part.start)
+        return stale
+
+    async def _in_sync(self, session: AsyncSession, user_id: str, manifest: ParquetManifest) -> bool:
+        """Whether the table holds exactly the mirrored rows up to the watermark."""
+        if manifest.watermark is None:
+            return not manifest.files
+        count = (
+            await session.execute(
+                text(
+                    f"SELECT COUNT(*) FROM {TABLE_NAME} "
+                    "WHERE user_id = :user_id AND feature_time <= :watermark"
+                ),
+                {"user_id": user_id, "watermark": _as_utc(manifest.watermark).replace(tzinfo=None)},
+            )
+        ).scalar_one()
+        return count == sum(part.rows for part in manifest.files)
+
+    def _reset(self, user_id: str, manifest: ParquetManifest) -> ParquetManifest:
+        """Drop every part so the next export rewrites the mirror from the table.
+
+        Files go before the empty manifest is saved: rebuilt parts may reuse
+        their names, and a crash in between only leaves a shorter mirror.
+        """
+        for part in manifest.files:
+            (self.user_dir(user_id) / part.path).unlink(missing_ok=True)
+        manifest = ParquetManifest()
+        self._save_manifest(user_id, manifest)
+        return manifest
+
+    async def export_incremental(
+        self,
+        session: AsyncSession,
+        user_id: str,
+        *,
+        batch_size: int = EXPORT_BATCH_SIZE,
+        now: Optional[datetime] = None,
+    ) -> dict[str, Any]:
+        """Append settled snapshots newer than the watermark; returns row and file counts.
+
+        Snapshots taken within ``BACKFILL_WINDOW`` of ``now`` may still get
+        their late fields and wait for a later export.
+
+        A mirror that no longer matches the table below its watermark, or
+        was written with an older column set, is rebuilt first (``rebuilt``
+        in the result).
+        """
+        if not HAS_PYARROW:
+            return {"status": "skipped", "reason": "pyarrow not installed"}
+        has_table = await session.run_sync(
+            lambda sync_session: inspect(sync_session.connection()).has_table(TABLE_NAME)
+        )
+        if not has_table:
+            return {"status": "skipped", "reason": "no training table"}
+        manifest = self.load_manifest(user_id)
+        rebuilt = manifest.version != SCHEMA_VERSION or not await self._in_sync(session, user_id, manifest)
+        if rebuilt:
+            logger.info("ML Parquet mirror for %s is out of step with the table; rebuilding", user_id)
+            manifest = self._reset(user_id, manifest)
+        watermark = _as_utc(manifest.watermark)
+        settled = (_as_utc(now) or datetime.now(timezone.utc)) - BACKFILL_WINDOW
+        # The table stores naive UTC timestamps.
+        params: dict[str, Any] = {"user_id": user_id, "settled": settled.replace(tzinfo=None)}
+        query = f"SELECT * FROM {TABLE_NAME} WHERE user_id = :user_id AND feature_time <= :settled"
+        if watermark is not None:
+            query += " AND feature_time > :watermark"
+            params["watermark"] = watermark.replace(tzinfo=None)
+        query += " ORDER BY feature_time ASC"
+
+        result = await session.stream(text(query), params)
+        columns = list(result.keys())
+        exported = 0
+        written = 0
+        async for rows in result.partitions(batch_size):
+            table = self._table_from_rows(rows, columns)
+            before = len(manifest.files)
+            self._append(user_id, manifest, table)
+            written += len(manifest.files) - before
+            exported += table.num_rows
+            manifest.watermark = table.column("feature_time")[-1].as_py().isoformat()
+            # Persist progress per batch so a crash never re-exports rows.
+            self._save_manifest(user_id, manifest)
+
+        stale = self._compact(user_id, manifest)
+        if stale:
+            self._save_manifest(user_id, manifest)
+            for path in stale:
+                (self.user_dir(user_id) / path).unlink(missing_ok=True)
+        return {
+            "status": "ok",
+            "rows": exported,
+            "new_files": written,
+            "compacted_parts": len(stale),
+            "rebuilt": rebuilt,
+            "watermark": manifest.watermark,
+        }
+
+    def read(
+        self,
+        user_id: str,
+        *,
+        columns: Optional[Iterable[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> pd.DataFrame:
+        """Memory-mapped read of the requested columns within ``[start, end)``."""
+        if not HAS_PYARROW:
+            raise RuntimeError("pyarrow not installed")
+        start = _as_utc(start)
+        end = _as_utc(end)
+        wanted = list(dict.fromkeys(["feature_time", *(columns or TRAINING_COLUMNS)]))
+        wanted = [name for name in wanted if name in TRAINING_COLUMNS]
+        filters = []
+        if start is not None:
+            filters.append(("feature_time", ">=", start))
+        if end is not None:
+            filters.append(("feature_time", "<", end))
+
+        base = self.user_dir(user_id)
+        tables = [
+            pq.read_table(
+                base / part.path, columns=wanted, filters=filters or None, memory_map=True
+            )
+            for part in self.load_manifest(user_id).files
+            if (start is None or _as_utc(part.end) >= start)
+            and (end is None or _as_utc(part.start) < end)
+        ]
+        if not tables:
+            return pd.DataFrame(columns=wanted)
+        frame = pa.concat_tables(tables).sort_by("feature_time").to_pandas()
+        for name in wanted:
+            if TRAINING_COLUMNS[name] == "category":
+                frame[name] = frame[name].astype(object)
+        return frame
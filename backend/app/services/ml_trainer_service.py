@@ -1,6 +1,8 @@
 
+import asyncio
 import logging
 import json
+import os
 import shutil
 import pandas as pd
 import numpy as np
@@ -11,8 +13,17 @@ from typing import Dict, Any, Optional
 from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.settings import get_settings
-from app.services.ml_inference_service import MLInferenceService
+from app.services.ml_feature_store import (
+    ACTUAL_BG_COLUMNS,
+    CAT_FEATURES,
+    HORIZONS,
+    AlignedMatrix,
+    build_training_matrix,
+)
+from app.services.ml_inference_service import MLInferenceService, file_sha256
 from app.models.ml_store import MLModelStore
+from app.services.ml_parquet_store import HAS_PYARROW, MLParquetStore
+from app.services.ml_training_pool import FitTask, run_tasks, scratch_store
 
 try:
     from catboost import CatBoostRegressor
@@ -22,6 +33,33 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+QUANTILE_LOSSES = {"p50": "RMSE", "p10": "Quantile:alpha=0.1", "p90": "Quantile:alpha=0.9"}
+CATBOOST_PARAMS = {
+    "iterations": 500,
+    "learning_rate": 0.05,
+    "depth": 6,
+    "verbose": False,
+    "allow_writing_files": False,
+}
+# Warm-start runs add this many trees to each live model
+INCREMENTAL_ITERATIONS = 100
+# Aligned rows a horizon needs to be (re)trained
+FULL_MIN_SAMPLES = 500
+INCREMENTAL_MIN_SAMPLES = 100
+# A candidate may be this much worse than the live models on the holdout
+PROMOTION_TOLERANCE = 0.02
+# Everything train_user_model touches; the rest of the snapshot is never read.
+TRAINER_COLUMNS = [
+    "feature_time", "bg_mgdl", "trend", "iob_u", "cob_g", "basal_active_u",
+    "basal_total_24h", "bolus_total_3h", "carbs_total_3h", "exercise_minutes_6h",
+] + [f"baseline_bg_{h}m" for h in HORIZONS] + list(ACTUAL_BG_COLUMNS)
+
+def _utc_ts(value: pd.Timestamp) -> float:
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("UTC")
+    return ts.timestamp()
+
 class MLTrainerService:
     """
     Handles automatic training of ML models with strict quality gates.
@@ -31,13 +69,38 @@ class MLTrainerService:
         self.session = session
         self.settings = get_settings()
 
-    async def _fetch_training_data(self, user_id: str) -> pd.DataFrame:
-        stmt = text("""
-            SELECT * FROM ml_training_data_v2 
-            WHERE user_id = :user_id 
-            ORDER BY feature_time ASC
-        """)
-        result = await self.session.execute(stmt, {"user_id": user_id})
+    async def _fetch_training_data(self, user_id: str, since: Optional[datetime] = None) -> pd.DataFrame:
+        """Training columns within the configured window (and from `since` on).
+
+        Prefers the Parquet mirror (appending newly settled snapshots first) so only the
+        needed columns are read; falls back to the table without pyarrow.
+        """
+        window_days = self.settings.ml.training_window_days
+        start = datetime.now(timezone.utc) - timedelta(days=window_days) if window_days else None
+        if since is not None and (start is None or since > start):
+            start = since
+
+        if HAS_PYARROW:
+            try:
+                store = MLParquetStore()
+                await store.export_incremental(self.session, user_id)
+                df = store.read(user_id, columns=TRAINER_COLUMNS, start=start)
+                if not df.empty:
+                    # Same naive-UTC timestamps as the table path.
+                    df["feature_time"] = df["feature_time"].dt.tz_convert(None)
+                return df
+            except Exception as e:
+                logger.warning(f"ML: Parquet mirror unavailable, reading table: {e}")
+
+        query = f"""
+            SELECT {", ".join(TRAINER_COLUMNS)} FROM ml_training_data_v2
+            WHERE user_id = :user_id
+        """
+        params: Dict[str, Any] = {"user_id": user_id}
+        if start is not None:
+            query += " AND feature_time >= :start"
+            params["start"] = start.replace(tzinfo=None)
+        result = await self.session.execute(text(query + " ORDER BY feature_time ASC"), params)
         rows = result.fetchall()
         
         if not rows:
@@ -52,40 +115,6 @@ class MLTrainerService:
             
         return df
 
-    def _prepare_target_columns(self, df: pd.DataFrame, horizons=[30, 60, 120, 240, 360]) -> pd.DataFrame:
-        """
-        Calculate target residuals for training.
-        Target = (Actual Future BG) - (Baseline Physics Forecast at that future time)
-        
-        Note: The 'baseline_bg_Xm' columns in the DB are the forecasts made AT feature_time for feature_time+X.
-        We need to match row[t] with row[t+X]['bg_mgdl'].
-        """
-        df = df.sort_values("feature_time").copy()
-        df.set_index("feature_time", inplace=True)
-        
-        # Forward fill essential holes (small)
-        # df["bg_mgdl"] = df["bg_mgdl"].interpolate(method="time", limit=3)
-        
-        for h in horizons:
-            # Shift BG backwards to bring future value to current row
-            # target_bg_h = BG at t+h
-            # We can use shift(-h // 5) if data is perfectly 5 min, but better to reindex
-            
-            # Create a shifter series
-            future_bg = df["bg_mgdl"].shift(periods=int(-h/5)) 
-            # Note: this assumes uniform 5 min spacing. 
-            # Ideally reindex to 5min frequency to be safe.
-            
-            # Calculate Residual
-            # Target Residual = Actual Future - Baseline Forecast
-            baseline_col = f"baseline_bg_{h}m"
-            if baseline_col in df.columns:
-                 df[f"target_residual_{h}m"] = future_bg - df[baseline_col]
-        
-        df.reset_index(inplace=True)
-        return df
-
-
     async def _safe_create_store_table(self):
         """Create MLModelStore table if not exists (raw SQL to avoid Alembic issues)"""
         try:
@@ -130,31 +159,7 @@ class MLTrainerService:
         # Safe default: Only train if allow_training_on_ephemeral is True OR we are sure we are persistent.
         # For now, rely on `training_enabled` which user must opt-in.
         
-        # 3. Load Data
-        df = await self._fetch_training_data(user_id)
-        if df.empty:
-            return {"status": "skipped", "reason": "No data found"}
-            
-        # 4. Check Sample Count Gate
-        sample_count = len(df)
-        if sample_count < ml_cfg.min_training_samples:
-            return {
-                "status": "skipped", 
-                "reason": f"Insufficient samples: {sample_count} < {ml_cfg.min_training_samples}. State: DATA_GATHERING."
-            }
-            
-        # 5. Check Time Span Gate
-        min_date = df["feature_time"].min()
-        max_date = df["feature_time"].max()
-        days_covered = (max_date - min_date).total_seconds() / 86400
-        
-        if days_covered < ml_cfg.min_days_history:
-             return {
-                "status": "skipped", 
-                "reason": f"Insufficient history duration: {days_covered:.1f} days < {ml_cfg.min_days_history} days"
-            }
-
-        # 6. Check Retrain Interval
+        # 3. Check Retrain Interval
         # Look for existing model metadata
         svc = MLInferenceService.get_instance()
         current_meta = svc._metadata
@@ -166,128 +171,190 @@ class MLTrainerService:
                  if hours_since < ml_cfg.retrain_interval_hours:
                       return {"status": "skipped", "reason": f"Recently trained ({hours_since:.1f}h ago)"}
 
+        # 4. Pick Mode: continue the current models on new rows, or retrain from scratch
+        out_dir = self._ensure_model_dir()
+        previous = self._warm_start_base(current_meta, user_id, out_dir)
+        trained_since = None
+        if previous:
+            trained_since = datetime.fromtimestamp(previous["trained_until_ts"], tz=timezone.utc)
+
+        # 5. Load Data
+        df = await self._fetch_training_data(user_id, since=trained_since)
+        if df.empty:
+            return {"status": "skipped", "reason": "No data found"}
+            
+        sample_count = len(df)
+        min_date = df["feature_time"].min()
+        max_date = df["feature_time"].max()
+        days_covered = (max_date - min_date).total_seconds() / 86400
+
+        # 6. Check Sample Count / Time Span Gates (the warm-start base already passed them)
+        if not previous:
+            if sample_count < ml_cfg.min_training_samples:
+                return {
+                    "status": "skipped", 
+                    "reason": f"Insufficient samples: {sample_count} < {ml_cfg.min_training_samples}. State: DATA_GATHERING."
+                }
+            if days_covered < ml_cfg.min_days_history:
+                 return {
+                    "status": "skipped", 
+                    "reason": f"Insufficient history duration: {days_covered:.1f} days < {ml_cfg.min_days_history} days"
+                }
+
         # 7. Prepare Training Data
         if not HAS_CATBOOST:
             return {"status": "error", "reason": "CatBoost not installed"}
 
-        logger.info(f"ML: Starting training for {user_id}. Samples={sample_count}, Days={days_covered:.1f}")
-        
-        df_train = self._prepare_target_columns(df)
-        
-        # Features to use (exclude meta columns)
-        feature_cols = [
-            "bg_mgdl", "trend", "iob_u", "cob_g", "basal_active_u", 
-            "basal_total_24h", "bolus_total_3h", "carbs_total_3h",
-            "exercise_minutes_6h", "hour_of_day", "day_of_week"
-        ]
-        # Dynamically add available features from schema if needed (like baseline_bg_Xm)
-        # We include baseline forecasts as inputs? Yes, correction model.
-        horizons = [30, 60, 120, 240, 360]
-        for h in horizons:
-            feature_cols.append(f"baseline_bg_{h}m")
-            
-        # Clean Data (Drop rows where target is NaN)
-        # We handle categorical Features
-        cat_features = ["trend"]
+        mode = "incremental" if previous else "full"
+        logger.info(f"ML: Starting {mode} training for {user_id}. Samples={sample_count}, Days={days_covered:.1f}")
         
+        # Snapshots on the exact 5-minute grid, targets joined by timestamp
+        matrix = await build_training_matrix(self.session, user_id, df, HORIZONS)
+        horizons = list(HORIZONS)
+        cat_features = list(CAT_FEATURES)
+
+        # The most recent slice is held out to validate the candidate
+        # against the current model before promotion.
+        holdout_start = max_date - timedelta(hours=ml_cfg.validation_holdout_hours)
+        in_holdout = np.asarray(matrix.feature_time >= holdout_start)
+        # Rows from here on are trained by the next incremental run
+        trained_until = holdout_start
+        min_rows = INCREMENTAL_MIN_SAMPLES if previous else FULL_MIN_SAMPLES
+
+        # Candidates are written aside and only replace the live models once accepted
+        cand_dir = out_dir / ".candidate"
+        shutil.rmtree(cand_dir, ignore_errors=True)
+        cand_dir.mkdir()
+
         metrics = {}
-        models = {}
-        
-        # Define output directory
-        out_dir = self._ensure_model_dir()
-        
-        # Training Loop
-        total_mae = 0
-        valid_models_count = 0
-        
-        for h in horizons:
-            target_col = f"target_residual_{h}m"
-            if target_col not in df_train.columns: continue
-            
-            # Subset valid data
-            # Subset valid data
-            valid_cols = [c for c in ([target_col] + feature_cols) if c in df_train.columns]
-            train_subset = df_train.dropna(subset=valid_cols)
-            if len(train_subset) < 500: # Min samples per horizon
-                logger.warning(f"ML: Not enough aligned samples for H{h} ({len(train_subset)})")
-                continue
-                
-            X = train_subset[[c for c in feature_cols if c in train_subset.columns]]
-            y = train_subset[target_col]
-            
-            # Treat categorical
-            for c in cat_features:
-                 if c in X.columns:
-                     X[c] = X[c].astype(str)
-            
-            # Train CatBoost p50 (median)
-            model_p50 = CatBoostRegressor(
-                iterations=500, 
-                learning_rate=0.05, 
-                depth=6, 
-                loss_function='RMSE',
-                verbose=False,
-                allow_writing_files=False
-            )
-            model_p50.fit(X, y, cat_features=cat_features if "trend" in X.columns else None)
+        # Training Plan: one independent task per horizon x quantile
+        try:
+            with scratch_store() as store:
+                store.put_frame("features", matrix.features, cat_columns=cat_features)
+                tasks = []
+                eval_rows = {}
+                for h in horizons:
+                    if h not in matrix.masks: continue
+
+                    valid = matrix.masks[h]
+                    rows = np.flatnonzero(valid & ~in_holdout)
+                    if len(rows) < min_rows: # Min samples per horizon
+                        logger.warning(f"ML: Not enough aligned samples for H{h} ({len(rows)})")
+                        continue
+
+                    held_out = np.flatnonzero(valid & in_holdout)
+                    eval_rows[h] = held_out if len(held_out) else rows
+                    store.put_array(f"rows_{h}", rows)
+                    store.put_array(f"eval_{h}", eval_rows[h])
+                    store.put_array(f"target_{h}", matrix.targets[h])
+                    for quantile, loss in QUANTILE_LOSSES.items():
+                        params = {**CATBOOST_PARAMS, "loss_function": loss}
+                        init_model = None
+                        if previous:
+                            params["iterations"] = INCREMENTAL_ITERATIONS
+                            init_model = str(out_dir / f"catboost_residual_{h}m_{quantile}.cbm")
+                        tasks.append(FitTask(
+                            key=(h, quantile),
+                            frame="features",
+                            target=f"target_{h}",
+                            params=params,
+                            rows=f"rows_{h}",
+                            # Eval on the holdout (in-sample when there is none)
+                            predict_rows=f"eval_{h}" if quantile == "p50" else None,
+                            save_path=str(cand_dir / f"catboost_residual_{h}m_{quantile}.cbm"),
+                            init_model=init_model,
+                        ))
+
+                # CatBoost fits block; keep them (and the pool bookkeeping) off the event loop
+                results = await asyncio.to_thread(
+                    lambda: list(run_tasks(store, tasks, ml_cfg.training_workers, ml_cfg.training_memory_mb))
+                )
+
+            total_mae = 0
+            valid_models_count = 0
+            for result in results:
+                h, quantile = result.key
+                if quantile != "p50":
+                    continue
+                y = matrix.targets[h][eval_rows[h]]
+                preds = result.predictions
+                mae = np.mean(np.abs(preds - y))
+                rmse = np.sqrt(np.mean((preds - y)**2))
+
+                metrics[h] = {"mae": float(mae), "rmse": float(rmse), "n": result.n_train, "n_eval": len(y)}
+                total_mae += mae
+                valid_models_count += 1
             
-            # Train CatBoost p10 (optimistic / lower bound)
-            model_p10 = CatBoostRegressor(
-                iterations=500,
-                learning_rate=0.05,
-                depth=6,
-                loss_function='Quantile:alpha=0.1',
-                verbose=False,
-                allow_writing_files=False
-            )
-            model_p10.fit(X, y, cat_features=cat_features if "trend" in X.columns else None)
+            if valid_models_count == 0:
+                 if previous:
+                     return {"status": "skipped", "reason": "Not enough new samples for incremental training"}
+                 return {"status": "failed", "reason": "Could not train any valid horizon model"}
+                 
+            avg_mae = total_mae / valid_models_count
             
-            # Train CatBoost p90 (pessimistic / upper bound)
-            model_p90 = CatBoostRegressor(
-                iterations=500,
-                learning_rate=0.05,
-                depth=6,
-                loss_function='Quantile:alpha=0.9',
-                verbose=False,
-                allow_writing_files=False
+            # 8. Integrity/Quality Check (relajado para primer modelo)
+            is_first_model = current_meta is None
+            quality_threshold = 60.0 if is_first_model else float(ml_cfg.model_quality_max_rmse)
+            if avg_mae > quality_threshold:
+                 logger.warning(f"ML: Model rejected due to high error. MAE={avg_mae:.1f} > {quality_threshold:.1f}")
+                 return {"status": "rejected", "reason": f"Quality too low (MAE {avg_mae:.1f} > {quality_threshold:.1f})"}
+
+            # 8.1 Validation Gate: the candidate must not be worse than the live models
+            current_mae = await asyncio.to_thread(
+                self._current_eval_mae, out_dir, matrix, cat_features, eval_rows
             )
-            model_p90.fit(X, y, cat_features=cat_features if "trend" in X.columns else None)
-            
-            # Eval (simple in-sample for sanity check)
-            preds = model_p50.predict(X)
-            mae = np.mean(np.abs(preds - y))
-            rmse = np.sqrt(np.mean((preds - y)**2))
-            
-            metrics[h] = {"mae": float(mae), "rmse": float(rmse), "n": len(X)}
-            total_mae += mae
-            
-            # Save Artifacts (p50, p10, p90)
-            fname_p50 = f"catboost_residual_{h}m_p50.cbm"
-            fname_p10 = f"catboost_residual_{h}m_p10.cbm"
-            fname_p90 = f"catboost_residual_{h}m_p90.cbm"
-            model_p50.save_model(str(out_dir / fname_p50))
-            model_p10.save_model(str(out_dir / fname_p10))
-            model_p90.save_model(str(out_dir / fname_p90))
-            valid_models_count += 1
-        
-        if valid_models_count == 0:
-             return {"status": "failed", "reason": "Could not train any valid horizon model"}
-             
-        avg_mae = total_mae / valid_models_count
-        
-        # 8. Integrity/Quality Check (relajado para primer modelo)
-        is_first_model = current_meta is None
-        quality_threshold = 60.0 if is_first_model else float(ml_cfg.model_quality_max_rmse)
-        if avg_mae > quality_threshold:
-             logger.warning(f"ML: Model rejected due to high error. MAE={avg_mae:.1f} > {quality_threshold:.1f}")
-             return {"status": "rejected", "reason": f"Quality too low (MAE {avg_mae:.1f} > {quality_threshold:.1f})"}
-
-        # 9. Save Metadata
+            validation = None
+            if current_mae:
+                candidate_mae = float(np.mean([metrics[h]["mae"] for h in current_mae]))
+                baseline_mae = float(np.mean(list(current_mae.values())))
+                validation = {
+                    "holdout_hours": ml_cfg.validation_holdout_hours,
+                    "candidate_mae": candidate_mae,
+                    "current_mae": baseline_mae,
+                }
+                if candidate_mae > baseline_mae * (1 + PROMOTION_TOLERANCE):
+                    logger.warning(
+                        f"ML: Candidate rejected by validation gate. MAE={candidate_mae:.2f} > current {baseline_mae:.2f}"
+                    )
+                    return {
+                        "status": "rejected",
+                        "reason": f"Worse than current model on holdout (MAE {candidate_mae:.2f} > {baseline_mae:.2f})",
+                    }
+
+            # Horizons without new rows keep the previous models
+            if previous:
+                for h in previous.get("horizons", []):
+                    if h in metrics:
+                        continue
+                    for quantile in QUANTILE_LOSSES:
+                        fname = f"catboost_residual_{h}m_{quantile}.cbm"
+                        if (out_dir / fname).exists():
+                            shutil.copy2(out_dir / fname, cand_dir / fname)
+                    if h in previous.get("metrics", {}):
+                        metrics[h] = previous["metrics"][h]
+
+            # 9. Promote and Save Metadata (with artifact hashes for incremental sync)
+            files = {}
+            for fname in sorted(p.name for p in cand_dir.glob("*.cbm")):
+                files[fname] = file_sha256(cand_dir / fname)
+                os.replace(cand_dir / fname, out_dir / fname)
+        finally:
+            shutil.rmtree(cand_dir, ignore_errors=True)
+
         version = f"v1-{datetime.now().strftime('%Y%m%d%H%M')}"
+        now_ts = datetime.now(timezone.utc).timestamp()
+        if previous and previous.get("data_end_ts"):
+            # The window overlaps the previous holdout; count only rows it had not seen
+            previous_end = datetime.fromtimestamp(previous["data_end_ts"], tz=timezone.utc)
+            new_rows = (df["feature_time"] > previous_end.replace(tzinfo=None)).to_numpy()
+            sample_count = previous.get("samples_total", 0) + int(new_rows.sum())
+            days_covered = previous.get("days_covered", 0) + max(
+                0.0, (_utc_ts(max_date) - previous["data_end_ts"]) / 86400
+            )
         meta = {
             "version": version,
             "created_at": datetime.now().isoformat(),
-            "created_at_ts": datetime.now(timezone.utc).timestamp(),
+            "created_at_ts": now_ts,
             "user_id": user_id,
             "samples_total": sample_count,
             "days_covered": days_covered,
@@ -295,7 +362,14 @@ class MLTrainerService:
             "quantiles": ["p10", "p50", "p90"],
             "metrics": metrics,
             "avg_mae": avg_mae,
-            "is_first_model": is_first_model
+            "is_first_model": is_first_model,
+            "files": files,
+            "training_mode": mode,
+            "base_version": previous.get("version") if previous else None,
+            "last_full_train_ts": previous["last_full_train_ts"] if previous else now_ts,
+            "trained_until_ts": _utc_ts(trained_until),
+            "data_end_ts": _utc_ts(max_date),
+            "validation": validation,
         }
         
         with open(out_dir / "metadata.json", "w") as f:
@@ -316,28 +390,70 @@ class MLTrainerService:
         ))
 
         # 10.2 Upload Models (p50, p10, p90)
-        for h in metrics.keys():
-            for quantile in ["p50", "p10", "p90"]:
-                fname = f"catboost_residual_{h}m_{quantile}.cbm"
-                fpath = out_dir / fname
-                if fpath.exists():
-                    with open(fpath, "rb") as f:
-                        bin_data = f.read()
-                    await self.session.merge(MLModelStore(
-                        model_name=fname,
-                        user_id=user_id,
-                        model_data=bin_data,
-                        version=version
-                    ))
+        for fname in files:
+            with open(out_dir / fname, "rb") as f:
+                bin_data = f.read()
+            await self.session.merge(MLModelStore(
+                model_name=fname,
+                user_id=user_id,
+                model_data=bin_data,
+                version=version
+            ))
         
         await self.session.commit()
         logger.info("ML: Models synced to Database (accessible by Render)")
 
         # 11. Reload Inference Service
-        svc.load_models(force_reload=True)
+        await svc.load_models_async(force_reload=True)
         
         return {"status": "success", "metadata": meta}
 
+    def _warm_start_base(self, current_meta: Optional[Dict], user_id: str, out_dir: Path) -> Optional[Dict]:
+        """Metadata of the live version if it can seed an incremental run, else None."""
+        ml_cfg = self.settings.ml
+        if not ml_cfg.incremental_training or not current_meta:
+            return None
+        if current_meta.get("user_id") != user_id:
+            return None
+        last_full_ts = current_meta.get("last_full_train_ts")
+        if not last_full_ts or not current_meta.get("trained_until_ts"):
+            return None
+        full_age = datetime.now(timezone.utc) - datetime.fromtimestamp(last_full_ts, tz=timezone.utc)
+        if full_age >= timedelta(days=ml_cfg.full_retrain_days):
+            return None
+        # Every artifact of the live version must be on disk to continue from it
+        for fname, digest in (current_meta.get("files") or {}).items():
+            path = out_dir / fname
+            if not path.exists() or file_sha256(path) != digest:
+                return None
+        return current_meta if current_meta.get("files") else None
+
+    @staticmethod
+    def _current_eval_mae(
+        out_dir: Path,
+        matrix: AlignedMatrix,
+        cat_features: list,
+        eval_rows: Dict[int, np.ndarray],
+    ) -> Dict[int, float]:
+        """p50 MAE of the live models on the candidate's evaluation rows."""
+        maes = {}
+        for h, rows in eval_rows.items():
+            path = out_dir / f"catboost_residual_{h}m_p50.cbm"
+            if not path.exists():
+                continue
+            X = matrix.features.iloc[rows].copy()
+            for c in cat_features:
+                if c in X.columns:
+                    X[c] = X[c].astype(str)
+            y = matrix.targets[h][rows]
+            try:
+                model = CatBoostRegressor()
+                model.load_model(str(path))
+                maes[h] = float(np.mean(np.abs(model.predict(X) - y)))
+            except Exception as e:
+                logger.warning(f"ML: Could not evaluate current H{h} model: {e}")
+        return maes
+
     def _ensure_model_dir(self) -> Path:
         """
         Guarantees that the ML model directory exists.
@@ -25,8 +25,10 @@ from app.models.forecast import (
 from app.models.settings import UserSettings
 from app.models.temp_mode import TempModeDB
 from app.models.treatment import Treatment
+from app.services.cgm_series import CGMPoint, CGMSeries, CGMSeriesRepository
 from app.services.forecast_engine import ForecastEngine
-from app.services.iob import compute_cob_from_sources, compute_iob_from_sources
+from app.services.iob import compute_cob_from_sources, compute_iob_from_sources, sources_from_treatments
+from app.services.ml_feature_store import TARGET_TOLERANCE
 from app.services.nightscout_client import NightscoutClient
 from app.services.nightscout_secrets_service import get_ns_config
 from app.services.settings_service import get_user_settings_service
@@ -35,6 +37,11 @@ from app.services.store import DataStore
 logger = logging.getLogger(__name__)
 
 BASELINE_HORIZONS = [30, 60, 120, 240, 360]
+# Momentum input for the baseline; older readings leave the BG missing.
+RECENT_BG_WINDOW = timedelta(minutes=45)
+# Snapshots whose late fields are still retried (longest horizon plus slack
+# for readings that are ingested late).
+BACKFILL_WINDOW = timedelta(hours=8)
 
 
 @dataclass
@@ -57,6 +64,13 @@ def _to_utc(dt: datetime) -> datetime:
     return dt.astimezone(timezone.utc)
 
 
+def _stored_time(value) -> datetime:
+    # SQLite hands back timestamps as text.
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return _to_utc(value)
+
+
 def _normalize_db_treatment(row: Treatment) -> dict:
     created_at = _to_utc(row.created_at)
     return {
@@ -161,15 +175,12 @@ def _reconcile_treatments(db_rows: Sequence[Treatment], ns_rows: Sequence) -> Tr
     )
 
 
-def _recent_bg_series(sgvs: Sequence, now_utc: datetime) -> list[dict]:
+def _recent_bg_series(points: Sequence[CGMPoint], now_utc: datetime) -> list[dict]:
     series = []
-    for entry in sgvs:
-        entry_ts = datetime.fromtimestamp(entry.date / 1000, tz=timezone.utc)
-        mins_ago = (now_utc - entry_ts).total_seconds() / 60.0
-        if mins_ago < 0:
-            mins_ago = 0.0
+    for point in points:
+        mins_ago = max(0.0, (now_utc - point.measured_at).total_seconds() / 60.0)
         if mins_ago <= 60:
-            series.append({"minutes_ago": mins_ago, "value": float(entry.sgv)})
+            series.append({"minutes_ago": mins_ago, "value": float(point.sgv)})
     return series
 
 
@@ -229,14 +240,41 @@ def _basal_active_snapshot(latest_basal: Optional[BasalEntry], now_utc: datetime
     return remaining_u, elapsed_h * 60.0
 
 
+@dataclass
+class SnapshotRun:
+    """State shared by every user's snapshot in one job run."""
+
+    now_utc: datetime
+    store: DataStore
+    local_events: list[dict]
+
+    @classmethod
+    def start(cls, now_utc: Optional[datetime] = None) -> "SnapshotRun":
+        store = DataStore(Path(get_settings().data.data_dir))
+        try:
+            local_events = store.load_events()
+        except Exception as exc:
+            logger.warning("ML training snapshot: local events unavailable: %s", exc)
+            local_events = []
+        return cls(now_utc=now_utc or datetime.now(timezone.utc), store=store, local_events=local_events)
+
+
 async def build_training_snapshot(
     user_id: str,
     session: AsyncSession,
     now_utc: Optional[datetime] = None,
+    run: Optional[SnapshotRun] = None,
 ) -> Optional[dict]:
-    now_utc = now_utc or datetime.now(timezone.utc)
-    settings = get_settings()
-    store = DataStore(Path(settings.data.data_dir))
+    """Feature snapshot for ``user_id`` at the current 5-minute slot.
+
+    Glucose comes from the ingested ``glucose_readings`` (one Nightscout range
+    read only when the local table does not cover the recent window), and a
+    single 48-hour treatment query feeds the windows, IOB, COB and the
+    baseline forecast.
+    """
+    run = run or SnapshotRun.start(now_utc)
+    now_utc = now_utc or run.now_utc
+    store = run.store
 
     settings_data = await get_user_settings_service(user_id, session)
     if not settings_data or not settings_data.get("settings"):
@@ -249,32 +287,44 @@ async def build_training_snapshot(
     bg_val = None
     bg_trend = None
     bg_age_min = None
-    recent_series: list[dict] = []
+    recent_points: list[CGMPoint] = []
     ns_treatments = []
+    repo = CGMSeriesRepository(session, user_id)
     if ns_config and ns_config.enabled and ns_config.url:
         ns_client = NightscoutClient(ns_config.url, ns_config.api_secret)
+    try:
         try:
-            latest = await ns_client.get_latest_sgv()
-            bg_val = float(latest.sgv)
-            bg_trend = latest.direction
-            entry_ts = datetime.fromtimestamp(latest.date / 1000, tz=timezone.utc)
-            bg_age_min = (now_utc - entry_ts).total_seconds() / 60.0
-            history = await ns_client.get_sgv_range(now_utc - timedelta(minutes=45), now_utc, count=20)
-            recent_series = _recent_bg_series(history, now_utc)
-            ns_treatments = await ns_client.get_recent_treatments(hours=24, limit=200)
+            series = await repo.load(now_utc - RECENT_BG_WINDOW, now_utc, fallback_client=ns_client)
+            recent_points = series.points
         except Exception as exc:
-            logger.warning("Nightscout fetch failed for user %s: %s", user_id, exc)
-        finally:
+            logger.warning("Nightscout glucose fallback failed for user %s: %s", user_id, exc)
+            recent_points = await repo.get_range(now_utc - RECENT_BG_WINDOW, now_utc)
+        if ns_client is not None:
+            try:
+                ns_treatments = await ns_client.get_recent_treatments(hours=24, limit=200)
+            except Exception as exc:
+                logger.warning("Nightscout fetch failed for user %s: %s", user_id, exc)
+    finally:
+        if ns_client is not None:
             await ns_client.aclose()
 
-    cutoff = now_utc - timedelta(hours=24)
-    db_stmt = (
+    if recent_points:
+        latest = recent_points[-1]
+        bg_val = float(latest.sgv)
+        bg_trend = latest.direction
+        bg_age_min = max(0.0, (now_utc - latest.measured_at).total_seconds() / 60.0)
+    recent_series = _recent_bg_series(recent_points, now_utc)
+
+    treatment_cutoff = (now_utc - timedelta(hours=48)).replace(tzinfo=None)
+    treatment_stmt = (
         select(Treatment)
         .where(Treatment.user_id == user_id)
-        .where(Treatment.created_at >= cutoff.replace(tzinfo=None))
+        .where(Treatment.created_at >= treatment_cutoff)
         .order_by(Treatment.created_at.desc())
     )
-    db_rows = (await session.execute(db_stmt)).scalars().all()
+    treatment_rows = (await session.execute(treatment_stmt)).scalars().all()
+    cutoff = now_utc - timedelta(hours=24)
+    db_rows = [row for row in treatment_rows if _to_utc(row.created_at) >= cutoff]
 
     treatment_summary = _reconcile_treatments(db_rows, ns_treatments)
 
@@ -296,6 +346,9 @@ async def build_training_snapshot(
     )
     temp_rows = (await session.execute(temp_stmt)).scalars().all()
 
+    iob_sources, cob_sources = sources_from_treatments(
+        now_utc, user_settings, treatment_rows, run.local_events, user_id
+    )
     iob_total, _, iob_info, _ = await compute_iob_from_sources(
         now=now_utc,
         settings=user_settings,
@@ -303,6 +356,8 @@ async def build_training_snapshot(
         data_store=store,
         extra_boluses=None,
         user_id=user_id,
+        persist_cache=False,
+        sources=iob_sources,
     )
     cob_total, cob_info, _ = await compute_cob_from_sources(
         now=now_utc,
@@ -310,6 +365,7 @@ async def build_training_snapshot(
         data_store=store,
         extra_entries=None,
         user_id=user_id,
+        sources=cob_sources,
     )
 
     bolus_total_3h = 0.0
@@ -505,53 +561,6 @@ async def build_training_snapshot(
 
 
 async def persist_training_snapshot(session: AsyncSession, snapshot: dict) -> None:
-    await session.execute(
-        text(
-            """
-            CREATE TABLE IF NOT EXISTS ml_training_data_v2 (
-                feature_time TIMESTAMP NOT NULL,
-                user_id VARCHAR NOT NULL,
-                bg_mgdl FLOAT,
-                trend VARCHAR,
-                bg_age_min FLOAT,
-                iob_u FLOAT,
-                cob_g FLOAT,
-                iob_status VARCHAR,
-                cob_status VARCHAR,
-                basal_active_u FLOAT,
-                basal_latest_u FLOAT,
-                basal_latest_age_min FLOAT,
-                basal_total_24h FLOAT,
-                basal_total_48h FLOAT,
-                bolus_total_3h FLOAT,
-                bolus_total_6h FLOAT,
-                carbs_total_3h FLOAT,
-                carbs_total_6h FLOAT,
-                exercise_minutes_6h FLOAT,
-                exercise_minutes_24h FLOAT,
-                baseline_bg_30m FLOAT,
-                baseline_bg_60m FLOAT,
-                baseline_bg_120m FLOAT,
-                baseline_bg_240m FLOAT,
-                baseline_bg_360m FLOAT,
-                active_params TEXT,
-                event_counts TEXT,
-                source_ns_enabled BOOLEAN,
-                source_ns_treatments_count INTEGER,
-                source_db_treatments_count INTEGER,
-                source_overlap_count INTEGER,
-                source_conflict_count INTEGER,
-                source_consistency_status VARCHAR,
-                flag_bg_missing BOOLEAN,
-                flag_bg_stale BOOLEAN,
-                flag_iob_unavailable BOOLEAN,
-                flag_cob_unavailable BOOLEAN,
-                flag_source_conflict BOOLEAN,
-                PRIMARY KEY (feature_time, user_id)
-            )
-            """
-        )
-    )
     insert_sql = text(
         """
         INSERT INTO ml_training_data_v2 (
@@ -646,13 +655,88 @@ async def persist_training_snapshot(session: AsyncSession, snapshot: dict) -> No
     await session.commit()
 
 
+async def backfill_actual_bg(
+    session: AsyncSession,
+    user_id: str,
+    now_utc: Optional[datetime] = None,
+) -> int:
+    """Fill the ``actual_bg_{h}m`` late fields of recent snapshots.
+
+    Pending rows and the readings they need are read once, and every row
+    that gained a value is written by a single executemany UPDATE. Returns
+    the number of rows updated.
+    """
+    now_utc = now_utc or datetime.now(timezone.utc)
+    late = [f"actual_bg_{h}m" for h in BASELINE_HORIZONS]
+    first_due = min(BASELINE_HORIZONS)
+    result = await session.execute(
+        text(
+            f"""
+            SELECT feature_time, {", ".join(late)}
+            FROM ml_training_data_v2
+            WHERE user_id = :user_id
+              AND feature_time >= :since
+              AND feature_time <= :due
+              AND ({" OR ".join(f"{name} IS NULL" for name in late)})
+            ORDER BY feature_time ASC
+            """
+        ),
+        {
+            "user_id": user_id,
+            "since": (now_utc - BACKFILL_WINDOW).astimezone(timezone.utc).replace(tzinfo=None),
+            "due": (now_utc - timedelta(minutes=first_due)).astimezone(timezone.utc).replace(tzinfo=None),
+        },
+    )
+    pending = result.fetchall()
+    if not pending:
+        return 0
+
+    start = _stored_time(pending[0].feature_time) + timedelta(minutes=first_due) - TARGET_TOLERANCE
+    repo = CGMSeriesRepository(session, user_id)
+    series = CGMSeries(start=start, end=now_utc, points=await repo.get_range(start, now_utc))
+
+    updates = []
+    for row in pending:
+        feature_time = _stored_time(row.feature_time)
+        values = {}
+        for h, name in zip(BASELINE_HORIZONS, late):
+            target = feature_time + timedelta(minutes=h)
+            if getattr(row, name) is not None or target > now_utc:
+                continue
+            point = series.value_at(target, tolerance=TARGET_TOLERANCE)
+            if point is not None:
+                values[name] = float(point.sgv)
+        if values:
+            # The stored value is bound back as read so the key matches on every driver.
+            updates.append(
+                {"user_id": user_id, "feature_time": row.feature_time, **{name: values.get(name) for name in late}}
+            )
+    if not updates:
+        return 0
+
+    assignments = ", ".join(f"{name} = COALESCE({name}, :{name})" for name in late)
+    await session.execute(
+        text(
+            f"""
+            UPDATE ml_training_data_v2 SET {assignments}
+            WHERE user_id = :user_id AND feature_time = :feature_time
+            """
+        ),
+        updates,
+    )
+    await session.commit()
+    return len(updates)
+
+
 async def collect_and_persist_training_snapshot(
     user_id: str,
     session: AsyncSession,
     now_utc: Optional[datetime] = None,
+    run: Optional[SnapshotRun] = None,
 ) -> Optional[dict]:
-    snapshot = await build_training_snapshot(user_id, session, now_utc=now_utc)
+    snapshot = await build_training_snapshot(user_id, session, now_utc=now_utc, run=run)
     if not snapshot:
         return None
     await persist_training_snapshot(session, snapshot)
+    await backfill_actual_bg(session, user_id, now_utc=now_utc or (run.now_utc if run else None))
     return snapshot
@@ -0,0 +1,236 @@
+"""Parallel CatBoost training over memory-mapped feature matrices.
+
+A training run (horizons x quantiles, and for the offline script every
+rolling backtest split) is expressed as a list of independent ``FitTask``s.
+The feature frames they read are written once to ``.npy`` files in a
+scratch directory; workers open them with ``mmap_mode="r"`` so every process
+shares the same page cache instead of receiving a pickled copy.
+
+Categorical columns are stored as integer codes plus their category strings
+and decoded back to strings in the worker, so the fitted models see exactly
+the input they would have seen in-process.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    from catboost import CatBoostRegressor
+    HAS_CATBOOST = True
+except ImportError:
+    HAS_CATBOOST = False
+
+logger = logging.getLogger(__name__)
+
+# Rough CatBoost working set per worker on top of its share of the data.
+WORKER_BASE_MB = 200
+# Quantized pools, gradients and the decoded frame, relative to raw float64 rows.
+WORKER_DATA_FACTOR = 4
+
+# Index array name in the store, or a contiguous [start, stop) row range.
+Rows = Union[str, Tuple[int, int]]
+
+
+@dataclass(frozen=True)
+class FitTask:
+    key: Tuple[Any, ...]
+    frame: str
+    target: str
+    params: Dict[str, Any]
+    rows: Rows
+    predict_rows: Optional[Rows] = None
+    # Fill numeric NaNs with the medians of the training rows (offline script)
+    impute: bool = False
+    save_path: Optional[str] = None
+    # Continue boosting from this saved model (warm start)
+    init_model: Optional[str] = None
+
+
+@dataclass
+class FitResult:
+    key: Tuple[Any, ...]
+    n_train: int
+    predictions: Optional[np.ndarray] = None
+
+
+class SharedArrays:
+    """Write-once store of frames and arrays backed by ``.npy`` files."""
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self._manifest: Dict[str, Dict[str, Any]] = {}
+
+    def put_frame(self, name: str, df: pd.DataFrame, cat_columns: Sequence[str] = ()) -> None:
+        columns = list(df.columns)
+        cats = [c for c in columns if c in cat_columns]
+        nums = [c for c in columns if c not in cats]
+        numeric = np.empty((len(df), len(nums)), dtype=np.float64)
+        for i, col in enumerate(nums):
+            numeric[:, i] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        codes = np.empty((len(df), len(cats)), dtype=np.int32)
+        categories: Dict[str, List[str]] = {}
+        for i, col in enumerate(cats):
+            col_codes, uniques = pd.factorize(df[col].astype(str))
+            codes[:, i] = col_codes
+            categories[col] = [str(u) for u in uniques]
+        np.save(self.root / f"{name}.num.npy", numeric)
+        np.save(self.root / f"{name}.cat.npy", codes)
+        self._manifest[name] = {"columns": columns, "numeric": nums, "categorical": categories}
+        self._write_manifest()
+
+    def put_array(self, name: str, values: Any) -> None:
+        np.save(self.root / f"{name}.npy", np.asarray(values))
+
+    def _write_manifest(self) -> None:
+        with open(self.root / "manifest.json", "w") as f:
+            json.dump(self._manifest, f)
+
+
+_OPENED: Dict[str, "_SharedReader"] = {}
+
+
+class _SharedReader:
+    def __init__(self, root: str):
+        self.root = Path(root)
+        with open(self.root / "manifest.json") as f:
+            self.manifest = json.load(f)
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def open(cls, root: str) -> "_SharedReader":
+        reader = _OPENED.get(root)
+        if reader is None:
+            reader = _OPENED[root] = cls(root)
+        return reader
+
+    def array(self, filename: str) -> np.ndarray:
+        if filename not in self._arrays:
+            self._arrays[filename] = np.load(self.root / filename, mmap_mode="r")
+        return self._arrays[filename]
+
+    def select(self, rows: Rows) -> Union[slice, np.ndarray]:
+        if isinstance(rows, str):
+            return np.asarray(self.array(f"{rows}.npy"))
+        return slice(rows[0], rows[1])
+
+    def frame(self, name: str, rows: Rows) -> pd.DataFrame:
+        spec = self.manifest[name]
+        index = self.select(rows)
+        numeric = np.asarray(self.array(f"{name}.num.npy")[index])
+        codes = np.asarray(self.array(f"{name}.cat.npy")[index])
+        data: Dict[str, Any] = {col: numeric[:, i] for i, col in enumerate(spec["numeric"])}
+        for i, (col, categories) in enumerate(spec["categorical"].items()):
+            data[col] = np.asarray(categories, dtype=object)[codes[:, i]]
+        return pd.DataFrame(data, columns=spec["columns"])
+
+
+def run_fit_task(root: str, task: FitTask) -> FitResult:
+    """Fit one model in the current process. Entry point of pool workers."""
+    reader = _SharedReader.open(root)
+    X = reader.frame(task.frame, task.rows)
+    y = np.asarray(reader.array(f"{task.target}.npy")[reader.select(task.rows)], dtype=np.float64)
+    cat_features = list(reader.manifest[task.frame]["categorical"])
+
+    X_pred = reader.frame(task.frame, task.predict_rows) if task.predict_rows is not None else None
+    if task.impute:
+        numeric = reader.manifest[task.frame]["numeric"]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            medians = X[numeric].median()
+        X[numeric] = X[numeric].fillna(medians)
+        if X_pred is not None:
+            X_pred[numeric] = X_pred[numeric].fillna(medians)
+
+    model = CatBoostRegressor(**task.params)
+    model.fit(X, y, cat_features=cat_features or None, init_model=task.init_model)
+    if task.save_path:
+        model.save_model(task.save_path)
+    predictions = np.asarray(model.predict(X_pred)) if X_pred is not None else None
+    return FitResult(task.key, len(X), predictions)
+
+
+def plan_workers(
+    n_tasks: int,
+    rows_per_task: int,
+    n_features: int,
+    max_workers: Optional[int],
+    memory_limit_mb: Optional[int],
+) -> int:
+    """Worker count bounded by tasks, cores and the memory budget."""
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(n_tasks, max_workers or cpus))
+    if memory_limit_mb:
+        per_worker = WORKER_BASE_MB + rows_per_task * n_features * 8 * WORKER_DATA_FACTOR / (1024 * 1024)
+        workers = max(1, min(workers, int(memory_limit_mb // per_worker)))
+    return workers
+
+
+def _with_resources(task: FitTask, workers: int, memory_limit_mb: Optional[int]) -> FitTask:
+    params = dict(task.params)
+    # Split the cores instead of letting every worker start one thread per core.
+    params.setdefault("thread_count", max(1, (os.cpu_count() or 1) // workers))
+    if memory_limit_mb:
+        params.setdefault("used_ram_limit", f"{max(64, memory_limit_mb // workers)}mb")
+    return replace(task, params=params)
+
+
+def run_tasks(
+    store: SharedArrays,
+    tasks: Sequence[FitTask],
+    max_workers: Optional[int] = None,
+    memory_limit_mb: Optional[int] = None,
+) -> Iterator[FitResult]:
+    """Run tasks, in a spawn-based process pool when more than one worker fits.
+
+    Results are yielded in task order.
+    """
+    if not tasks:
+        return
+    manifest = store._manifest
+    n_features = max((len(spec["columns"]) for spec in manifest.values()), default=1)
+    rows_per_task = max(_row_count(store, t.rows) for t in tasks)
+    workers = plan_workers(len(tasks), rows_per_task, n_features, max_workers, memory_limit_mb)
+    tasks = [_with_resources(t, workers, memory_limit_mb) for t in tasks]
+    root = str(store.root)
+
+    if workers == 1:
+        logger.info(f"ML: Training {len(tasks)} models in-process")
+        for task in tasks:
+            yield run_fit_task(root, task)
+        return
+
+    logger.info(f"ML: Training {len(tasks)} models on {workers} worker processes")
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [pool.submit(run_fit_task, root, task) for task in tasks]
+        for future in futures:
+            yield future.result()
+
+
+def _row_count(store: SharedArrays, rows: Rows) -> int:
+    if isinstance(rows, str):
+        return int(np.load(store.root / f"{rows}.npy", mmap_mode="r").shape[0])
+    return rows[1] - rows[0]
+
+
+@contextmanager
+def scratch_store(prefix: str = "ml-train-") -> Iterator[SharedArrays]:
+    """A SharedArrays in a temporary directory, removed on exit."""
+    with tempfile.TemporaryDirectory(prefix=prefix) as root:
+        try:
+            yield SharedArrays(root)
+        finally:
+            _OPENED.pop(root, None)
@@ -1,21 +1,151 @@
+import asyncio
 import hashlib
 import logging
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Any, Optional
-import uuid
+from typing import Any, Awaitable, Callable, Iterator, Optional
 import json
 
 import httpx
 
 from app.models.schemas import NightscoutSGV, NightscoutStatus, Treatment
+from app.services.circuit_breaker import CircuitOpenError, get_breaker
 
 logger = logging.getLogger(__name__)
 
 
+# Upper bound for one /api/v1/treatments request; longer windows are paged.
+TREATMENTS_PAGE_SIZE = 100
+# Calls asking for more items than this learn their latency apart from
+# small polls of the same path.
+BULK_ITEMS = 20
+
+
+def _endpoint_class(method: str, url: str, kwargs: dict[str, Any]) -> str:
+    """Latency class of a call: method, path (ids folded) and small/bulk size."""
+    path = httpx.URL(url).path
+    if path.startswith("/api/v1/treatments/"):
+        path = "/api/v1/treatments/{id}"
+    params = kwargs.get("params") or {}
+    body = kwargs.get("json")
+    try:
+        items = int(params.get("count") or 0) if isinstance(params, dict) else 0
+    except (TypeError, ValueError):
+        items = 0
+    if isinstance(body, list):
+        items = max(items, len(body))
+    return f"{method.upper()} {path}{' bulk' if items > BULK_ITEMS else ''}"
+
+
 class NightscoutError(Exception):
     """Raised when Nightscout interaction fails."""
 
 
+class NightscoutUnavailableError(NightscoutError, CircuitOpenError):
+    """Nightscout's circuit breaker is open; the call was not attempted."""
+
+
+# Identical reads of one Nightscout site within these windows share a single
+# HTTP response. Scheduler jobs that fire on the same minute and user requests
+# landing at that instant then cost one upstream call. 0 disables caching
+# (in-flight coalescing still applies).
+RESPONSE_TTL_SECONDS: dict[str, float] = {
+    "latest_sgv": 15.0,
+    "sgv_range": 30.0,
+    "treatments": 30.0,
+}
+# Range reads compute their window from "now"; bucket it so near-simultaneous
+# callers produce the same key.
+SGV_RANGE_KEY_QUANTUM_MS = 10_000
+# Upper bound on duplicate-probe pages for one batch upload.
+SGV_PROBE_MAX_PAGES = 20
+_MAX_CACHED_RESPONSES = 512
+
+
+class _SingleFlight:
+    """Coalesce concurrent identical reads and keep their result for a short TTL."""
+
+    def __init__(self) -> None:
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._cache: dict[tuple, tuple[float, Any]] = {}
+
+    def clear(self) -> None:
+        self._inflight.clear()
+        self._cache.clear()
+
+    def invalidate(self, scope: tuple) -> None:
+        for key in [key for key in self._cache if key[0] == scope]:
+            del self._cache[key]
+
+    def _store(self, key: tuple, ttl: float, value: Any) -> None:
+        now = time.monotonic()
+        if len(self._cache) >= _MAX_CACHED_RESPONSES:
+            for stale in [k for k, (expires, _) in self._cache.items() if expires <= now]:
+                del self._cache[stale]
+            if len(self._cache) >= _MAX_CACHED_RESPONSES:
+                self._cache.pop(next(iter(self._cache)))
+        self._cache[key] = (now + ttl, value)
+
+    async def run(self, key: tuple, ttl: float, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        hit = self._cache.get(key)
+        if hit is not None:
+            if hit[0] > time.monotonic():
+                return hit[1]
+            del self._cache[key]
+
+        loop = asyncio.get_running_loop()
+        shared = self._inflight.get(key)
+        if shared is not None and shared.get_loop() is loop:
+            try:
+                return await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise
+                # The leading caller was cancelled; issue our own request.
+                return await self.run(key, ttl, fetch)
+
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            result = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # followers re-raise it; silence "never retrieved"
+            raise
+        else:
+            future.set_result(result)
+            if ttl > 0:
+                self._store(key, ttl, result)
+            return result
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+
+_single_flight = _SingleFlight()
+
+
+def clear_response_cache() -> None:
+    """Drop coalesced/cached Nightscout responses (tests, credential changes)."""
+    _single_flight.clear()
+
+
+def _copy_models(result: Any) -> Any:
+    # Shared results must not leak mutations between callers.
+    if isinstance(result, list):
+        return [item.model_copy() for item in result]
+    return result.model_copy()
+
+
+def _ns_timestamp(dt: datetime) -> str:
+    """Format like Nightscout's own ``created_at`` so string range filters compare correctly."""
+    dt = dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
 class NightscoutClient:
     def __init__(
         self,
@@ -53,6 +183,15 @@ class NightscoutClient:
             params=params, 
         )
         
+        # Coalescing scope: responses are only shared between clients pointed at
+        # the same site with the same credentials.
+        auth_fingerprint = hashlib.sha1(
+            repr(sorted(self._auth_headers().items())).encode("utf-8")
+        ).hexdigest()
+        self._scope = (self.base_url, auth_fingerprint)
+        # One breaker per site: every client for a degraded Nightscout fails fast.
+        self.breaker = get_breaker(f"nightscout:{self.base_url}")
+
         # Clock Skew: Difference between Local Time and Server Time (Server - Local)
         # If Server is ahead, skew is positive. If Server is behind, skew is negative.
         # Adjusted Time = Local Time + Skew
@@ -135,6 +274,41 @@ class NightscoutClient:
             
         return headers
 
+    async def _request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send one HTTP call through the site's circuit breaker.
+
+        Refuses immediately while the breaker is open. Without an explicit
+        ``timeout`` the call gets a deadline adapted to the recent latency of
+        its endpoint class; a timeout the caller passed is never shortened.
+        Transport errors and 5xx count as failures; 4xx are the caller's
+        problem and count as successes. A call cancelled or failing for any
+        other reason records nothing.
+        """
+        endpoint = _endpoint_class(method, url, kwargs)
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.breaker.deadline(float(self.timeout_seconds), endpoint)
+        token = self.breaker.allow(float(kwargs["timeout"]))
+        if token is None:
+            raise NightscoutUnavailableError(f"Nightscout circuit open for {self.base_url}")
+        started = time.monotonic()
+        try:
+            response = await getattr(self.client, method)(url, **kwargs)
+        except (httpx.TimeoutException, httpx.TransportError):
+            self.breaker.record_failure(time.monotonic() - started)
+            raise
+        except BaseException:
+            # Cancelled (e.g. by a caller's deadline) or failed before an
+            # outcome: say nothing about the site, but free the probe slot
+            # if this call held it.
+            self.breaker.release_probe(token)
+            raise
+        status_code = getattr(response, "status_code", 200)
+        if isinstance(status_code, int) and status_code >= 500:
+            self.breaker.record_failure(time.monotonic() - started)
+        else:
+            self.breaker.record_success(time.monotonic() - started, endpoint)
+        return response
+
     async def _handle_response(self, response: httpx.Response) -> Any:
         # Update clock skew first
         self._update_clock_skew(response.headers)
@@ -163,7 +337,7 @@ class NightscoutClient:
         last_error: Optional[Exception] = None
         for endpoint in endpoint_candidates:
             try:
-                response = await self.client.get(endpoint)
+                response = await self._request("get", endpoint)
                 data = await self._handle_response(response)
                 # If status returns list (shouldn't), handle it? status usually dict.
                 if isinstance(data, list):
@@ -174,148 +348,224 @@ class NightscoutClient:
                 logger.warning("Nightscout status endpoint failed", extra={"endpoint": endpoint, "error": str(exc)})
         raise NightscoutError(f"Unable to fetch Nightscout status: {last_error}")
 
+    async def _shared(self, endpoint: str, key: tuple, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        result = await _single_flight.run(
+            (self._scope, endpoint, *key), RESPONSE_TTL_SECONDS.get(endpoint, 0.0), fetch
+        )
+        return _copy_models(result)
+
     async def get_latest_sgv(self) -> NightscoutSGV:
+        return await self._shared("latest_sgv", (), self._fetch_latest_sgv)
+
+    async def _fetch_latest_sgv(self) -> NightscoutSGV:
         # 'count=1' gets the single most recent entry
-        response = await self.client.get("/api/v1/entries/sgv", params={"count": 1})
+        response = await self._request("get", "/api/v1/entries/sgv", params={"count": 1})
         data = await self._handle_response(response)
         if not data:
             raise NightscoutError("No SGV data available")
         entry = data[0] if isinstance(data, list) else data
         return NightscoutSGV.model_validate(entry)
 
-    async def get_recent_treatments(self, hours: int = 24, limit: int = 200) -> list[Treatment]:
-        try:
-             # Prepare Params - Fallback to basic count to ensure compatibility
-            params = {
-                "count": limit, 
-            }
-            
-            # Use a slightly longer timeout for fetching large lists, but capped
-            # We use an internal loop for retries since httpx transport retries are basic
-            import asyncio
-            retries = 2
-            last_err = None
+    @staticmethod
+    def _parse_created_at(item: dict) -> Optional[datetime]:
+        # 'created_at' usually contains ISO string: "2023-10-27T10:00:00.000Z"
+        created_at_val = item.get("created_at")
+        if not created_at_val:
+            # Fallback to 'timestamp' if available
+            created_at_val = item.get("timestamp")
+        if not created_at_val:
+            return None
 
-            for attempt in range(retries + 1):
+        try:
+            # Handle numeric timestamp (ms or s)
+            if isinstance(created_at_val, (int, float)):
+                ts_val = float(created_at_val)
+                # Simple heuristic: if > 1e11 implying ms
+                if ts_val > 100000000000:
+                    ts_val /= 1000.0
+                dt = datetime.fromtimestamp(ts_val, timezone.utc)
+            else:
+                clean_ts = str(created_at_val).strip().replace("Z", "+00:00")
                 try:
-                    req_id = uuid.uuid4().hex[:8]
-                    # Explicit timeout per attempt (8s)
-                    response = await self.client.get("/api/v1/treatments", params=params, timeout=8.0)
-                    
-                    # Manual Handling
-                    if response.status_code in (401, 403):
-                        raise NightscoutError(f"Unauthorized: {response.status_code}")
-                    
-                    response.raise_for_status()
-                    
-                    # Relaxed Empty Body Check Logic
-                    raw_bytes = response.content
-                    n_bytes = len(raw_bytes)
-                    
-                    if n_bytes == 0:
-                        # Empty body often means no results in some NS versions or empty results
-                        logger.debug("Empty body from Nightscout treatments, returning []")
-                        return []
-                    
+                    dt = datetime.fromisoformat(clean_ts)
+                except ValueError:
+                    # Fallback formats
                     try:
-                        data = json.loads(raw_bytes)
+                        dt = datetime.strptime(clean_ts, "%Y-%m-%dT%H:%M:%S")
                     except ValueError:
-                         logger.error(f"Invalid JSON in treatments.")
-                         raise NightscoutError("Invalid JSON received")
-
-                    break # Success
-                except httpx.TimeoutException:
-                     last_err = NightscoutError("Timeout connecting to Nightscout")
-                except httpx.HTTPStatusError as e:
-                     logger.warning(f"NS Error {e.response.status_code} fetching treatments.")
-                     if e.response.status_code in (401, 403):
-                         raise NightscoutError("Unauthorized")
-                     last_err = e
-                except Exception as e:
-                    last_err = e
-                
-                # If we are here, we failed an attempt
-                if attempt < retries:
-                     wait_ms = 250 if attempt == 0 else 750
-                     await asyncio.sleep(wait_ms / 1000.0)
-
-            # Check if we have data or exhausted retries
-            # If 'data' is not bound (loop finished without break), raise last error
-            if 'data' not in locals():
-                 raise last_err or NightscoutError("Unknown fetch failure")
-
-            if not isinstance(data, list):
-                logger.warning(f"Expected list for treatments, got {type(data)}")
-                return []
+                        dt = datetime.strptime(clean_ts, "%Y-%m-%dT%H:%M:%S.%f")
+        except Exception as e:
+            logger.debug(f"Failed to parse created_at: {created_at_val} ({e})")
+            return None
 
-            # Client-side validation & Filtering
-            valid_treatments = []
-            
-            # Use timezone-aware UTC for comparison
-            from datetime import timezone
-            now_utc = datetime.now(timezone.utc)
-            cutoff = now_utc - timedelta(hours=hours)
-            
-            for item in data:
+        # Normalize to aware UTC
+        if dt.tzinfo is None:
+            return dt.replace(tzinfo=timezone.utc)
+        return dt.astimezone(timezone.utc)
+
+    @staticmethod
+    def _iter_json_array(raw_bytes: bytes) -> Iterator[Any]:
+        """Decode a JSON array one element at a time.
+
+        Elements are handed to the caller as soon as they are parsed, so
+        out-of-window treatments are dropped without first materialising the
+        whole page as Python objects. A non-array document yields nothing.
+        """
+        text = raw_bytes.decode("utf-8")
+        decoder = json.JSONDecoder()
+        ws = " \t\n\r"
+        pos = len(text) - len(text.lstrip(ws))
+        if not text.startswith("[", pos):
+            document = json.loads(text)  # raises ValueError for non-JSON bodies
+            logger.warning(f"Expected list for treatments, got {type(document)}")
+            return
+        pos += 1
+        while True:
+            while pos < len(text) and text[pos] in ws:
+                pos += 1
+            if text.startswith("]", pos):
+                return
+            item, pos = decoder.raw_decode(text, pos)
+            yield item
+            while pos < len(text) and text[pos] in ws:
+                pos += 1
+            if text.startswith(",", pos):
+                pos += 1
+            elif not text.startswith("]", pos):
+                raise ValueError(f"Malformed JSON array at offset {pos}")
+
+    async def _fetch_treatments_page(self, params: dict[str, Any]) -> bytes:
+        # We use an internal loop for retries since httpx transport retries are basic
+        retries = 2
+        last_err: Optional[Exception] = None
+
+        for attempt in range(retries + 1):
+            try:
+                # Explicit timeout per attempt (8s)
+                response = await self._request("get", "/api/v1/treatments", params=params, timeout=8.0)
+
+                # Manual Handling
+                if response.status_code in (401, 403):
+                    raise NightscoutError(f"Unauthorized: {response.status_code}")
+
+                response.raise_for_status()
+                # Empty body often means no results in some NS versions
+                return response.content or b""
+            except NightscoutError:
+                raise
+            except httpx.TimeoutException:
+                last_err = NightscoutError("Timeout connecting to Nightscout")
+            except httpx.HTTPStatusError as e:
+                logger.warning(f"NS Error {e.response.status_code} fetching treatments.")
+                if e.response.status_code in (401, 403):
+                    raise NightscoutError("Unauthorized")
+                last_err = e
+            except Exception as e:
+                last_err = e
+
+            # If we are here, we failed an attempt
+            if attempt < retries:
+                wait_ms = 250 if attempt == 0 else 750
+                await asyncio.sleep(wait_ms / 1000.0)
+
+        raise last_err or NightscoutError("Unknown fetch failure")
+
+    async def get_recent_treatments(
+        self,
+        hours: int = 24,
+        limit: int = 200,
+        page_size: int = TREATMENTS_PAGE_SIZE,
+    ) -> list[Treatment]:
+        return await self._shared(
+            "treatments",
+            (hours, limit, page_size),
+            lambda: self._fetch_recent_treatments(hours, limit, page_size),
+        )
+
+    async def _fetch_recent_treatments(
+        self,
+        hours: int,
+        limit: int,
+        page_size: int,
+    ) -> list[Treatment]:
+        """Treatments created in the last ``hours``, newest first, at most ``limit``.
+
+        The window is pushed to Nightscout as ``find[created_at]`` filters and
+        read in pages of ``page_size``, walking backwards from the newest
+        treatment until the window is exhausted or ``limit`` is reached. The
+        client-side window check stays as a guard for servers that ignore the
+        filters.
+        """
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
+            valid_treatments: list[Treatment] = []
+            seen: set[Any] = set()
+            upper: Optional[datetime] = None
+            fetched = 0
+
+            while len(valid_treatments) < limit:
+                want = max(1, min(page_size, limit - len(valid_treatments)))
+                params: dict[str, Any] = {
+                    "find[created_at][$gte]": _ns_timestamp(cutoff),
+                    "count": want,
+                }
+                if upper is not None:
+                    params["find[created_at][$lte]"] = _ns_timestamp(upper)
+
+                raw_bytes = await self._fetch_treatments_page(params)
+                if not raw_bytes.strip():
+                    logger.debug("Empty body from Nightscout treatments page")
+                    break
+
+                page_count = 0
+                added = 0
+                oldest: Optional[datetime] = None
+                left_window = False
                 try:
-                    # 'created_at' usually contains ISO string: "2023-10-27T10:00:00.000Z"
-                    created_at_val = item.get("created_at")
-                    if not created_at_val:
-                        # Fallback to 'timestamp' if available
-                        created_at_val = item.get("timestamp")
-                    
-                    if not created_at_val:
-                        continue
-
-                    dt = None
-                    try:
-                        # Handle numeric timestamp (ms or s)
-                        if isinstance(created_at_val, (int, float)):
-                            ts_val = float(created_at_val)
-                            # Simple heuristic: if > 1e11 implying ms
-                            if ts_val > 100000000000: 
-                                ts_val /= 1000.0
-                            dt = datetime.fromtimestamp(ts_val, timezone.utc)
-                        else:
-                            # Handle String
-                            s_val = str(created_at_val).strip()
-                            # Replace Z -> +00:00
-                            clean_ts = s_val.replace("Z", "+00:00")
-                            try:
-                                dt = datetime.fromisoformat(clean_ts)
-                            except ValueError:
-                                # Fallback formats
-                                try:
-                                    dt = datetime.strptime(clean_ts, "%Y-%m-%dT%H:%M:%S")
-                                except ValueError:
-                                     # Try with milliseconds
-                                    dt = datetime.strptime(clean_ts, "%Y-%m-%dT%H:%M:%S.%f")
-
-                    except Exception as e:
-                         # Log parsing error but skip item
-                         logger.debug(f"Failed to parse created_at: {created_at_val} ({e})")
-                         continue
-
-                    if not dt:
-                        continue
-
-                    # Normalize to aware UTC
-                    if dt.tzinfo is None:
-                        dt = dt.replace(tzinfo=timezone.utc)
-                    else:
-                        dt = dt.astimezone(timezone.utc)
-                    
-                    # Only include if within requested window (hours)
-                    if dt >= cutoff:
-                        valid_treatments.append(Treatment.model_validate(item))
-                except Exception as e:
-                    # Skip malformed items
-                    logger.error(f"Skipping treatment due to error: {e}. Item: {item}")
-                    continue
-                    
-            logger.info(f"Fetched {len(data)} treatments, {len(valid_treatments)} valid after filtering ({hours}h).")
-            return valid_treatments
-            
+                    for item in self._iter_json_array(raw_bytes):
+                        page_count += 1
+                        if not isinstance(item, dict):
+                            continue
+                        dt = self._parse_created_at(item)
+                        if dt is None:
+                            continue
+                        if oldest is None or dt < oldest:
+                            oldest = dt
+                        # Only include if within requested window (hours)
+                        if dt < cutoff:
+                            left_window = True
+                            continue
+                        key = item.get("_id") or (
+                            dt,
+                            item.get("eventType"),
+                            item.get("insulin"),
+                            item.get("carbs"),
+                        )
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        try:
+                            valid_treatments.append(Treatment.model_validate(item))
+                            added += 1
+                        except Exception as e:
+                            # Skip malformed items
+                            logger.error(f"Skipping treatment due to error: {e}. Item: {item}")
+                except ValueError:
+                    logger.error("Invalid JSON in treatments.")
+                    raise NightscoutError("Invalid JSON received")
+
+                fetched += page_count
+                # A short page, a page reaching past the cutoff (filter ignored)
+                # or a page with nothing new means the window is covered.
+                if page_count < want or left_window or added == 0 or oldest is None:
+                    break
+                upper = oldest
+
+            logger.info(
+                f"Fetched {fetched} treatments, {len(valid_treatments)} valid after filtering ({hours}h)."
+            )
+            return valid_treatments[:limit]
+
         except NightscoutError:
             raise
         except Exception as e:
@@ -328,6 +578,18 @@ class NightscoutClient:
         Nightscout API supports find[dateString][$gte] etc, but date formats vary.
         Using direct epoch milliseconds is safer: find[date][$gte]=...
         """
+        start_ms = int(start_dt.timestamp() * 1000)
+        end_ms = int(end_dt.timestamp() * 1000)
+        key = (
+            start_ms // SGV_RANGE_KEY_QUANTUM_MS,
+            end_ms // SGV_RANGE_KEY_QUANTUM_MS,
+            count,
+        )
+        return await self._shared(
+            "sgv_range", key, lambda: self._fetch_sgv_range(start_dt, end_dt, count)
+        )
+
+    async def _fetch_sgv_range(self, start_dt: datetime, end_dt: datetime, count: int) -> list[NightscoutSGV]:
         # Convert to epoch ms
         start_ms = int(start_dt.timestamp() * 1000)
         end_ms = int(end_dt.timestamp() * 1000)
@@ -338,7 +600,7 @@ class NightscoutClient:
             "count": count
         }
         
-        response = await self.client.get("/api/v1/entries/sgv", params=params)
+        response = await self._request("get", "/api/v1/entries/sgv", params=params)
         data = await self._handle_response(response)
         
         if not isinstance(data, list):
@@ -366,7 +628,8 @@ class NightscoutClient:
         A reading is considered identical when both its timestamp and SGV match.
         """
         timestamp = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
-        existing = await self.get_sgv_range(
+        # Uncached read: a stale range here would re-upload a fresh reading.
+        existing = await self._fetch_sgv_range(
             timestamp - timedelta(seconds=2),
             timestamp + timedelta(seconds=2),
             count=10,
@@ -382,14 +645,82 @@ class NightscoutClient:
             "direction": direction,
             "device": device,
         }
-        response = await self.client.post("/api/v1/entries", json=[payload])
+        response = await self._request("post", "/api/v1/entries", json=[payload])
         result = await self._handle_response(response)
+        _single_flight.invalidate(self._scope)
         return {
             "status": "uploaded",
             "uploaded_count": 1,
             "nightscout_response": result,
         }
 
+    async def _existing_sgv_keys(self, keys: set[tuple[int, int]]) -> set[tuple[int, int]]:
+        """``(date, sgv)`` of every entry Nightscout holds over the span of ``keys``.
+
+        Other uploaders can put many entries in the same span, so the probe is
+        paged newest first until a short page shows the span is exhausted.
+        """
+        first_ms = min(ts for ts, _ in keys) - 2000
+        upper_ms = max(ts for ts, _ in keys) + 2000
+        page_size = len(keys) * 2 + 10
+        existing: set[tuple[int, int]] = set()
+        for _ in range(SGV_PROBE_MAX_PAGES):
+            page = await self._fetch_sgv_range(
+                datetime.fromtimestamp(first_ms / 1000, tz=timezone.utc),
+                datetime.fromtimestamp(upper_ms / 1000, tz=timezone.utc),
+                count=page_size,
+            )
+            found = {(entry.date, entry.sgv) for entry in page}
+            if len(page) < page_size or found <= existing:
+                existing |= found
+                break
+            existing |= found
+            # Inclusive bound: the oldest millisecond may continue on the next page.
+            upper_ms = min(entry.date for entry in page)
+        return existing
+
+    async def upload_sgv_batch(
+        self,
+        readings: list[tuple[int, int, str]],
+        device: str = "Dexcom G7 via Bolus AI",
+    ) -> dict[str, set[tuple[int, int]]]:
+        """
+        Upload many ``(glucose_mgdl, timestamp_ms, direction)`` readings in one POST.
+
+        Uncached range reads over the batch span (paged on busy sites) replace
+        the per-reading duplicate probe of ``upload_sgv``. Returns the ``(timestamp_ms, sgv)``
+        keys that were uploaded and those Nightscout already had.
+        """
+        keys = {(timestamp_ms, glucose_mgdl) for glucose_mgdl, timestamp_ms, _ in readings}
+        if not keys:
+            return {"uploaded": set(), "duplicate": set()}
+        duplicate = keys & await self._existing_sgv_keys(keys)
+
+        payload = []
+        sent: set[tuple[int, int]] = set()
+        for glucose_mgdl, timestamp_ms, direction in readings:
+            key = (timestamp_ms, glucose_mgdl)
+            if key in duplicate or key in sent:
+                continue
+            sent.add(key)
+            payload.append(
+                {
+                    "type": "sgv",
+                    "sgv": glucose_mgdl,
+                    "date": timestamp_ms,
+                    "dateString": datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
+                    .isoformat()
+                    .replace("+00:00", "Z"),
+                    "direction": direction,
+                    "device": device,
+                }
+            )
+        if payload:
+            response = await self._request("post", "/api/v1/entries", json=payload)
+            await self._handle_response(response)
+            _single_flight.invalidate(self._scope)
+        return {"uploaded": sent, "duplicate": duplicate}
+
     async def upload_treatments(self, treatments: list[dict]) -> Any:
         # Warning: Some Nightscout versions are strict about the 'enteredBy' field.
         # Ensure it is present in all treatments.
@@ -400,7 +731,8 @@ class NightscoutClient:
         # We explicitly ensure we are posting JSON
         # The client is already configured with headers, but let's double check content-type
         
-        response = await self.client.post("/api/v1/treatments", json=treatments)
+        response = await self._request("post", "/api/v1/treatments", json=treatments)
+        _single_flight.invalidate(self._scope)
         
         # Special handling for uploads:
         # Some Nightscout versions return 200 OK via empty body on success?
@@ -420,11 +752,13 @@ class NightscoutClient:
         return response.json()
 
     async def update_treatment(self, treatment_id: str, updates: dict) -> Any:
-        response = await self.client.put(f"/api/v1/treatments/{treatment_id}", json=updates)
+        response = await self._request("put", f"/api/v1/treatments/{treatment_id}", json=updates)
+        _single_flight.invalidate(self._scope)
         return await self._handle_response(response)
 
     async def delete_treatment(self, treatment_id: str) -> None:
-        response = await self.client.delete(f"/api/v1/treatments/{treatment_id}")
+        response = await self._request("delete", f"/api/v1/treatments/{treatment_id}")
+        _single_flight.invalidate(self._scope)
         if response.status_code not in (200, 204):
              response.raise_for_status()
 
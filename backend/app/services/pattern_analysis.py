@@ -9,11 +9,18 @@ from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from app.models.analysis import BolusPostAnalysis
 from app.models.settings import UserSettings
+from app.services.cgm_series import CGMSeriesRepository
 from app.services.nightscout_client import NightscoutClient
 # from app.services.iob import compute_iob_from_sources # Not needed if we trust the loop
 
 logger = logging.getLogger(__name__)
 
+def _as_aware(dt: datetime) -> datetime:
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
 def get_meal_slot(dt: datetime, settings: Optional[UserSettings] = None) -> str:
     from app.utils.timezone import ZoneInfo, to_local
 
@@ -52,9 +59,10 @@ async def run_analysis_service(
     Rebuild post-bolus outcome analysis for the requested period.
 
     The rebuild deletes the existing rows for the period before writing the
-    fresh outcomes. Because the outcome windows depend on Nightscout SGV range
-    reads, a range-read failure must abort and roll back the transaction rather
-    than silently rewriting useful historical rows as ``missing``.
+    fresh outcomes. Outcome windows are read from the local CGM series; when
+    that needs a Nightscout range read to fill an un-backfilled period, a
+    read failure must abort and roll back the transaction rather than silently
+    rewriting useful historical rows as ``missing``.
     """
 
     # 1. Fetch treatments
@@ -139,11 +147,30 @@ async def run_analysis_service(
     windows_written = 0
     target_base = settings.targets.mid
     
+    # One local series read covers every bolus window. Nightscout is only
+    # queried (once, for the whole span) when the local table has not been
+    # backfilled for the period yet.
+    series = None
+    if boluses:
+        bolus_times = [_as_aware(b.created_at) for b in boluses]
+        series_start = min(bolus_times) + timedelta(hours=2) - timedelta(minutes=15)
+        series_end = max(bolus_times) + timedelta(hours=5) + timedelta(minutes=15)
+        try:
+            series = await CGMSeriesRepository(db, user_id).load(
+                series_start, series_end, fallback_client=ns_client
+            )
+        except Exception as e:
+            logger.warning(
+                "Analysis: SGV range fetch failed for %s..%s; aborting refresh: %s",
+                series_start.isoformat(),
+                series_end.isoformat(),
+                e,
+            )
+            await db.rollback()
+            raise RuntimeError("Nightscout SGV range fetch failed; analysis refresh aborted") from e
+
     for b in boluses:
-        b_time = b.created_at
-        if b_time.tzinfo is None:
-            b_time = b_time.replace(tzinfo=timezone.utc)
-        
+        b_time = _as_aware(b.created_at)
         meal_slot = get_meal_slot(b_time, settings)
         
         # Sick Mode Check
@@ -167,57 +194,22 @@ async def run_analysis_service(
         for w in [2, 3, 5]:
             check_time = b_time + timedelta(hours=w)
             
-            # Fetch BG
-            # +/- 15 min
-            s_win = check_time - timedelta(minutes=15)
-            e_win = check_time + timedelta(minutes=15)
-            
             result = "missing"
             bg_val = None
             bg_at_val = None
-            
-            if ns_client:
-                try:
-                    sgvs = await ns_client.get_sgv_range(s_win, e_win, count=20)
-                except Exception as e:
-                    logger.warning(
-                        "Analysis: SGV range fetch failed for bolus_at=%s window=%sh; aborting refresh: %s",
-                        b_time.isoformat(),
-                        w,
-                        e,
-                    )
-                    await db.rollback()
-                    raise RuntimeError("Nightscout SGV range fetch failed; analysis refresh aborted") from e
-            else:
-                sgvs = [] # Need DB lookup for SGV? Or assume unavailable without NS?
-                # TODO: If we store glucose in DB eventually, fetch here.
-                # For now, without NS, result is "missing" which is correct behavior.
 
-            if sgvs:
-                # Parse dates if needed, NightscoutSGV schema has date as int (epoch ms)
-                # Helper to get datetime
-                best_sgv = None
-                min_diff = float("inf")
+            point = series.value_at(check_time, tolerance=timedelta(minutes=15)) if series else None
+            if point and point.sgv:
+                bg_val = float(point.sgv)
+                bg_at_val = point.measured_at
+                delta = bg_val - target
+                if delta > 30:
+                    result = "short"
+                elif delta < -30:
+                    result = "over"
+                else:
+                    result = "ok"
 
-                for s in sgvs:
-                    s_dt = datetime.fromtimestamp(s.date / 1000, tz=timezone.utc)
-                    diff = abs((s_dt - check_time).total_seconds())
-                    if diff <= 15 * 60:
-                        if diff < min_diff:
-                            min_diff = diff
-                            best_sgv = s
-                            bg_val = float(s.sgv)
-                            bg_at_val = s_dt
-
-                if bg_val:
-                    delta = bg_val - target
-                    if delta > 30:
-                        result = "short"
-                    elif delta < -30:
-                        result = "over"
-                    else:
-                        result = "ok"
-            
             # Upsert
             stmt = pg_insert(BolusPostAnalysis).values(
                 user_id=user_id,
@@ -13,6 +13,7 @@ from __future__ import annotations
 import argparse
 import json
 import os
+import sys
 from dataclasses import dataclass
 from datetime import timedelta
 from pathlib import Path
@@ -20,8 +21,10 @@ from typing import Iterable
 
 import numpy as np
 import pandas as pd
-from catboost import CatBoostRegressor
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.services.ml_training_pool import FitTask, run_tasks, scratch_store  # noqa: E402
 
 HORIZONS_MIN = [30, 60, 120, 240, 360]
 QUANTILES = [0.1, 0.5, 0.9]
@@ -98,6 +101,12 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--db-url", default=os.getenv("DATABASE_URL"), help="Database URL")
     parser.add_argument("--output-dir", default="backend/ml_training_output", help="Output directory")
     parser.add_argument("--user-id", default=None, help="Optional user_id filter")
+    parser.add_argument(
+        "--parquet-dir",
+        default=os.getenv("ML_PARQUET_DIR"),
+        help="Read the Parquet mirror instead of the database (requires --user-id)",
+    )
+    parser.add_argument("--since-days", type=int, default=None, help="Only load the last N days")
     parser.add_argument("--train-window-days", type=int, default=14)
     parser.add_argument("--test-window-days", type=int, default=2)
     parser.add_argument("--step-days", type=int, default=2)
@@ -106,67 +115,95 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--rmse-improvement", type=float, default=0.05, help="Required RMSE improvement")
     parser.add_argument("--bias-threshold", type=float, default=5.0, help="Abs bias threshold")
     parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=None, help="Training processes (default: one per core)")
+    parser.add_argument("--memory-mb", type=int, default=None, help="Memory budget shared by the workers")
     return parser.parse_args()
 
 
-def load_data(db_url: str, user_id: str | None, include_flagged: bool) -> pd.DataFrame:
-    if not db_url:
-        raise ValueError("DATABASE_URL is required for offline training.")
-
-    engine = create_engine(db_url)
-    query = """
-        SELECT
-            feature_time,
-            user_id,
-            bg_mgdl,
-            trend,
-            bg_age_min,
-            iob_u,
-            cob_g,
-            iob_status,
-            cob_status,
-            basal_active_u,
-            basal_latest_u,
-            basal_latest_age_min,
-            basal_total_24h,
-            basal_total_48h,
-            bolus_total_3h,
-            bolus_total_6h,
-            carbs_total_3h,
-            carbs_total_6h,
-            exercise_minutes_6h,
-            exercise_minutes_24h,
-            baseline_bg_30m,
-            baseline_bg_60m,
-            baseline_bg_120m,
-            baseline_bg_240m,
-            baseline_bg_360m,
-            source_ns_enabled,
-            source_ns_treatments_count,
-            source_db_treatments_count,
-            source_overlap_count,
-            source_conflict_count,
-            source_consistency_status,
-            flag_bg_missing,
-            flag_bg_stale,
-            flag_iob_unavailable,
-            flag_cob_unavailable,
-            flag_source_conflict
-        FROM ml_training_data_v2
-    """
-    params: dict[str, str] = {}
-    if user_id:
-        query += " WHERE user_id = :user_id"
-        params["user_id"] = user_id
-    df = pd.read_sql_query(query, engine, params=params)
+LOAD_COLUMNS = [
+    "feature_time",
+    "user_id",
+    "bg_mgdl",
+    "trend",
+    "bg_age_min",
+    "iob_u",
+    "cob_g",
+    "iob_status",
+    "cob_status",
+    "basal_active_u",
+    "basal_latest_u",
+    "basal_latest_age_min",
+    "basal_total_24h",
+    "basal_total_48h",
+    "bolus_total_3h",
+    "bolus_total_6h",
+    "carbs_total_3h",
+    "carbs_total_6h",
+    "exercise_minutes_6h",
+    "exercise_minutes_24h",
+    "baseline_bg_30m",
+    "baseline_bg_60m",
+    "baseline_bg_120m",
+    "baseline_bg_240m",
+    "baseline_bg_360m",
+    "source_ns_enabled",
+    "source_ns_treatments_count",
+    "source_db_treatments_count",
+    "source_overlap_count",
+    "source_conflict_count",
+    "source_consistency_status",
+    "flag_bg_missing",
+    "flag_bg_stale",
+    "flag_iob_unavailable",
+    "flag_cob_unavailable",
+    "flag_source_conflict",
+]
+
+
+def load_parquet(parquet_dir: str, user_id: str, since: pd.Timestamp | None) -> pd.DataFrame:
+    """Memory-mapped read of the columnar mirror written by the ML export job."""
+    from app.services.ml_parquet_store import MLParquetStore
+
+    return MLParquetStore(parquet_dir).read(user_id, columns=LOAD_COLUMNS, start=since)
+
+
+def load_data(
+    db_url: str,
+    user_id: str | None,
+    include_flagged: bool,
+    parquet_dir: str | None = None,
+    since_days: int | None = None,
+) -> pd.DataFrame:
+    since = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=since_days) if since_days else None
+    if parquet_dir:
+        if not user_id:
+            raise ValueError("--user-id is required with --parquet-dir.")
+        df = load_parquet(parquet_dir, user_id, since)
+    else:
+        if not db_url:
+            raise ValueError("DATABASE_URL is required for offline training.")
+
+        engine = create_engine(db_url)
+        query = f"SELECT {', '.join(LOAD_COLUMNS)} FROM ml_training_data_v2"
+        clauses = []
+        params: dict[str, object] = {}
+        if user_id:
+            clauses.append("user_id = :user_id")
+            params["user_id"] = user_id
+        if since is not None:
+            clauses.append("feature_time >= :since")
+            params["since"] = since.tz_convert(None).to_pydatetime()
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        df = pd.read_sql_query(text(query), engine, params=params)
     df["feature_time"] = pd.to_datetime(df["feature_time"], utc=True)
     if not include_flagged:
         df = df[
-            (~df["flag_bg_missing"].fillna(False))
-            & (~df["flag_bg_stale"].fillna(False))
-            & (~df["flag_iob_unavailable"].fillna(False))
-            & (~df["flag_cob_unavailable"].fillna(False))
-            & (~df["flag_source_conflict"].fillna(False))
+            (~df["flag_bg_missing"].fillna(False).astype(bool))
+            & (~df["flag_bg_stale"].fillna(False).astype(bool))
+            & (~df["flag_iob_unavailable"].fillna(False).astype(bool))
+            & (~df["flag_cob_unavailable"].fillna(False).astype(bool))
+            & (~df["flag_source_conflict"].fillna(False).astype(bool))
         ]
     return df.sort_values("feature_time").reset_index(drop=True)
 
@@ -247,62 +284,32 @@ def prepare_features(df: pd.DataFrame, horizon_min: int) -> tuple[pd.DataFrame,
     return features[feature_cols], cat_indices
 
 
-def fill_missing(train_df: pd.DataFrame, test_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
-    train_df = train_df.copy()
-    test_df = test_df.copy()
-    numeric_cols = [col for col in train_df.columns if col not in CATEGORICAL_FEATURES]
-    medians = train_df[numeric_cols].median()
-    train_df[numeric_cols] = train_df[numeric_cols].fillna(medians)
-    test_df[numeric_cols] = test_df[numeric_cols].fillna(medians)
-    for col in CATEGORICAL_FEATURES:
-        if col in train_df.columns:
-            train_df[col] = train_df[col].fillna("unknown")
-            test_df[col] = test_df[col].fillna("unknown")
-    return train_df, test_df
-
-
-def train_quantile_model(
-    X_train: pd.DataFrame,
-    y_train: pd.Series,
-    cat_indices: list[int],
-    quantile: float,
-    random_seed: int,
-) -> CatBoostRegressor:
-    model = CatBoostRegressor(
-        loss_function=f"Quantile:alpha={quantile}",
-        depth=6,
-        learning_rate=0.1,
-        iterations=600,
-        random_seed=random_seed,
-        verbose=False,
-    )
-    model.fit(X_train, y_train, cat_features=cat_indices)
-    return model
+def quantile_params(quantile: float, random_seed: int) -> dict:
+    return {
+        "loss_function": f"Quantile:alpha={quantile}",
+        "depth": 6,
+        "learning_rate": 0.1,
+        "iterations": 600,
+        "random_seed": random_seed,
+        "verbose": False,
+    }
+
 
+def time_range(times: pd.Series, start: pd.Timestamp, end: pd.Timestamp) -> tuple[int, int]:
+    """Row range [a, b) with start <= feature_time < end; times must be sorted."""
+    index = pd.DatetimeIndex(times)
+    return int(index.searchsorted(start)), int(index.searchsorted(end))
 
-def evaluate_split(
+
+def split_metrics(
     df: pd.DataFrame,
     horizon_min: int,
     train_end: pd.Timestamp,
     test_end: pd.Timestamp,
-    train_window_start: pd.Timestamp,
-    random_seed: int,
+    test_rows: tuple[int, int],
+    residual_pred: np.ndarray,
 ) -> SplitMetrics:
-    train_mask = (df["feature_time"] >= train_window_start) & (df["feature_time"] < train_end)
-    test_mask = (df["feature_time"] >= train_end) & (df["feature_time"] < test_end)
-
-    train_df = df.loc[train_mask]
-    test_df = df.loc[test_mask]
-    X_train, cat_indices = prepare_features(train_df, horizon_min)
-    X_test, _ = prepare_features(test_df, horizon_min)
-    X_train, X_test = fill_missing(X_train, X_test)
-
-    y_train = train_df["target_residual"]
-
-    model = train_quantile_model(X_train, y_train, cat_indices, 0.5, random_seed)
-    residual_pred = model.predict(X_test)
-
-    baseline_errors = test_df["baseline_error"].to_numpy()
+    baseline_errors = df["baseline_error"].to_numpy()[test_rows[0]:test_rows[1]]
     model_errors = baseline_errors - residual_pred
 
     baseline_stats = stats_from_errors(baseline_errors)
@@ -359,7 +366,9 @@ def compute_ml_ready(
 
 def main() -> None:
     args = parse_args()
-    df_raw = load_data(args.db_url, args.user_id, args.include_flagged)
+    df_raw = load_data(
+        args.db_url, args.user_id, args.include_flagged, args.parquet_dir, args.since_days
+    )
     if df_raw.empty:
         raise RuntimeError("No training data found in ml_training_data_v2.")
 
@@ -389,17 +398,66 @@ def main() -> None:
     test_window = timedelta(days=args.test_window_days)
     step = timedelta(days=args.step_days)
 
-    for horizon in HORIZONS_MIN:
-        df_h = build_horizon_dataset(df_raw, horizon)
-        if df_h.empty:
-            continue
-
-        splits = []
-        for train_start, train_end, test_end in rolling_splits(
-            df_h["feature_time"], train_window, test_window, step
-        ):
-            split_metric = evaluate_split(df_h, horizon, train_end, test_end, train_start, args.random_seed)
-            splits.append(split_metric)
+    with scratch_store() as store:
+        # Every backtest split and every final model is an independent task
+        # over a per-horizon feature matrix shared with the workers.
+        datasets: dict[int, pd.DataFrame] = {}
+        tasks: list[FitTask] = []
+        split_plans: dict[int, list[tuple[pd.Timestamp, pd.Timestamp, tuple[int, int]]]] = {}
+        for horizon in HORIZONS_MIN:
+            df_h = build_horizon_dataset(df_raw, horizon)
+            if df_h.empty:
+                continue
+            df_h = df_h.sort_values("feature_time", kind="stable").reset_index(drop=True)
+            datasets[horizon] = df_h
+
+            features, _ = prepare_features(df_h, horizon)
+            store.put_frame(f"h{horizon}", features, cat_columns=CATEGORICAL_FEATURES)
+            store.put_array(f"target_h{horizon}", df_h["target_residual"].to_numpy(dtype=float))
+
+            split_plans[horizon] = []
+            for train_start, train_end, test_end in rolling_splits(
+                df_h["feature_time"], train_window, test_window, step
+            ):
+                train_rows = time_range(df_h["feature_time"], train_start, train_end)
+                test_rows = time_range(df_h["feature_time"], train_end, test_end)
+                tasks.append(
+                    FitTask(
+                        key=(horizon, "split", len(split_plans[horizon])),
+                        frame=f"h{horizon}",
+                        target=f"target_h{horizon}",
+                        params=quantile_params(0.5, args.random_seed),
+                        rows=train_rows,
+                        predict_rows=test_rows,
+                        impute=True,
+                    )
+                )
+                split_plans[horizon].append((train_end, test_end, test_rows))
+
+            # Train final models on full dataset
+            for quantile in QUANTILES:
+                tasks.append(
+                    FitTask(
+                        key=(horizon, "final", quantile),
+                        frame=f"h{horizon}",
+                        target=f"target_h{horizon}",
+                        params=quantile_params(quantile, args.random_seed),
+                        rows=(0, len(df_h)),
+                        impute=True,
+                        save_path=str(output_dir / f"catboost_residual_{horizon}m_p{int(quantile*100)}.cbm"),
+                    )
+                )
+
+        predictions = {
+            result.key: result.predictions
+            for result in run_tasks(store, tasks, args.workers, args.memory_mb)
+        }
+
+    for horizon, df_h in datasets.items():
+        splits = [
+            split_metrics(df_h, horizon, train_end, test_end, test_rows, predictions[(horizon, "split", i)])
+            for i, (train_end, test_end, test_rows) in enumerate(split_plans[horizon])
+        ]
         split_results.extend(splits)
 
         baseline_metrics, model_metrics = summarize_splits(splits)
@@ -419,16 +477,6 @@ def main() -> None:
             )
         )
 
-        # Train final models on full dataset
-        X_full, cat_indices = prepare_features(df_h, horizon)
-        X_full, _ = fill_missing(X_full, X_full)
-        y_full = df_h["target_residual"]
-
-        for quantile in QUANTILES:
-            model = train_quantile_model(X_full, y_full, cat_indices, quantile, args.random_seed)
-            model_path = output_dir / f"catboost_residual_{horizon}m_p{int(quantile*100)}.cbm"
-            model.save_model(model_path)
-
         report["horizons"][str(horizon)] = {
             "baseline": baseline_metrics.__dict__,
             "model": model_metrics.__dict__,
@@ -43,3 +43,24 @@ def _init_test_db():
         loop.run_until_complete(init_auth_db())
     finally:
         loop.close()
+
+
+@pytest.fixture(autouse=True)
+def _reset_nightscout_response_cache():
+    from app.services.circuit_breaker import reset_breakers  # noqa: WPS433
+    from app.services.dexcom_client import clear_sessions  # noqa: WPS433
+    from app.services.dosing_context import clear_dosing_contexts  # noqa: WPS433
+    from app.services.glucose_agp_service import clear_agp_cache  # noqa: WPS433
+    from app.services.nightscout_client import clear_response_cache  # noqa: WPS433
+
+    clear_response_cache()
+    reset_breakers()
+    clear_sessions()
+    clear_agp_cache()
+    clear_dosing_contexts()
+    yield
+    clear_response_cache()
+    reset_breakers()
+    clear_sessions()
+    clear_agp_cache()
+    clear_dosing_contexts()
@@ -0,0 +1,463 @@
+"""In-process stand-in for a Nightscout site.
+
+Serves ``status``, ``entries``, ``treatments`` and ``devicestatus`` from
+seeded synthetic data, with optional latency, error and timeout injection.
+
+In tests, point a ``NightscoutClient`` at it without any network::
+
+    fake = FakeNightscout(seed=7, days=2)
+    client = fake.client()
+
+For load tests of the whole app, run it as a local server and point
+``NIGHTSCOUT__BASE_URL`` (or the user's stored URL) at it::
+
+    python -m tests.fake_nightscout --port 1337 --days 14 --latency-ms 120 --error-rate 0.02
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.services.nightscout_client import NightscoutClient
+
+
+FAKE_BASE_URL = "http://fake-nightscout.local"
+CGM_INTERVAL = timedelta(minutes=5)
+DEVICESTATUS_INTERVAL = timedelta(minutes=5)
+DEFAULT_COUNT = 10
+
+_DIRECTIONS = (
+    (-3.0, "DoubleDown"),
+    (-2.0, "SingleDown"),
+    (-1.0, "FortyFiveDown"),
+    (1.0, "Flat"),
+    (2.0, "FortyFiveUp"),
+    (3.0, "SingleUp"),
+)
+
+
+def _direction(rate_per_minute: float) -> str:
+    for upper, name in _DIRECTIONS:
+        if rate_per_minute < upper:
+            return name
+    return "DoubleUp"
+
+
+def _ms(dt: datetime) -> int:
+    return int(dt.timestamp() * 1000)
+
+
+def _iso(dt: datetime) -> str:
+    dt = dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
+def generate_treatments(
+    start: datetime, end: datetime, *, seed: int = 0, meals_per_day: int = 3
+) -> list[dict[str, Any]]:
+    """Meal boluses around breakfast, lunch and dinner plus a daily basal dose."""
+    rng = random.Random(seed)
+    meal_hours = (8.0, 14.0, 21.0)[:meals_per_day]
+    treatments: list[dict[str, Any]] = []
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        for hour in meal_hours:
+            at = day + timedelta(hours=hour + rng.uniform(-0.75, 0.75))
+            if not start <= at < end:
+                continue
+            carbs = float(rng.choice((20, 30, 45, 60, 75)))
+            treatments.append(
+                {
+                    "_id": uuid.UUID(int=rng.getrandbits(128)).hex,
+                    "eventType": "Meal Bolus",
+                    "created_at": _iso(at),
+                    "carbs": carbs,
+                    "insulin": round(carbs / 10.0, 1),
+                    "enteredBy": "fake-nightscout",
+                }
+            )
+        basal_at = day + timedelta(hours=22)
+        if start <= basal_at < end:
+            treatments.append(
+                {
+                    "_id": uuid.UUID(int=rng.getrandbits(128)).hex,
+                    "eventType": "Basal",
+                    "created_at": _iso(basal_at),
+                    "insulin": 14.0,
+                    "enteredBy": "fake-nightscout",
+                    "notes": "basal",
+                }
+            )
+        day += timedelta(days=1)
+    treatments.sort(key=lambda item: item["created_at"], reverse=True)
+    return treatments
+
+
+def generate_cgm(
+    start: datetime,
+    end: datetime,
+    *,
+    seed: int = 0,
+    treatments: Optional[list[dict[str, Any]]] = None,
+) -> list[dict[str, Any]]:
+    """Five-minute SGV entries: a daily rhythm, a mean-reverting random walk and meal peaks.
+
+    ``treatments`` with carbs add a rise peaking about an hour after the meal,
+    so the trace looks like a real sensor next to its treatments.
+    """
+    rng = random.Random(seed)
+    meals = [
+        (datetime.fromisoformat(item["created_at"].replace("Z", "+00:00")), item["carbs"])
+        for item in treatments or ()
+        if item.get("carbs")
+    ]
+    entries: list[dict[str, Any]] = []
+    drift = 0.0
+    previous: Optional[float] = None
+    at = start
+    while at < end:
+        hour = at.hour + at.minute / 60.0
+        value = 120.0 + 18.0 * math.sin((hour - 4.0) / 24.0 * 2 * math.pi)
+        drift = 0.92 * drift + rng.gauss(0.0, 4.0)
+        value += drift
+        for meal_at, carbs in meals:
+            minutes = (at - meal_at).total_seconds() / 60.0
+            if 0 <= minutes <= 240:
+                value += carbs * 1.6 * (minutes / 60.0) * math.exp(1 - minutes / 60.0)
+        value = max(40.0, min(400.0, value))
+        rate = 0.0 if previous is None else (value - previous) / 5.0
+        entries.append(
+            {
+                "_id": uuid.UUID(int=rng.getrandbits(128)).hex,
+                "type": "sgv",
+                "sgv": int(round(value)),
+                "date": _ms(at),
+                "dateString": _iso(at),
+                "direction": _direction(rate),
+                "delta": None if previous is None else round(value - previous, 1),
+                "device": "fake-nightscout",
+            }
+        )
+        previous = value
+        at += CGM_INTERVAL
+    entries.reverse()
+    return entries
+
+
+def generate_devicestatus(start: datetime, end: datetime, *, seed: int = 0) -> list[dict[str, Any]]:
+    rng = random.Random(seed)
+    statuses: list[dict[str, Any]] = []
+    battery = 100
+    at = start
+    while at < end:
+        battery = 100 if battery <= 15 else battery - rng.choice((0, 0, 1))
+        statuses.append(
+            {
+                "_id": uuid.UUID(int=rng.getrandbits(128)).hex,
+                "device": "fake-uploader",
+                "created_at": _iso(at),
+                "uploaderBattery": battery,
+                "uploader": {"battery": battery},
+            }
+        )
+        at += DEVICESTATUS_INTERVAL
+    statuses.reverse()
+    return statuses
+
+
+@dataclass(slots=True)
+class FaultConfig:
+    """Per-request fault injection for everything under ``/api``.
+
+    A "timeout" holds the request for ``timeout_seconds`` before answering,
+    long enough for a client deadline to fire first.
+    """
+
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    timeout_rate: float = 0.0
+    timeout_seconds: float = 30.0
+    seed: int = 0
+
+
+class _DeadlineASGITransport(httpx.ASGITransport):
+    """ASGI transport that honours the request's read timeout like a socket would."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        deadline = (request.extensions.get("timeout") or {}).get("read")
+        if deadline is None:
+            return await super().handle_async_request(request)
+        try:
+            return await asyncio.wait_for(super().handle_async_request(request), deadline)
+        except asyncio.TimeoutError as exc:
+            raise httpx.ReadTimeout("Timed out waiting for fake Nightscout", request=request) from exc
+
+
+def _range_filter(params: Any, field_name: str) -> list[tuple[str, str]]:
+    return [
+        (op, params[f"find[{field_name}][{op}]"])
+        for op in ("$gte", "$gt", "$lte", "$lt")
+        if f"find[{field_name}][{op}]" in params
+    ]
+
+
+def _matches(value: Any, filters: list[tuple[str, Any]]) -> bool:
+    for op, bound in filters:
+        if op == "$gte" and not value >= bound:
+            return False
+        if op == "$gt" and not value > bound:
+            return False
+        if op == "$lte" and not value <= bound:
+            return False
+        if op == "$lt" and not value < bound:
+            return False
+    return True
+
+
+def _count(params: Any) -> int:
+    try:
+        return max(0, int(params.get("count", DEFAULT_COUNT)))
+    except ValueError:
+        return DEFAULT_COUNT
+
+
+@dataclass
+class FakeNightscout:
+    """Seeded fake Nightscout site; see the module docstring for usage."""
+
+    seed: int = 0
+    days: float = 1.0
+    api_secret: Optional[str] = None
+    now: Optional[datetime] = None
+    faults: FaultConfig = field(default_factory=FaultConfig)
+    base_url: str = FAKE_BASE_URL
+    requests: Counter = field(default_factory=Counter)
+
+    def __post_init__(self) -> None:
+        end = (self.now or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+        start = end - timedelta(days=self.days)
+        self.treatments = generate_treatments(start, end, seed=self.seed)
+        self.entries = generate_cgm(start, end, seed=self.seed, treatments=self.treatments)
+        self.devicestatus = generate_devicestatus(start, end, seed=self.seed)
+        self._fault_rng = random.Random(self.faults.seed)
+        self.app = self._build_app()
+
+    # --- wiring ---------------------------------------------------------
+
+    def transport(self) -> httpx.AsyncBaseTransport:
+        return _DeadlineASGITransport(app=self.app)
+
+    def client(self, token: Optional[str] = None, **kwargs: Any) -> NightscoutClient:
+        """``NightscoutClient`` whose HTTP goes straight to this app, no sockets."""
+        http = httpx.AsyncClient(base_url=self.base_url, transport=self.transport())
+        client = NightscoutClient(self.base_url, token or self.api_secret, client=http, **kwargs)
+        http.headers.update(client._auth_headers())
+        http.headers["Accept"] = "application/json"
+        return client
+
+    def serve(self, host: str = "127.0.0.1", port: int = 1337) -> None:
+        import uvicorn
+
+        uvicorn.run(self.app, host=host, port=port, log_level="warning")
+
+    # --- data helpers -----------------------------------------------------
+
+    def add_entry(self, sgv: int, at: Optional[datetime] = None, direction: str = "Flat") -> dict[str, Any]:
+        at = at or datetime.now(timezone.utc)
+        entry = {
+            "_id": uuid.uuid4().hex,
+            "type": "sgv",
+            "sgv": sgv,
+            "date": _ms(at),
+            "dateString": _iso(at),
+            "direction": direction,
+        }
+        self._insert_entries([entry])
+        return entry
+
+    def _insert_entries(self, items: list[dict[str, Any]]) -> None:
+        self.entries.extend(items)
+        self.entries.sort(key=lambda item: item["date"], reverse=True)
+
+    def _authorized(self, request: Request) -> bool:
+        if not self.api_secret:
+            return True
+        expected = hashlib.sha1(self.api_secret.encode("utf-8")).hexdigest()
+        if request.headers.get("api-secret") in (expected, self.api_secret):
+            return True
+        return request.query_params.get("token") == self.api_secret
+
+    async def _inject_faults(self, request: Request) -> Optional[JSONResponse]:
+        faults = self.faults
+        delay = faults.latency_ms + (self._fault_rng.uniform(0, faults.jitter_ms) if faults.jitter_ms else 0)
+        if delay:
+            await asyncio.sleep(delay / 1000.0)
+        roll = self._fault_rng.random()
+        if roll < faults.timeout_rate:
+            await asyncio.sleep(faults.timeout_seconds)
+            return JSONResponse({"status": 504, "message": "injected timeout"}, status_code=504)
+        if roll < faults.timeout_rate + faults.error_rate:
+            return JSONResponse(
+                {"status": faults.error_status, "message": "injected error"},
+                status_code=faults.error_status,
+            )
+        return None
+
+    # --- app ------------------------------------------------------------
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Fake Nightscout")
+
+        @app.middleware("http")
+        async def _faults_and_auth(request: Request, call_next):
+            path = request.url.path
+            self.requests[f"{request.method} {path}"] += 1
+            if path.startswith("/api") or path == "/status.json":
+                injected = await self._inject_faults(request)
+                if injected is not None:
+                    return injected
+                if not self._authorized(request):
+                    return JSONResponse({"status": 401, "message": "Unauthorized"}, status_code=401)
+            return await call_next(request)
+
+        def status_payload() -> dict[str, Any]:
+            return {
+                "status": "ok",
+                "name": "fake-nightscout",
+                "version": "15.0.2",
+                "serverTime": _iso(datetime.now(timezone.utc)),
+                "apiEnabled": True,
+                "settings": {"units": "mg/dl"},
+            }
+
+        for path in ("/api/v1/status", "/api/v1/status.json", "/status.json"):
+            app.add_api_route(path, status_payload, methods=["GET"])
+
+        def list_entries(request: Request) -> list[dict[str, Any]]:
+            params = request.query_params
+            filters = [(op, int(value)) for op, value in _range_filter(params, "date")]
+            limit = _count(params)
+            result = []
+            for entry in self.entries:
+                if len(result) >= limit:
+                    break
+                if _matches(entry["date"], filters):
+                    result.append(entry)
+            return result
+
+        for path in ("/api/v1/entries", "/api/v1/entries.json", "/api/v1/entries/sgv", "/api/v1/entries/sgv.json"):
+            app.add_api_route(path, list_entries, methods=["GET"])
+
+        @app.post("/api/v1/entries")
+        async def create_entries(request: Request) -> list[dict[str, Any]]:
+            body = await request.json()
+            items = body if isinstance(body, list) else [body]
+            existing = {(entry["date"], entry.get("sgv")) for entry in self.entries}
+            created = []
+            for item in items:
+                key = (item.get("date"), item.get("sgv"))
+                if key in existing:
+                    continue
+                existing.add(key)
+                created.append({"_id": uuid.uuid4().hex, **item})
+            self._insert_entries(created)
+            return created
+
+        @app.get("/api/v1/treatments")
+        @app.get("/api/v1/treatments.json")
+        def list_treatments(request: Request) -> list[dict[str, Any]]:
+            params = request.query_params
+            filters = _range_filter(params, "created_at")
+            limit = _count(params)
+            result = []
+            for treatment in self.treatments:
+                if len(result) >= limit:
+                    break
+                if _matches(treatment["created_at"], filters):
+                    result.append(treatment)
+            return result
+
+        @app.post("/api/v1/treatments")
+        async def create_treatments(request: Request) -> list[dict[str, Any]]:
+            body = await request.json()
+            items = body if isinstance(body, list) else [body]
+            created = []
+            for item in items:
+                treatment = {"_id": uuid.uuid4().hex, "created_at": _iso(datetime.now(timezone.utc)), **item}
+                created.append(treatment)
+            self.treatments.extend(created)
+            self.treatments.sort(key=lambda item: item["created_at"], reverse=True)
+            return created
+
+        @app.put("/api/v1/treatments/{treatment_id}")
+        async def update_treatment(treatment_id: str, request: Request):
+            updates = await request.json()
+            for treatment in self.treatments:
+                if treatment["_id"] == treatment_id:
+                    treatment.update(updates)
+                    return treatment
+            return JSONResponse({"status": 404, "message": "not found"}, status_code=404)
+
+        @app.delete("/api/v1/treatments/{treatment_id}")
+        def delete_treatment(treatment_id: str) -> dict[str, Any]:
+            before = len(self.treatments)
+            self.treatments = [item for item in self.treatments if item["_id"] != treatment_id]
+            return {"n": before - len(self.treatments), "ok": 1}
+
+        @app.get("/api/v1/devicestatus")
+        @app.get("/api/v1/devicestatus.json")
+        def list_devicestatus(request: Request) -> list[dict[str, Any]]:
+            return self.devicestatus[: _count(request.query_params)]
+
+        return app
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run a local fake Nightscout site.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1337)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--days", type=float, default=7.0)
+    parser.add_argument("--api-secret", default=None)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-seconds", type=float, default=30.0)
+    args = parser.parse_args(argv)
+    fake = FakeNightscout(
+        seed=args.seed,
+        days=args.days,
+        api_secret=args.api_secret,
+        base_url=f"http://{args.host}:{args.port}",
+        faults=FaultConfig(
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate,
+            error_status=args.error_status,
+            timeout_rate=args.timeout_rate,
+            timeout_seconds=args.timeout_seconds,
+            seed=args.seed,
+        ),
+    )
+    fake.serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -151,3 +151,39 @@ def test_current_glucose_post_stateless_filter(client: TestClient):
         assert resp.status_code == 200
         data = resp.json()
         assert isinstance(data["is_compression"], bool)
+
+
+def test_entries_since_returns_delta_and_honours_etag(client: TestClient):
+    login_resp = client.post("/api/auth/login", json={"username": "admin", "password": "admin123"})
+    headers = {"Authorization": f"Bearer {login_resp.json()['access_token']}"}
+    client.put("/api/nightscout/secret", headers=headers, json={
+        "url": "https://test-ns.example.com",
+        "api_secret": "secret-token",
+        "enabled": True
+    })
+
+    base = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1)
+    entries = [
+        NightscoutSGV(sgv=100 + i, direction="Flat", date=base + timedelta(minutes=5 * i))
+        for i in range(12)
+    ]
+    since = entries[8].date
+    with patch("app.api.nightscout.NightscoutClient") as MockClient:
+        instance = MockClient.return_value
+        instance.get_sgv_range = AsyncMock(return_value=entries)
+        instance.get_recent_treatments = AsyncMock(return_value=[])
+        instance.aclose = AsyncMock()
+
+        resp = client.get(f"/api/nightscout/entries?since={since}", headers=headers)
+        assert resp.status_code == 200
+        # Only the overlap behind the cursor plus newer points are sent.
+        assert [e["sgv"] for e in resp.json()] == [107, 108, 109, 110, 111]
+        assert resp.headers["X-Nightscout-Cursor"] == str(entries[-1].date)
+        fetch_start = instance.get_sgv_range.await_args.args[0]
+        assert fetch_start >= base
+
+        again = client.get(
+            f"/api/nightscout/entries?since={since}",
+            headers={**headers, "If-None-Match": resp.headers["ETag"]},
+        )
+        assert again.status_code == 304
@@ -106,6 +106,7 @@ class TestTDDCalculation:
     @pytest.mark.asyncio
     async def test_tdd_uses_real_basal(self):
         """Verify TDD calculation prioritizes real basal doses over schedule."""
+        from app.services.daily_totals_service import local_today
         from app.services.dynamic_isf_service import DynamicISFService, TDDDebugInfo
 
         # Mock session
@@ -123,8 +124,8 @@ class TestTDDCalculation:
         mock_settings.autosens.min_ratio = 0.7
         mock_settings.autosens.max_ratio = 1.3
 
-        # Mock _get_real_basal_doses to return some real doses
-        today = date.today()
+        # Mock _get_real_basal_doses to return some real doses (user's local days)
+        today = local_today("test_user")
         mock_basal = {
             today: 12.0,
             today - timedelta(days=1): 12.0,
@@ -0,0 +1,100 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.security import CurrentUser
+from app.models.bolus_v2 import BolusRequestV2
+from app.models.iob import COBInfo, IOBInfo, SourceStatus
+from app.services.bolus_calc_service import calculate_bolus_stateless_service
+from app.services.bolus_trace import build_bolus_trace
+from app.services.glucose_source_service import ResolvedGlucose
+from app.services.store import DataStore
+
+
+def _patch_sources(monkeypatch, *, delay=0.2, iob_delay=None):
+    now = datetime.now(timezone.utc)
+    iob = IOBInfo(
+        iob_u=0,
+        status="ok",
+        source="local_db",
+        fetched_at=now,
+        last_known_iob=0,
+        last_updated_at=now,
+        treatments_source_status=SourceStatus(source="local_db", status="ok", fetched_at=now),
+    )
+    cob = COBInfo(cob_g=0, status="ok", model="linear", source="local_db", fetched_at=now)
+
+    async def slow_resolver(*_args, **_kwargs):
+        await asyncio.sleep(delay)
+        return ResolvedGlucose(140, "dexcom_android", "ok", now, 2, usable_for_dosing=True)
+
+    async def slow_iob(*_args, **_kwargs):
+        await asyncio.sleep(delay if iob_delay is None else iob_delay)
+        return 0, [], iob, None
+
+    async def slow_cob(*_args, **_kwargs):
+        await asyncio.sleep(delay)
+        return 0, cob, SourceStatus(source="local_db", status="ok", fetched_at=now)
+
+    async def no_ns_config(*_args, **_kwargs):
+        return None
+
+    monkeypatch.setattr("app.services.bolus_calc_service.resolve_current_glucose", slow_resolver)
+    monkeypatch.setattr("app.services.bolus_calc_service.compute_iob_from_sources", slow_iob)
+    monkeypatch.setattr("app.services.bolus_calc_service.compute_cob_from_sources", slow_cob)
+    monkeypatch.setattr("app.services.bolus_calc_service.get_ns_config", no_ns_config)
+
+
+async def _calculate(tmp_path, **overrides):
+    return await calculate_bolus_stateless_service(
+        BolusRequestV2(
+            carbs_g=0,
+            target_mgdl=110,
+            cr_g_per_u=10,
+            isf_mgdl_per_u=30,
+            enable_autosens=False,
+            **overrides,
+        ),
+        store=DataStore(tmp_path),
+        user=CurrentUser(username="admin", role="admin"),
+        session=object(),
+    )
+
+
+@pytest.mark.asyncio
+async def test_context_stages_run_concurrently_and_are_timed(monkeypatch, tmp_path):
+    _patch_sources(monkeypatch, delay=0.2)
+
+    started = time.perf_counter()
+    response = await _calculate(tmp_path)
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.5  # three 200 ms stages, not 600 ms in sequence
+    assert response.correction_u == 1
+    for stage in ("settings", "glucose", "iob", "cob", "context", "engine", "total"):
+        assert stage in response.timings_ms
+    assert response.timings_ms["glucose"] >= 150
+    assert response.timings_ms["context"] < 450
+    snapshot, _, _ = build_bolus_trace(response)
+    assert snapshot["timings_ms"] == response.timings_ms
+
+
+@pytest.mark.asyncio
+async def test_stage_missing_deadline_is_treated_as_unavailable(monkeypatch, tmp_path):
+    monkeypatch.setattr("app.services.bolus_calc_service.BOLUS_CONTEXT_DEADLINE_SECONDS", 0.3)
+    _patch_sources(monkeypatch, delay=0.01, iob_delay=5)
+
+    with pytest.raises(HTTPException) as exc:
+        await _calculate(tmp_path)
+    assert exc.value.detail["error_code"] == "IOB_UNAVAILABLE_CONFIRM_REQUIRED"
+    assert exc.value.detail["iob"]["reason"] == "timeout"
+
+    started = time.perf_counter()
+    response = await _calculate(tmp_path, confirm_iob_unknown=True, manual_iob_u=0.5)
+    assert time.perf_counter() - started < 1.0
+    assert "IOB_CONTEXT_TIMEOUT" in response.assumptions
+    assert response.iob_u == 0.5
+    assert response.glucose.mgdl == 140
@@ -0,0 +1,137 @@
+import pytest
+from pydantic import ValidationError
+
+from app.core.security import CurrentUser
+from app.models.bolus_v2 import (
+    BolusRequestV2,
+    BolusSweepGrid,
+    ExerciseParams,
+    GlucoseUsed,
+    SweepExercise,
+)
+from app.models.settings import UserSettings
+from app.services.bolus_calc_service import calculate_bolus_stateless_service
+from app.services.bolus_engine import calculate_bolus_v2, sweep_bolus_v2
+from app.services.store import DataStore
+
+GRID = BolusSweepGrid(
+    carbs_g=[0, 4, 12.5, 30, 45, 60, 95, 140],
+    exercise=[
+        SweepExercise(minutes=0),
+        SweepExercise(minutes=45, intensity="low"),
+        SweepExercise(minutes=90, intensity="high"),
+    ],
+    targets_mgdl=[80, 110, 140],
+)
+
+
+def _settings(**overrides) -> UserSettings:
+    settings = UserSettings()
+    settings.cr.lunch = 9.0
+    settings.cf.lunch = 35.0
+    settings.max_bolus_u = overrides.get("max_bolus_u", 15.0)
+    settings.max_iob_u = overrides.get("max_iob_u")
+    settings.round_step_u = overrides.get("round_step_u", 0.1)
+    settings.techne.enabled = overrides.get("techne", False)
+    settings.warsaw.enabled = overrides.get("warsaw", False)
+    settings.calculator.subtract_fiber = overrides.get("subtract_fiber", False)
+    settings.dual_bolus.enabled_default = overrides.get("dual", False)
+    return settings
+
+
+SCENARIOS = [
+    dict(settings={}, bg=180, trend="Flat", iob=0.5),
+    dict(settings={"techne": True, "round_step_u": 0.5}, bg=190, trend="SingleUp", iob=0.0),
+    dict(settings={"techne": True, "round_step_u": 0.5}, bg=150, trend="DoubleDown", iob=1.0),
+    dict(settings={"warsaw": True, "dual": True}, bg=160, trend="Flat", iob=0.0, fat=30, protein=40),
+    dict(settings={"warsaw": True}, bg=120, trend=None, iob=0.0, fat=8, protein=10),
+    dict(settings={"subtract_fiber": True}, bg=140, trend="Flat", iob=0.0, fiber=10),
+    dict(settings={"max_iob_u": 6.0, "max_bolus_u": 8.0}, bg=250, trend="Flat", iob=3.0),
+    dict(settings={}, bg=65, trend="Flat", iob=0.0),
+    dict(settings={}, bg=200, trend="Flat", iob=0.0, stale=True),
+    dict(settings={}, bg=None, trend=None, iob=0.0, autosens=1.2),
+]
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_sweep_matches_single_calculation_at_every_cell(scenario):
+    settings = _settings(**scenario["settings"])
+    glucose = GlucoseUsed(
+        mgdl=scenario["bg"],
+        source="manual" if scenario["bg"] else "none",
+        trend=scenario["trend"],
+        is_stale=scenario.get("stale", False),
+    )
+    base = BolusRequestV2(
+        carbs_g=50,
+        fat_g=scenario.get("fat", 0),
+        protein_g=scenario.get("protein", 0),
+        fiber_g=scenario.get("fiber", 0),
+        meal_slot="lunch",
+    )
+    autosens = scenario.get("autosens", 1.0)
+
+    table = sweep_bolus_v2(base, settings, scenario["iob"], glucose, GRID, autosens_ratio=autosens)
+
+    for e, exercise in enumerate(table.exercise):
+        for t, target in enumerate(table.targets_mgdl):
+            for c, carbs in enumerate(table.carbs_g):
+                request = base.model_copy(
+                    update={
+                        "carbs_g": carbs,
+                        "target_mgdl": target,
+                        "exercise": ExerciseParams(
+                            planned=exercise.minutes > 0,
+                            minutes=exercise.minutes,
+                            intensity=exercise.intensity,
+                        ),
+                    }
+                )
+                single = calculate_bolus_v2(
+                    request, settings, scenario["iob"], glucose, autosens_ratio=autosens
+                )
+                cell = (e, t, c)
+                assert table.total_u[e][t][c] == single.total_u, cell
+                assert table.upfront_u[e][t][c] == single.upfront_u, cell
+                assert table.later_u[e][t][c] == single.later_u, cell
+                assert table.duration_min[e][t][c] == single.duration_min, cell
+                assert table.meal_u[c] == single.meal_bolus_u, cell
+                assert table.correction_u[t] == single.correction_u, cell
+
+
+def test_sweep_grid_is_bounded():
+    with pytest.raises(ValidationError):
+        BolusSweepGrid(
+            carbs_g=list(range(0, 500)),
+            exercise=[SweepExercise(minutes=m) for m in range(0, 60, 10)],
+            targets_mgdl=[90, 100, 110, 120],
+        )
+
+
+@pytest.mark.asyncio
+async def test_calc_returns_sweep_from_the_same_context(tmp_path):
+    payload = BolusRequestV2(
+        carbs_g=40,
+        bg_mgdl=150,
+        target_mgdl=110,
+        cr_g_per_u=10,
+        isf_mgdl_per_u=40,
+        enable_autosens=False,
+        confirm_iob_unknown=True,
+        manual_iob_u=0.0,
+        sweep=BolusSweepGrid(carbs_g=[0, 20, 40, 60]),
+    )
+
+    response = await calculate_bolus_stateless_service(
+        payload,
+        store=DataStore(tmp_path),
+        user=CurrentUser(username="admin", role="admin"),
+        session=None,
+    )
+
+    assert response.sweep is not None
+    assert response.sweep.targets_mgdl == [110]
+    assert response.sweep.exercise == [SweepExercise(minutes=0, intensity="moderate")]
+    assert response.sweep.total_u[0][0][2] == response.total_u
+    assert response.sweep.total_u[0][0] == sorted(response.sweep.total_u[0][0])
+    assert "sweep" in response.timings_ms
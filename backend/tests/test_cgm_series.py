@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import pytest
+
+from app.core.db import SessionLocal
+from app.models.glucose_reading import GlucoseReadingDB
+from app.services.cgm_series import CGMPoint, CGMSeries, CGMSeriesRepository, dedupe_points
+
+
+def _reading(user_id: str, measured_at: datetime, value: int, source: str, **kwargs) -> GlucoseReadingDB:
+    return GlucoseReadingDB(
+        user_id=user_id,
+        reading_uid=str(uuid4()),
+        glucose_mgdl=value,
+        measured_at=measured_at,
+        source=source,
+        validation_status=kwargs.pop("validation_status", "accepted"),
+        **kwargs,
+    )
+
+
+def test_dedupe_prefers_source_priority_for_same_sample():
+    base = datetime(2026, 5, 1, 8, 0, tzinfo=timezone.utc)
+    points = dedupe_points(
+        [
+            CGMPoint(measured_at=base, sgv=120, source="nightscout"),
+            CGMPoint(measured_at=base + timedelta(seconds=20), sgv=121, source="dexcom_android"),
+            CGMPoint(measured_at=base + timedelta(minutes=5), sgv=125, source="nightscout"),
+        ]
+    )
+
+    assert [(p.sgv, p.source) for p in points] == [(121, "dexcom_android"), (125, "nightscout")]
+
+
+def test_value_at_respects_tolerance_and_resample_marks_gaps():
+    base = datetime(2026, 5, 1, 8, 0, tzinfo=timezone.utc)
+    series = CGMSeries(
+        start=base,
+        end=base + timedelta(minutes=20),
+        points=[
+            CGMPoint(measured_at=base + timedelta(minutes=1), sgv=100, source="nightscout"),
+            CGMPoint(measured_at=base + timedelta(minutes=19), sgv=140, source="nightscout"),
+        ],
+    )
+
+    assert series.value_at(base + timedelta(minutes=4)).sgv == 100
+    assert series.value_at(base + timedelta(minutes=10), tolerance=timedelta(minutes=5)) is None
+    assert [value for _, value in series.resample()] == [100, None, None, None, 140]
+
+
+@pytest.mark.asyncio
+async def test_repository_reads_local_rows_without_remote_calls():
+    user_id = f"cgm-series-{uuid4()}"
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    async with SessionLocal() as session:
+        for i in range(12):
+            session.add(_reading(user_id, start + timedelta(minutes=5 * i), 100 + i, "nightscout"))
+        session.add(_reading(user_id, start, 99, "dexcom_android"))
+        session.add(
+            _reading(user_id, start + timedelta(minutes=2), 300, "manual", validation_status="rejected")
+        )
+        await session.commit()
+
+        client = AsyncMock()
+        series = await CGMSeriesRepository(session, user_id).load(
+            start, start + timedelta(minutes=55), fallback_client=client
+        )
+
+    assert len(series) == 12
+    assert series.points[0].sgv == 99
+    assert series.points[0].source == "dexcom_android"
+    assert series.remote_fallback_used is False
+    client.get_sgv_range.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_repository_falls_back_to_one_remote_read_when_local_is_sparse():
+    user_id = f"cgm-series-{uuid4()}"
+    start = datetime.now(timezone.utc) - timedelta(hours=2)
+    client = AsyncMock()
+    client.get_sgv_range.return_value = [
+        SimpleNamespace(
+            sgv=110 + i,
+            date=int((start + timedelta(minutes=5 * i)).timestamp() * 1000),
+            direction="Flat",
+        )
+        for i in range(24)
+    ]
+
+    async with SessionLocal() as session:
+        series = await CGMSeriesRepository(session, user_id).load(
+            start, start + timedelta(hours=2), fallback_client=client
+        )
+
+    client.get_sgv_range.assert_awaited_once()
+    assert series.remote_fallback_used is True
+    assert len(series) == 24
+    assert series.value_at(start + timedelta(minutes=61)).sgv == 122
@@ -0,0 +1,196 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import httpx
+import pytest
+import respx
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.dexcom_client import DexcomClient
+from app.services.nightscout_client import NightscoutClient, NightscoutUnavailableError
+
+
+def test_breaker_opens_on_consecutive_failures_and_recovers_through_probe(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: clock.now)
+    breaker = CircuitBreaker("test")
+
+    for _ in range(circuit_breaker.CONSECUTIVE_FAILURES_TO_OPEN):
+        assert breaker.allow()
+        breaker.record_failure(0.1)
+
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    clock.now += circuit_breaker.OPEN_BASE_SECONDS
+    assert breaker.allow()  # the half-open probe
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record_failure(0.1)
+    assert breaker.state == "open"
+
+    clock.now += circuit_breaker.OPEN_BASE_SECONDS  # cool-down doubled: still open
+    assert not breaker.allow()
+    clock.now += circuit_breaker.OPEN_BASE_SECONDS
+    assert breaker.allow()
+    breaker.record_success(0.1)
+    assert breaker.state == "closed"
+    assert breaker.failure_rate() == 0.0
+
+
+def test_unanswered_probe_expires_after_its_deadline(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: clock.now)
+    breaker = CircuitBreaker("test")
+    for _ in range(circuit_breaker.CONSECUTIVE_FAILURES_TO_OPEN):
+        breaker.record_failure(0.1)
+
+    clock.now += circuit_breaker.OPEN_BASE_SECONDS
+    assert breaker.allow(4.0)
+    clock.now += 3.9
+    assert not breaker.allow(4.0)
+    clock.now += 0.2
+    assert breaker.allow(4.0)  # the first probe never reported back
+
+
+def test_deadline_adapts_to_recent_latency():
+    breaker = CircuitBreaker("test")
+    assert breaker.deadline(10.0) == 10.0
+
+    for _ in range(circuit_breaker.MIN_SAMPLES):
+        breaker.record_success(0.2)
+    assert breaker.deadline(10.0) == circuit_breaker.MIN_DEADLINE_SECONDS
+
+    for _ in range(circuit_breaker.MIN_SAMPLES):
+        breaker.record_success(1.5)
+    assert breaker.deadline(10.0) == pytest.approx(4.5)
+
+
+def test_deadline_is_learned_per_endpoint_class():
+    breaker = CircuitBreaker("test")
+    for _ in range(circuit_breaker.MIN_SAMPLES):
+        breaker.record_success(0.1, "GET /api/v1/entries/sgv")
+        breaker.record_success(2.0, "GET /api/v1/entries/sgv bulk")
+
+    assert breaker.deadline(10.0, "GET /api/v1/entries/sgv") == circuit_breaker.MIN_DEADLINE_SECONDS
+    assert breaker.deadline(10.0, "GET /api/v1/entries/sgv bulk") == pytest.approx(6.0)
+    assert breaker.deadline(10.0, "GET /api/v1/treatments") == 10.0
+
+
+def test_only_the_probe_holder_can_release_the_slot(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: clock.now)
+    breaker = CircuitBreaker("test")
+    straggler = breaker.allow()  # admitted while still closed
+    for _ in range(circuit_breaker.CONSECUTIVE_FAILURES_TO_OPEN):
+        breaker.record_failure(0.1)
+    clock.now += circuit_breaker.OPEN_BASE_SECONDS
+    probe = breaker.allow(4.0)
+
+    breaker.release_probe(straggler)
+    assert not breaker.allow(4.0)
+    breaker.release_probe(probe)
+    assert breaker.allow(4.0)
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_nightscout_fails_fast_once_site_breaker_is_open():
+    route = respx.get("https://ns.example.com/api/v1/entries/sgv").mock(
+        return_value=httpx.Response(503, json={})
+    )
+
+    for _ in range(circuit_breaker.CONSECUTIVE_FAILURES_TO_OPEN):
+        client = NightscoutClient(base_url="https://ns.example.com")
+        with pytest.raises(Exception):
+            await client.get_latest_sgv()
+        await client.aclose()
+
+    other_caller = NightscoutClient(base_url="https://ns.example.com", token="another-user")
+    with pytest.raises(NightscoutUnavailableError):
+        await other_caller.get_latest_sgv()
+    await other_caller.aclose()
+    assert route.call_count == circuit_breaker.CONSECUTIVE_FAILURES_TO_OPEN
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_cancelled_nightscout_probe_frees_the_slot():
+    def cancelled(request):
+        raise asyncio.CancelledError()
+
+    respx.get("https://ns-cancel.example.com/api/v1/entries/sgv").mock(side_effect=cancelled)
+    client = NightscoutClient(base_url="https://ns-cancel.example.com")
+    for _ in range(circuit_breaker.CONSECUTIVE_FAILURES_TO_OPEN):
+        client.breaker.record_failure(1.0)
+    client.breaker._retry_at = 0.0  # cool-down over: the next call is the probe
+
+    with pytest.raises(asyncio.CancelledError):
+        await client.get_latest_sgv()
+    await client.aclose()
+
+    assert client.breaker.state == "half_open"
+    assert client.breaker.allow()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_explicit_timeout_is_not_shortened_by_fast_polls():
+    seen = []
+
+    def record(request):
+        seen.append(request.extensions["timeout"]["read"])
+        return httpx.Response(200, json=[])
+
+    respx.get("https://ns-timeout.example.com/api/v1/treatments").mock(side_effect=record)
+    client = NightscoutClient(base_url="https://ns-timeout.example.com")
+    for _ in range(circuit_breaker.MIN_SAMPLES):
+        client.breaker.record_success(0.05, "GET /api/v1/treatments")
+
+    await client._request("get", "/api/v1/treatments", timeout=8.0)
+    await client._request("get", "/api/v1/treatments")
+    await client.aclose()
+
+    assert seen == [8.0, circuit_breaker.MIN_DEADLINE_SECONDS]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_dexcom_returns_none_without_calling_while_open():
+    client = DexcomClient("someone", "pw")
+    for _ in range(circuit_breaker.CONSECUTIVE_FAILURES_TO_OPEN):
+        client.breaker.record_failure(1.0)
+
+    share = respx.post(url__startswith=client.base_url).mock(return_value=httpx.Response(200, json=[]))
+
+    now = datetime.now(timezone.utc)
+    assert await client.get_latest_sgv() is None
+    assert await client.get_sgv_range(now - timedelta(hours=1), now) == []
+    assert share.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_sources_status_reports_nightscout_circuit():
+    from uuid import uuid4
+
+    from app.api.glucose import get_glucose_sources_status
+    from app.core.db import SessionLocal
+    from app.services.nightscout_secrets_service import upsert_ns_config
+
+    user_id = f"breaker-{uuid4()}"
+    async with SessionLocal() as session:
+        await upsert_ns_config(
+            session, user_id=user_id, url="https://status-ns.example.com/", api_secret="s", enabled=True
+        )
+    breaker = circuit_breaker.get_breaker("nightscout:https://status-ns.example.com")
+    for _ in range(circuit_breaker.CONSECUTIVE_FAILURES_TO_OPEN):
+        breaker.record_failure(0.5)
+
+    async with SessionLocal() as session:
+        status = await get_glucose_sources_status(user=SimpleNamespace(username=user_id), session=session)
+
+    circuits = {state.source: state.circuit for state in status.sources}
+    assert circuits["nightscout"].state == "open"
+    assert circuits["nightscout"].retry_at is not None
+    assert circuits["dexcom_android"] is None
@@ -0,0 +1,180 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.core.db import SessionLocal
+from app.models.daily_totals import DailyInsulinTotalDB
+from app.models.settings import UserSettings
+from app.models.treatment import Treatment
+from app.services import basal_repo, daily_totals_service
+from app.services.daily_totals_service import local_today, read_daily_totals, rebuild_daily_totals
+from app.services.dynamic_isf_service import DynamicISFService
+from app.services.export_service import stream_user_export
+from app.services.import_service import import_user_stream
+from app.utils.timezone import set_user_timezone
+
+
+def _user(tz: str = "UTC") -> str:
+    user_id = f"tdd-{uuid.uuid4()}"
+    set_user_timezone(tz, user_id)
+    return user_id
+
+
+async def _rows(user_id: str) -> dict:
+    async with SessionLocal() as session:
+        result = await session.execute(
+            select(DailyInsulinTotalDB).where(DailyInsulinTotalDB.user_id == user_id)
+        )
+        return {row.day: row for row in result.scalars().all()}
+
+
+@pytest.mark.asyncio
+async def test_treatment_writes_update_local_day_rows():
+    user_id = _user("America/New_York")
+    # 02:00 UTC is still the previous evening in New York.
+    late = datetime(2024, 6, 11, 2, 0)
+    noon = datetime(2024, 6, 11, 16, 0)
+    async with SessionLocal() as session:
+        session.add_all(
+            [
+                Treatment(id=str(uuid.uuid4()), user_id=user_id, created_at=late, insulin=2.0, carbs=20),
+                Treatment(id="edit-" + user_id, user_id=user_id, created_at=noon, insulin=4.0, carbs=45),
+            ]
+        )
+        await session.commit()
+
+    rows = await _rows(user_id)
+    day_before, day = late.date() - timedelta(days=1), noon.date()
+    assert (rows[day_before].bolus_u, rows[day_before].carbs_g) == (2.0, 20)
+    assert (rows[day].bolus_u, rows[day].treatments) == (4.0, 1)
+    assert rows[day].rebuilt_at is None
+
+    async with SessionLocal() as session:
+        edited = await session.get(Treatment, "edit-" + user_id)
+        edited.insulin = 5.5
+        edited.created_at = noon - timedelta(days=1)
+        await session.commit()
+        await session.delete(await session.get(Treatment, "edit-" + user_id))
+        await session.commit()
+
+    rows = await _rows(user_id)
+    assert rows[day].bolus_u == 0.0 and rows[day].treatments == 0
+    assert rows[day_before].bolus_u == 2.0 and rows[day_before].treatments == 1
+
+
+@pytest.mark.asyncio
+async def test_reads_use_rebuilt_rows_and_compute_only_missing_days(monkeypatch):
+    user_id = _user()
+    today = local_today(user_id)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    async with SessionLocal() as session:
+        for days_ago in range(3):
+            session.add(
+                Treatment(
+                    id=str(uuid.uuid4()),
+                    user_id=user_id,
+                    created_at=now - timedelta(days=days_ago),
+                    insulin=10.0,
+                    carbs=50,
+                )
+            )
+        await session.commit()
+    await basal_repo.upsert_basal_dose(user_id, 14.0, effective_from=today)
+    assert (await _rows(user_id))[today].basal_u == 14.0
+
+    async with SessionLocal() as session:
+        unreconciled = await read_daily_totals(session, user_id, today - timedelta(days=6), today)
+        await rebuild_daily_totals(session, user_id, today - timedelta(days=6), today)
+        await session.commit()
+
+    computed = []
+    real_compute = daily_totals_service.compute_daily_totals
+
+    async def tracking_compute(session, user_id, start, end):
+        computed.append((start, end))
+        return await real_compute(session, user_id, start, end)
+
+    monkeypatch.setattr(daily_totals_service, "compute_daily_totals", tracking_compute)
+    async with SessionLocal() as session:
+        totals = await read_daily_totals(session, user_id, today - timedelta(days=6), today)
+        wider = await read_daily_totals(session, user_id, today - timedelta(days=8), today)
+
+    assert totals == unreconciled
+    assert [item.bolus_u for item in totals.values()] == [0, 0, 0, 0, 10.0, 10.0, 10.0]
+    assert totals[today].basal_u == 14.0
+    assert computed == [(today - timedelta(days=8), today - timedelta(days=7))]
+    assert len(wider) == 9
+
+
+@pytest.mark.asyncio
+async def test_dynamic_ratio_reads_daily_totals():
+    user_id = _user()
+    today = local_today(user_id)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    async with SessionLocal() as session:
+        for days_ago in range(1, 7):
+            session.add(
+                Treatment(
+                    id=str(uuid.uuid4()),
+                    user_id=user_id,
+                    created_at=now - timedelta(days=days_ago),
+                    insulin=20.0,
+                    carbs=100,
+                )
+            )
+        session.add(
+            Treatment(id=str(uuid.uuid4()), user_id=user_id, created_at=now, insulin=22.0, carbs=100)
+        )
+        await session.commit()
+        await rebuild_daily_totals(session, user_id, today - timedelta(days=6), today)
+        await session.commit()
+
+    settings = UserSettings()
+    settings.tdd_u = 30.0
+    async with SessionLocal() as session:
+        ratio, debug = await DynamicISFService.calculate_dynamic_ratio(
+            username=user_id, session=session, settings=settings, return_debug=True
+        )
+
+    assert debug.safety_reason is None
+    assert sum(debug.bolus_by_day.values()) == pytest.approx(142.0)
+    assert debug.recent_tdd == pytest.approx(22.0 + debug.basal_by_day[0])
+    # Today's partial total stays out of the week average.
+    complete_days = [20.0] * 6 + [0.0]
+    assert sorted(debug.basal_by_day) == list(range(8))
+    assert debug.week_avg_tdd == pytest.approx(
+        sum(bolus + debug.basal_by_day[d] for d, bolus in enumerate(complete_days, start=1)) / 7
+    )
+    assert ratio == debug.final_ratio
+
+
+@pytest.mark.asyncio
+async def test_bulk_import_reopens_rebuilt_days():
+    user_id = _user()
+    today = local_today(user_id)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    async with SessionLocal() as session:
+        await rebuild_daily_totals(session, user_id, today, today)
+        await session.commit()
+    assert (await _rows(user_id))[today].rebuilt_at is not None
+
+    source = _user()
+    treatment = Treatment(id=str(uuid.uuid4()), user_id=source, created_at=now, insulin=3.0, carbs=30)
+    async with SessionLocal() as session:
+        session.add(treatment)
+        await session.commit()
+        payload = b"".join([chunk async for chunk in stream_user_export(source)])
+        await session.delete(treatment)
+        await session.commit()
+
+    async def export():
+        yield payload
+
+    await import_user_stream(user_id, export())
+
+    assert (await _rows(user_id))[today].rebuilt_at is None
+    async with SessionLocal() as session:
+        totals = await read_daily_totals(session, user_id, today, today)
+    assert totals[today].bolus_u == 3.0
@@ -0,0 +1,197 @@
+import gzip
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.core.db import SessionLocal
+from app.models.glucose_reading import GlucoseReadingDB
+from app.models.learning import MealEntry, MealOutcome
+from app.models.treatment import Treatment
+from app.services.export_service import gzip_stream, stream_user_export
+from app.services.glucose_ingest_service import GlucoseIngestData, ingest_glucose_readings_bulk
+from app.services.import_service import import_user_data, import_user_stream
+
+
+async def _seed(user_id: str) -> None:
+    now = datetime.now(timezone.utc)
+    async with SessionLocal() as session:
+        await ingest_glucose_readings_bulk(
+            session,
+            user_id,
+            [
+                GlucoseIngestData(glucose_mgdl=100 + i, measured_at=now - timedelta(minutes=5 * i), source="nightscout")
+                for i in range(30)
+            ],
+        )
+        session.add(
+            Treatment(
+                id=str(uuid.uuid4()),
+                user_id=user_id,
+                created_at=datetime.utcnow(),
+                insulin=2.5,
+                carbs=40,
+                calculation_trace={"ratio": 10},
+            )
+        )
+        await session.commit()
+
+
+async def _collect(chunks) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+async def _replay(payload: bytes, size: int = 97):
+    for offset in range(0, len(payload), size):
+        yield payload[offset : offset + size]
+
+
+async def _counts(user_id: str) -> tuple[int, int]:
+    async with SessionLocal() as session:
+        readings = (
+            await session.execute(select(GlucoseReadingDB.id).where(GlucoseReadingDB.user_id == user_id))
+        ).all()
+        treatments = (await session.execute(select(Treatment).where(Treatment.user_id == user_id))).scalars().all()
+    return len(readings), len(treatments)
+
+
+@pytest.mark.asyncio
+async def test_streaming_export_covers_glucose_and_treatments():
+    user_id = f"export-{uuid.uuid4()}"
+    await _seed(user_id)
+
+    lines = [json.loads(line) for line in (await _collect(stream_user_export(user_id, batch_size=7))).splitlines()]
+
+    header, footer = lines[0], lines[-1]
+    assert header["type"] == "header" and header["user_id"] == user_id
+    assert {"glucose_readings", "treatments"} <= set(header["tables"])
+    assert "nightscout_secrets" not in header["tables"]
+    rows = [line for line in lines if line["type"] == "row"]
+    assert sum(1 for row in rows if row["table"] == "glucose_readings") == 30
+    assert footer["counts"]["glucose_readings"] == 30
+    assert footer["counts"]["treatments"] == 1
+    assert footer["total"] == len(rows)
+    assert all(row["data"]["user_id"] == user_id for row in rows)
+
+
+@pytest.mark.asyncio
+async def test_gzipped_export_round_trips_through_bulk_import():
+    user_id = f"restore-{uuid.uuid4()}"
+    await _seed(user_id)
+    payload = await _collect(gzip_stream(stream_user_export(user_id)))
+    assert gzip.decompress(payload).startswith(b'{"type":"header"')
+
+    async with SessionLocal() as session:
+        await session.execute(delete(GlucoseReadingDB).where(GlucoseReadingDB.user_id == user_id))
+        await session.execute(delete(Treatment).where(Treatment.user_id == user_id))
+        await session.commit()
+    assert await _counts(user_id) == (0, 0)
+
+    stats = await import_user_stream(user_id, _replay(payload), batch_size=8)
+    plain = gzip.decompress(payload) + b"not json\n"
+    again = await import_user_stream(user_id, _replay(plain), batch_size=8)
+
+    assert stats["tables"]["glucose_readings"] == 30
+    assert stats["errors"] == 0
+    assert stats["source_user_id"] == user_id
+    assert await _counts(user_id) == (30, 1)  # re-import upserts, no duplicates
+    assert again["errors"] == 1
+    async with SessionLocal() as session:
+        treatment = (await session.execute(select(Treatment).where(Treatment.user_id == user_id))).scalar_one()
+    assert treatment.calculation_trace == {"ratio": 10}
+    assert treatment.insulin == 2.5
+
+
+@pytest.mark.asyncio
+async def test_import_never_rewrites_another_users_rows():
+    owner = f"owner-{uuid.uuid4()}"
+    await _seed(owner)
+    payload = await _collect(stream_user_export(owner))
+    lines = payload.decode().splitlines()
+    tampered = [json.loads(line) for line in lines]
+    for record in tampered:
+        if record.get("table") == "treatments":
+            record["data"]["insulin"] = 99.0
+
+    intruder = f"intruder-{uuid.uuid4()}"
+    stats = await import_user_stream(intruder, _replay("\n".join(map(json.dumps, tampered)).encode()))
+    legacy = await import_user_data(intruder, {"treatments": [r["data"] for r in tampered if r.get("table") == "treatments"]})
+
+    async with SessionLocal() as session:
+        treatment = (await session.execute(select(Treatment).where(Treatment.user_id == owner))).scalar_one()
+    assert treatment.insulin == 2.5
+    assert "treatments" not in stats["tables"]
+    assert stats["skipped"] >= 1
+    assert "total_imported" in legacy
+
+
+@pytest.mark.asyncio
+async def test_child_rows_follow_their_parent_through_export_and_import():
+    user_id = f"children-{uuid.uuid4()}"
+    meal_id = str(uuid.uuid4())
+    async with SessionLocal() as session:
+        session.add(MealEntry(id=meal_id, user_id=user_id, carbs_g=45.0))
+        session.add(MealOutcome(id=str(uuid.uuid4()), meal_entry_id=meal_id, score=8))
+        await session.commit()
+
+    payload = await _collect(stream_user_export(user_id))
+    header = json.loads(payload.splitlines()[0])
+    assert header["tables"].index("meal_entries") < header["tables"].index("meal_outcomes")
+
+    async with SessionLocal() as session:
+        await session.execute(delete(MealOutcome).where(MealOutcome.meal_entry_id == meal_id))
+        await session.execute(delete(MealEntry).where(MealEntry.id == meal_id))
+        await session.commit()
+
+    stats = await import_user_stream(user_id, _replay(payload), batch_size=1)
+    # Outcomes replayed against someone else's meal are dropped, not attached.
+    intruder = await import_user_stream(f"intruder-{uuid.uuid4()}", _replay(payload), batch_size=1)
+
+    assert "meal_outcomes" not in intruder["tables"]
+    assert stats["tables"]["meal_outcomes"] == 1
+    async with SessionLocal() as session:
+        outcome = (
+            await session.execute(select(MealOutcome).where(MealOutcome.meal_entry_id == meal_id))
+        ).scalar_one()
+    assert outcome.score == 8
+
+
+@pytest.mark.asyncio
+async def test_unique_clash_only_drops_the_offending_row():
+    user_id = f"clash-{uuid.uuid4()}"
+    await _seed(user_id)
+    payload = await _collect(stream_user_export(user_id))
+    rows = [json.loads(line) for line in payload.splitlines()]
+    newest = next(row["data"] for row in rows if row.get("table") == "glucose_readings")
+
+    async with SessionLocal() as session:
+        await session.execute(delete(GlucoseReadingDB).where(GlucoseReadingDB.user_id == user_id))
+        # Same reading_uid under a different primary key.
+        clone = {key: value for key, value in newest.items() if key != "id"}
+        session.add(
+            GlucoseReadingDB(
+                **{key: datetime.fromisoformat(value) if key.endswith("_at") and value else value
+                   for key, value in clone.items()}
+            )
+        )
+        await session.commit()
+
+    stats = await import_user_stream(user_id, _replay(payload), batch_size=500)
+
+    assert stats["errors"] == 1
+    assert stats["tables"]["glucose_readings"] == 29
+    assert (await _counts(user_id))[0] == 30
+
+
+@pytest.mark.asyncio
+async def test_legacy_import_only_writes_allowlisted_tables():
+    user_id = f"legacy-{uuid.uuid4()}"
+    stats = await import_user_data(
+        user_id,
+        {"treatments": [{"id": str(uuid.uuid4()), "insulin": 1.0, "created_at": datetime.utcnow().isoformat()}]},
+    )
+
+    assert stats["total_imported"] == 0
+    assert await _counts(user_id) == (0, 0)
@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import httpx
+import pytest
+import respx
+from sqlalchemy import func, select
+
+from app.core.db import SessionLocal
+from app.models.glucose_reading import GlucoseReadingDB
+from app.models.settings import UserSettings
+from app.services import glucose_backfill_service
+from app.services.dexcom_client import DEXCOM_BASE_URLS, DexcomClient, DexcomShareError, GlucoseReading
+from app.services.glucose_backfill_service import backfill_dexcom
+
+
+BASE = DEXCOM_BASE_URLS["ous"]
+ACCOUNT_ID = "11111111-2222-3333-4444-555555555555"
+SESSION_IDS = ["aaaaaaaa-0000-0000-0000-000000000001", "aaaaaaaa-0000-0000-0000-000000000002"]
+
+
+def _share_items(now: datetime, n: int) -> list[dict]:
+    items = []
+    for i in range(n):
+        ms = int((now - timedelta(minutes=5 * i)).timestamp() * 1000)
+        items.append({"WT": f"Date({ms})", "DT": f"Date({ms}+0100)", "Value": 120 + i, "Trend": "Flat"})
+    return items
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_share_session_is_reused_across_clients():
+    now = datetime.now(timezone.utc)
+    auth = respx.post(f"{BASE}General/AuthenticatePublisherAccount").mock(
+        return_value=httpx.Response(200, json=ACCOUNT_ID)
+    )
+    login = respx.post(f"{BASE}General/LoginPublisherAccountById").mock(
+        return_value=httpx.Response(200, json=SESSION_IDS[0])
+    )
+    read = respx.post(f"{BASE}Publisher/ReadPublisherLatestGlucoseValues").mock(
+        return_value=httpx.Response(200, json=_share_items(now, 3))
+    )
+
+    latest = await DexcomClient("share-user", "pw").get_latest_sgv()
+    window = await DexcomClient("share-user", "pw").fetch_sgv_range(now - timedelta(minutes=7), now)
+
+    assert auth.call_count == 1
+    assert login.call_count == 1
+    assert read.call_count == 2
+    assert read.calls.last.request.url.params["sessionId"] == SESSION_IDS[0]
+    assert read.calls.last.request.url.params["minutes"] == "8"
+    assert latest.sgv == 120 and latest.trend == "→" and latest.direction == "Flat"
+    assert abs((latest.date - now).total_seconds()) < 1
+    assert [reading.sgv for reading in window] == [120, 121]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_expired_share_session_logs_in_again_once():
+    now = datetime.now(timezone.utc)
+    respx.post(f"{BASE}General/AuthenticatePublisherAccount").mock(
+        return_value=httpx.Response(200, json=ACCOUNT_ID)
+    )
+    login = respx.post(f"{BASE}General/LoginPublisherAccountById").mock(
+        side_effect=[httpx.Response(200, json=session_id) for session_id in SESSION_IDS]
+    )
+    respx.post(f"{BASE}Publisher/ReadPublisherLatestGlucoseValues").mock(
+        side_effect=[
+            httpx.Response(500, json={"Code": "SessionNotValid", "Message": "expired"}),
+            httpx.Response(200, json=_share_items(now, 1)),
+        ]
+    )
+    client = DexcomClient("expiring-user", "pw")
+
+    reading = await client.get_latest_sgv()
+
+    assert reading.sgv == 120
+    assert login.call_count == 2
+    assert client.breaker.snapshot().consecutive_failures == 0
+
+
+@pytest.mark.asyncio
+async def test_dexcom_backfill_merges_only_new_readings(monkeypatch):
+    user_id = f"dexcom-backfill-{uuid4()}"
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    settings = UserSettings.default()
+    settings.dexcom.enabled = True
+    settings.dexcom.username = "share-user"
+    settings.dexcom.password = "pw"
+    monkeypatch.setattr(
+        glucose_backfill_service, "load_glucose_user_settings", AsyncMock(return_value=settings)
+    )
+    share = SimpleNamespace(fetch_sgv_range=AsyncMock())
+    monkeypatch.setattr(glucose_backfill_service, "DexcomClient", lambda **_kwargs: share)
+
+    def readings(end: datetime, n: int) -> list[GlucoseReading]:
+        # The value is a function of the timestamp, so overlapping pulls repeat samples exactly.
+        dates = [end - timedelta(minutes=5 * i) for i in range(n)]
+        return [
+            GlucoseReading(sgv=90 + int(at.timestamp() // 300) % 60, trend="→", date=at, direction="Flat")
+            for at in dates
+        ]
+
+    async with SessionLocal() as session:
+        share.fetch_sgv_range.return_value = readings(now, 12)
+        first = await backfill_dexcom(session, user_id, now=now)
+        assert share.fetch_sgv_range.await_args.args[0] == now - timedelta(hours=24)
+
+        later = now + timedelta(minutes=5)
+        share.fetch_sgv_range.return_value = readings(later, 4)
+        second = await backfill_dexcom(session, user_id, now=later)
+        stored = (
+            await session.execute(
+                select(func.count()).select_from(GlucoseReadingDB).where(
+                    GlucoseReadingDB.user_id == user_id,
+                    GlucoseReadingDB.source == "dexcom_share",
+                )
+            )
+        ).scalar_one()
+
+    assert first == {"status": "ok", "fetched": 12, "inserted": 12}
+    assert share.fetch_sgv_range.await_args.args[0] == now - timedelta(minutes=15)
+    assert second["inserted"] == 1
+    assert stored == 13
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_failed_share_pull_is_not_reported_as_backfilled(monkeypatch):
+    user_id = f"dexcom-backfill-down-{uuid4()}"
+    settings = UserSettings.default()
+    settings.dexcom.enabled = True
+    settings.dexcom.username = f"down-{uuid4()}"
+    settings.dexcom.password = "pw"
+    monkeypatch.setattr(
+        glucose_backfill_service, "load_glucose_user_settings", AsyncMock(return_value=settings)
+    )
+    respx.post(f"{BASE}General/AuthenticatePublisherAccount").mock(
+        return_value=httpx.Response(500, json={"Code": "SSO_InternalError", "Message": "down"})
+    )
+
+    async with SessionLocal() as session:
+        with pytest.raises(DexcomShareError):
+            await backfill_dexcom(session, user_id)
+
+    state = glucose_backfill_service.get_backfill_state(user_id)
+    assert state.last_error is not None
+    assert state.last_success_at is None
+
+
+def test_dexcom_configured_requires_both_enable_flags():
+    settings = UserSettings.default()
+    settings.dexcom.username = "share-user"
+    settings.dexcom.password = "pw"
+    settings.dexcom.enabled = True
+    settings.glucose_sources.dexcom_share_enabled = False
+    assert not glucose_backfill_service.dexcom_configured(settings)
+
+    settings.glucose_sources.dexcom_share_enabled = True
+    assert glucose_backfill_service.dexcom_configured(settings)
+    settings.dexcom.enabled = False
+    assert not glucose_backfill_service.dexcom_configured(settings)
@@ -0,0 +1,154 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.db import SessionLocal
+from app.core.security import CurrentUser
+from app.core.settings import get_settings
+from app.models.bolus_v2 import BolusRequestV2
+from app.models.settings import UserSettings
+from app.models.treatment import Treatment
+from app.services import iob as iob_service
+from app.services.bolus_calc_service import calculate_bolus_stateless_service
+from app.services.dosing_context import contexts
+from app.services.glucose_events import hub
+from app.services.glucose_source_service import ResolvedGlucose
+from app.services.store import DataStore
+
+
+async def _add_bolus(user_id: str, units: float, minutes_ago: int) -> None:
+    async with SessionLocal() as session:
+        session.add(
+            Treatment(
+                id=str(uuid.uuid4()),
+                user_id=user_id,
+                created_at=datetime.utcnow() - timedelta(minutes=minutes_ago),
+                insulin=units,
+                carbs=0,
+            )
+        )
+        await session.commit()
+
+
+def _count_loads(monkeypatch):
+    calls = {"glucose": 0, "iob": 0}
+    real_load_iob = iob_service.load_iob_sources
+
+    async def fake_resolver(*_args, **_kwargs):
+        calls["glucose"] += 1
+        measured_at = datetime.now(timezone.utc) - timedelta(minutes=2)
+        return ResolvedGlucose(150, "dexcom_android", "ok", measured_at, 2, usable_for_dosing=True)
+
+    async def counting_load_iob(**kwargs):
+        calls["iob"] += 1
+        return await real_load_iob(**kwargs)
+
+    monkeypatch.setattr("app.services.bolus_calc_service.resolve_current_glucose", fake_resolver)
+    monkeypatch.setattr(iob_service, "load_iob_sources", counting_load_iob)
+    return calls
+
+
+async def _calculate(user_id: str, **overrides):
+    async with SessionLocal() as session:
+        return await calculate_bolus_stateless_service(
+            BolusRequestV2(carbs_g=0, enable_autosens=False, **overrides),
+            # The background refresh uses the configured data dir.
+            store=DataStore(Path(get_settings().data.data_dir)),
+            user=CurrentUser(username=user_id, role="user"),
+            session=session,
+            persist_iob_cache=False,
+        )
+
+
+@pytest.mark.asyncio
+async def test_second_calculation_reuses_warm_context(monkeypatch):
+    user_id = f"ctx-{uuid.uuid4()}"
+    calls = _count_loads(monkeypatch)
+    await _add_bolus(user_id, 2.0, minutes_ago=30)
+
+    first = await _calculate(user_id)
+    second = await _calculate(user_id)
+
+    assert first.context_cached == []
+    assert set(second.context_cached) == {"glucose", "iob", "cob"}
+    assert calls == {"glucose": 1, "iob": 1}
+    assert second.glucose.mgdl == 150
+    assert 0 < second.iob_u <= first.iob_u  # decay still projected to now
+
+    explicit = await _calculate(user_id, cr_g_per_u=10, isf_mgdl_per_u=30, target_mgdl=110)
+    assert explicit.context_cached == []
+
+
+@pytest.mark.asyncio
+async def test_committed_treatment_invalidates_and_refreshes_iob(monkeypatch):
+    user_id = f"ctx-{uuid.uuid4()}"
+    calls = _count_loads(monkeypatch)
+    await _add_bolus(user_id, 1.0, minutes_ago=20)
+    before = await _calculate(user_id)
+
+    await _add_bolus(user_id, 3.0, minutes_ago=1)
+    assert contexts.fresh(user_id, "iob", "any") is None
+    for _ in range(50):  # the background refresh reloads the sources
+        if calls["iob"] == 2:
+            break
+        await asyncio.sleep(0.02)
+    after = await _calculate(user_id)
+
+    assert calls["iob"] == 2
+    assert "iob" in after.context_cached
+    assert after.iob_u > before.iob_u + 2.5
+
+
+def test_load_started_before_invalidation_is_discarded():
+    user_id = f"ctx-{uuid.uuid4()}"
+    contexts.touch(user_id)
+    epoch = contexts.epoch(user_id, "glucose")
+
+    hub.publish(user_id, {"type": "readings", "items": []})
+
+    assert not contexts.put(user_id, "glucose", object(), "fp", epoch=epoch)
+    assert contexts.put(user_id, "glucose", object(), "fp", epoch=contexts.epoch(user_id, "glucose"))
+    assert contexts.fresh(user_id, "glucose", "fp") is not None
+    assert contexts.fresh(user_id, "glucose", "other-settings") is None
+
+
+@pytest.mark.asyncio
+async def test_warm_iob_context_still_reads_nightscout(monkeypatch):
+    user_id = f"ctx-{uuid.uuid4()}"
+    calls = _count_loads(monkeypatch)
+    reads = []
+    real_merge = iob_service.with_nightscout_boluses
+
+    async def counting_merge(sources, settings, client):
+        reads.append(client)
+        return await real_merge(sources, settings, client)
+
+    monkeypatch.setattr(iob_service, "with_nightscout_boluses", counting_merge)
+    await _add_bolus(user_id, 2.0, minutes_ago=30)
+
+    await _calculate(user_id)
+    second = await _calculate(user_id)
+
+    assert "iob" in second.context_cached
+    assert calls["iob"] == 1
+    assert len(reads) == 2
+
+
+@pytest.mark.asyncio
+async def test_nightscout_boluses_are_merged_into_cached_sources():
+    class _Client:
+        async def get_recent_treatments(self, **_kwargs):
+            return [SimpleNamespace(id="ns-1", insulin=1.5, created_at=datetime.now(timezone.utc))]
+
+    cached = iob_service.IOBSources(db_boluses=[], local_boluses=[], ns_boluses=[])
+    settings = UserSettings.default()
+
+    merged = await iob_service.with_nightscout_boluses(cached, settings, _Client())
+
+    assert [bolus["id"] for bolus in merged.ns_boluses] == ["ns-1"]
+    assert cached.ns_boluses == []
+    assert await iob_service.with_nightscout_boluses(cached, settings, None) is cached
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from app.services.nightscout_client import NightscoutError, NightscoutUnavailableError
+from tests.fake_nightscout import FakeNightscout, FaultConfig
+
+
+NOW = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_seeded_data_is_reproducible():
+    first = FakeNightscout(seed=3, days=2, now=NOW)
+    second = FakeNightscout(seed=3, days=2, now=NOW)
+
+    assert len(first.entries) == 2 * 288
+    assert first.entries == second.entries
+    assert first.treatments == second.treatments
+    assert all(40 <= entry["sgv"] <= 400 for entry in first.entries)
+
+
+@pytest.mark.asyncio
+async def test_client_reads_and_writes_against_fake():
+    fake = FakeNightscout(seed=1, days=1, api_secret="fake-secret")
+    client = fake.client()
+
+    status = await client.get_status()
+    latest = await client.get_latest_sgv()
+    window = await client.get_sgv_range(
+        datetime.now(timezone.utc) - timedelta(hours=2), datetime.now(timezone.utc), count=100
+    )
+    treatments = await client.get_recent_treatments(hours=24, limit=50, page_size=2)
+
+    newest = fake.entries[0]
+    result = await client.upload_sgv_batch(
+        [(newest["sgv"], newest["date"], "Flat"), (150, newest["date"] + 300_000, "Flat")]
+    )
+    await client.aclose()
+
+    assert status.status == "ok"
+    assert latest.sgv == newest["sgv"]
+    assert 20 <= len(window) <= 25
+    assert len(treatments) == len(fake.treatments)
+    assert fake.requests["GET /api/v1/treatments"] > 1  # paged in twos
+    assert result["duplicate"] == {(newest["date"], newest["sgv"])}
+    assert fake.entries[0]["sgv"] == 150
+    assert fake.requests["POST /api/v1/entries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_rejects_wrong_secret():
+    fake = FakeNightscout(days=0.1, api_secret="right")
+    client = fake.client(token="wrong")
+
+    with pytest.raises(NightscoutError):
+        await client.get_latest_sgv()
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_injected_errors_and_timeouts_trip_the_breaker():
+    fake = FakeNightscout(days=0.1, faults=FaultConfig(error_rate=1.0))
+    client = fake.client()
+    for _ in range(3):
+        with pytest.raises(NightscoutError):
+            await client.get_latest_sgv()
+    with pytest.raises(NightscoutUnavailableError):
+        await client.get_latest_sgv()
+    await client.aclose()
+
+    slow = FakeNightscout(
+        days=0.1,
+        base_url="http://slow-nightscout.local",
+        faults=FaultConfig(timeout_rate=1.0, timeout_seconds=5.0),
+    )
+    slow_client = slow.client(timeout_seconds=0.05)
+    with pytest.raises(httpx.TimeoutException):
+        await slow_client._request("get", "/api/v1/entries/sgv")
+    await slow_client.aclose()
@@ -99,3 +99,58 @@ def test_ml_inference_logic_mocked(clean_ml_service):
     # Baseline 100 + 1.666 = 101.7
     p5 = next(p for p in res.predicted_series if p.t_min == 5)
     assert 101.6 < p5.bg < 101.8
+
+
+def _trained_models(horizons):
+    import numpy as np
+    import pandas as pd
+    from catboost import CatBoostRegressor
+
+    rng = np.random.default_rng(7)
+    n = 200
+    df = pd.DataFrame({
+        "bg_mgdl": rng.normal(140, 30, n),
+        "trend": rng.choice(["Flat", "SingleUp", "FortyFiveDown"], n),
+        "iob_u": rng.random(n) * 3,
+    })
+    for h in horizons:
+        df[f"baseline_bg_{h}m"] = df["bg_mgdl"] + rng.normal(0, 10, n)
+    models = {}
+    for h in horizons:
+        y = (df["bg_mgdl"] - 140) * h / 300 + rng.normal(0, 2, n)
+        models[h] = {}
+        for key, loss in (("p50", "RMSE"), ("p10", "Quantile:alpha=0.1"), ("p90", "Quantile:alpha=0.9")):
+            model = CatBoostRegressor(iterations=20, depth=3, loss_function=loss, verbose=False, allow_writing_files=False)
+            model.fit(df, y, cat_features=["trend"])
+            models[h][key] = model
+    return models
+
+
+def test_predict_many_matches_single_predictions(clean_ml_service):
+    pytest.importorskip("catboost")
+    import pandas as pd
+
+    svc = MLInferenceService.get_instance()
+    svc.models_loaded = True
+    svc._models = _trained_models([30, 60])
+
+    baseline = [ForecastPoint(t_min=t, bg=120.0 + t / 5) for t in range(0, 65, 5)]
+    contexts = [
+        ({"bg_mgdl": 180.0, "trend": "SingleUp", "iob_u": 0.5, "unused": 3}, baseline),
+        ({"bg_mgdl": 95.0, "trend": None, "iob_u": 2.0}, baseline[:8]),  # 60m baseline missing
+        ({"bg_mgdl": 140.0, "trend": "Flat"}, baseline),
+    ]
+
+    batch = svc.predict_many(contexts)
+    singles = [svc.predict(f, s) for f, s in contexts]
+
+    assert svc._registry.layout.names == ("bg_mgdl", "trend", "iob_u", "baseline_bg_30m", "baseline_bg_60m")
+    assert [r.predicted_series for r in batch] == [r.predicted_series for r in singles]
+    assert [r.p90_series for r in batch] == [r.p90_series for r in singles]
+    assert batch[1].predicted_series[-1].t_min == 30
+
+    # Same value the per-model DataFrame path produced
+    row = {"bg_mgdl": 180.0, "trend": "SingleUp", "iob_u": 0.5, "baseline_bg_30m": 126.0, "baseline_bg_60m": 132.0}
+    residual = svc._models[30]["p50"].predict(pd.DataFrame([row]))[0]
+    p30 = next(p for p in batch[0].predicted_series if p.t_min == 30)
+    assert p30.bg == round(126.0 + residual, 1)
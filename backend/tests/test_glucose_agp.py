@@ -0,0 +1,101 @@
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytest
+
+from app.core.db import SessionLocal
+from app.services.glucose_agp_service import (
+    binned_percentiles,
+    build_report,
+    get_agp_report,
+    local_minute_of_day,
+)
+from app.services.glucose_ingest_service import GlucoseIngestData, ingest_glucose_readings_bulk
+from app.services.glucose_rollup_service import refresh_changed_rollups
+
+
+def test_binned_percentiles_match_numpy():
+    rng = np.random.default_rng(7)
+    bins = rng.integers(0, 24, size=5000)
+    values = rng.normal(150, 40, size=5000)
+
+    counts, table = binned_percentiles(bins, values, 26)
+
+    assert counts.sum() == 5000
+    assert np.isnan(table[:, 24:]).all()
+    for index in range(24):
+        expected = np.percentile(values[bins == index], [5, 25, 50, 75, 95])
+        np.testing.assert_allclose(table[:, index], expected)
+
+
+def test_local_minute_of_day_follows_dst():
+    madrid = ZoneInfo("Europe/Madrid")
+    before = datetime(2026, 3, 28, 12, 0, tzinfo=timezone.utc)  # CET, UTC+1
+    after = datetime(2026, 3, 30, 12, 0, tzinfo=timezone.utc)  # CEST, UTC+2
+    minutes = local_minute_of_day(np.array([int(before.timestamp()), int(after.timestamp())]), madrid)
+
+    assert minutes.tolist() == [13 * 60, 14 * 60]
+
+
+def test_ninety_day_report_is_fast():
+    end = datetime(2026, 6, 1, tzinfo=timezone.utc)
+    start = end - timedelta(days=90)
+    epoch = np.arange(int(start.timestamp()), int(end.timestamp()), 300, dtype=np.int64)
+    values = 140 + 50 * np.sin(epoch / 86400 * 2 * np.pi)
+
+    began = time.perf_counter()
+    report = build_report(epoch, values, start=start, end=end, days=90, tz=ZoneInfo("UTC"))
+    elapsed = time.perf_counter() - began
+
+    assert elapsed < 0.5
+    assert report.samples == epoch.size
+    assert report.coverage_pct == 100.0
+    assert len(report.bands) == 96
+    assert report.bands[0].samples == 90 * 3
+    assert report.gmi_pct == pytest.approx(3.31 + 0.02392 * report.mean_mgdl, abs=0.05)
+    total = (
+        report.very_low_pct + report.low_pct + report.in_range_pct + report.high_pct + report.very_high_pct
+    )
+    assert total == pytest.approx(100.0, abs=0.3)
+
+
+@pytest.mark.asyncio
+async def test_report_is_cached_until_new_readings_arrive():
+    user_id = f"agp-{uuid4()}"
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    old = [
+        GlucoseIngestData(glucose_mgdl=100 + i, measured_at=now - timedelta(days=2, minutes=5 * i), source="nightscout")
+        for i in range(12)
+    ]
+    async with SessionLocal() as session:
+        await ingest_glucose_readings_bulk(session, user_id, old)
+        await session.commit()
+        await refresh_changed_rollups(session)
+        # Not yet rolled up: served from the raw tail.
+        await ingest_glucose_readings_bulk(
+            session,
+            user_id,
+            [GlucoseIngestData(glucose_mgdl=300, measured_at=now - timedelta(minutes=10), source="nightscout")],
+        )
+        await session.commit()
+
+        first = await get_agp_report(session, user_id, days=7)
+        again = await get_agp_report(session, user_id, days=7)
+
+        await ingest_glucose_readings_bulk(
+            session,
+            user_id,
+            [GlucoseIngestData(glucose_mgdl=50, measured_at=now - timedelta(minutes=5), source="nightscout")],
+        )
+        await session.commit()
+        refreshed = await get_agp_report(session, user_id, days=7)
+
+    assert again is first
+    assert first.samples == 13
+    assert first.very_high_pct == pytest.approx(7.7)
+    assert refreshed is not first
+    assert refreshed.samples == 14
+    assert refreshed.very_low_pct == pytest.approx(7.1)
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import func, select
+
+from app.api import glucose as glucose_api
+from app.core.db import SessionLocal
+from app.models.glucose_reading import GlucoseReadingDB
+from app.services import glucose_backfill_service
+from app.services.glucose_backfill_service import backfill_nightscout
+
+
+def _entries(start: datetime, n: int, first_sgv: int = 100):
+    return [
+        SimpleNamespace(
+            sgv=first_sgv + i,
+            date=int((start + timedelta(minutes=5 * i)).timestamp() * 1000),
+            direction="Flat",
+        )
+        for i in range(n)
+    ]
+
+
+def _patch_nightscout(monkeypatch, client):
+    monkeypatch.setattr(
+        glucose_backfill_service,
+        "get_ns_config",
+        AsyncMock(return_value=SimpleNamespace(enabled=True, url="https://ns.example", api_secret="s")),
+    )
+    monkeypatch.setattr(glucose_backfill_service, "NightscoutClient", lambda *args, **kwargs: client)
+
+
+@pytest.mark.asyncio
+async def test_backfill_advances_from_high_water_mark(monkeypatch):
+    user_id = f"backfill-{uuid4()}"
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    first_start = now - timedelta(hours=1)
+    client = AsyncMock()
+    client.get_sgv_range.return_value = _entries(first_start, 12)
+    _patch_nightscout(monkeypatch, client)
+
+    async with SessionLocal() as session:
+        first = await backfill_nightscout(session, user_id, now=now)
+        assert first == {"status": "ok", "fetched": 12, "inserted": 12}
+        assert client.get_sgv_range.await_args.args[0] == now - timedelta(hours=24)
+
+        # Second pass re-reads only the overlap behind the newest stored point.
+        client.get_sgv_range.return_value = _entries(first_start + timedelta(minutes=50), 3, first_sgv=110)
+        second = await backfill_nightscout(session, user_id, now=now + timedelta(minutes=5))
+        stored = (
+            await session.execute(
+                select(func.count()).select_from(GlucoseReadingDB).where(GlucoseReadingDB.user_id == user_id)
+            )
+        ).scalar_one()
+
+    high_water_mark = first_start + timedelta(minutes=55)
+    assert client.get_sgv_range.await_args.args[0] == high_water_mark - timedelta(minutes=15)
+    assert second["inserted"] == 1
+    assert stored == 13
+    assert glucose_backfill_service.get_backfill_state(user_id).high_water_mark == high_water_mark + timedelta(minutes=5)
+
+
+@pytest.mark.asyncio
+async def test_history_serves_local_rows_and_schedules_backfill_when_stale(monkeypatch):
+    user_id = f"backfill-history-{uuid4()}"
+    old = datetime.now(timezone.utc) - timedelta(minutes=40)
+    async with SessionLocal() as session:
+        session.add(
+            GlucoseReadingDB(
+                user_id=user_id,
+                reading_uid=str(uuid4()),
+                glucose_mgdl=140,
+                measured_at=old,
+                source="nightscout",
+                validation_status="accepted",
+            )
+        )
+        await session.commit()
+
+    scheduled = []
+    monkeypatch.setattr(
+        glucose_api, "schedule_backfill", lambda user, since=None: scheduled.append((user, since)) or True
+    )
+    response = SimpleNamespace(headers={})
+    async with SessionLocal() as session:
+        items = await glucose_api.get_glucose_history(
+            response=response,
+            count=3,
+            hours=1,
+            refresh=True,
+            since=None,
+            if_none_match=None,
+            user=SimpleNamespace(username=user_id),
+            session=session,
+        )
+
+    assert [item.sgv for item in items] == [140]
+    assert scheduled and scheduled[0][0] == user_id
+    assert response.headers["X-Glucose-Freshness"] == "stale"
+    assert response.headers["X-Glucose-Backfill"] == "scheduled"
+    assert "X-Glucose-Latest-At" in response.headers
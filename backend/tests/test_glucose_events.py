@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+
+from app.core.db import SessionLocal
+from app.services.glucose_events import GlucoseEventHub, hub
+from app.services.glucose_ingest_service import GlucoseIngestData, ingest_glucose_readings_bulk
+
+
+def _batch(n: int):
+    base = datetime.now(timezone.utc) - timedelta(minutes=5 * n)
+    return [
+        GlucoseIngestData(
+            glucose_mgdl=110 + i,
+            measured_at=base + timedelta(minutes=5 * i),
+            source="nightscout",
+        )
+        for i in range(n)
+    ]
+
+
+@pytest.fixture(autouse=True)
+def _no_forecast_ticks(monkeypatch):
+    monkeypatch.setattr(hub, "_tick_handler", None)
+
+
+@pytest.mark.asyncio
+async def test_committed_ingest_publishes_one_readings_event_per_commit():
+    user_id = f"events-{uuid4()}"
+    async with hub.subscribe(user_id) as queue:
+        async with SessionLocal() as session:
+            await ingest_glucose_readings_bulk(session, user_id, _batch(3), sync_to_nightscout=False)
+            assert queue.empty()
+            await session.commit()
+
+        message = queue.get_nowait()
+        assert queue.empty()
+
+    assert message["type"] == "readings"
+    assert [item["sgv"] for item in message["items"]] == [110, 111, 112]
+    assert all(item["id"] for item in message["items"])
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_ingest_publishes_nothing():
+    user_id = f"events-{uuid4()}"
+    async with hub.subscribe(user_id) as queue:
+        async with SessionLocal() as session:
+            await ingest_glucose_readings_bulk(session, user_id, _batch(2), sync_to_nightscout=False)
+            await session.rollback()
+
+        assert queue.empty()
+    assert hub.latest(user_id) == []
+
+
+@pytest.mark.asyncio
+async def test_tick_handler_coalesces_readings_that_arrive_while_computing():
+    events = GlucoseEventHub()
+    calls = []
+    release = asyncio.Event()
+
+    async def tick(user_id, context):
+        calls.append(context)
+        await release.wait()
+        return {"type": "forecast", "summary": {"n": len(calls)}}
+
+    events.set_tick_handler(tick)
+    async with events.subscribe("u1", context="ctx") as queue:
+        events.publish("u1", {"type": "readings", "items": []})
+        await asyncio.sleep(0)
+        for _ in range(3):
+            events.publish("u1", {"type": "readings", "items": []})
+        release.set()
+        for _ in range(20):
+            await asyncio.sleep(0)
+
+        forecasts = []
+        while not queue.empty():
+            message = queue.get_nowait()
+            if message["type"] == "forecast":
+                forecasts.append(message)
+
+    # First tick plus one coalesced re-run for the three readings that queued behind it.
+    assert calls == ["ctx", "ctx"]
+    assert [message["summary"]["n"] for message in forecasts] == [1, 2]
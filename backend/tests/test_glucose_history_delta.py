@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from app.api import glucose as glucose_api
+from app.core.db import SessionLocal
+from app.models.glucose_reading import GlucoseReadingDB
+from app.services.glucose_history_service import decode_cursor, encode_cursor
+
+
+def _reading(user_id: str, measured_at: datetime, value: int, source: str, **kwargs) -> GlucoseReadingDB:
+    return GlucoseReadingDB(
+        user_id=user_id,
+        reading_uid=str(uuid4()),
+        glucose_mgdl=value,
+        measured_at=measured_at,
+        source=source,
+        validation_status="accepted",
+        **kwargs,
+    )
+
+
+async def _history(user_id: str, *, since=None, if_none_match=None):
+    response = SimpleNamespace(headers={})
+    async with SessionLocal() as session:
+        body = await glucose_api.get_glucose_history(
+            response=response,
+            count=24,
+            hours=2,
+            refresh=False,
+            since=since,
+            if_none_match=if_none_match,
+            user=SimpleNamespace(username=user_id),
+            session=session,
+        )
+    return body, response.headers
+
+
+def test_cursor_round_trip_and_rejects_foreign_values():
+    at = datetime(2026, 5, 1, 8, 0, 0, 123456, tzinfo=timezone.utc)
+
+    assert decode_cursor(encode_cursor(at)) == at
+    assert decode_cursor("v0:123") is None
+    assert decode_cursor("v1:abc") is None
+
+
+@pytest.mark.asyncio
+async def test_history_delta_returns_new_rows_and_tombstones_superseded_copy(monkeypatch):
+    monkeypatch.setattr(glucose_api, "schedule_backfill", lambda *args, **kwargs: False)
+    user_id = f"history-delta-{uuid4()}"
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    async with SessionLocal() as session:
+        for i in range(6):
+            session.add(_reading(user_id, now - timedelta(minutes=30 - 5 * i), 120 + i, "nightscout"))
+        await session.commit()
+
+    full, headers = await _history(user_id)
+    assert len(full) == 6
+    cursor = headers["X-Glucose-Cursor"]
+
+    # Unchanged data: conditional request is answered with 304.
+    not_modified, _ = await _history(user_id, if_none_match=headers["ETag"])
+    assert not_modified.status_code == 304
+
+    superseded = next(item for item in full if item.sgv == 125)
+    # Advance past the overlap window so only rows written after the poll count.
+    since = encode_cursor(decode_cursor(cursor) + timedelta(minutes=1))
+    written_at = datetime.now(timezone.utc) + timedelta(minutes=2)
+    async with SessionLocal() as session:
+        session.add(
+            _reading(user_id, now - timedelta(minutes=5), 125, "dexcom_android", updated_at=written_at)
+        )
+        session.add(_reading(user_id, now, 131, "nightscout", updated_at=written_at))
+        await session.commit()
+
+    delta, delta_headers = await _history(user_id, since=since)
+
+    assert delta.full is False
+    assert [(item.sgv, item.source) for item in delta.items] == [(131, "nightscout"), (125, "dexcom_android")]
+    assert delta.tombstones == [superseded.id]
+    assert delta.cursor == delta_headers["X-Glucose-Cursor"] != cursor
+
+
+@pytest.mark.asyncio
+async def test_history_with_unreadable_cursor_returns_full_window(monkeypatch):
+    monkeypatch.setattr(glucose_api, "schedule_backfill", lambda *args, **kwargs: False)
+    user_id = f"history-delta-{uuid4()}"
+    async with SessionLocal() as session:
+        session.add(_reading(user_id, datetime.now(timezone.utc), 110, "nightscout"))
+        await session.commit()
+
+    delta, _ = await _history(user_id, since="garbage")
+
+    assert delta.full is True
+    assert [item.sgv for item in delta.items] == [110]
+
+
+@pytest.mark.asyncio
+async def test_etag_changes_when_a_reading_leaves_the_window(monkeypatch):
+    monkeypatch.setattr(glucose_api, "schedule_backfill", lambda *args, **kwargs: False)
+    user_id = f"history-window-{uuid4()}"
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    async with SessionLocal() as session:
+        session.add(_reading(user_id, now - timedelta(minutes=10), 120, "nightscout"))
+        session.add(_reading(user_id, now - timedelta(hours=2, seconds=-1), 110, "nightscout"))
+        await session.commit()
+    _, before = await _history(user_id)
+
+    # Same cursor and count, but the oldest reading has aged out of the 2 h window.
+    real_datetime = glucose_api.datetime
+
+    class Later(real_datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return real_datetime.now(tz) + timedelta(seconds=5)
+
+    monkeypatch.setattr(glucose_api, "datetime", Later)
+    body, after = await _history(user_id, if_none_match=before["ETag"])
+
+    assert after["X-Glucose-Cursor"] == before["X-Glucose-Cursor"]
+    assert after["ETag"] != before["ETag"]
+    assert [item.sgv for item in body] == [120]
@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+
+from app.api.glucose import get_glucose_rollups, get_glucose_stats
+from app.core.db import SessionLocal
+from app.models.glucose_reading import GlucoseReadingDB
+from app.models.glucose_rollup import GlucoseRollup5mDB, GlucoseRollupDailyDB, GlucoseRollupHourlyDB
+from app.services import glucose_rollup_service
+from app.services.glucose_ingest_service import GlucoseIngestData, ingest_glucose_readings_bulk
+from app.services.glucose_rollup_service import (
+    GlucoseAggregate,
+    load_rollups,
+    prune_raw_readings,
+    refresh_changed_rollups,
+    summarize_range,
+)
+
+
+def _base() -> datetime:
+    now = datetime.now(timezone.utc)
+    return now.replace(hour=10, minute=0, second=0, microsecond=0) - timedelta(days=2)
+
+
+async def _ingest(user_id: str, base: datetime) -> None:
+    readings = [
+        GlucoseIngestData(glucose_mgdl=100, measured_at=base, source="nightscout"),
+        # Same 5-minute slot from a more direct source: this one wins.
+        GlucoseIngestData(
+            glucose_mgdl=110, measured_at=base + timedelta(seconds=40), source="dexcom_android"
+        ),
+        GlucoseIngestData(glucose_mgdl=60, measured_at=base + timedelta(minutes=5), source="nightscout"),
+        GlucoseIngestData(glucose_mgdl=200, measured_at=base + timedelta(minutes=10), source="nightscout"),
+        GlucoseIngestData(glucose_mgdl=260, measured_at=base + timedelta(minutes=15), source="nightscout"),
+    ]
+    async with SessionLocal() as session:
+        await ingest_glucose_readings_bulk(session, user_id, readings)
+        await session.commit()
+
+
+def test_aggregate_combines_additively():
+    first = GlucoseAggregate.from_values([100, 120, 140])
+    second = GlucoseAggregate.from_values([60, 200])
+    merged = GlucoseAggregate.combine([first, second])
+    direct = GlucoseAggregate.from_values([100, 120, 140, 60, 200])
+
+    assert merged.samples == direct.samples == 5
+    assert merged.mean == pytest.approx(direct.mean)
+    assert merged.sd == pytest.approx(direct.sd)
+    assert (merged.min_mgdl, merged.max_mgdl) == (60, 200)
+    assert merged.below_70 == 1 and merged.above_180 == 1 and merged.in_range == 3
+    assert direct.p50 == 120
+
+
+@pytest.mark.asyncio
+async def test_rollups_pick_canonical_source_and_aggregate():
+    user_id = f"rollup-{uuid4()}"
+    base = _base()
+    await _ingest(user_id, base)
+
+    async with SessionLocal() as session:
+        await refresh_changed_rollups(session)
+        slots = (
+            await session.execute(
+                select(GlucoseRollup5mDB)
+                .where(GlucoseRollup5mDB.user_id == user_id)
+                .order_by(GlucoseRollup5mDB.bucket_start)
+            )
+        ).scalars().all()
+        hourly = (
+            await session.execute(select(GlucoseRollupHourlyDB).where(GlucoseRollupHourlyDB.user_id == user_id))
+        ).scalars().all()
+        daily = (
+            await session.execute(select(GlucoseRollupDailyDB).where(GlucoseRollupDailyDB.user_id == user_id))
+        ).scalars().all()
+        resolution, rows = await load_rollups(session, user_id, base - timedelta(days=5), base)
+        summary = await summarize_range(
+            session, user_id, base - timedelta(days=1, hours=3), datetime.now(timezone.utc)
+        )
+
+    assert [(slot.glucose_mgdl, slot.source) for slot in slots] == [
+        (110, "dexcom_android"),
+        (60, "nightscout"),
+        (200, "nightscout"),
+        (260, "nightscout"),
+    ]
+    assert len(hourly) == len(daily) == 1
+    for row in (hourly[0], daily[0]):
+        assert row.samples == 4
+        assert (row.min_mgdl, row.max_mgdl) == (60, 260)
+        assert (row.below_70, row.in_range, row.above_180, row.above_250) == (1, 1, 2, 1)
+        assert row.p50 == pytest.approx(155.0)
+    assert resolution == "hourly" and len(rows) == 1
+    assert summary.samples == 4
+    assert summary.mean == pytest.approx(157.5)
+    assert summary.p50 == pytest.approx(155.0)
+    assert summary.pct(summary.in_range) == 25.0
+
+
+@pytest.mark.asyncio
+async def test_rollups_survive_raw_pruning_and_serve_endpoints(monkeypatch):
+    monkeypatch.setattr(glucose_rollup_service, "raw_retention", lambda: timedelta(days=90))
+    user_id = f"rollup-prune-{uuid4()}"
+    await _ingest(user_id, _base())
+    user = SimpleNamespace(username=user_id)
+
+    async with SessionLocal() as session:
+        await refresh_changed_rollups(session)
+        # Far enough ahead that every day above is past raw retention.
+        later = datetime.now(timezone.utc) + timedelta(days=120)
+        await prune_raw_readings(session, now=later)
+        remaining = (
+            await session.execute(
+                select(GlucoseReadingDB.source, GlucoseReadingDB.sync_status).where(
+                    GlucoseReadingDB.user_id == user_id
+                )
+            )
+        ).all()
+        # A later rollup run must not wipe days whose raw rows are gone.
+        await refresh_changed_rollups(session, now=later)
+
+        stats = await get_glucose_stats(days=7, user=user, session=session)
+        series = await get_glucose_rollups(days=7, resolution="auto", user=user, session=session)
+        five_minute = await get_glucose_rollups(days=3, resolution="5m", user=user, session=session)
+
+    # Only the reading still waiting for its Nightscout upload is kept.
+    assert [tuple(row) for row in remaining] == [("dexcom_android", "pending")]
+    assert stats.samples == 4
+    assert stats.in_range_pct == 25.0
+    assert stats.above_250_pct == 25.0
+    assert stats.mean_mgdl == 157.5
+    assert stats.cv_pct is not None
+    assert series.resolution == "hourly"
+    assert [point.samples for point in series.points] == [4]
+    assert [point.sgv for point in five_minute.points] == [110, 60, 200, 260]
+
+
+@pytest.mark.asyncio
+async def test_raw_readings_are_kept_unless_retention_is_configured():
+    user_id = f"rollup-keep-{uuid4()}"
+    await _ingest(user_id, _base())
+
+    async with SessionLocal() as session:
+        pruned = await prune_raw_readings(session, now=datetime.now(timezone.utc) + timedelta(days=400))
+        kept = (
+            await session.execute(select(GlucoseReadingDB.id).where(GlucoseReadingDB.user_id == user_id))
+        ).all()
+
+    assert pruned == 0
+    assert kept
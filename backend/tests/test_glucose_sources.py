@@ -1,11 +1,16 @@
 from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock
 from uuid import uuid4
 
 import pytest
 
 from app.core.db import SessionLocal
 from app.models.settings import UserSettings
-from app.services.glucose_ingest_service import GlucoseIngestData, ingest_glucose_reading
+from app.services.glucose_ingest_service import (
+    GlucoseIngestData,
+    ingest_glucose_reading,
+    ingest_glucose_readings_bulk,
+)
 from app.services.glucose_source_service import resolve_current_glucose
 from app.services.glucose_sync_service import sync_glucose_reading
 
@@ -240,6 +245,100 @@ async def test_live_duplicate_can_upgrade_recent_backfill_metadata():
     assert duplicate.reading.usable_for_dosing is False
 
 
+def _bulk_fixture(base: datetime, prefix: str) -> list[GlucoseIngestData]:
+    items = [
+        GlucoseIngestData(
+            glucose_mgdl=100 + i,
+            measured_at=base + timedelta(minutes=5 * i),
+            source="dexcom_android",
+            reading_uid=f"{prefix}-{i}",
+            sensor_state="OK",
+        )
+        for i in range(6)
+    ]
+    items.append(
+        GlucoseIngestData(
+            glucose_mgdl=500,
+            measured_at=base,
+            source="dexcom_android",
+            reading_uid=f"{prefix}-out-of-range",
+        )
+    )
+    # Repeated inside the same batch and via the sensor sequence identity.
+    items.append(items[2])
+    items.extend(
+        GlucoseIngestData(
+            glucose_mgdl=140,
+            measured_at=base + timedelta(minutes=40),
+            source="g7_direct_watch",
+            reading_uid=f"{prefix}-seq-{copy}",
+            origin_installation_id="watch-installation",
+            sensor_session_id=f"{prefix}-session",
+            sequence=7,
+        )
+        for copy in range(2)
+    )
+    return items
+
+
+@pytest.mark.asyncio
+async def test_bulk_ingest_matches_sequential_results():
+    base = datetime.now(timezone.utc) - timedelta(hours=1)
+    sequential_user = _user()
+    bulk_user = _user()
+
+    async with SessionLocal() as session:
+        await ingest_glucose_reading(
+            session,
+            sequential_user,
+            GlucoseIngestData(
+                glucose_mgdl=101,
+                measured_at=base + timedelta(minutes=5),
+                source="dexcom_android",
+                reading_uid="seq-1",
+                historical=True,
+            ),
+        )
+        await ingest_glucose_reading(
+            session,
+            bulk_user,
+            GlucoseIngestData(
+                glucose_mgdl=101,
+                measured_at=base + timedelta(minutes=5),
+                source="dexcom_android",
+                reading_uid="bulk-1",
+                historical=True,
+            ),
+        )
+        await session.commit()
+
+        sequential = [
+            await ingest_glucose_reading(session, sequential_user, item)
+            for item in _bulk_fixture(base, "seq")
+        ]
+        bulk = await ingest_glucose_readings_bulk(session, bulk_user, _bulk_fixture(base, "bulk"))
+        await session.commit()
+
+    def summary(results):
+        return [
+            (
+                result.status,
+                result.duplicate,
+                result.reading.glucose_mgdl,
+                result.reading.validation_reason,
+                result.reading.sync_status,
+                result.reading.historical,
+            )
+            for result in results
+        ]
+
+    assert summary(bulk) == summary(sequential)
+    assert [r.status for r in bulk].count("duplicate") == 3
+    assert bulk[7].reading is bulk[2].reading
+    assert bulk[9].reading is bulk[8].reading
+    assert all(result.reading.id for result in bulk)
+
+
 @pytest.mark.asyncio
 async def test_manually_disconnected_source_is_not_selected():
     user_id = _user()
@@ -364,3 +463,57 @@ async def test_selected_nightscout_falls_back_when_stale():
     assert resolved.source == "dexcom_android"
     assert resolved.bg_mgdl == 121
     assert resolved.fallback_used is True
+
+
+@pytest.mark.asyncio
+async def test_pending_sync_uploads_in_chunks(monkeypatch):
+    from app.services import glucose_sync_service
+
+    user_id = _user()
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=2)
+
+    class BatchClient:
+        def __init__(self):
+            self.batches = []
+
+        async def upload_sgv_batch(self, readings):
+            self.batches.append(readings)
+            if len(self.batches) == 2:
+                raise RuntimeError("unavailable")
+            first = readings[0]
+            return {
+                "uploaded": {(ts, sgv) for sgv, ts, _ in readings[1:]},
+                "duplicate": {(first[1], first[0])},
+            }
+
+        async def aclose(self):
+            pass
+
+    client = BatchClient()
+    monkeypatch.setattr(glucose_sync_service, "SYNC_CHUNK_SIZE", 3)
+    monkeypatch.setattr(
+        glucose_sync_service, "_nightscout_client_for_user", AsyncMock(return_value=client)
+    )
+
+    async with SessionLocal() as session:
+        readings = [
+            GlucoseIngestData(
+                glucose_mgdl=100 + i,
+                measured_at=start + timedelta(minutes=5 * i),
+                source="dexcom_android",
+            )
+            for i in range(5)
+        ]
+        results = await ingest_glucose_readings_bulk(session, user_id, readings)
+        await session.commit()
+        stats = await glucose_sync_service.sync_pending_glucose_readings(session, user_id=user_id)
+        for result in results:
+            await session.refresh(result.reading)
+
+    assert [len(batch) for batch in client.batches] == [3, 2]
+    assert stats == {"processed": 5, "synced": 2, "duplicate": 1, "failed": 2, "pending": 0}
+    statuses = [result.reading.sync_status for result in results]
+    assert statuses == ["duplicate", "synced", "synced", "failed", "failed"]
+    assert all(result.reading.sync_attempts == 1 for result in results)
+    assert results[0].reading.synced_at is not None
+    assert results[3].reading.sync_error == "RuntimeError"
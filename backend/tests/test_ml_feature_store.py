@@ -0,0 +1,107 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core.db import SessionLocal
+from app.models.glucose_reading import GlucoseReadingDB
+from app.services import ml_feature_store
+from app.services.ml_feature_store import align_snapshots, build_training_matrix
+
+START = datetime(2026, 3, 2, 8, 0)
+
+
+def _snapshots(slots: list[int]) -> pd.DataFrame:
+    times = [START + timedelta(minutes=5 * s) for s in slots]
+    df = pd.DataFrame({"feature_time": times, "bg_mgdl": [100.0 + s for s in slots], "trend": "Flat"})
+    for col in ("iob_u", "cob_g", "basal_active_u", "basal_total_24h", "bolus_total_3h",
+                "carbs_total_3h", "exercise_minutes_6h"):
+        df[col] = 0.0
+    for h in (30, 60, 120, 240, 360):
+        df[f"baseline_bg_{h}m"] = 100.0
+    return df
+
+
+def test_targets_follow_timestamps_across_missing_slots():
+    # Slot 3 was never written; the shuffled, duplicated input is still aligned.
+    slots = [s for s in range(20) if s != 3]
+    df = _snapshots(slots + [10]).sample(frac=1, random_state=1)
+
+    matrix = align_snapshots(df, horizons=(30,))
+
+    assert len(matrix) == 19 and matrix.missing_slots == 1
+    assert list(matrix.slots - matrix.slots[0]) == slots
+    # Row at slot s pairs with the snapshot at slot s + 6, whatever the row offset.
+    target = dict(zip(slots, matrix.targets[30]))
+    assert target[0] == 6.0 and target[4] == 10.0 and target[13] == 19.0
+    assert np.isnan(target[14]) and not matrix.masks[30][slots.index(14)]
+    assert list(matrix.rows(30)) == [slots.index(s) for s in range(14) if s != 3]
+    assert list(matrix.features["hour_of_day"][:2]) == [8, 8]
+
+
+def test_readings_replace_snapshot_bg_within_half_a_period():
+    df = _snapshots(list(range(10)))
+    target_time = pd.Timestamp(START + timedelta(minutes=30), tz="UTC")
+    readings = (
+        np.array([target_time.value + 60_000_000_000, target_time.value + 5 * 60_000_000_000 + 200_000_000_000]),
+        np.array([180.0, 250.0]),
+    )
+
+    matrix = align_snapshots(df, readings, horizons=(30,))
+
+    # 1 minute off: the reading wins. 3m20s off slot 1's target: the snapshot is used.
+    assert matrix.actual_bg[30][0] == 180.0
+    assert matrix.actual_bg[30][1] == 107.0
+
+
+@pytest.mark.asyncio
+async def test_training_matrix_joins_glucose_readings():
+    user_id = f"fs-{uuid.uuid4()}"
+    df = _snapshots([0, 1, 2])
+    async with SessionLocal() as session:
+        session.add_all(
+            GlucoseReadingDB(
+                user_id=user_id,
+                reading_uid=str(uuid.uuid4()),
+                glucose_mgdl=150 + i,
+                measured_at=(START + timedelta(minutes=31 + 5 * i)).replace(tzinfo=timezone.utc),
+                source="dexcom_android",
+            )
+            for i in range(3)
+        )
+        await session.commit()
+
+        matrix = await build_training_matrix(session, user_id, df, horizons=(30, 60))
+
+    assert list(matrix.actual_bg[30]) == [150.0, 151.0, 152.0]
+    assert list(matrix.targets[30]) == [50.0, 51.0, 52.0]
+    assert not matrix.masks[60].any()
+
+
+@pytest.mark.asyncio
+async def test_stored_late_fields_come_first_and_readings_fill_the_gaps(monkeypatch):
+    df = _snapshots([0, 1, 2])
+    df["actual_bg_30m"] = [170.0, None, 172.0]
+    readings = (
+        np.array([pd.Timestamp(START + timedelta(minutes=35 + 5 * i), tz="UTC").value for i in range(2)]),
+        np.array([201.0, 202.0]),
+    )
+
+    matrix = align_snapshots(df, readings, horizons=(30,))
+
+    assert list(matrix.actual_bg[30]) == [170.0, 201.0, 172.0]
+
+    loaded = []
+
+    async def fake_load(session, user_id, start, end):
+        loaded.append((start, end))
+        return readings
+
+    monkeypatch.setattr(ml_feature_store, "load_readings", fake_load)
+    df["actual_bg_30m"] = [170.0, 171.0, 172.0]
+    filled = await build_training_matrix(None, "fs-filled", df, horizons=(30,))
+
+    assert loaded == []
+    assert list(filled.targets[30]) == [70.0, 71.0, 72.0]
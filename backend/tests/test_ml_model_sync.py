@@ -0,0 +1,130 @@
+import hashlib
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete
+
+from app.core.db import SessionLocal
+from app.models.ml_store import MLModelStore
+from app.services import ml_inference_service
+from app.services.ml_inference_service import MLInferenceService
+
+catboost = pytest.importorskip("catboost")
+
+
+@pytest.fixture
+def svc(monkeypatch, tmp_path):
+    MLInferenceService._instance = None
+    service = MLInferenceService.get_instance()
+    monkeypatch.setattr(service.settings.ml, "model_dir", str(tmp_path / "models"))
+    yield service
+    MLInferenceService._instance = None
+
+
+_MODELS: dict = {}
+
+
+def _model_bytes(tmp_path, seed: int) -> bytes:
+    """A small trained model per seed; saved files are not byte-stable across fits."""
+    import numpy as np
+
+    if seed in _MODELS:
+        return _MODELS[seed]
+
+    rng = np.random.default_rng(seed)
+    X = rng.random((60, 2))
+    model = catboost.CatBoostRegressor(iterations=5, depth=2, verbose=False, allow_writing_files=False)
+    model.fit(X, X[:, 0] * seed)
+    path = tmp_path / f"m{seed}.cbm"
+    model.save_model(str(path))
+    return _MODELS.setdefault(seed, path.read_bytes())
+
+
+async def _publish(user_id: str, version: str, files: dict, at: datetime, hashes: bool = True) -> None:
+    meta = {"version": version, "horizons": [30]}
+    if hashes:
+        meta["files"] = {name: hashlib.sha256(data).hexdigest() for name, data in files.items()}
+    async with SessionLocal() as session:
+        for name, data in {**files, "metadata.json": json.dumps(meta).encode()}.items():
+            await session.merge(
+                MLModelStore(model_name=name, user_id=user_id, model_data=data, version=version, updated_at=at)
+            )
+        await session.commit()
+
+
+async def _sync(service) -> None:
+    async with SessionLocal() as session:
+        await service.sync_models_from_db(session)
+
+
+@pytest.mark.asyncio
+async def test_sync_downloads_only_changed_artifacts(svc, tmp_path, monkeypatch):
+    user_id = f"mlsync-{uuid.uuid4()}"
+    now = datetime.now(timezone.utc) + timedelta(days=1)
+    p50, p10 = "catboost_residual_30m_p50.cbm", "catboost_residual_30m_p10.cbm"
+    target = tmp_path / "models"
+    target.mkdir()
+    (target / "README.md").write_text("keep me")
+    monkeypatch.setattr(ml_inference_service, "SYNC_CHUNK_BYTES", 1024)
+
+    downloads = []
+    real_download = MLInferenceService._download_artifact
+
+    async def tracking_download(self, session, user_id, version, name, dest, expected_sha):
+        downloads.append(name)
+        return await real_download(self, session, user_id, version, name, dest, expected_sha)
+
+    monkeypatch.setattr(MLInferenceService, "_download_artifact", tracking_download)
+    try:
+        await _publish(user_id, "v-a", {p50: _model_bytes(tmp_path, 1), p10: _model_bytes(tmp_path, 2)}, now)
+        await _sync(svc)
+        assert svc._model_version == "v-a"
+        assert sorted(downloads) == sorted([p10, p50])
+        first = svc._registry
+
+        downloads.clear()
+        await _publish(user_id, "v-b", {p50: _model_bytes(tmp_path, 3), p10: _model_bytes(tmp_path, 2)}, now + timedelta(seconds=5))
+        await _sync(svc)
+
+        assert svc._model_version == "v-b"
+        assert downloads == [p50]
+        assert (target / p50).read_bytes() == _model_bytes(tmp_path, 3)
+        assert (target / "README.md").read_text() == "keep me"
+        # Unchanged artifact keeps its loaded model; the changed one is new.
+        assert svc._models[30]["p10"] is first.models[30]["p10"]
+        assert svc._models[30]["p50"] is not first.models[30]["p50"]
+        assert first.version == "v-a"  # readers holding the old registry are unaffected
+        assert not any(p.name.startswith(".models") for p in tmp_path.iterdir())
+    finally:
+        async with SessionLocal() as session:
+            await session.execute(delete(MLModelStore).where(MLModelStore.user_id == user_id))
+            await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_sync_keeps_current_models_on_hash_mismatch(svc, tmp_path):
+    user_id = f"mlsync-{uuid.uuid4()}"
+    now = datetime.now(timezone.utc) + timedelta(days=1)
+    p50 = "catboost_residual_30m_p50.cbm"
+    try:
+        await _publish(user_id, "v-a", {p50: _model_bytes(tmp_path, 1)}, now)
+        await _sync(svc)
+        assert svc._model_version == "v-a"
+
+        await _publish(user_id, "v-b", {p50: _model_bytes(tmp_path, 4)}, now + timedelta(seconds=5))
+        async with SessionLocal() as session:
+            # Blob no longer matches the hash published in metadata.json
+            row = await session.get(MLModelStore, (p50, user_id))
+            row.model_data = _model_bytes(tmp_path, 5)
+            await session.commit()
+        await _sync(svc)
+
+        assert svc._model_version == "v-a"
+        assert (tmp_path / "models" / p50).read_bytes() == _model_bytes(tmp_path, 1)
+        assert not (tmp_path / ".models.staging").exists()
+    finally:
+        async with SessionLocal() as session:
+            await session.execute(delete(MLModelStore).where(MLModelStore.user_id == user_id))
+            await session.commit()
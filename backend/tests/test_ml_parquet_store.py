@@ -0,0 +1,172 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import text
+
+from app.core.db import SessionLocal
+from app.services import ml_parquet_store
+from app.services.ml_parquet_store import TRAINING_COLUMNS, MLParquetStore
+from app.services.ml_training_pipeline import BACKFILL_WINDOW, persist_training_snapshot
+
+pytest.importorskip("pyarrow")
+
+
+def _snapshot(user_id: str, feature_time: datetime, bg: float) -> dict:
+    snapshot = {name: None for name in TRAINING_COLUMNS}
+    snapshot.update(
+        feature_time=feature_time,
+        user_id=user_id,
+        bg_mgdl=bg,
+        trend="Flat",
+        iob_u=1.5,
+        baseline_bg_30m=bg + 5,
+        source_ns_enabled=True,
+        source_ns_treatments_count=2,
+        flag_bg_missing=False,
+        flag_bg_stale=True,
+    )
+    return snapshot
+
+
+async def _seed(user_id: str, times: list[datetime]) -> None:
+    async with SessionLocal() as session:
+        for index, feature_time in enumerate(times):
+            await persist_training_snapshot(session, _snapshot(user_id, feature_time, 100 + index))
+
+
+@pytest.mark.asyncio
+async def test_incremental_export_appends_only_new_snapshots(tmp_path):
+    user_id = f"parquet-{uuid.uuid4()}"
+    start = datetime(2024, 1, 31, 22, 0, tzinfo=timezone.utc)
+    await _seed(user_id, [start + timedelta(minutes=5 * i) for i in range(48)])
+    store = MLParquetStore(tmp_path)
+
+    async with SessionLocal() as session:
+        first = await store.export_incremental(session, user_id, batch_size=10)
+        again = await store.export_incremental(session, user_id)
+    await _seed(user_id, [start + timedelta(days=1, minutes=5 * i) for i in range(6)])
+    async with SessionLocal() as session:
+        more = await store.export_incremental(session, user_id)
+
+    assert first["rows"] == 48
+    assert again["rows"] == 0 and again["new_files"] == 0
+    assert more["rows"] == 6
+    months = sorted(path.name for path in store.user_dir(user_id).glob("month=*"))
+    assert months == ["month=2024-01", "month=2024-02"]
+    manifest = store.load_manifest(user_id)
+    assert sum(part.rows for part in manifest.files) == 54
+    assert manifest.watermark.startswith("2024-02-01T22:25:00")
+
+    frame = store.read(user_id)
+    assert len(frame) == 54
+    assert frame["feature_time"].is_monotonic_increasing
+    assert frame["bg_mgdl"].iloc[0] == 100
+    assert bool(frame["flag_bg_stale"].iloc[0]) is True
+    assert frame["source_ns_treatments_count"].iloc[0] == 2
+
+
+@pytest.mark.asyncio
+async def test_read_projects_columns_and_prunes_by_time(tmp_path):
+    user_id = f"parquet-{uuid.uuid4()}"
+    start = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    await _seed(user_id, [start + timedelta(hours=i) for i in range(72)])
+    store = MLParquetStore(tmp_path)
+    async with SessionLocal() as session:
+        await store.export_incremental(session, user_id)
+
+    frame = store.read(
+        user_id,
+        columns=["bg_mgdl", "trend"],
+        start=start + timedelta(days=1),
+        end=start + timedelta(days=2),
+    )
+
+    assert list(frame.columns) == ["feature_time", "bg_mgdl", "trend"]
+    assert len(frame) == 24
+    assert frame["feature_time"].min() == start + timedelta(days=1)
+    assert set(frame["trend"]) == {"Flat"}
+    assert store.read(user_id, start=start + timedelta(days=30)).empty
+
+
+@pytest.mark.asyncio
+async def test_busy_months_are_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(ml_parquet_store, "COMPACT_AFTER_PARTS", 2)
+    user_id = f"parquet-{uuid.uuid4()}"
+    start = datetime(2024, 5, 10, tzinfo=timezone.utc)
+    store = MLParquetStore(tmp_path)
+    for chunk in range(3):
+        await _seed(user_id, [start + timedelta(hours=chunk, minutes=5 * i) for i in range(3)])
+        async with SessionLocal() as session:
+            result = await store.export_incremental(session, user_id)
+
+    manifest = store.load_manifest(user_id)
+    assert result["compacted_parts"] == 3
+    assert len(manifest.files) == 1 and manifest.files[0].rows == 9
+    assert len(list(store.user_dir(user_id).rglob("*.parquet"))) == 1
+    assert len(store.read(user_id)) == 9
+
+
+@pytest.mark.asyncio
+async def test_rows_written_behind_the_watermark_trigger_a_rebuild(tmp_path):
+    user_id = f"parquet-{uuid.uuid4()}"
+    start = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    await _seed(user_id, [start + timedelta(minutes=5 * i) for i in range(12)])
+    store = MLParquetStore(tmp_path)
+    async with SessionLocal() as session:
+        first = await store.export_incremental(session, user_id)
+    # An import lands older snapshots than anything mirrored so far.
+    await _seed(user_id, [start - timedelta(days=1, minutes=5 * i) for i in range(4)])
+    async with SessionLocal() as session:
+        second = await store.export_incremental(session, user_id)
+        third = await store.export_incremental(session, user_id)
+
+    assert first["rebuilt"] is False
+    assert second["rebuilt"] is True and second["rows"] == 16
+    assert third["rebuilt"] is False and third["rows"] == 0
+    frame = store.read(user_id)
+    assert len(frame) == 16
+    assert frame["feature_time"].min() == start - timedelta(days=1, minutes=15)
+    assert len(list(store.user_dir(user_id).rglob("*.parquet"))) == len(store.load_manifest(user_id).files)
+
+
+@pytest.mark.asyncio
+async def test_mirror_from_an_older_column_set_is_rebuilt(tmp_path):
+    user_id = f"parquet-{uuid.uuid4()}"
+    start = datetime(2024, 7, 1, tzinfo=timezone.utc)
+    await _seed(user_id, [start + timedelta(minutes=5 * i) for i in range(6)])
+    store = MLParquetStore(tmp_path)
+    async with SessionLocal() as session:
+        await store.export_incremental(session, user_id)
+    manifest = store.load_manifest(user_id)
+    manifest.version = ml_parquet_store.SCHEMA_VERSION - 1
+    store._save_manifest(user_id, manifest)
+
+    async with SessionLocal() as session:
+        result = await store.export_incremental(session, user_id)
+
+    assert result["rebuilt"] is True and result["rows"] == 6
+    assert store.load_manifest(user_id).version == ml_parquet_store.SCHEMA_VERSION
+    assert "actual_bg_30m" in store.read(user_id).columns
+
+
+@pytest.mark.asyncio
+async def test_snapshots_are_mirrored_once_their_late_fields_settle(tmp_path):
+    user_id = f"parquet-{uuid.uuid4()}"
+    now = datetime(2024, 8, 1, 12, 0, tzinfo=timezone.utc)
+    await _seed(user_id, [now - BACKFILL_WINDOW - timedelta(minutes=5), now - timedelta(hours=1)])
+    store = MLParquetStore(tmp_path)
+    async with SessionLocal() as session:
+        early = await store.export_incremental(session, user_id, now=now)
+        # The pipeline fills the targets of the recent snapshot afterwards.
+        await session.execute(
+            text("UPDATE ml_training_data_v2 SET actual_bg_30m = 140 WHERE user_id = :user_id"),
+            {"user_id": user_id},
+        )
+        await session.commit()
+        later = await store.export_incremental(session, user_id, now=now + BACKFILL_WINDOW)
+
+    assert early["rows"] == 1
+    assert later["rows"] == 1 and later["rebuilt"] is False
+    frame = store.read(user_id)
+    assert frame["actual_bg_30m"].isna().tolist() == [True, False]
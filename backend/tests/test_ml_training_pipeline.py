@@ -1,16 +1,23 @@
+import uuid
 from datetime import datetime, timezone, timedelta
 
 import pytest
-from sqlalchemy import text
+from sqlalchemy import select, text
 
-from app.core.db import get_db_session_context
+from app.core.db import SessionLocal, get_db_session_context
 from app.models.basal import BasalEntry
+from app.models.glucose_reading import GlucoseReadingDB
+from app.models.ml_training import MLTrainingSnapshotDB
 from app.models.settings import UserSettings
 from app.models.treatment import Treatment
 from app.models.schemas import NightscoutSGV, Treatment as NSTreatment
 from app.services.nightscout_secrets_service import upsert_ns_config
 from app.services.settings_service import get_user_settings_service, update_user_settings_service
-from app.services.ml_training_pipeline import collect_and_persist_training_snapshot
+from app.services.ml_training_pipeline import (
+    backfill_actual_bg,
+    collect_and_persist_training_snapshot,
+    persist_training_snapshot,
+)
 
 
 class DummyNightscoutClient:
@@ -105,9 +112,9 @@ async def test_ml_training_snapshot_inserts_row(monkeypatch):
 
 
 class StaleNightscoutClient(DummyNightscoutClient):
-    async def get_latest_sgv(self):
+    async def get_sgv_range(self, start_dt, end_dt, count=20):
         ts = int((datetime.now(timezone.utc) - timedelta(minutes=30)).timestamp() * 1000)
-        return NightscoutSGV(sgv=130, direction="Flat", date=ts)
+        return [NightscoutSGV(sgv=130, direction="Flat", date=ts)]
 
     async def get_recent_treatments(self, hours=24, limit=200):
         now = datetime.now(timezone.utc) - timedelta(minutes=10)
@@ -180,3 +187,109 @@ async def test_ml_training_snapshot_flags(monkeypatch):
         assert row is not None
         assert bool(row.flag_bg_stale) is True
         assert bool(row.flag_source_conflict) is True
+
+
+class OfflineNightscoutClient(DummyNightscoutClient):
+    async def get_latest_sgv(self):
+        raise AssertionError("latest SGV is read from glucose_readings")
+
+    async def get_sgv_range(self, start_dt, end_dt, count=20):
+        raise AssertionError("local readings cover the window")
+
+    async def get_recent_treatments(self, hours=24, limit=200):
+        return []
+
+
+def _reading(user_id: str, value: int, measured_at: datetime) -> GlucoseReadingDB:
+    return GlucoseReadingDB(
+        user_id=user_id,
+        reading_uid=str(uuid.uuid4()),
+        glucose_mgdl=value,
+        measured_at=measured_at,
+        source="dexcom_android",
+        trend_arrow="Flat",
+    )
+
+
+@pytest.mark.asyncio
+async def test_snapshot_uses_ingested_readings_and_shared_treatments(monkeypatch):
+    monkeypatch.setattr(
+        "app.services.ml_training_pipeline.NightscoutClient",
+        OfflineNightscoutClient,
+    )
+    user_id = f"ml-snap-{uuid.uuid4()}"
+    now = datetime(2026, 3, 2, 12, 2, tzinfo=timezone.utc)
+
+    async with SessionLocal() as session:
+        await update_user_settings_service(user_id, UserSettings.default().model_dump(), 0, session)
+        await upsert_ns_config(session, user_id, "https://example.com/", "secret", enabled=True)
+        session.add_all(
+            _reading(user_id, 140 - 2 * i, now - timedelta(minutes=2 + 5 * i)) for i in range(9)
+        )
+        session.add(
+            Treatment(
+                id=str(uuid.uuid4()),
+                user_id=user_id,
+                created_at=(now - timedelta(hours=2)).replace(tzinfo=None),
+                insulin=3.0,
+                carbs=40.0,
+            )
+        )
+        session.add(
+            BasalEntry(user_id=user_id, dose_u=10.0, created_at=now - timedelta(hours=30))
+        )
+        await session.commit()
+
+        snapshot = await collect_and_persist_training_snapshot(user_id, session, now_utc=now)
+
+    assert snapshot["bg_mgdl"] == 140.0
+    assert snapshot["bg_age_min"] == pytest.approx(2.0)
+    assert snapshot["flag_bg_stale"] is False
+    assert snapshot["baseline_bg_30m"] is not None
+    assert snapshot["bolus_total_3h"] == 3.0
+    assert snapshot["carbs_total_3h"] == 40.0
+    assert (snapshot["basal_total_24h"], snapshot["basal_total_48h"]) == (0.0, 10.0)
+    assert snapshot["basal_latest_u"] == 10.0
+    assert 0 < snapshot["iob_u"] < 3.0
+    assert snapshot["source_db_treatments_count"] == 1
+    assert snapshot["source_ns_treatments_count"] == 0
+
+
+@pytest.mark.asyncio
+async def test_backfill_fills_due_late_fields_in_one_pass():
+    user_id = f"ml-late-{uuid.uuid4()}"
+    now = datetime(2026, 3, 2, 12, 0, tzinfo=timezone.utc)
+    first = now - timedelta(hours=2)
+
+    async with SessionLocal() as session:
+        for i in range(3):
+            await persist_training_snapshot(
+                session,
+                {
+                    **{column.key: None for column in MLTrainingSnapshotDB.__table__.columns},
+                    "feature_time": first + timedelta(minutes=5 * i),
+                    "user_id": user_id,
+                },
+            )
+        # Readings are a minute off the grid; 30m after the second slot is missing.
+        session.add_all(
+            _reading(user_id, 100 + i, first + timedelta(minutes=1 + 5 * i))
+            for i in range(24)
+            if i != 7
+        )
+        await session.commit()
+
+        assert await backfill_actual_bg(session, user_id, now_utc=now) == 3
+        assert await backfill_actual_bg(session, user_id, now_utc=now) == 0
+
+        rows = (
+            await session.execute(
+                select(MLTrainingSnapshotDB)
+                .where(MLTrainingSnapshotDB.user_id == user_id)
+                .order_by(MLTrainingSnapshotDB.feature_time)
+            )
+        ).scalars().all()
+
+    assert [row.actual_bg_30m for row in rows] == [106.0, None, 108.0]
+    assert [row.actual_bg_60m for row in rows] == [112.0, 113.0, 114.0]
+    assert all(row.actual_bg_120m is None and row.actual_bg_360m is None for row in rows)
@@ -0,0 +1,193 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import delete
+
+from app.core.db import SessionLocal
+from app.models.ml_store import MLModelStore
+from app.services import ml_trainer_service
+from app.services.ml_inference_service import MLInferenceService
+from app.services.ml_trainer_service import MLTrainerService
+from app.services.ml_training_pool import FitTask, plan_workers, run_tasks, scratch_store
+
+pytest.importorskip("catboost")
+
+PARAMS = {"iterations": 15, "depth": 3, "verbose": False, "allow_writing_files": False, "random_seed": 3}
+
+
+def _frame(n: int = 400) -> tuple[pd.DataFrame, np.ndarray]:
+    rng = np.random.default_rng(11)
+    df = pd.DataFrame({
+        "bg_mgdl": rng.normal(140, 30, n),
+        "trend": rng.choice(["Flat", "SingleUp", "DoubleDown"], n),
+        "iob_u": np.where(rng.random(n) < 0.1, np.nan, rng.random(n) * 4),
+    })
+    y = (df["bg_mgdl"] - 140) * 0.2 + np.where(df["trend"] == "SingleUp", 8.0, 0.0)
+    return df, y.to_numpy()
+
+
+def _tasks(tmp_path, n: int) -> list:
+    return [
+        FitTask(key=("split", 0), frame="X", target="y", params=PARAMS, rows=(0, 300), predict_rows=(300, n), impute=True),
+        FitTask(key=("rows",), frame="X", target="y", params=PARAMS, rows="even", predict_rows="even",
+                save_path=str(tmp_path / "even.cbm")),
+    ]
+
+
+def test_pool_matches_in_process_training(tmp_path):
+    df, y = _frame()
+    with scratch_store() as store:
+        store.put_frame("X", df, cat_columns=["trend"])
+        store.put_array("y", y)
+        store.put_array("even", np.arange(0, len(df), 2))
+        inline = list(run_tasks(store, _tasks(tmp_path, len(df)), max_workers=1))
+        pooled = list(run_tasks(store, _tasks(tmp_path, len(df)), max_workers=2))
+
+    assert [r.key for r in pooled] == [("split", 0), ("rows",)]
+    assert [r.n_train for r in pooled] == [300, 200]
+    for a, b in zip(inline, pooled):
+        np.testing.assert_allclose(a.predictions, b.predictions)
+    assert (tmp_path / "even.cbm").exists()
+    # The categorical column reaches CatBoost as strings, not codes
+    assert pooled[1].predictions[df["trend"].to_numpy()[::2] == "SingleUp"].mean() > 4
+
+
+def test_worker_count_respects_memory_budget():
+    assert plan_workers(15, 1000, 20, max_workers=8, memory_limit_mb=None) == 8
+    assert plan_workers(2, 1000, 20, max_workers=8, memory_limit_mb=None) == 2
+    assert plan_workers(15, 1000, 20, max_workers=8, memory_limit_mb=700) == 3
+    assert plan_workers(15, 10_000_000, 20, max_workers=8, memory_limit_mb=700) == 1
+
+
+def _snapshots(n: int) -> pd.DataFrame:
+    rng = np.random.default_rng(5)
+    times = pd.date_range(datetime(2025, 1, 1), periods=n, freq="5min")
+    bg = 140 + 40 * np.sin(np.arange(n) / 30) + rng.normal(0, 3, n)
+    df = pd.DataFrame({"feature_time": times, "bg_mgdl": bg, "trend": rng.choice(["Flat", "SingleUp"], n)})
+    for col in ("iob_u", "cob_g", "basal_active_u", "basal_total_24h", "bolus_total_3h",
+                "carbs_total_3h", "exercise_minutes_6h"):
+        df[col] = rng.random(n)
+    df["hour_of_day"] = times.hour
+    df["day_of_week"] = times.dayofweek
+    for h in (30, 60, 120, 240, 360):
+        df[f"baseline_bg_{h}m"] = np.roll(bg, -h // 5) + rng.normal(0, 5, n)
+    return df
+
+
+@pytest.fixture
+def trainer(tmp_path, monkeypatch):
+    """Trainer on synthetic snapshots; tests set `history` to the rows available."""
+    user_id = f"mltrain-{uuid.uuid4()}"
+    MLInferenceService._instance = None
+    service = MLTrainerService(session=None)
+    ml = service.settings.ml
+    monkeypatch.setattr(ml, "training_enabled", True)
+    monkeypatch.setattr(ml, "model_dir", str(tmp_path / "models"))
+    monkeypatch.setattr(ml, "training_workers", 1)
+    monkeypatch.setattr(ml, "retrain_interval_hours", 0)
+    monkeypatch.setattr(ml_trainer_service, "CATBOOST_PARAMS", {**ml_trainer_service.CATBOOST_PARAMS, "iterations": 10})
+    monkeypatch.setattr(ml_trainer_service, "INCREMENTAL_ITERATIONS", 5)
+    service.history = pd.DataFrame()
+    service.fetched_since = []
+
+    async def fake_fetch(_user_id, since=None):
+        service.fetched_since.append(since)
+        df = service.history
+        if since is not None:
+            df = df[df["feature_time"] >= since.replace(tzinfo=None)]
+        return df.copy()
+
+    monkeypatch.setattr(service, "_fetch_training_data", fake_fetch)
+
+    async def train():
+        async with SessionLocal() as session:
+            service.session = session
+            return await service.train_user_model(user_id)
+
+    service.train = train
+    yield service
+    MLInferenceService._instance = None
+
+
+async def _cleanup_store() -> None:
+    async with SessionLocal() as session:
+        await session.execute(delete(MLModelStore).where(MLModelStore.user_id.like("mltrain-%")))
+        await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_trainer_runs_plan_and_records_metrics(trainer, tmp_path):
+    trainer.history = _snapshots(1200)
+    try:
+        result = await trainer.train()
+
+        assert result["status"] == "success", result
+        meta = result["metadata"]
+        assert meta["training_mode"] == "full"
+        assert sorted(meta["metrics"]) == [30, 60, 120, 240, 360]
+        assert all(m["n"] >= 500 for m in meta["metrics"].values())
+        assert len(meta["files"]) == 15
+        assert all((tmp_path / "models" / name).exists() for name in meta["files"])
+        assert not (tmp_path / "models" / ".candidate").exists()
+    finally:
+        await _cleanup_store()
+
+
+@pytest.mark.asyncio
+async def test_incremental_run_continues_live_models_on_new_rows(trainer, tmp_path, monkeypatch):
+    from catboost import CatBoostRegressor
+
+    p50 = tmp_path / "models" / "catboost_residual_30m_p50.cbm"
+    full_history = _snapshots(1500)
+    trainer.history = full_history.iloc[:1200]
+    try:
+        first = (await trainer.train())["metadata"]
+        trained_until = datetime.fromtimestamp(first["trained_until_ts"], tz=timezone.utc)
+        assert trained_until.replace(tzinfo=None) == trainer.history["feature_time"].max() - timedelta(hours=24)
+
+        trainer.history = full_history
+        result = await trainer.train()
+
+        assert result["status"] == "success", result
+        meta = result["metadata"]
+        assert meta["training_mode"] == "incremental"
+        assert trainer.fetched_since[-1] == trained_until
+        assert meta["last_full_train_ts"] == first["last_full_train_ts"]
+        assert meta["samples_total"] == 1500
+        assert meta["validation"]["current_mae"] > 0
+        model = CatBoostRegressor()
+        model.load_model(str(p50))
+        assert model.tree_count_ == 15  # 10 from the full run + 5 warm-started
+
+        # A candidate that loses to the live models on the holdout is not promoted
+        live = p50.read_bytes()
+        monkeypatch.setattr(
+            MLTrainerService, "_current_eval_mae", staticmethod(lambda *args: {h: 0.0 for h in args[-1]})
+        )
+        trainer.history = pd.concat([full_history, _snapshots(1800).iloc[1500:]])
+        rejected = await trainer.train()
+        assert rejected["status"] == "rejected"
+        assert "holdout" in rejected["reason"]
+        assert p50.read_bytes() == live
+    finally:
+        await _cleanup_store()
+
+
+@pytest.mark.asyncio
+async def test_full_retrain_when_last_full_run_is_old(trainer, monkeypatch):
+    trainer.history = _snapshots(1200)
+    try:
+        first = (await trainer.train())["metadata"]
+        assert first["training_mode"] == "full"
+        monkeypatch.setattr(trainer.settings.ml, "full_retrain_days", 0)
+
+        result = await trainer.train()
+
+        assert result["metadata"]["training_mode"] == "full"
+        assert trainer.fetched_since[-1] is None
+        assert result["metadata"]["last_full_train_ts"] > first["last_full_train_ts"]
+    finally:
+        await _cleanup_store()
@@ -157,6 +157,57 @@ async def test_v2_watch_ingest_is_idempotent_and_stored_first(monkeypatch):
     assert second.duplicate is True
 
 
+@pytest.mark.asyncio
+async def test_v2_batch_ingest_reports_per_reading_results(monkeypatch):
+    monkeypatch.setenv("CGM_INGEST_KEY", "cgm-secret")
+    now = int(datetime.now(timezone.utc).timestamp())
+
+    def reading(offset_min: int, uid: str, display_only: bool = False):
+        return integrations.MobileGlucoseEntryV2Request(
+            schema_version=2,
+            reading_uid=uid,
+            glucose_mgdl=120,
+            display_only=display_only,
+            timestamp=now - offset_min * 60,
+            trend_arrow="Flat",
+            sensor_state="OK",
+            sensor_type="G7",
+            source_package="org.wtachtsugar",
+            source="g7_direct_watch",
+        )
+
+    batch = integrations.MobileGlucoseBatchRequest(
+        readings=[
+            reading(0, f"batch-{now}-a"),
+            reading(10, f"batch-{now}-b", display_only=True),
+            reading(5, f"batch-{now}-c"),
+            reading(0, f"batch-{now}-a"),
+        ]
+    )
+
+    async with SessionLocal() as session:
+        response = await integrations.mobile_glucose_entries_batch(
+            payload=batch,
+            request=SimpleNamespace(query_params={}),
+            ingest_key_header="cgm-secret",
+            session=session,
+        )
+
+    assert [item.reading_uid for item in response.readings] == [
+        f"batch-{now}-b",
+        f"batch-{now}-c",
+        f"batch-{now}-a",
+        f"batch-{now}-a",
+    ]
+    assert [item.status for item in response.readings] == [
+        "rejected",
+        "accepted",
+        "accepted",
+        "duplicate",
+    ]
+    assert (response.accepted, response.rejected, response.duplicates) == (2, 1, 1)
+
+
 def _watch_v1_payload(timestamp_ms: int, suffix: str):
     return integrations.WatchGlucoseEntryV1Request.model_validate({
         "schemaVersion": 1,
@@ -1,4 +1,6 @@
-from datetime import datetime, timedelta
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
 
 import httpx
 import pytest
@@ -76,3 +78,110 @@ async def test_status_failure_raises():
     )
     with pytest.raises(NightscoutError):
         await client.get_status()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_recent_treatments_pushes_window_and_pages_backwards():
+    now = datetime.now(timezone.utc)
+
+    def _treatment(minutes_ago: int) -> dict:
+        created = (now - timedelta(minutes=minutes_ago)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        return {"_id": f"t{minutes_ago}", "eventType": "Bolus", "created_at": created, "insulin": 1.0}
+
+    pages = [
+        [_treatment(m) for m in (5, 10, 15)],
+        [_treatment(m) for m in (15, 20, 25)],  # $lte repeats the page boundary
+        [_treatment(30)],
+    ]
+    route = respx.get("https://example.com/api/v1/treatments").mock(
+        side_effect=[httpx.Response(200, json=page) for page in pages]
+    )
+    client = NightscoutClient(
+        base_url="https://example.com",
+        client=httpx.AsyncClient(base_url="https://example.com"),
+    )
+
+    treatments = await client.get_recent_treatments(hours=1, limit=50, page_size=3)
+
+    assert [t.id for t in treatments] == ["t5", "t10", "t15", "t20", "t25", "t30"]
+    assert route.call_count == 3
+    first, second = (call.request.url.params for call in route.calls[:2])
+    assert "find[created_at][$gte]" in first and "find[created_at][$lte]" not in first
+    assert first["count"] == "3"
+    assert second["find[created_at][$lte]"] == pages[0][-1]["created_at"]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_concurrent_identical_reads_share_one_request():
+    calls = 0
+
+    async def slow_latest(request):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json=[{"sgv": 140, "direction": "Flat", "date": 1690000000000}])
+
+    respx.get("https://example.com/api/v1/entries/sgv").mock(side_effect=slow_latest)
+    clients = [
+        NightscoutClient(base_url="https://example.com", token="same-secret") for _ in range(3)
+    ]
+
+    results = await asyncio.gather(*(c.get_latest_sgv() for c in clients))
+    cached = await clients[0].get_latest_sgv()
+    other_site = NightscoutClient(base_url="https://example.com", token="other-secret")
+    await other_site.get_latest_sgv()
+
+    assert calls == 2  # one shared call + one for different credentials
+    assert [r.sgv for r in results] == [140, 140, 140]
+    assert results[0] is not results[1]
+    assert cached.sgv == 140
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_upload_sgv_batch_posts_one_array_without_duplicates():
+    base_ms = 1690000000000
+    respx.get("https://example.com/api/v1/entries/sgv").mock(
+        return_value=httpx.Response(200, json=[{"sgv": 120, "direction": "Flat", "date": base_ms}])
+    )
+    post = respx.post("https://example.com/api/v1/entries").mock(
+        return_value=httpx.Response(200, json=[{"ok": 1}])
+    )
+    client = NightscoutClient(base_url="https://example.com", token="t")
+
+    readings = [(120 + i, base_ms + i * 300_000, "Flat") for i in range(4)]
+    result = await client.upload_sgv_batch(readings)
+    await client.aclose()
+
+    assert post.call_count == 1
+    sent = json.loads(post.calls.last.request.content)
+    assert [entry["sgv"] for entry in sent] == [121, 122, 123]
+    assert result["duplicate"] == {(base_ms, 120)}
+    assert len(result["uploaded"]) == 3
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_upload_sgv_batch_pages_the_duplicate_probe_on_busy_sites():
+    base_ms = 1690000000000
+    readings = [(120, base_ms, "Flat"), (130, base_ms + 300_000, "Flat")]
+    # Other uploaders filled the span: a first page of the probe's size holds
+    # only newer entries, the batch's oldest reading is on the second page.
+    others = [{"sgv": 200 + i, "direction": "Flat", "date": base_ms + 300_000 - i * 1000} for i in range(14)]
+    pages = [
+        httpx.Response(200, json=others),
+        httpx.Response(200, json=[{"sgv": 120, "direction": "Flat", "date": base_ms}]),
+    ]
+    probe = respx.get("https://example.com/api/v1/entries/sgv").mock(side_effect=pages)
+    post = respx.post("https://example.com/api/v1/entries").mock(return_value=httpx.Response(200, json=[]))
+    client = NightscoutClient(base_url="https://example.com", token="t")
+
+    result = await client.upload_sgv_batch(readings)
+    await client.aclose()
+
+    assert probe.call_count == 2
+    assert probe.calls.last.request.url.params["find[date][$lte]"] == str(base_ms + 300_000 - 13_000)
+    assert result["duplicate"] == {(base_ms, 120)}
+    assert [entry["sgv"] for entry in json.loads(post.calls.last.request.content)] == [130]